@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Declarative routing of bot callback actions.
+
+Every action is registered once with its cost class:
+
+    fast       runs inline on the dispatcher thread (menus, views of data
+               that is already in memory)
+    slow       runs on a bounded worker pool, so a script or a scan does
+               not hold up the navigation buttons
+    exclusive  runs on the pool and never together with another exclusive
+               action (optimize, night mode and cleanup all change limits)
+
+An action may also limit how many of its runs are in flight and drop a
+repeated tap of the same button by the same user within a debounce window.
+Callback data is resolved with at most two dict lookups: the full string,
+then the part before the last underscore for parametrized actions such as
+'load_history_3600'.
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+FAST = "fast"
+SLOW = "slow"
+EXCLUSIVE = "exclusive"
+COST_CLASSES = (FAST, SLOW, EXCLUSIVE)
+
+# Dispatch results
+ACCEPTED = "accepted"
+DEBOUNCED = "debounced"
+BUSY = "busy"
+UNKNOWN = "unknown"
+
+DEFAULT_WORKERS = 2
+# Taps remembered for debouncing before old ones are pruned
+MAX_TAPS = 1024
+
+
+@dataclass(frozen=True)
+class ActionSpec:
+    """A registered action and its execution policy."""
+    name: str
+    handler: Callable
+    cost: str = FAST
+    max_concurrency: int = 0
+    debounce: float = 0.0
+    parametrized: bool = False
+
+
+class ActionRouter:
+    """
+    Dict-based dispatcher with concurrency limits and debouncing.
+
+    Handlers are called as handler(*args, arg), where arg is the parameter
+    of a parametrized action and an empty string otherwise.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS,
+                 on_error: Optional[Callable[[ActionSpec, Exception, tuple], None]] = None,
+                 observe: Optional[Callable[[str, float, bool], None]] = None):
+        self.on_error = on_error
+        self.observe = observe
+        self._actions: Dict[str, ActionSpec] = {}
+        self._parametrized: Dict[str, ActionSpec] = {}
+        self._running: Dict[str, int] = {}
+        self._exclusive: Optional[str] = None
+        self._taps: Dict[Tuple[int, str], float] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="action")
+
+    def action(self, name: str, cost: str = FAST, max_concurrency: int = 0,
+               debounce: float = 0.0, parametrized: bool = False):
+        """
+        Decorator registering a handler
+
+        Args:
+            name (str): Callback data, or its prefix for a parametrized action
+            cost (str): fast, slow or exclusive
+            max_concurrency (int): Runs in flight at most, 0 for no limit
+            debounce (float): Seconds in which a repeated tap by the same user is dropped
+            parametrized (bool): Match 'name_<arg>' instead of 'name'
+
+        Returns:
+            callable: Decorator returning the handler unchanged
+        """
+        if cost not in COST_CLASSES:
+            raise ValueError(f"Unknown cost class: {cost}")
+
+        def decorator(handler):
+            spec = ActionSpec(name, handler, cost, max_concurrency, debounce, parametrized)
+            (self._parametrized if parametrized else self._actions)[name] = spec
+            return handler
+        return decorator
+
+    def resolve(self, data: str) -> Tuple[Optional[ActionSpec], str]:
+        """
+        Find the action for callback data
+
+        Args:
+            data (str): Callback data
+
+        Returns:
+            Tuple[Optional[ActionSpec], str]: (action or None, parameter)
+        """
+        spec = self._actions.get(data)
+        if spec is not None:
+            return spec, ""
+        prefix, sep, arg = data.rpartition("_")
+        spec = self._parametrized.get(prefix) if sep else None
+        return (spec, arg) if spec is not None else (None, "")
+
+    def _admit(self, spec: ActionSpec, user_id: int, data: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if spec.debounce:
+                last = self._taps.get((user_id, data))
+                if last is not None and now - last < spec.debounce:
+                    return DEBOUNCED
+            running = self._running.get(spec.name, 0)
+            if spec.max_concurrency and running >= spec.max_concurrency:
+                return BUSY
+            if spec.cost == EXCLUSIVE:
+                if self._exclusive is not None:
+                    return BUSY
+                self._exclusive = spec.name
+            if spec.debounce:
+                if len(self._taps) >= MAX_TAPS:
+                    self._taps = {k: t for k, t in self._taps.items() if now - t < spec.debounce}
+                self._taps[(user_id, data)] = now
+            self._running[spec.name] = running + 1
+            return ACCEPTED
+
+    def _release(self, spec: ActionSpec):
+        with self._lock:
+            self._running[spec.name] -= 1
+            if self._exclusive == spec.name:
+                self._exclusive = None
+
+    def _run(self, spec: ActionSpec, arg: str, args: tuple):
+        started = time.monotonic()
+        failed = False
+        try:
+            spec.handler(*args, arg)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            failed = True
+            logging.error("Action %s failed: %s", spec.name, e, exc_info=True)
+            if self.on_error is not None:
+                try:
+                    self.on_error(spec, e, args)
+                except Exception as report_err:  # pylint: disable=broad-exception-caught
+                    logging.error("Cannot report failure of action %s: %s", spec.name, report_err)
+        finally:
+            self._release(spec)
+            if self.observe is not None:
+                self.observe(spec.name, time.monotonic() - started, failed)
+
+    def dispatch(self, data: str, user_id: int, *args) -> Tuple[str, Optional[ActionSpec]]:
+        """
+        Run the action for callback data according to its policy
+
+        Args:
+            data (str): Callback data
+            user_id (int): User who pressed the button
+            *args: Arguments passed to the handler before the parameter
+
+        Returns:
+            Tuple[str, Optional[ActionSpec]]: (accepted, debounced, busy or unknown; the action)
+        """
+        spec, arg = self.resolve(data)
+        if spec is None:
+            return UNKNOWN, None
+        status = self._admit(spec, user_id, data)
+        if status != ACCEPTED:
+            return status, spec
+        if spec.cost == FAST:
+            self._run(spec, arg, args)
+        else:
+            self._pool.submit(self._run, spec, arg, args)
+        return ACCEPTED, spec
+
+    def running(self) -> Dict[str, int]:
+        """Actions in flight and their run counts."""
+        with self._lock:
+            return {name: count for name, count in self._running.items() if count}
+
+    def probe(self, callback: Callable[[], None]):
+        """Run a callback on the worker pool, e.g. a watchdog heartbeat."""
+        self._pool.submit(callback)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Streaming anomaly detection over host metrics.
+
+Every metric has a seasonal baseline: an exponentially weighted mean and
+variance for each hour of the day, plus one for the whole day that is used
+while an hour has not been seen often enough. A sample costs O(1): one
+z-score against its hour and one update of two baselines. A value is
+unusual for this host when it stays above its baseline by ANOMALY_Z_THRESHOLD
+standard deviations for several samples in a row, so the same detector
+works on a host idling at load 0.2 and on one that is always at 12.
+
+Values feeding the baseline are clipped at the alert level, so an incident
+does not teach the detector that the incident is normal. The baselines
+are a few hundred numbers and are persisted as JSON.
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from history_store import sample_metrics
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(BASE_DIR, "anomaly_state.json")
+DEFAULT_METRICS = ("load", "cpu", "mem")
+DEFAULT_THRESHOLD = 4.0
+DEFAULT_COOLDOWN = 1800
+# Consecutive unusual samples that raise an alert
+CONSECUTIVE = 3
+# Samples an hour needs before its own baseline is trusted
+MIN_HOUR_SAMPLES = 180
+# Samples the whole-day baseline needs before any alert
+MIN_SAMPLES = 360
+# Smallest EWMA weights: about 3 days of one hour and 1 day overall at a 10 s interval
+HOUR_ALPHA = 1.0 / 1000
+DAY_ALPHA = 1.0 / 8640
+# Standard deviation floors, so a perfectly flat metric does not alert on noise
+STD_FLOOR = {"load": 0.3, "cpu": 3.0, "mem": 1.5, "io_util": 3.0, "net_rx": 65536.0, "net_tx": 65536.0,
+             "net_faults": 1.0, "tcp_retrans": 0.5}
+DEFAULT_STD_FLOOR = 1.0
+# Seconds between state saves
+SAVE_INTERVAL = 300
+MAX_PENDING = 50
+
+
+class Baseline:
+    """Exponentially weighted mean and variance."""
+
+    __slots__ = ("mean", "var", "count")
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0, count: int = 0):
+        self.mean = mean
+        self.var = var
+        self.count = count
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    def update(self, value: float, min_alpha: float):
+        # A plain average until 1/count drops to the EWMA weight
+        self.count += 1
+        alpha = max(1.0 / self.count, min_alpha)
+        diff = value - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + diff * increment)
+
+    def to_list(self) -> list:
+        return [round(self.mean, 6), round(self.var, 6), self.count]
+
+
+@dataclass
+class Anomaly:
+    """A metric that is unusually high for this host."""
+    metric: str
+    timestamp: float
+    value: float
+    mean: float
+    std: float
+    z: float
+    hour: int
+    seasonal: bool
+
+
+class _MetricState:
+    """Baselines of one metric and its run of unusual samples."""
+
+    def __init__(self):
+        self.hours = [Baseline() for _ in range(24)]
+        self.day = Baseline()
+        self.streak = 0
+        self.last_alert = 0.0
+
+    def baseline(self, hour: int) -> Optional[Baseline]:
+        if self.hours[hour].count >= MIN_HOUR_SAMPLES:
+            return self.hours[hour]
+        if self.day.count >= MIN_SAMPLES:
+            return self.day
+        return None
+
+
+class AnomalyDetector:
+    """
+    Seasonal EWMA detector fed by the sampler.
+
+    observe() runs on the sampler thread and queues anomalies; the bot
+    picks them up with drain().
+    """
+
+    def __init__(self, metrics=DEFAULT_METRICS, threshold: float = DEFAULT_THRESHOLD,
+                 cooldown: float = DEFAULT_COOLDOWN, state_file: Optional[str] = STATE_FILE):
+        self.metrics = tuple(metrics)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state_file = state_file
+        self._states: Dict[str, _MetricState] = {name: _MetricState() for name in self.metrics}
+        self._pending = deque(maxlen=MAX_PENDING)
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for name, saved in data.items():
+                state = self._states.get(name)
+                if state is None or len(saved.get("hours", [])) != 24:
+                    continue
+                state.hours = [Baseline(*values) for values in saved["hours"]]
+                state.day = Baseline(*saved["day"])
+        except (OSError, ValueError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning("Anomaly baselines %s ignored: %s", self.state_file, e)
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        if not self.state_file:
+            return
+        data = {name: {"hours": [b.to_list() for b in state.hours], "day": state.day.to_list()}
+                for name, state in self._states.items()}
+        tmp_path = f"{self.state_file}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logging.error("Cannot save anomaly baselines %s: %s", self.state_file, e)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _score(self, name: str, state: _MetricState, timestamp: float, value: float,
+               hour: int) -> Optional[Anomaly]:
+        baseline = state.baseline(hour)
+        if baseline is None:
+            return None
+        std = max(baseline.std, STD_FLOOR.get(name, DEFAULT_STD_FLOOR))
+        z = (value - baseline.mean) / std
+        if z < self.threshold:
+            state.streak = 0
+            return None
+        state.streak += 1
+        if state.streak < CONSECUTIVE or timestamp - state.last_alert < self.cooldown:
+            return None
+        state.last_alert = timestamp
+        return Anomaly(name, timestamp, value, baseline.mean, std, z, hour,
+                       seasonal=baseline is state.hours[hour])
+
+    def observe(self, timestamp: float, values: Dict[str, float]) -> List[Anomaly]:
+        """
+        Score one sample and learn from it
+
+        Args:
+            timestamp (float): Time of the sample
+            values (Dict[str, float]): Metric name to value; unknown metrics are ignored
+
+        Returns:
+            List[Anomaly]: Alerts raised by this sample
+        """
+        hour = time.localtime(timestamp).tm_hour
+        found = []
+        with self._lock:
+            for name, state in self._states.items():
+                value = values.get(name)
+                if value is None:
+                    continue
+                anomaly = self._score(name, state, timestamp, value, hour)
+                if anomaly is not None:
+                    found.append(anomaly)
+                # Learn from the value clipped at the alert level of each baseline
+                for baseline, alpha in ((state.hours[hour], HOUR_ALPHA), (state.day, DAY_ALPHA)):
+                    if baseline.count:
+                        ceiling = baseline.mean + self.threshold * max(
+                            baseline.std, STD_FLOOR.get(name, DEFAULT_STD_FLOOR))
+                        baseline.update(min(value, ceiling), alpha)
+                    else:
+                        baseline.update(value, alpha)
+            self._pending.extend(found)
+            if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self._save()
+        return found
+
+    def drain(self) -> List[Anomaly]:
+        """Take the anomalies queued since the last call."""
+        with self._lock:
+            found = list(self._pending)
+            self._pending.clear()
+            return found
+
+    def baselines(self, hour: int) -> Dict[str, Optional[Baseline]]:
+        """Baseline that would score each metric at the given hour, None while learning."""
+        with self._lock:
+            return {name: state.baseline(hour) for name, state in self._states.items()}
+
+
+def attach_detector(detector: AnomalyDetector, sampler):
+    """
+    Feed every sampler sample to the detector
+
+    Args:
+        detector (AnomalyDetector): Target detector
+        sampler (Sampler): Source sampler
+    """
+    sampler.add_listener(lambda sample, _processes: detector.observe(sample.timestamp, sample_metrics(sample)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show the learned per-hour metric baselines")
+    parser.add_argument("--state", default=STATE_FILE)
+    args = parser.parse_args(argv)
+
+    detector = AnomalyDetector(state_file=args.state)
+    current = time.localtime().tm_hour
+    print("hour  " + "".join(f"{name:>26}" for name in detector.metrics))
+    for hour in range(24):
+        cells = []
+        for name in detector.metrics:
+            baseline = detector._states[name].hours[hour]  # pylint: disable=protected-access
+            cells.append(f"{baseline.mean:>10.2f} ±{baseline.std:>6.2f} ({baseline.count:>4})"
+                         if baseline.count else f"{'-':>26}")
+        print(f"{hour:02d}{'*' if hour == current else ' '}   " + "".join(f"{c:>26}" for c in cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
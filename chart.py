@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Minimal PNG line charts.
+
+Series are downsampled with Largest-Triangle-Three-Buckets to the plot
+width, drawn into an indexed-colour raster and encoded with zlib, so the
+cost of a chart depends on its size in pixels, not on the number of
+samples, and no plotting library is needed. Panels are stacked
+vertically, one per metric, with a small bitmap font for the scale and
+time labels.
+"""
+import time
+import zlib
+import struct
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_WIDTH = 720
+PANEL_HEIGHT = 140
+MARGIN_LEFT = 44
+MARGIN_RIGHT = 10
+MARGIN_TOP = 18
+MARGIN_BOTTOM = 16
+# Seconds a rendered chart is reused for the same metric set and window
+CACHE_TTL = 60.0
+
+# Indexed palette: background, axes, grid, text, then line colours
+PALETTE = [
+    (255, 255, 255), (60, 60, 60), (225, 225, 225), (40, 40, 40),
+    (31, 119, 180), (214, 39, 40), (44, 160, 44), (255, 127, 14), (148, 103, 189),
+]
+BACKGROUND, AXIS, GRID, TEXT = 0, 1, 2, 3
+LINE_COLOURS = (4, 5, 6, 7, 8)
+
+# 3x5 glyphs, rows top to bottom, 3 bits per row
+_FONT = {
+    "0": "111101101101111", "1": "010110010010111", "2": "111001111100111", "3": "111001111001111",
+    "4": "101101111001001", "5": "111100111001111", "6": "111100111101111", "7": "111001010010010",
+    "8": "111101111101111", "9": "111101111001111", ".": "000000000000010", ":": "000010000010000",
+    "%": "101001010100101", "-": "000000111000000", "/": "001001010100100", " ": "000000000000000",
+    "A": "010101111101101", "C": "111100100100111", "D": "110101101101110", "E": "111100111100111",
+    "G": "111100101101111", "H": "101101111101101", "I": "111010010010111", "K": "101110100110101",
+    "L": "100100100100111", "M": "101111111101101", "N": "110101101101101", "O": "111101101101111",
+    "P": "111101111100100", "R": "110101110101101", "S": "111100111001111", "T": "111010010010010",
+    "U": "101101101101111", "W": "101101111111101", "X": "101101010101101", "Y": "101101010010010",
+    "B": "110101110101110", "F": "111100111100100", "J": "001001001101111", "Q": "111101101111001",
+    "V": "101101101101010", "Z": "111001010100111",
+}
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    """
+    Downsample a series with Largest-Triangle-Three-Buckets
+
+    The first and last points are kept; from every bucket in between the
+    point forming the largest triangle with the previously selected point
+    and the average of the next bucket is chosen, preserving peaks.
+
+    Args:
+        xs (Sequence[float]): X values, ascending
+        ys (Sequence[float]): Y values
+        threshold (int): Number of points to keep
+
+    Returns:
+        Tuple[List[float], List[float]]: Selected (xs, ys)
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+    out_x, out_y = [xs[0]], [ys[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        a = best
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+class Canvas:
+    """Indexed-colour raster with line, rectangle and text drawing."""
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.rows = [bytearray([BACKGROUND]) * width for _ in range(height)]
+
+    def pixel(self, x: int, y: int, colour: int):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.rows[y][x] = colour
+
+    def hline(self, x0: int, x1: int, y: int, colour: int):
+        if 0 <= y < self.height:
+            x0, x1 = max(min(x0, x1), 0), min(max(x0, x1), self.width - 1)
+            self.rows[y][x0:x1 + 1] = bytes([colour]) * (x1 - x0 + 1)
+
+    def vline(self, x: int, y0: int, y1: int, colour: int):
+        for y in range(max(min(y0, y1), 0), min(max(y0, y1), self.height - 1) + 1):
+            self.pixel(x, y, colour)
+
+    def line(self, x0: int, y0: int, x1: int, y1: int, colour: int):
+        """Bresenham line."""
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        err = dx + dy
+        while True:
+            self.pixel(x0, y0, colour)
+            if x0 == x1 and y0 == y1:
+                return
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def text(self, x: int, y: int, value: str, colour: int = TEXT, scale: int = 1):
+        for ch in value.upper():
+            glyph = _FONT.get(ch, _FONT[" "])
+            for row in range(5):
+                for col in range(3):
+                    if glyph[row * 3 + col] == "1":
+                        for sy in range(scale):
+                            for sx in range(scale):
+                                self.pixel(x + col * scale + sx, y + row * scale + sy, colour)
+            x += 4 * scale
+
+    def to_png(self) -> bytes:
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        raw = b"".join(b"\x00" + bytes(row) for row in self.rows)
+        return (b"\x89PNG\r\n\x1a\n"
+                + chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 3, 0, 0, 0))
+                + chunk(b"PLTE", b"".join(struct.pack("BBB", *rgb) for rgb in PALETTE))
+                + chunk(b"IDAT", zlib.compress(raw, 6))
+                + chunk(b"IEND", b""))
+
+
+def _format_tick(value: float) -> str:
+    if value >= 100:
+        return f"{value:.0f}"
+    return f"{value:.1f}" if value >= 10 else f"{value:.2f}"
+
+
+def render_chart(panels: List[Tuple[str, Sequence[float], Sequence[float], Optional[float]]],
+                 start: float, end: float, width: int = DEFAULT_WIDTH) -> bytes:
+    """
+    Render stacked line panels sharing one time axis
+
+    Args:
+        panels (List[Tuple[str, Sequence[float], Sequence[float], Optional[float]]]):
+            (title, timestamps, values, fixed maximum or None for auto scale)
+        start (float): Time axis start
+        end (float): Time axis end
+        width (int): Image width in pixels
+
+    Returns:
+        bytes: PNG image
+    """
+    plot_w = width - MARGIN_LEFT - MARGIN_RIGHT
+    panel_total = PANEL_HEIGHT + MARGIN_TOP
+    canvas = Canvas(width, panel_total * len(panels) + MARGIN_BOTTOM)
+    span = max(end - start, 1e-9)
+
+    for index, (title, xs, ys, fixed_max) in enumerate(panels):
+        top = index * panel_total + MARGIN_TOP
+        bottom = top + PANEL_HEIGHT - 1
+        colour = LINE_COLOURS[index % len(LINE_COLOURS)]
+        y_max = fixed_max if fixed_max else max(max(ys, default=0.0) * 1.1, 1.0)
+
+        for step in range(5):
+            y = bottom - round(step * (PANEL_HEIGHT - 1) / 4)
+            canvas.hline(MARGIN_LEFT, MARGIN_LEFT + plot_w - 1, y, GRID)
+            label = _format_tick(y_max * step / 4)
+            canvas.text(MARGIN_LEFT - 4 - 4 * len(label), y - 2, label)
+        canvas.vline(MARGIN_LEFT, top, bottom, AXIS)
+        canvas.hline(MARGIN_LEFT, MARGIN_LEFT + plot_w - 1, bottom, AXIS)
+        canvas.text(MARGIN_LEFT + 2, top - 13, title, colour, scale=2)
+
+        px, py = lttb(xs, ys, plot_w)
+        points = [
+            (MARGIN_LEFT + round((x - start) / span * (plot_w - 1)),
+             bottom - round(min(max(y / y_max, 0.0), 1.0) * (PANEL_HEIGHT - 1)))
+            for x, y in zip(px, py)
+        ]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            canvas.line(x0, y0, x1, y1, colour)
+        if len(points) == 1:
+            canvas.pixel(*points[0], colour)
+
+    # Time labels under the last panel
+    label_format = "%H:%M" if span <= 2 * 86400 else "%d/%m"
+    y = canvas.height - MARGIN_BOTTOM + 5
+    for step in range(5):
+        ts = start + span * step / 4
+        label = datetime.fromtimestamp(ts).strftime(label_format)
+        x = MARGIN_LEFT + round(step * (plot_w - 1) / 4) - 2 * len(label)
+        canvas.text(min(max(x, 0), width - 4 * len(label)), y, label)
+    return canvas.to_png()
+
+
+class ChartCache:
+    """Rendered charts per key, reused for CACHE_TTL seconds."""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[tuple, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+            return None
+
+    def put(self, key: tuple, value):
+        with self._lock:
+            now = time.monotonic()
+            self._entries = {k: v for k, v in self._entries.items() if now - v[0] < self.ttl}
+            self._entries[key] = (now, value)
@@ -5,7 +5,12 @@ SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 
 # Загружаем конфигурацию из текущей директории
 CONFIG_FILE="$SCRIPT_DIR/critical_processes_config.sh"
-if [ -f "$CONFIG_FILE" ]; then
+# Значения и функции конфига читаются из снапшота, который бот обновляет при каждом изменении конфига:
+# одно чтение без повторной загрузки конфига. Полный конфиг загружается, только если снапшота нет или он устарел
+CONFIG_SNAPSHOT="$(dirname "$CONFIG_FILE")/.config_snapshot.env"
+if [ -f "$CONFIG_SNAPSHOT" ] && ! [ "$CONFIG_FILE" -nt "$CONFIG_SNAPSHOT" ]; then
+  source "$CONFIG_SNAPSHOT"
+elif [ -f "$CONFIG_FILE" ]; then
   source "$CONFIG_FILE"
 else
   echo "Ошибка: Конфигурационный файл $CONFIG_FILE не найден."
@@ -51,7 +56,16 @@ DISK_PERCENT=$(df -h | grep '/$' | awk '{print $5}' | tr -d '%')
 TOP_CPU=$(ps aux --sort=-%cpu | head -6 | tail -5 | awk '{print $11, " (PID:", $2, "CPU:", $3"%)"}')
 TOP_MEM=$(ps aux --sort=-%mem | head -6 | tail -5 | awk '{print $11, " (PID:", $2, "MEM:", $4"%)"}')
 CPU_USAGE=$(get_average_cpu 3 1)
-OPEN_PORTS=$(netstat -tuln | grep LISTEN | awk '{print $4}' | sort)
+# Слушающие сокеты читаются из /proc/net без netstat; netstat/ss остаются запасным вариантом
+if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/net_sockets.py" ]; then
+  NET_SUMMARY=$(python3 "$SCRIPT_DIR/net_sockets.py")
+  OPEN_PORTS=$(echo "$NET_SUMMARY" | awk '$1 ~ /^tcp/ {print $2}' | sort -u)
+  CONNECTIONS=$(echo "$NET_SUMMARY" | grep -E '^[A-Z_]+=')
+elif command -v netstat &> /dev/null; then
+  OPEN_PORTS=$(netstat -tuln | grep LISTEN | awk '{print $4}' | sort)
+else
+  OPEN_PORTS=$(ss -tln | awk 'NR > 1 {print $4}' | sort)
+fi
 
 # Проверяем историю нагрузки из лог-файла, если он существует
 LOAD_HISTORY=""
@@ -86,6 +100,7 @@ $TOP_MEM
 
 🔌 <b>Открытые порты:</b>
 $OPEN_PORTS
+$CONNECTIONS
 
 $LOAD_HISTORY
 
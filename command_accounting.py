@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Long-term resource accounting per command.
+
+Every sampler scan adds the CPU time, I/O bytes and resident memory of each
+process to its command (or to its systemd service or container, when it
+runs in one) in hourly and daily buckets. A bucket holds one Space-Saving
+sketch per resource: at most a fixed number of counters, where a new
+command replaces the smallest one and inherits its count as the error
+bound. Heavy consumers are therefore always kept, and memory stays fixed
+no matter how many distinct short-lived commands appear.
+
+CPU and I/O are summed; for memory the sum over the processes of a command
+at one scan is taken and its peak over the bucket is kept. A process that
+starts and exits between two scans is not seen.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from system_sampler import CLOCK_TICKS, PROC_ROOT, ProcessSample
+from disk_index import format_size
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(BASE_DIR, "command_accounting.json")
+RESOURCES = ("cpu", "io", "rss")
+# Counters per sketch
+HOUR_CAPACITY = 32
+DAY_CAPACITY = 64
+# Buckets kept
+HOURS_KEPT = 48
+DAYS_KEPT = 8
+# Seconds between state saves
+SAVE_INTERVAL = 300
+
+Row = Tuple[str, float, float]
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k counters.
+
+    In 'sum' mode a key that is not tracked replaces the smallest counter
+    and starts from its value, so counts are upper bounds with the error
+    recorded per key. In 'max' mode a key replaces the smallest counter
+    only if its value is larger.
+    """
+
+    def __init__(self, capacity: int, mode: str = "sum"):
+        self.capacity = capacity
+        self.mode = mode
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+
+    def add(self, key: str, value: float, error: float = 0.0):
+        if value <= 0:
+            return
+        counts = self.counts
+        if key in counts:
+            if self.mode == "sum":
+                counts[key] += value
+                self.errors[key] += error
+            elif value > counts[key]:
+                counts[key] = value
+            return
+        if len(counts) < self.capacity:
+            counts[key] = value
+            self.errors[key] = error
+            return
+        victim = min(counts, key=counts.get)
+        floor = counts[victim]
+        if self.mode == "max" and value <= floor:
+            return
+        del counts[victim]
+        del self.errors[victim]
+        if self.mode == "sum":
+            counts[key] = floor + value
+            self.errors[key] = floor + error
+        else:
+            counts[key] = value
+            self.errors[key] = 0.0
+
+    def merge(self, other: "SpaceSaving"):
+        for key, value in other.counts.items():
+            self.add(key, value, other.errors.get(key, 0.0))
+
+    def top(self, limit: int) -> List[Row]:
+        """
+        Get the largest counters
+
+        Args:
+            limit (int): Number of rows
+
+        Returns:
+            List[Row]: (key, count, error), largest first
+        """
+        keys = sorted(self.counts, key=self.counts.get, reverse=True)[:limit]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+    def to_dict(self) -> dict:
+        return {key: [round(self.counts[key], 3), round(self.errors[key], 3)] for key in self.counts}
+
+    @classmethod
+    def from_dict(cls, data: dict, capacity: int, mode: str) -> "SpaceSaving":
+        sketch = cls(capacity, mode)
+        for key, (count, error) in list(data.items())[:capacity]:
+            sketch.counts[key] = float(count)
+            sketch.errors[key] = float(error)
+        return sketch
+
+
+class UsageBucket:
+    """CPU seconds, I/O bytes and peak RSS per command over one period."""
+
+    def __init__(self, start: float, capacity: int):
+        self.start = start
+        self.capacity = capacity
+        self.sketches = {
+            "cpu": SpaceSaving(capacity),
+            "io": SpaceSaving(capacity),
+            "rss": SpaceSaving(capacity, mode="max"),
+        }
+
+    def add(self, key: str, cpu_seconds: float, io_bytes: float, rss_bytes: float):
+        self.sketches["cpu"].add(key, cpu_seconds)
+        self.sketches["io"].add(key, io_bytes)
+        self.sketches["rss"].add(key, rss_bytes)
+
+    def to_dict(self) -> dict:
+        return {"start": self.start, **{name: s.to_dict() for name, s in self.sketches.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict, capacity: int) -> "UsageBucket":
+        bucket = cls(float(data["start"]), capacity)
+        for name, sketch in bucket.sketches.items():
+            bucket.sketches[name] = SpaceSaving.from_dict(data.get(name, {}), capacity, sketch.mode)
+        return bucket
+
+
+def command_key(proc_root: str, pid: int, name: str) -> str:
+    """
+    Get the accounting key of a process
+
+    Args:
+        proc_root (str): procfs mount point
+        pid (int): Process ID
+        name (str): Command name from /proc/[pid]/stat
+
+    Returns:
+        str: systemd service, container 'docker-<id>' or the command name
+    """
+    try:
+        with open(os.path.join(proc_root, str(pid), "cgroup"), "r", encoding="utf-8") as f:
+            path = f.read().splitlines()[-1].rpartition(":")[2]
+    except (OSError, IndexError):
+        return name
+    unit = path.rstrip("/").rpartition("/")[2]
+    if unit.endswith(".service") and not unit.startswith("user@"):
+        return unit
+    if unit.startswith("docker-") and unit.endswith(".scope"):
+        return unit[:19]
+    return name
+
+
+def _read_uptime_ticks(proc_root: str) -> Optional[float]:
+    try:
+        with open(os.path.join(proc_root, "uptime"), "r", encoding="utf-8") as f:
+            return float(f.read().split()[0]) * CLOCK_TICKS
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _day_start(timestamp: float) -> float:
+    day = datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.timestamp()
+
+
+class CommandAccounting:
+    """
+    Hourly and daily heavy-hitter buckets fed by the sampler.
+
+    observe() runs on the sampler thread, top() on bot handlers.
+    """
+
+    def __init__(self, proc_root: str = PROC_ROOT, state_file: Optional[str] = STATE_FILE):
+        self.proc_root = proc_root
+        self.state_file = state_file
+        self.hours: deque = deque(maxlen=HOURS_KEPT)
+        self.days: deque = deque(maxlen=DAYS_KEPT)
+        # pid -> (start ticks, cpu ticks, io bytes, key)
+        self._prev: Dict[int, Tuple[int, int, int, str]] = {}
+        self._prev_uptime: Optional[float] = None
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.hours.extend(UsageBucket.from_dict(b, HOUR_CAPACITY) for b in data.get("hours", []))
+            self.days.extend(UsageBucket.from_dict(b, DAY_CAPACITY) for b in data.get("days", []))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning("Command accounting state %s ignored: %s", self.state_file, e)
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        if not self.state_file:
+            return
+        data = {"hours": [b.to_dict() for b in self.hours], "days": [b.to_dict() for b in self.days]}
+        tmp_path = f"{self.state_file}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logging.error("Cannot save command accounting %s: %s", self.state_file, e)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    @staticmethod
+    def _bucket(buckets: deque, start: float, capacity: int) -> UsageBucket:
+        if not buckets or buckets[-1].start < start:
+            buckets.append(UsageBucket(start, capacity))
+        return buckets[-1]
+
+    def _deltas(self, processes: List[ProcessSample]) -> Dict[str, List[float]]:
+        uptime = _read_uptime_ticks(self.proc_root)
+        prev_uptime = self._prev_uptime
+        usage: Dict[str, List[float]] = {}
+        current = {}
+        for proc in processes:
+            before = self._prev.get(proc.pid)
+            io_total = proc.read_bytes + proc.write_bytes
+            if before is not None and before[0] == proc.start_ticks:
+                _start, ticks, io_bytes, key = before
+                cpu_ticks = proc.cpu_ticks - ticks
+                io_delta = max(io_total - io_bytes, 0)
+            else:
+                key = command_key(self.proc_root, proc.pid, proc.name)
+                # A process started since the last scan is counted from its start
+                started_since = prev_uptime is not None and proc.start_ticks >= prev_uptime
+                cpu_ticks = proc.cpu_ticks if started_since else 0
+                io_delta = io_total if started_since else 0
+            current[proc.pid] = (proc.start_ticks, proc.cpu_ticks, io_total, key)
+            row = usage.setdefault(key, [0.0, 0.0, 0.0])
+            row[0] += max(cpu_ticks, 0) / CLOCK_TICKS
+            row[1] += io_delta
+            row[2] += proc.rss_bytes
+        self._prev = current
+        self._prev_uptime = uptime
+        return usage
+
+    def observe(self, timestamp: float, processes: List[ProcessSample]):
+        """
+        Account one process scan
+
+        Args:
+            timestamp (float): Time of the scan
+            processes (List[ProcessSample]): Every process of the scan
+        """
+        with self._lock:
+            usage = self._deltas(processes)
+            hour = self._bucket(self.hours, timestamp - timestamp % 3600, HOUR_CAPACITY)
+            day = self._bucket(self.days, _day_start(timestamp), DAY_CAPACITY)
+            for key, (cpu_seconds, io_bytes, rss_bytes) in usage.items():
+                hour.add(key, cpu_seconds, io_bytes, rss_bytes)
+                day.add(key, cpu_seconds, io_bytes, rss_bytes)
+            if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self._save()
+
+    def top(self, window: float, resource: str = "cpu", limit: int = 10,
+            now: Optional[float] = None) -> List[Row]:
+        """
+        Get the heaviest commands over a window
+
+        Windows up to two days are built from hourly buckets, longer ones from
+        daily buckets (the current day and the previous days).
+
+        Args:
+            window (float): Window in seconds
+            resource (str): cpu (seconds), io (bytes) or rss (peak bytes)
+            limit (int): Number of rows
+            now (float, optional): Window end
+
+        Returns:
+            List[Row]: (key, value, error bound), largest first
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if window <= HOURS_KEPT * 3600:
+                buckets, capacity = self.hours, HOUR_CAPACITY
+                start = now - window
+                start -= start % 3600
+            else:
+                buckets, capacity = self.days, DAY_CAPACITY
+                start = _day_start(now - window + 86400)
+            merged = SpaceSaving(capacity * 2, buckets[0].sketches[resource].mode if buckets else "sum")
+            for bucket in buckets:
+                if bucket.start >= start:
+                    merged.merge(bucket.sketches[resource])
+        return merged.top(limit)
+
+
+def attach_accounting(accounting: CommandAccounting, sampler):
+    """
+    Feed every sampler scan to the accounting
+
+    Args:
+        accounting (CommandAccounting): Target accounting
+        sampler (Sampler): Source sampler
+    """
+    sampler.add_listener(lambda sample, processes: accounting.observe(sample.timestamp, processes))
+
+
+def format_value(resource: str, value: float) -> str:
+    """Format a CPU time, I/O amount or memory size."""
+    if resource != "cpu":
+        return format_size(int(value))
+    if value >= 3600:
+        return f"{value / 3600:.1f}h"
+    if value >= 60:
+        return f"{value / 60:.1f}m"
+    return f"{value:.0f}s" if value >= 10 else f"{value:.1f}s"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Top commands by CPU, I/O and memory from the accounting state")
+    parser.add_argument("--window", choices=("24h", "7d"), default="24h")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--state", default=STATE_FILE)
+    args = parser.parse_args(argv)
+
+    accounting = CommandAccounting(state_file=args.state)
+    window = 86400 if args.window == "24h" else 7 * 86400
+    for resource, title in (("cpu", "CPU time"), ("io", "Disk I/O"), ("rss", "Peak memory")):
+        print(f"{title} over {args.window}:")
+        for key, value, error in accounting.top(window, resource, args.top):
+            bound = f" (±{format_value(resource, error)})" if error else ""
+            print(f"  {format_value(resource, value):>10}{bound}  {key}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Per-container resource usage read straight from cgroupfs.
+
+Containers are found by their cgroup directories (docker-<id>.scope with
+the systemd driver, docker/<id> with the cgroupfs driver) and their
+cpu.stat, memory.current, memory.stat and io.stat are read directly, so a
+snapshot of all containers costs a few small file reads instead of a
+`docker stats --no-stream` round trip. CPU and I/O rates are deltas
+between two collections. Memory policies from the configuration are
+evaluated against the same snapshot.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from server_config import load_server_config, parse_size
+from disk_index import format_size
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Container metadata, used to map ids to names without calling the docker CLI
+DOCKER_ROOT = "/var/lib/docker"
+# Depth below the cgroup root searched for container directories
+MAX_DISCOVERY_DEPTH = 4
+
+_CONTAINER_DIR_RE = re.compile(r"^(?:docker-|libpod-)?([0-9a-f]{64})(?:\.scope)?$")
+
+
+@dataclass
+class ContainerSample:
+    """Resource usage of one container."""
+    container_id: str
+    name: str
+    cgroup: str
+    timestamp: float
+    cpu_usec: int
+    mem_current: int
+    mem_limit: Optional[int]
+    mem_anon: int
+    mem_file: int
+    io_read: int
+    io_write: int
+    cpu_percent: float = 0.0
+    io_read_rate: float = 0.0
+    io_write_rate: float = 0.0
+
+
+@dataclass(frozen=True)
+class MemoryPolicy:
+    """
+    Memory rule for containers whose name contains pattern.
+
+    threshold is a fraction of host memory (for '20%') or bytes; when a
+    container exceeds it, memory and memory_swap are applied as its limits.
+    """
+    pattern: str
+    threshold: float
+    threshold_is_fraction: bool
+    memory: str
+    memory_swap: str
+
+    @classmethod
+    def parse(cls, spec: str) -> "MemoryPolicy":
+        """
+        Parse 'pattern:threshold:memory:memory_swap', e.g. 'clamd:20%:256m:384m'
+
+        Args:
+            spec (str): Policy from CONTAINER_MEMORY_POLICIES
+
+        Returns:
+            MemoryPolicy: Parsed policy
+        """
+        parts = spec.split(":")
+        if len(parts) != 4 or not parts[0]:
+            raise ValueError(f"Invalid container memory policy: {spec}")
+        pattern, threshold, memory, memory_swap = parts
+        parse_size(memory)
+        parse_size(memory_swap)
+        if threshold.endswith("%"):
+            return cls(pattern, float(threshold[:-1]) / 100.0, True, memory, memory_swap)
+        return cls(pattern, float(parse_size(threshold)), False, memory, memory_swap)
+
+    def exceeded(self, sample: ContainerSample, mem_total: int) -> bool:
+        limit = self.threshold * mem_total if self.threshold_is_fraction else self.threshold
+        return sample.mem_current > limit
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return None if value == "max" else int(value)
+
+
+def _read_keyed(path: str) -> Dict[str, int]:
+    """Read a flat 'key value' file such as cpu.stat or memory.stat."""
+    values = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1].isdigit():
+                    values[parts[0]] = int(parts[1])
+    except OSError:
+        pass
+    return values
+
+
+def read_io_stat(path: str) -> Tuple[int, int]:
+    """
+    Sum read and written bytes over all devices of an io.stat file
+
+    Args:
+        path (str): Path to io.stat
+
+    Returns:
+        Tuple[int, int]: (read bytes, written bytes)
+    """
+    rbytes = wbytes = 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                for field in line.split()[1:]:
+                    key, _, value = field.partition("=")
+                    if key == "rbytes":
+                        rbytes += int(value)
+                    elif key == "wbytes":
+                        wbytes += int(value)
+    except (OSError, ValueError):
+        pass
+    return rbytes, wbytes
+
+
+class ContainerCollector:
+    """
+    Collects ContainerSample for every container under a cgroup v2 root.
+
+    Both roots are parameters, so the collector runs against a fake tree.
+    """
+
+    def __init__(self, cgroup_root: str = CGROUP_ROOT, docker_root: str = DOCKER_ROOT):
+        self.cgroup_root = cgroup_root
+        self.docker_root = docker_root
+        self._names: Dict[str, str] = {}
+        self._previous: Dict[str, ContainerSample] = {}
+
+    def discover(self) -> Dict[str, str]:
+        """
+        Find container cgroup directories
+
+        Returns:
+            Dict[str, str]: Container id to cgroup directory
+        """
+        found = {}
+        base_depth = self.cgroup_root.rstrip(os.sep).count(os.sep)
+        for path, dirs, _files in os.walk(self.cgroup_root):
+            depth = path.count(os.sep) - base_depth
+            for name in dirs:
+                match = _CONTAINER_DIR_RE.match(name)
+                if match:
+                    found[match.group(1)] = os.path.join(path, name)
+            # Container cgroups are leaves of interest; do not descend into them
+            dirs[:] = [] if depth >= MAX_DISCOVERY_DEPTH else [d for d in dirs if not _CONTAINER_DIR_RE.match(d)]
+        return found
+
+    def container_name(self, container_id: str) -> str:
+        name = self._names.get(container_id)
+        if name is None:
+            name = container_id[:12]
+            try:
+                config_path = os.path.join(self.docker_root, "containers", container_id, "config.v2.json")
+                with open(config_path, "r", encoding="utf-8") as f:
+                    name = json.load(f).get("Name", name).lstrip("/") or name
+            except (OSError, ValueError):
+                pass
+            self._names[container_id] = name
+        return name
+
+    def read(self, container_id: str, cgroup: str, now: float) -> Optional[ContainerSample]:
+        mem_current = _read_int(os.path.join(cgroup, "memory.current"))
+        if mem_current is None:
+            return None
+        cpu = _read_keyed(os.path.join(cgroup, "cpu.stat"))
+        mem = _read_keyed(os.path.join(cgroup, "memory.stat"))
+        io_read, io_write = read_io_stat(os.path.join(cgroup, "io.stat"))
+        return ContainerSample(
+            container_id=container_id,
+            name=self.container_name(container_id),
+            cgroup=cgroup,
+            timestamp=now,
+            cpu_usec=cpu.get("usage_usec", 0),
+            mem_current=mem_current,
+            mem_limit=_read_int(os.path.join(cgroup, "memory.max")),
+            mem_anon=mem.get("anon", 0),
+            mem_file=mem.get("file", 0),
+            io_read=io_read,
+            io_write=io_write,
+        )
+
+    def collect(self, now: Optional[float] = None) -> List[ContainerSample]:
+        """
+        Read all containers and compute rates against the previous collection
+
+        Args:
+            now (float, optional): Timestamp, time.time() by default
+
+        Returns:
+            List[ContainerSample]: Samples, rates are zero on the first collection
+        """
+        now = time.time() if now is None else now
+        samples = []
+        current = {}
+        for container_id, cgroup in self.discover().items():
+            sample = self.read(container_id, cgroup, now)
+            if sample is None:
+                continue
+            prev = self._previous.get(container_id)
+            if prev is not None and now > prev.timestamp:
+                elapsed = now - prev.timestamp
+                sample.cpu_percent = max(sample.cpu_usec - prev.cpu_usec, 0) / (elapsed * 1e6) * 100.0
+                sample.io_read_rate = max(sample.io_read - prev.io_read, 0) / elapsed
+                sample.io_write_rate = max(sample.io_write - prev.io_write, 0) / elapsed
+            current[container_id] = sample
+            samples.append(sample)
+        self._previous = current
+        # Forget names of removed containers
+        self._names = {cid: name for cid, name in self._names.items() if cid in current}
+        return samples
+
+
+def parse_policies(specs: List[str]) -> List[MemoryPolicy]:
+    """
+    Parse CONTAINER_MEMORY_POLICIES, skipping invalid entries
+
+    Args:
+        specs (List[str]): Policy strings
+
+    Returns:
+        List[MemoryPolicy]: Valid policies
+    """
+    policies = []
+    for spec in specs:
+        try:
+            policies.append(MemoryPolicy.parse(spec))
+        except ValueError as e:
+            logging.warning("%s", e)
+    return policies
+
+
+def evaluate_policies(samples: List[ContainerSample], policies: List[MemoryPolicy],
+                      mem_total: int) -> List[Tuple[ContainerSample, MemoryPolicy]]:
+    """
+    Find containers exceeding their memory policy; the first matching policy wins
+
+    Args:
+        samples (List[ContainerSample]): Current container samples
+        policies (List[MemoryPolicy]): Configured policies
+        mem_total (int): Host memory in bytes
+
+    Returns:
+        List[Tuple[ContainerSample, MemoryPolicy]]: Containers to limit
+    """
+    actions = []
+    for sample in samples:
+        for policy in policies:
+            if policy.pattern in sample.name:
+                already_limited = sample.mem_limit is not None and sample.mem_limit <= parse_size(policy.memory)
+                if not already_limited and policy.exceeded(sample, mem_total):
+                    actions.append((sample, policy))
+                break
+    return actions
+
+
+def apply_memory_limit(name: str, memory: str, memory_swap: str) -> bool:
+    """
+    Apply memory limits to a running container, restarting it only if docker refuses
+
+    Args:
+        name (str): Container name
+        memory (str): --memory value
+        memory_swap (str): --memory-swap value
+
+    Returns:
+        bool: True if the limits are in place
+    """
+    cmd = ["docker", "update", f"--memory={memory}", f"--memory-swap={memory_swap}", name]
+    try:
+        if subprocess.run(cmd, capture_output=True, timeout=30, check=False).returncode == 0:
+            return True
+        logging.warning("docker update of %s failed, restarting the container", name)
+        stopped = subprocess.run(["docker", "stop", name], capture_output=True, timeout=120, check=False)
+        if stopped.returncode != 0:
+            logging.warning("docker stop %s exited with %d", name, stopped.returncode)
+        subprocess.run(cmd, capture_output=True, timeout=30, check=False)
+        started = subprocess.run(["docker", "start", name], capture_output=True, timeout=120, check=False)
+        if started.returncode != 0:
+            logging.error("docker start %s exited with %d", name, started.returncode)
+        return started.returncode == 0
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.error("Cannot limit container %s: %s", name, e)
+        return False
+
+
+def read_mem_total(proc_root: str = "/proc") -> int:
+    with open(os.path.join(proc_root, "meminfo"), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def format_top(samples: List[ContainerSample], limit: int = 10) -> List[str]:
+    """
+    Format a per-container top sorted by CPU, then memory
+
+    Args:
+        samples (List[ContainerSample]): Container samples
+        limit (int): Number of rows
+
+    Returns:
+        List[str]: Table lines
+    """
+    rows = sorted(samples, key=lambda s: (s.cpu_percent, s.mem_current), reverse=True)[:limit]
+    lines = [f"{'CPU%':>6} {'MEM':>7} {'LIMIT':>7} {'IO R/s':>7} {'IO W/s':>7}  NAME"]
+    for s in rows:
+        limit_text = format_size(s.mem_limit) if s.mem_limit else "-"
+        lines.append(f"{s.cpu_percent:>6.1f} {format_size(s.mem_current):>7} {limit_text:>7} "
+                     f"{format_size(s.io_read_rate):>7} {format_size(s.io_write_rate):>7}  {s.name}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Container stats from cgroupfs")
+    parser.add_argument("command", choices=("top", "enforce", "night-stop"))
+    parser.add_argument("--cgroup-root", default=None)
+    parser.add_argument("--docker-root", default=DOCKER_ROOT)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between the two reads of 'top'")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be done")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    cfg = load_server_config()
+    collector = ContainerCollector(args.cgroup_root or cfg.cgroup_root, args.docker_root)
+    if args.command == "top":
+        collector.collect()
+        time.sleep(args.interval)
+        print("\n".join(format_top(collector.collect(), limit=50)))
+        return 0
+
+    samples = collector.collect()
+    failed = False
+    if args.command == "night-stop":
+        for sample in samples:
+            if any(pattern in sample.name for pattern in cfg.container_night_stop):
+                logging.info("Night mode: stopping container %s", sample.name)
+                if not args.dry_run:
+                    stopped = subprocess.run(["docker", "stop", sample.name], capture_output=True, timeout=120,
+                                             check=False)
+                    if stopped.returncode != 0:
+                        logging.error("docker stop %s exited with %d", sample.name, stopped.returncode)
+                        failed = True
+        return 1 if failed else 0
+
+    for sample, policy in evaluate_policies(samples, parse_policies(cfg.container_memory_policies),
+                                            read_mem_total()):
+        logging.info("Container %s uses %d MB, applying memory=%s memory-swap=%s",
+                     sample.name, sample.mem_current // (1024 * 1024), policy.memory, policy.memory_swap)
+        if not args.dry_run and not apply_memory_limit(sample.name, policy.memory, policy.memory_swap):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -89,16 +89,75 @@ MEM_LIMIT_NORMAL=1024    # Обычное ограничение памяти
 MEM_LIMIT_STRICT=512     # Строгое ограничение памяти
 MEM_LIMIT_CRITICAL=256   # Критическое ограничение памяти
 
+# Политики памяти контейнеров: "часть_имени:порог:лимит:лимит_со_swap"
+# Порог - доля памяти сервера (20%) или размер (2G); при превышении контейнеру
+# выставляются лимиты через docker update без остановки
+CONTAINER_MEMORY_POLICIES=(
+  "clamd:20%:256m:384m"
+)
+# Контейнеры, которые останавливаются в ночное время (по части имени)
+CONTAINER_NIGHT_STOP=(
+  "clamd"
+)
+CGROUP_ROOT="/sys/fs/cgroup"    # Корень cgroup v2 для статистики контейнеров
+
+# Освобождение памяти по PSI (/proc/pressure) вместо сброса всего кэша
+PSI_MEMORY_THRESHOLD=10       # Доля времени ожидания памяти (some avg10, %), при которой нужна очистка
+RECLAIM_TARGET=512M           # Сколько памяти освобождать через memory.reclaim за один запуск
+
+# Оповещения о необычной для этого хоста нагрузке (базовая линия по часам суток)
+ANOMALY_Z_THRESHOLD=4         # Во сколько стандартных отклонений выше обычного значения считается аномалией
+ANOMALY_COOLDOWN=1800         # Минимальный интервал между оповещениями по одной метрике (секунды)
+
+# Предупреждения о процессах, память которых растет (утечки)
+MEMORY_TREND_HORIZON=24       # За сколько часов до исчерпания лимита памяти предупреждать
+MEMORY_TREND_MIN_GROWTH=10M   # Минимальный рост памяти в час, о котором стоит предупреждать
+
+# Кнопки, нажатые пока бот не работал
+STALE_ACTION_AGE=300          # Старше скольких секунд оптимизация, ночной режим и очистка не выполняются после перезапуска
+
+# Сторожевой таймер бота
+WATCHDOG_THRESHOLD=30         # Через сколько секунд без ответа диспетчера или очереди задач оповещать о зависании
+WATCHDOG_KILL_AFTER=300       # При зависании завершать команды, которых ждут обработчики бота, старше стольких секунд (0 - не завершать)
+
 # Настройки ночного режима
 NIGHT_START=22            # Начало ночного времени (час)
 NIGHT_END=7               # Конец ночного времени (час)
 NIGHT_CPU_LIMIT=10        # Ночное ограничение CPU
 NIGHT_MEM_LIMIT=256     # Ночное ограничение памяти
 
+# Профили ресурсов, которые бот включает по расписанию.
+# Записи профиля: "nice:процесс=N", "cpu:процесс=процент", "memory:контейнер=256M", "freeze:контейнер=1".
+# При смене профиля применяется только разница, отсутствующие в новом профиле настройки отменяются.
+# Пустой PROFILE_SCHEDULE означает "${NIGHT_START}:00=night" и "${NIGHT_END}:00=day";
+# пустой PROFILE_NIGHT - ограничение LIMIT_PROCESSES до NIGHT_CPU_LIMIT и заморозку CONTAINER_NIGHT_STOP
+PROFILE_SCHEDULE=(
+)
+PROFILE_DAY=(
+)
+PROFILE_NIGHT=(
+)
+
 # Настройки автоматической очистки
 CLEANUP_SCHEDULE="0 */4 * * *"  # Каждые 4 часа
 MAX_LOG_SIZE=100M              # Максимальный размер лог-файлов
 MAX_HISTORY_DAYS=7            # Хранить историю 7 дней
+LOG_ROTATE_COMPRESSION="gzip"  # Сжатие архивов логов: gzip, zstd (нужен модуль zstandard) или none
+LOG_ROTATE_KEEP=5             # Сколько архивов хранить для каждого лога
+DISK_SCAN_ROOTS=(             # Каталоги для поиска больших логов и анализа занятого места
+  "/home"
+)
+
+# Настройки сбора метрик
+SAMPLER_INTERVAL=10            # Интервал опроса /proc ботом (сек)
+METRICS_PORT=0                 # Порт эндпоинта /metrics для Prometheus (0 - выключен)
+METRICS_BIND="127.0.0.1"       # Адрес, на котором слушает эндпоинт /metrics
+
+# Мониторинг нескольких серверов (агенты запускаются как: python3 fleet.py agent --central HOST:PORT)
+FLEET_PORT=0                   # Порт для подключения агентов (0 - выключен)
+FLEET_BIND="127.0.0.1"         # Адрес, на котором бот принимает агентов; 0.0.0.0 - с других серверов, только с FLEET_TOKEN
+FLEET_QUERY_TIMEOUT=2          # Сколько секунд ждать ответа всех агентов при запросе статуса
+# FLEET_TOKEN лучше задавать через переменную окружения, как и TELEGRAM_BOT_TOKEN
 
 # Стандартный ответ неавторизованным пользователям
 UNAUTHORIZED_RESPONSE="Sorry, I'm not a real bot, they just made me for backward compatibility. I can't really answer any questions."
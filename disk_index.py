@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Incremental index of large files and disk consumers.
+
+Directories are listed with os.scandir and cached with their mtime; on the
+next run a directory whose mtime did not change is not listed again; only
+the tracked files in it (e.g. *.log) are re-stat'ed, because a growing file
+does not change its directory's mtime. Other files that grow in place are
+caught up by listing every directory again once its listing is older than
+max_age. Independent subtrees are walked in parallel threads.
+"""
+import os
+import sys
+import json
+import stat
+import time
+import fnmatch
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from server_config import parse_size
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Persisted per-directory cache
+CACHE_FILE = os.path.join(BASE_DIR, "disk_index_cache.json")
+# Files whose sizes are tracked individually
+DEFAULT_PATTERNS = ("*.log",)
+DEFAULT_WORKERS = 4
+# Seconds after which a directory is listed again even if its mtime did not change
+DEFAULT_MAX_AGE = 6 * 3600
+CACHE_VERSION = 1
+
+
+def format_size(size: float) -> str:
+    """
+    Format a byte count for humans
+
+    Args:
+        size (float): Size in bytes
+
+    Returns:
+        str: Size such as '1.5G'
+    """
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024.0
+    return f"{size:.1f}T"
+
+
+class DiskIndex:
+    """
+    Mtime-cached directory index over one or more roots.
+
+    Each cache entry holds a directory's mtime, its subdirectories, the
+    total size of the files directly inside it, the sizes of files
+    matching the tracked patterns and the time it was listed.
+    """
+
+    def __init__(self, roots: Iterable[str], cache_file: str = CACHE_FILE,
+                 patterns: Iterable[str] = DEFAULT_PATTERNS, workers: int = DEFAULT_WORKERS,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.cache_file = cache_file
+        self.patterns = tuple(patterns)
+        self.workers = workers
+        self.max_age = max_age
+        self.entries: Dict[str, dict] = {}
+        self.stats = {"listed": 0, "reused": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION and tuple(data.get("patterns", ())) == self.patterns:
+                self.entries = data.get("dirs", {})
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning("Disk index cache %s ignored: %s", self.cache_file, e)
+
+    def save(self):
+        tmp_path = None
+        try:
+            # A unique temporary file per save: indexes in several threads may save at once
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.cache_file) + ".",
+                                            suffix=".tmp", dir=os.path.dirname(self.cache_file))
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "patterns": list(self.patterns),
+                           "dirs": self.entries}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logging.error("Cannot save disk index cache %s: %s", self.cache_file, e)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _tracked(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _index_dir(self, path: str, cached: Optional[dict], stats: Dict[str, int]) -> Optional[dict]:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        now = time.time()
+        if cached is not None and cached.get("mtime") == mtime and now - cached.get("listed", 0) < self.max_age:
+            # Unchanged listing: only refresh the sizes of tracked files
+            files = {}
+            for name in cached.get("files", {}):
+                try:
+                    files[name] = os.stat(os.path.join(path, name)).st_size
+                except OSError:
+                    continue
+            stats["reused"] += 1
+            delta = sum(files.values()) - sum(cached.get("files", {}).values())
+            return {"mtime": mtime, "subdirs": cached.get("subdirs", []),
+                    "bytes": max(cached.get("bytes", 0) + delta, 0), "files": files, "listed": cached["listed"]}
+
+        subdirs, files, total = [], {}, 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        subdirs.append(entry.name)
+                    elif stat.S_ISREG(st.st_mode):
+                        total += st.st_size
+                        if self._tracked(entry.name):
+                            files[entry.name] = st.st_size
+        except OSError as e:
+            logging.debug("Cannot list %s: %s", path, e)
+        stats["listed"] += 1
+        return {"mtime": mtime, "subdirs": subdirs, "bytes": total, "files": files, "listed": now}
+
+    def _walk(self, top: str, dev: int) -> Tuple[Dict[str, dict], Dict[str, int]]:
+        result: Dict[str, dict] = {}
+        stats = {"listed": 0, "reused": 0}
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            entry = self._index_dir(path, self.entries.get(path), stats)
+            if entry is None:
+                continue
+            result[path] = entry
+            for name in entry["subdirs"]:
+                child = os.path.join(path, name)
+                try:
+                    # Stay on the root's filesystem like `find -xdev`
+                    if os.lstat(child).st_dev != dev:
+                        continue
+                except OSError:
+                    continue
+                stack.append(child)
+        return result, stats
+
+    def scan(self) -> "DiskIndex":
+        """
+        Refresh the index and persist the cache
+
+        Returns:
+            DiskIndex: self, for chaining
+        """
+        new_entries: Dict[str, dict] = {}
+        stats = {"listed": 0, "reused": 0}
+        tasks = []
+        for root in self.roots:
+            try:
+                dev = os.lstat(root).st_dev
+            except OSError as e:
+                logging.warning("Disk index root %s skipped: %s", root, e)
+                continue
+            entry = self._index_dir(root, self.entries.get(root), stats)
+            if entry is None:
+                continue
+            new_entries[root] = entry
+            # Every top-level subtree is an independent task
+            tasks += [(os.path.join(root, name), dev) for name in entry["subdirs"]]
+
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            for subtree, subtree_stats in pool.map(lambda task: self._walk(*task), tasks):
+                new_entries.update(subtree)
+                for key, value in subtree_stats.items():
+                    stats[key] += value
+
+        self.entries = new_entries
+        self.stats = stats
+        self.save()
+        return self
+
+    def large_files(self, min_size: int) -> List[Tuple[str, int]]:
+        """
+        Get tracked files larger than min_size bytes
+
+        Args:
+            min_size (int): Size threshold in bytes
+
+        Returns:
+            List[Tuple[str, int]]: (path, size), largest first
+        """
+        found = [
+            (os.path.join(path, name), size)
+            for path, entry in self.entries.items()
+            for name, size in entry.get("files", {}).items()
+            if size > min_size
+        ]
+        return sorted(found, key=lambda item: item[1], reverse=True)
+
+    def directory_totals(self) -> Dict[str, int]:
+        """
+        Get the recursive size of every indexed directory
+
+        Returns:
+            Dict[str, int]: Directory path to bytes
+        """
+        totals = {path: entry.get("bytes", 0) for path, entry in self.entries.items()}
+        # Deepest directories first, so children are complete before parents
+        for path in sorted(totals, key=lambda p: p.count(os.sep), reverse=True):
+            parent = os.path.dirname(path)
+            if parent != path and parent in totals and path not in self.roots:
+                totals[parent] += totals[path]
+        return totals
+
+    def top_consumers(self, limit: int = 10, max_depth: int = 2) -> List[Tuple[str, int]]:
+        """
+        Get the largest directories up to max_depth levels below the roots
+
+        Args:
+            limit (int): Number of directories to return
+            max_depth (int): Deepest level considered, 1 is a root's children
+
+        Returns:
+            List[Tuple[str, int]]: (path, bytes), largest first
+        """
+        totals = self.directory_totals()
+        candidates = []
+        for path, size in totals.items():
+            for root in self.roots:
+                rel = os.path.relpath(path, root)
+                if not rel.startswith(".."):
+                    depth = 0 if rel == "." else rel.count(os.sep) + 1
+                    if 1 <= depth <= max_depth:
+                        candidates.append((path, size))
+                    break
+        return sorted(candidates, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Incremental large-file and disk usage index")
+    parser.add_argument("--root", action="append", required=True, help="directory to index, repeatable")
+    parser.add_argument("--pattern", action="append", help="tracked file pattern (default: *.log)")
+    parser.add_argument("--min-size", default=None, help="print tracked files larger than this, e.g. 100M")
+    parser.add_argument("--top", type=int, default=0, help="print the N largest directories")
+    parser.add_argument("--cache", default=CACHE_FILE, help="cache file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    index = DiskIndex(args.root, cache_file=args.cache,
+                      patterns=args.pattern or DEFAULT_PATTERNS, workers=args.workers).scan()
+    if args.min_size is not None:
+        for path, _size in index.large_files(parse_size(args.min_size)):
+            print(path)
+    for path, size in index.top_consumers(args.top) if args.top else []:
+        print(f"{format_size(size)}\t{path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+"""
+Multi-node monitoring for Server Control Suite.
+
+In agent mode this module samples the local host and pushes compact
+snapshots over TCP to a central bot instance. The central side keeps a
+ring buffer per host and answers fleet-wide status queries by asking all
+connected agents at once with a shared deadline, so the wait is bounded
+by the timeout rather than by the number of hosts.
+
+Frames are a 5-byte header (payload length, codec) followed by a msgpack
+payload when msgpack is installed, or compact JSON otherwise.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import select
+import struct
+import logging
+import argparse
+import ipaddress
+import threading
+import socketserver
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+from system_sampler import Sample, Sampler
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 9185
+# Snapshots kept per host on the central side
+DEFAULT_RING_SIZE = 360
+# Seconds a status query waits for all agents together
+DEFAULT_QUERY_TIMEOUT = 2.0
+# Seconds a query may take to send to one agent; a query frame fits any window an agent still reads
+QUERY_SEND_TIMEOUT = 0.1
+# Processes per top list included in a snapshot
+SNAPSHOT_TOP_N = 5
+MAX_FRAME_SIZE = 1024 * 1024
+# Idle seconds before the agent probes the connection, and unacknowledged
+# seconds after which a half-open connection is dropped
+KEEPALIVE_IDLE = 30
+SEND_TIMEOUT = 30
+
+CODEC_JSON = 1
+CODEC_MSGPACK = 2
+_HEADER = struct.Struct("!IB")
+
+
+class ProtocolError(Exception):
+    """Raised on malformed frames or a failed handshake."""
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    """
+    Encode a message into a length-prefixed frame
+
+    Args:
+        message (Dict[str, Any]): Message with a 'type' key
+
+    Returns:
+        bytes: Frame ready to send
+    """
+    if MSGPACK_AVAILABLE:
+        codec, payload = CODEC_MSGPACK, msgpack.packb(message, use_bin_type=True)
+    else:
+        codec, payload = CODEC_JSON, json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(payload), codec) + payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(sock: socket.socket) -> Dict[str, Any]:
+    """
+    Read one frame from a socket
+
+    Args:
+        sock (socket.socket): Connected socket
+
+    Returns:
+        Dict[str, Any]: Decoded message
+    """
+    size, codec = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        raise ProtocolError(f"frame too large: {size} bytes")
+    payload = _recv_exact(sock, size)
+    if codec == CODEC_JSON:
+        message = json.loads(payload.decode("utf-8"))
+    elif codec == CODEC_MSGPACK and MSGPACK_AVAILABLE:
+        message = msgpack.unpackb(payload, raw=False)
+    else:
+        raise ProtocolError(f"unsupported codec {codec}")
+    if not isinstance(message, dict) or "type" not in message:
+        raise ProtocolError("message without type")
+    return message
+
+
+def sample_to_snapshot(sample: Sample, host: str) -> Dict[str, Any]:
+    """
+    Convert a sample to the compact wire representation
+
+    Args:
+        sample (Sample): Local sample
+        host (str): Host name reported to the central instance
+
+    Returns:
+        Dict[str, Any]: Snapshot
+    """
+    return {
+        "host": host,
+        "ts": round(sample.timestamp, 3),
+        "load": list(sample.load),
+        "cpu": sample.cpu_percent,
+        "ncpu": sample.cpu_count,
+        "mem": [sample.mem_total, sample.mem_available],
+        "swap": [sample.swap_total, sample.swap_free],
+        "disk": {mount: list(usage) for mount, usage in sample.disks.items()},
+        "procs": sample.processes_total,
+        "top": [[p.pid, p.name, p.cpu_percent, p.rss_bytes] for p in sample.top_cpu[:SNAPSHOT_TOP_N]],
+    }
+
+
+def format_snapshot_line(snapshot: Dict[str, Any]) -> str:
+    """
+    Render a snapshot as one status line
+
+    Args:
+        snapshot (Dict[str, Any]): Snapshot
+
+    Returns:
+        str: Short human-readable summary
+    """
+    mem_total, mem_available = snapshot.get("mem", [0, 0])
+    mem_percent = (mem_total - mem_available) * 100.0 / mem_total if mem_total else 0.0
+    total, used = snapshot.get("disk", {}).get("/", [0, 0])
+    disk_percent = used * 100.0 / total if total else 0.0
+    load = snapshot.get("load", [0.0])[0]
+    return (f"load {load:.2f} | CPU {snapshot.get('cpu', 0.0):.0f}% | "
+            f"RAM {mem_percent:.0f}% | / {disk_percent:.0f}%")
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Check whether a bind address only accepts local connections
+
+    Args:
+        host (str): Address or host name
+
+    Returns:
+        bool: True for loopback addresses and 'localhost'
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def set_keepalive(sock: socket.socket, idle: int = KEEPALIVE_IDLE, send_timeout: int = SEND_TIMEOUT):
+    """
+    Make a dead peer surface as an error on a socket that may sit idle in recv
+
+    TCP keepalive probes an idle connection, and TCP_USER_TIMEOUT fails
+    sends that stay unacknowledged, so neither a blocked read nor a push
+    into a half-open connection waits forever. Options missing on the
+    platform are skipped.
+
+    Args:
+        sock (socket.socket): Connected socket
+        idle (int): Idle seconds before the first probe
+        send_timeout (int): Seconds sent data may stay unacknowledged
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", max(idle // 3, 1)), ("TCP_KEEPCNT", 3),
+                        ("TCP_USER_TIMEOUT", send_timeout * 1000)):
+        option = getattr(socket, name, None)
+        if option is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+            except OSError:
+                pass
+
+
+def send_before(sock: socket.socket, data: bytes, deadline: float):
+    """
+    Send a frame without blocking past a deadline
+
+    The socket keeps its own timeout for the reader thread; writability is
+    waited for with select and each send takes only what fits. A frame cut
+    off by the deadline would corrupt the stream, so the connection is
+    shut down and the agent reconnects.
+
+    Args:
+        sock (socket.socket): Connected socket
+        data (bytes): Frame to send
+        deadline (float): time.monotonic() by which the frame must be sent
+
+    Raises:
+        socket.timeout: If the frame was not sent by the deadline
+        OSError: If sending failed
+    """
+    view = memoryview(data)
+    while view:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([], [sock], [], remaining)[1]:
+            if len(view) < len(data):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            raise socket.timeout("send timed out")
+        view = view[sock.send(view, socket.MSG_DONTWAIT):]
+
+
+class HostState:
+    """Central-side state of one agent."""
+
+    def __init__(self, host: str, ring_size: int):
+        self.host = host
+        self.snapshots = deque(maxlen=ring_size)
+        self.last_seen = 0.0
+        self.connected = False
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, List[Any]] = {}
+        self._pending_lock = threading.Lock()
+
+    def attach(self, sock: socket.socket):
+        self._sock = sock
+        self.connected = True
+
+    def detach(self, sock: socket.socket):
+        if self._sock is not sock:
+            # The agent already reconnected on a new socket
+            return
+        self._sock = None
+        self.connected = False
+        with self._pending_lock:
+            for waiter in self._pending.values():
+                waiter[0].set()
+
+    def add_snapshot(self, snapshot: Dict[str, Any]):
+        self.snapshots.append(snapshot)
+        self.last_seen = time.time()
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self.snapshots[-1] if self.snapshots else None
+
+    def send_query(self, query_id: int, deadline: float) -> Optional[threading.Event]:
+        """
+        Ask the agent for a fresh snapshot without waiting for the reply
+
+        Args:
+            query_id (int): Identifier echoed back by the agent
+            deadline (float): time.monotonic() after which sending is given up
+
+        Returns:
+            Optional[threading.Event]: Set when the reply arrives, None if offline
+        """
+        sock = self._sock
+        if sock is None:
+            return None
+        event = threading.Event()
+        with self._pending_lock:
+            self._pending[query_id] = [event, None]
+        sent = False
+        # A previous query may still be stuck on the same agent
+        if self._send_lock.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            try:
+                send_before(sock, encode_frame({"type": "query", "id": query_id}), deadline)
+                sent = True
+            except OSError as e:
+                logging.warning("Fleet query to %s failed: %s", self.host, e)
+            finally:
+                self._send_lock.release()
+        if not sent:
+            with self._pending_lock:
+                self._pending.pop(query_id, None)
+            return None
+        return event
+
+    def resolve(self, query_id: int, snapshot: Dict[str, Any]):
+        with self._pending_lock:
+            waiter = self._pending.get(query_id)
+            if waiter is not None:
+                waiter[1] = snapshot
+                waiter[0].set()
+
+    def take_reply(self, query_id: int) -> Optional[Dict[str, Any]]:
+        with self._pending_lock:
+            waiter = self._pending.pop(query_id, None)
+        return waiter[1] if waiter else None
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    # Many agents reconnect at once after a central restart
+    request_queue_size = 128
+
+
+class FleetServer:
+    """
+    Central endpoint agents connect to.
+
+    Every agent connection is served by its own thread that stores pushed
+    snapshots and resolves query replies.
+    """
+
+    def __init__(self, port: int = DEFAULT_PORT, bind: str = "127.0.0.1", token: str = "",
+                 ring_size: int = DEFAULT_RING_SIZE):
+        self.address = (bind, port)
+        self.token = token
+        self.ring_size = ring_size
+        self.hosts: Dict[str, HostState] = {}
+        self._hosts_lock = threading.Lock()
+        self._query_id = 0
+        self._server: Optional[_TCPServer] = None
+
+    def _host_state(self, host: str) -> HostState:
+        with self._hosts_lock:
+            state = self.hosts.get(host)
+            if state is None:
+                state = self.hosts[host] = HostState(host, self.ring_size)
+            return state
+
+    def _handle(self, sock: socket.socket, peer: Tuple[str, int]):
+        sock.settimeout(30)
+        try:
+            hello = read_frame(sock)
+            if hello.get("type") != "hello" or not hello.get("host"):
+                raise ProtocolError("expected hello")
+            if self.token and not hmac.compare_digest(str(hello.get("token", "")), self.token):
+                raise ProtocolError("invalid token")
+            interval = float(hello.get("interval", 10))
+        except (OSError, TypeError, ValueError, ProtocolError, struct.error) as e:
+            logging.warning("Fleet handshake from %s rejected: %s", peer[0], e)
+            return
+        state = self._host_state(str(hello["host"]))
+        state.attach(sock)
+        # Agents push at least once per interval; silence means a dead peer
+        sock.settimeout(max(interval * 3, 30))
+        logging.info("Fleet agent %s connected from %s", state.host, peer[0])
+        try:
+            while True:
+                message = read_frame(sock)
+                kind = message.get("type")
+                if kind == "snapshot":
+                    state.add_snapshot(message["snapshot"])
+                elif kind == "reply":
+                    state.add_snapshot(message["snapshot"])
+                    state.resolve(int(message.get("id", -1)), message["snapshot"])
+        except (OSError, ValueError, KeyError, ProtocolError, struct.error) as e:
+            logging.info("Fleet agent %s disconnected: %s", state.host, e)
+        finally:
+            state.detach(sock)
+
+    def start(self):
+        """
+        Start listening
+
+        Raises:
+            ValueError: If the address accepts remote agents but no token is set
+            OSError: If the address cannot be bound
+        """
+        if not self.token and not is_loopback(self.address[0]):
+            raise ValueError(f"refusing to accept agents on {self.address[0]} without a token")
+        server_ref = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server_ref._handle(self.request, self.client_address)  # pylint: disable=protected-access
+
+        self._server = _TCPServer(self.address, Handler)
+        self.address = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, name="fleet-server", daemon=True).start()
+        logging.info("Fleet server listening on %s:%s", *self.address)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def query_all(self, timeout: float = DEFAULT_QUERY_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+        """
+        Ask every agent for a fresh snapshot concurrently
+
+        The shared deadline starts before the queries are sent and bounds
+        both sending and waiting, so the call takes at most `timeout`
+        however many hosts are connected. Each send is further limited to
+        QUERY_SEND_TIMEOUT, so an agent that stopped reading costs the
+        others no more than that. Hosts that do not answer in time fall back to
+        their last pushed snapshot.
+
+        Args:
+            timeout (float): Seconds to wait for all replies
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Host name to
+                {'status': 'ok'|'stale'|'offline', 'snapshot': dict or None, 'age': seconds}
+        """
+        with self._hosts_lock:
+            states = list(self.hosts.values())
+            base_id = self._query_id
+            self._query_id += len(states)
+        deadline = time.monotonic() + timeout
+        waiting = []
+        for offset, state in enumerate(states):
+            event = state.send_query(base_id + offset, min(deadline, time.monotonic() + QUERY_SEND_TIMEOUT))
+            waiting.append((state, base_id + offset, event))
+
+        result = {}
+        now = time.time()
+        for state, query_id, event in waiting:
+            snapshot = None
+            if event is not None and event.wait(max(deadline - time.monotonic(), 0)):
+                snapshot = state.take_reply(query_id)
+            else:
+                state.take_reply(query_id)
+            if snapshot is not None:
+                result[state.host] = {"status": "ok", "snapshot": snapshot, "age": 0.0}
+            else:
+                latest = state.latest()
+                result[state.host] = {
+                    "status": "stale" if state.connected else "offline",
+                    "snapshot": latest,
+                    "age": now - state.last_seen if state.last_seen else None,
+                }
+        return result
+
+    def history(self, host: str) -> List[Dict[str, Any]]:
+        with self._hosts_lock:
+            state = self.hosts.get(host)
+        return list(state.snapshots) if state else []
+
+
+class FleetAgent:
+    """Samples the local host and pushes snapshots to the central instance."""
+
+    def __init__(self, central: Tuple[str, int], host: Optional[str] = None, token: str = "",
+                 interval: float = 10, sampler: Optional[Sampler] = None):
+        self.central = central
+        self.host = host or socket.gethostname()
+        self.token = token
+        self.interval = interval
+        self.sampler = sampler or Sampler(interval=interval)
+        self.sampler.add_listener(self._on_sample)
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _send(self, message: Dict[str, Any]):
+        sock = self._sock
+        if sock is None:
+            return
+        try:
+            with self._send_lock:
+                sock.sendall(encode_frame(message))
+        except OSError as e:
+            logging.warning("Fleet push failed, reconnecting: %s", e)
+            # Wakes up the reader in run(), which then reconnects
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _on_sample(self, sample: Sample, _processes):
+        self._send({"type": "snapshot", "snapshot": sample_to_snapshot(sample, self.host)})
+
+    def _serve(self, sock: socket.socket):
+        self._send({"type": "hello", "host": self.host, "token": self.token,
+                    "version": PROTOCOL_VERSION, "interval": self.interval})
+        latest = self.sampler.buffer.latest()
+        if latest is not None:
+            self._on_sample(latest, None)
+        while not self._stop.is_set():
+            message = read_frame(sock)
+            if message.get("type") == "query":
+                latest = self.sampler.buffer.latest()
+                if latest is not None:
+                    self._send({"type": "reply", "id": message.get("id"),
+                                "snapshot": sample_to_snapshot(latest, self.host)})
+
+    def run(self):
+        """Connect, push and reconnect with backoff until stopped."""
+        self.sampler.start()
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                sock = socket.create_connection(self.central, timeout=10)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                # Reads block until a query arrives; keepalive bounds the wait on a dead central
+                sock.settimeout(None)
+                set_keepalive(sock)
+                logging.info("Connected to fleet server %s:%s as %s", *self.central, self.host)
+                backoff = 1.0
+                self._sock = sock
+                self._serve(sock)
+            except (OSError, ValueError, ProtocolError, struct.error) as e:
+                logging.warning("Fleet connection to %s:%s lost: %s", *self.central, e)
+            finally:
+                sock_ref, self._sock = self._sock, None
+                if sock_ref is not None:
+                    sock_ref.close()
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def stop(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.sampler.stop()
+
+
+def parse_address(value: str, default_host: str = "0.0.0.0") -> Tuple[str, int]:
+    """
+    Parse 'host:port' or a bare port
+
+    Args:
+        value (str): Address string
+        default_host (str): Host used when only a port is given
+
+    Returns:
+        Tuple[str, int]: (host, port)
+    """
+    host, _, port = str(value).rpartition(":")
+    return (host or default_host), int(port)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Server Control Suite fleet agent")
+    parser.add_argument("mode", choices=["agent"], help="run as an agent pushing to a central bot")
+    parser.add_argument("--central", required=True, help="central bot address, host:port")
+    parser.add_argument("--host", default=None, help="name reported for this host (default: hostname)")
+    parser.add_argument("--token", default=os.environ.get("FLEET_TOKEN", ""),
+                        help="shared token, defaults to $FLEET_TOKEN")
+    parser.add_argument("--interval", type=float, default=10, help="sampling interval in seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    agent = FleetAgent(parse_address(args.central, "127.0.0.1"), host=args.host,
+                       token=args.token, interval=args.interval)
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
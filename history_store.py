@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Persistent metric history.
+
+Each metric is a time series kept in two array('d') columns in memory and
+mirrored to an append-only file of (timestamp, value) float64 pairs under
+history/. Windows are cut with a binary search on the timestamps, so a
+query costs the size of the window, not of the history. Points older than
+the retention are dropped when the series outgrows it by a margin, and the
+file is rewritten at the same time.
+"""
+import os
+import time
+import struct
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from system_sampler import Sample
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_DIR = os.path.join(BASE_DIR, "history")
+DEFAULT_RETENTION = 7 * 24 * 3600
+# Share of the retention by which a series may grow before it is compacted
+COMPACT_MARGIN = 0.1
+# Appends buffered before the files are flushed
+FLUSH_EVERY = 6
+_RECORD = struct.Struct("<dd")
+
+
+class Series:
+    """One metric: parallel timestamp and value columns."""
+
+    def __init__(self):
+        self.ts = array("d")
+        self.values = array("d")
+
+    def window(self, start: float, end: Optional[float] = None) -> Tuple[array, array]:
+        """
+        Get the points with start <= timestamp <= end
+
+        Args:
+            start (float): Window start
+            end (float, optional): Window end, the last point by default
+
+        Returns:
+            Tuple[array, array]: (timestamps, values) copies
+        """
+        lo = bisect_left(self.ts, start)
+        hi = len(self.ts) if end is None else bisect_left(self.ts, end + 1e-9)
+        return self.ts[lo:hi], self.values[lo:hi]
+
+
+class HistoryStore:
+    """
+    Named metric series with file persistence.
+
+    append() is called from the sampler thread and queries from bot
+    handlers, so all access goes through one lock.
+    """
+
+    def __init__(self, directory: str = HISTORY_DIR, retention: float = DEFAULT_RETENTION):
+        self.directory = directory
+        self.retention = retention
+        self.series: Dict[str, Series] = {}
+        self._files: Dict[str, object] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _load(self):
+        try:
+            names = [n[:-4] for n in os.listdir(self.directory) if n.endswith(".bin")]
+        except FileNotFoundError:
+            return
+        cutoff = time.time() - self.retention
+        for name in names:
+            series = Series()
+            try:
+                with open(self._path(name), "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                logging.warning("History of %s not loaded: %s", name, e)
+                continue
+            # A torn last record from a crash is ignored
+            usable = len(data) - len(data) % _RECORD.size
+            for ts, value in _RECORD.iter_unpack(data[:usable]):
+                if ts >= cutoff:
+                    series.ts.append(ts)
+                    series.values.append(value)
+            self.series[name] = series
+
+    def _file(self, name: str):
+        f = self._files.get(name)
+        if f is None:
+            os.makedirs(self.directory, exist_ok=True)
+            f = self._files[name] = open(self._path(name), "ab")
+        return f
+
+    def _compact(self, name: str, series: Series, now: float):
+        cutoff = bisect_left(series.ts, now - self.retention)
+        del series.ts[:cutoff]
+        del series.values[:cutoff]
+        f = self._files.pop(name, None)
+        if f is not None:
+            f.close()
+        tmp_path = f"{self._path(name)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(_RECORD.pack(t, v) for t, v in zip(series.ts, series.values)))
+        os.replace(tmp_path, self._path(name))
+
+    def append(self, timestamp: float, values: Dict[str, float]):
+        """
+        Add one point to several series
+
+        Args:
+            timestamp (float): Time of the values
+            values (Dict[str, float]): Metric name to value
+        """
+        with self._lock:
+            for name, value in values.items():
+                series = self.series.get(name)
+                if series is None:
+                    series = self.series[name] = Series()
+                if series.ts and timestamp <= series.ts[-1]:
+                    continue
+                series.ts.append(timestamp)
+                series.values.append(float(value))
+                try:
+                    if timestamp - series.ts[0] > self.retention * (1 + COMPACT_MARGIN):
+                        self._compact(name, series, timestamp)
+                    else:
+                        self._file(name).write(_RECORD.pack(timestamp, value))
+                except OSError as e:
+                    logging.error("Cannot persist history of %s: %s", name, e)
+            self._pending += 1
+            if self._pending >= FLUSH_EVERY:
+                self._flush()
+
+    def _flush(self):
+        self._pending = 0
+        for f in self._files.values():
+            try:
+                f.flush()
+            except OSError as e:
+                logging.error("Cannot flush history: %s", e)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def window(self, name: str, seconds: float, end: Optional[float] = None) -> Tuple[array, array]:
+        """
+        Get the last seconds of a series
+
+        Args:
+            name (str): Metric name
+            seconds (float): Window length
+            end (float, optional): Window end, now by default
+
+        Returns:
+            Tuple[array, array]: (timestamps, values), empty if unknown
+        """
+        end = time.time() if end is None else end
+        with self._lock:
+            series = self.series.get(name)
+            if series is None:
+                return array("d"), array("d")
+            return series.window(end - seconds, end)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self.series)
+
+
+def sample_metrics(sample: Sample) -> Dict[str, float]:
+    """
+    Values of a sampler sample recorded in the history
+
+    Args:
+        sample (Sample): Sampler sample
+
+    Returns:
+        Dict[str, float]: Metric name to value
+    """
+    return {
+        "load": sample.load[0],
+        "cpu": sample.cpu_percent,
+        "mem": sample.mem_percent,
+        "disk": sample.disk_percent("/"),
+        "io_read": sum(d.read_bps for d in sample.disk_io.values()),
+        "io_write": sum(d.write_bps for d in sample.disk_io.values()),
+        "io_util": sample.io_util,
+        "io_await": sample.io_await,
+        "net_rx": sample.net_rx_bps,
+        "net_tx": sample.net_tx_bps,
+        "net_faults": sample.net_faults_per_sec,
+        "tcp_retrans": sample.tcp_retrans_percent,
+    }
+
+
+def attach_to_sampler(store: HistoryStore, sampler):
+    """
+    Record every sampler sample into the store
+
+    Args:
+        store (HistoryStore): Target store
+        sampler (Sampler): Source sampler
+    """
+    sampler.add_listener(lambda sample, _processes: store.append(sample.timestamp, sample_metrics(sample)))
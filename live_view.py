@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Messages kept up to date in place for a limited time.
+
+A live view is one chat message that a repeating job re-renders every few
+seconds, like top in a terminal. The manager only decides which messages
+to edit and with what text; the bot performs the edits:
+
+- one view per chat, a new one replaces the old;
+- one render per language per tick, shared by every viewer;
+- no edit when the rendered text is what the message already shows, which
+  the bot confirms after each successful edit; a failed edit is retried;
+- at most one edit per chat every MIN_EDIT_INTERVAL seconds and
+  EDITS_PER_SECOND edits overall, longest waiting first, so the bot stays
+  under the Telegram rate limits; a flood-control reply pauses all views.
+"""
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_INTERVAL = 5
+DEFAULT_DURATION = 300
+MAX_VIEWS = 20
+# Telegram allows about one message per second per chat and 30 per second overall
+MIN_EDIT_INTERVAL = 3.0
+EDITS_PER_SECOND = 20
+
+
+@dataclass
+class LiveSession:
+    """One message being refreshed."""
+    chat_id: int
+    message_id: int
+    user_id: int
+    language: str
+    expires: float
+    last_text: str = ""
+    last_edit: float = 0.0
+
+
+class LiveViews:
+    """
+    Registry of live messages and the edit schedule.
+
+    start() and stop() run on handler threads, tick() on the job thread.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, duration: float = DEFAULT_DURATION,
+                 max_views: int = MAX_VIEWS, min_edit_interval: float = MIN_EDIT_INTERVAL,
+                 edits_per_second: float = EDITS_PER_SECOND):
+        self.interval = interval
+        self.duration = duration
+        self.max_views = max_views
+        self.min_edit_interval = max(min_edit_interval, interval)
+        self.edits_per_second = edits_per_second
+        self._sessions: Dict[int, LiveSession] = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def start(self, chat_id: int, message_id: int, user_id: int, language: str, text: str = "",
+              now: Optional[float] = None) -> Optional[LiveSession]:
+        """
+        Begin refreshing a message
+
+        Args:
+            chat_id (int): Chat of the message
+            message_id (int): Message to edit
+            user_id (int): User the text is rendered for
+            language (str): Language code; views in one language share a render
+            text (str): Text the message shows now
+            now (float, optional): Monotonic time
+
+        Returns:
+            Optional[LiveSession]: The new view, None when too many chats are watching
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if chat_id not in self._sessions and len(self._sessions) >= self.max_views:
+                return None
+            session = LiveSession(chat_id, message_id, user_id, language, now + self.duration, text, now)
+            self._sessions[chat_id] = session
+            return session
+
+    def stop(self, chat_id: int, message_id: Optional[int] = None) -> Optional[LiveSession]:
+        """
+        Stop refreshing the view of a chat
+
+        Args:
+            chat_id (int): Chat ID
+            message_id (int, optional): Only stop if the view is this message
+
+        Returns:
+            Optional[LiveSession]: The stopped view, None if there was none
+        """
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None or (message_id is not None and session.message_id != message_id):
+                return None
+            return self._sessions.pop(chat_id)
+
+    def pause(self, seconds: float, now: Optional[float] = None):
+        """Skip every edit for a while, e.g. after a RetryAfter reply."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._paused_until = max(self._paused_until, now + seconds)
+
+    def confirm(self, session: LiveSession, text: str):
+        """Record the text a message shows after a successful edit."""
+        with self._lock:
+            session.last_text = text
+
+    def tick(self, render: Callable[[str, int], str],
+             now: Optional[float] = None) -> Tuple[List[Tuple[LiveSession, str]], List[LiveSession]]:
+        """
+        Choose the edits of this tick
+
+        Args:
+            render (Callable[[str, int], str]): Text for (language, user_id)
+            now (float, optional): Monotonic time
+
+        Returns:
+            Tuple[List[Tuple[LiveSession, str]], List[LiveSession]]: (views to edit with their
+            new text, views that expired and were removed); confirm() each successful edit
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.expires <= now]
+            for session in expired:
+                del self._sessions[session.chat_id]
+            if now < self._paused_until:
+                return [], expired
+            # Views waiting longest go first when the budget runs out
+            waiting = sorted((s for s in self._sessions.values() if now - s.last_edit >= self.min_edit_interval),
+                             key=lambda s: s.last_edit)
+            budget = max(int(self.edits_per_second * self.interval), 1)
+            rendered: Dict[str, str] = {}
+            edits = []
+            for session in waiting:
+                if len(edits) >= budget:
+                    break
+                text = rendered.get(session.language)
+                if text is None:
+                    text = rendered[session.language] = render(session.language, session.user_id)
+                if text == session.last_text:
+                    continue
+                # Counted as an attempt for the rate limit; the text is only kept once confirmed
+                session.last_edit = now
+                edits.append((session, text))
+            return edits, expired
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Non-blocking logging for the bot.
+
+Handler threads only put records on a bounded queue; a single listener
+thread formats and writes them. When the queue is full the record is
+dropped and counted instead of stalling the caller, so a saturated disk
+slows down the log, not the bot.
+
+The listener writes files in batches: formatted lines are buffered and
+written with one call when the queue runs empty or the buffer fills up,
+and the file is rotated by size at batch boundaries.
+
+Records of the 'audit' logger go to a separate JSON-lines file, one
+object per line, for a structured trail of who ran which action.
+"""
+import json
+import queue
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional
+
+AUDIT_LOGGER = "audit"
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+# Lines buffered before a write even if more records are waiting
+BATCH_SIZE = 256
+LOG_FORMAT = '[%(asctime)s] %(levelname)s: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that counts and drops records instead of blocking."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """Size-rotated file written in batches of buffered lines."""
+
+    def __init__(self, filename: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT, capacity: int = BATCH_SIZE):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.capacity = capacity
+        self._buffer: List[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._buffer.append(self.format(record) + self.terminator)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.handleError(record)
+            return
+        if len(self._buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self._buffer:
+                return
+            data = "".join(self._buffer)
+            self._buffer.clear()
+            try:
+                if self.stream is None:
+                    self.stream = self._open()
+                if self.maxBytes and self.stream.tell() + len(data) >= self.maxBytes:
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+                self.stream.write(data)
+                self.stream.flush()
+            except OSError as e:
+                logging.lastResort.handle(logging.makeLogRecord(
+                    {"msg": f"Cannot write log {self.baseFilename}: {e}", "levelno": logging.ERROR,
+                     "levelname": "ERROR"}))
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class FlushingQueueListener(QueueListener):
+    """QueueListener that flushes its handlers whenever the queue runs empty."""
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, event and the fields passed as extra={'audit': {...}}."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                 "event": record.getMessage()}
+        entry.update(getattr(record, "audit", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _is_audit(record: logging.LogRecord) -> bool:
+    return record.name == AUDIT_LOGGER
+
+
+def _is_not_audit(record: logging.LogRecord) -> bool:
+    return record.name != AUDIT_LOGGER
+
+
+class LogPipeline:
+    """
+    Root logger wired to a queue and a listener thread.
+
+    Usage:
+        pipeline = LogPipeline("bot.log", "audit.jsonl")
+        pipeline.start()
+        ...
+        pipeline.stop()
+    """
+
+    def __init__(self, log_file: str, audit_file: Optional[str] = None, level: int = logging.INFO,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT, console: bool = True):
+        self.level = level
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        handlers = []
+        file_handler = BatchedRotatingFileHandler(log_file, max_bytes, backup_count)
+        handlers.append(file_handler)
+        if console:
+            handlers.append(logging.StreamHandler())
+        formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            handler.addFilter(_is_not_audit)
+        if audit_file:
+            audit_handler = BatchedRotatingFileHandler(audit_file, max_bytes, backup_count)
+            audit_handler.setFormatter(JsonLinesFormatter())
+            audit_handler.addFilter(_is_audit)
+            handlers.append(audit_handler)
+        self.listener = FlushingQueueListener(self.queue, *handlers)
+
+    @property
+    def dropped(self) -> int:
+        """Records dropped because the queue was full."""
+        return self.queue_handler.dropped
+
+    def start(self):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self):
+        """Write out everything queued and close the files."""
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+def audit(event: str, **fields):
+    """
+    Record a structured audit event
+
+    Args:
+        event (str): Event name, e.g. 'action'
+        **fields: JSON-serializable details
+    """
+    logging.getLogger(AUDIT_LOGGER).info(event, extra={"audit": fields})
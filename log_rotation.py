@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Streaming log rotation.
+
+A log is compressed into a gzip or zstd archive in one pass with a fixed
+size buffer, or copied with copy_file_range/sendfile when no compression
+is wanted, and then truncated in place so processes holding the file open
+keep writing to the same inode. Old archives are pruned by count and age.
+"""
+import os
+import sys
+import gzip
+import glob
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+from server_config import parse_size
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ".bak"}
+# Read size of the streaming pass; memory use does not depend on the log size
+CHUNK_SIZE = 1024 * 1024
+# Times the tail written during the copy is chased before truncating
+MAX_CATCH_UP_ROUNDS = 3
+DEFAULT_KEEP = 5
+
+
+@dataclass
+class RotationResult:
+    """Outcome of rotating one file."""
+    path: str
+    archive: Optional[str]
+    original_size: int
+    archive_size: int
+    error: Optional[str] = None
+
+    @property
+    def freed(self) -> int:
+        return self.original_size - self.archive_size if self.archive else 0
+
+
+def resolve_compression(compression: str) -> str:
+    """
+    Validate a compression name, falling back to gzip without zstandard
+
+    Args:
+        compression (str): gzip, zstd or none
+
+    Returns:
+        str: Usable compression name
+    """
+    compression = (compression or "gzip").lower()
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd" and not ZSTD_AVAILABLE:
+        logging.warning("zstandard module is not installed, using gzip")
+        return "gzip"
+    return compression
+
+
+def _copy_range(src_fd: int, dst_fd: int, count: int):
+    """Copy count bytes between descriptors inside the kernel when possible."""
+    while count > 0:
+        try:
+            if hasattr(os, "copy_file_range"):
+                copied = os.copy_file_range(src_fd, dst_fd, min(count, 1 << 30))
+            else:
+                copied = os.sendfile(dst_fd, src_fd, None, min(count, 1 << 30))
+        except OSError as e:
+            if e.errno not in (18, 22, 38, 95):  # EXDEV, EINVAL, ENOSYS, EOPNOTSUPP
+                raise
+            # Filesystem without in-kernel copy support
+            while count > 0:
+                data = os.read(src_fd, min(count, CHUNK_SIZE))
+                if not data:
+                    return
+                os.write(dst_fd, data)
+                count -= len(data)
+            return
+        if copied == 0:
+            return
+        count -= copied
+
+
+class _ArchiveWriter:
+    """Streams chunks into the archive with the selected compression."""
+
+    def __init__(self, raw, compression: str, level: int):
+        self.raw = raw
+        self.compression = compression
+        if compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level)
+        elif compression == "zstd":
+            self.stream = zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=False)
+        else:
+            self.stream = None
+
+    def copy(self, src, count: int):
+        if self.stream is None:
+            self.raw.flush()
+            _copy_range(src.fileno(), self.raw.fileno(), count)
+            return
+        while count > 0:
+            data = src.read(min(count, CHUNK_SIZE))
+            if not data:
+                break
+            self.stream.write(data)
+            count -= len(data)
+
+    def close(self):
+        """Finish the archive and push it to disk."""
+        if self.stream is not None:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+
+def rotate_file(path: str, compression: str = "gzip", level: int = 6,
+                suffix: Optional[str] = None) -> RotationResult:
+    """
+    Archive a log and truncate it in place
+
+    The file is read from its current position until it stops growing
+    (bounded by MAX_CATCH_UP_ROUNDS). The archive is written under a
+    temporary name, finished, synced and renamed into place, and only then
+    is the log truncated, so a failure at any step, such as a full disk,
+    leaves the log untouched. An existing archive with the same name, from
+    a rotation in the same second, is kept and the new archive gets a -1,
+    -2... suffix. Lines written between the last read and the
+    truncation are lost, as with logrotate's copytruncate.
+
+    Args:
+        path (str): Log file
+        compression (str): gzip, zstd or none
+        level (int): Compression level
+        suffix (str, optional): Archive suffix, current date and time by default
+
+    Returns:
+        RotationResult: Result of the rotation
+    """
+    compression = resolve_compression(compression)
+    suffix = suffix or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    archive = f"{path}.{suffix}{EXTENSIONS[compression]}"
+    tmp_archive = None
+    try:
+        src = open(path, "rb")
+    except OSError as e:
+        return RotationResult(path, None, 0, 0, str(e))
+    try:
+        size = os.fstat(src.fileno()).st_size
+        if size == 0:
+            return RotationResult(path, None, 0, 0)
+        if compression == "none":
+            free = shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free
+            if free < size:
+                return RotationResult(path, None, size, 0, "not enough free space for an uncompressed copy")
+        copied = 0
+        # Rotations of the same log may run at once, from the bot and from cron
+        fd, tmp_archive = tempfile.mkstemp(prefix=os.path.basename(archive) + ".", suffix=".tmp",
+                                           dir=os.path.dirname(os.path.abspath(archive)))
+        with os.fdopen(fd, "wb") as raw:
+            writer = _ArchiveWriter(raw, compression, level)
+            for _ in range(MAX_CATCH_UP_ROUNDS + 1):
+                current = os.fstat(src.fileno()).st_size
+                if current <= copied:
+                    break
+                src.seek(copied)
+                writer.copy(src, current - copied)
+                copied = current
+            writer.close()
+        shutil.copymode(path, tmp_archive)
+        archive = _publish(tmp_archive, archive, EXTENSIONS[compression])
+        tmp_archive = None
+        _sync_dir(os.path.dirname(os.path.abspath(archive)))
+    except OSError as e:
+        if tmp_archive is not None:
+            try:
+                os.unlink(tmp_archive)
+            except OSError:
+                pass
+        return RotationResult(path, None, 0, 0, str(e))
+    finally:
+        src.close()
+    try:
+        # Truncating the same inode keeps O_APPEND writers working
+        os.truncate(path, 0)
+    except OSError as e:
+        # The log still holds everything, a second copy in the archive is not needed
+        try:
+            os.unlink(archive)
+        except OSError:
+            pass
+        return RotationResult(path, None, 0, 0, str(e))
+    return RotationResult(path, archive, copied, os.path.getsize(archive))
+
+
+def _publish(tmp_path: str, archive: str, extension: str) -> str:
+    """Give a finished archive its name without replacing an existing archive."""
+    stem = archive[:-len(extension)]
+    name, n = archive, 0
+    while True:
+        try:
+            # Unlike rename, link fails if the name is taken
+            os.link(tmp_path, name)
+            break
+        except FileExistsError:
+            n += 1
+            name = f"{stem}-{n}{extension}"
+    os.unlink(tmp_path)
+    return name
+
+
+def _sync_dir(path: str):
+    """Make a rename in a directory durable before acting on it."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def enforce_retention(path: str, keep: int = DEFAULT_KEEP, max_age_days: int = 0) -> List[str]:
+    """
+    Delete old archives of a log
+
+    Args:
+        path (str): Log file whose archives are pruned
+        keep (int): Newest archives to keep, 0 for no limit
+        max_age_days (int): Delete archives older than this, 0 for no limit
+
+    Returns:
+        List[str]: Deleted archives
+    """
+    archives = []
+    for ext in EXTENSIONS.values():
+        archives += glob.glob(f"{glob.escape(path)}.*{ext}")
+    archives.sort(key=os.path.getmtime, reverse=True)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    deleted = []
+    for i, archive in enumerate(archives):
+        if (keep and i >= keep) or (cutoff is not None and os.path.getmtime(archive) < cutoff):
+            try:
+                os.unlink(archive)
+                deleted.append(archive)
+            except OSError as e:
+                logging.warning("Cannot delete old archive %s: %s", archive, e)
+    return deleted
+
+
+def rotate_large_logs(paths: Iterable[str], compression: str = "gzip", keep: int = DEFAULT_KEEP,
+                      max_age_days: int = 0, level: int = 6) -> List[RotationResult]:
+    """
+    Rotate logs and prune their archives
+
+    Args:
+        paths (Iterable[str]): Logs to rotate
+        compression (str): gzip, zstd or none
+        keep (int): Archives kept per log
+        max_age_days (int): Maximum archive age in days
+        level (int): Compression level
+
+    Returns:
+        List[RotationResult]: One result per log
+    """
+    results = []
+    for path in paths:
+        result = rotate_file(path, compression, level)
+        if result.error:
+            logging.error("Rotation of %s failed: %s", path, result.error)
+        else:
+            logging.info("Rotated %s -> %s (%d -> %d bytes)", path, result.archive,
+                         result.original_size, result.archive_size)
+        enforce_retention(path, keep, max_age_days)
+        results.append(result)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Streaming compressed log rotation")
+    parser.add_argument("files", nargs="*", help="logs to rotate")
+    parser.add_argument("--root", action="append", default=[],
+                        help="rotate *.log files above --max-size found under this directory")
+    parser.add_argument("--max-size", default="100M", help="size threshold for --root, e.g. 100M")
+    parser.add_argument("--compress", default="gzip", choices=COMPRESSIONS)
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="archives kept per log")
+    parser.add_argument("--max-age-days", type=int, default=0, help="delete older archives")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    paths = list(args.files)
+    if args.root:
+        from disk_index import DiskIndex  # pylint: disable=import-outside-toplevel
+        index = DiskIndex(args.root).scan()
+        paths += [path for path, _size in index.large_files(parse_size(args.max_size))]
+    results = rotate_large_logs(paths, args.compress, args.keep, args.max_age_days, args.level)
+    return 1 if any(r.error for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
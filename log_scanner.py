@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Incremental scanner of system logs.
+
+The byte offset and inode of every log are persisted, so a run reads only
+lines appended since the previous one and notices rotation. Matching
+lines are reduced to signatures (numbers and hex identifiers replaced)
+and counted in a bounded table, which keeps the cost of a check tied to
+the amount of new data rather than to the size of the logs.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# State of the optimisation script; other consumers pass their own file
+STATE_FILE = os.path.join(BASE_DIR, "log_scanner_state.json")
+DEFAULT_LOGS = ("/var/log/syslog", "/var/log/messages", "/var/log/dmesg")
+DEFAULT_PATTERN = r"error|failed|warning"
+# Signatures kept in the table; the least frequent are evicted first
+MAX_SIGNATURES = 500
+# Bytes read from a log seen for the first time
+INITIAL_BACKLOG = 1024 * 1024
+# Upper bound of bytes read per log and run; older data is skipped
+MAX_READ_BYTES = 16 * 1024 * 1024
+MAX_SIGNATURE_LENGTH = 200
+STATE_VERSION = 1
+
+_PREFIX_RES = (
+    # "Oct 19 03:20:12 host " and "2026-10-19T03:20:12.123+00:00 host "
+    re.compile(r"^[A-Z][a-z]{2}\s+\d+\s+\d\d:\d\d:\d\d\s+\S+\s+"),
+    re.compile(r"^\d{4}-\d\d-\d\dT\S+\s+\S+\s+"),
+    # dmesg "[  123.456789] "
+    re.compile(r"^\[\s*\d+\.\d+\]\s*"),
+)
+_HEX_RE = re.compile(r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{6,}\b")
+_NUMBER_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(line: str) -> str:
+    """
+    Reduce a log line to its signature
+
+    Args:
+        line (str): Raw log line
+
+    Returns:
+        str: Line without timestamp, host, numbers and hex identifiers
+    """
+    for prefix in _PREFIX_RES:
+        line = prefix.sub("", line, count=1)
+    line = _HEX_RE.sub("<hex>", line)
+    line = _NUMBER_RE.sub("#", line)
+    return _SPACE_RE.sub(" ", line).strip()[:MAX_SIGNATURE_LENGTH]
+
+
+class SignatureTable:
+    """Bounded table of signature counts with first and last seen times."""
+
+    def __init__(self, limit: int = MAX_SIGNATURES, entries: Optional[Dict[str, list]] = None):
+        self.limit = limit
+        # signature -> [count, first_seen, last_seen]
+        self.entries: Dict[str, list] = entries or {}
+
+    def add(self, signature: str, count: int, now: float):
+        entry = self.entries.get(signature)
+        if entry is None:
+            self.entries[signature] = [count, now, now]
+        else:
+            entry[0] += count
+            entry[2] = now
+
+    def trim(self):
+        """Evict the least frequent, then least recent signatures above the limit."""
+        if len(self.entries) <= self.limit:
+            return
+        ranked = sorted(self.entries.items(), key=lambda item: (item[1][0], item[1][2]), reverse=True)
+        self.entries = dict(ranked[:self.limit])
+
+    def top(self, limit: int = 10) -> List[Tuple[str, list]]:
+        return sorted(self.entries.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+
+
+class LogScanner:
+    """
+    Reads new lines of several logs and aggregates matching signatures.
+
+    Every scan() returns the signatures found since the previous scan; the
+    cumulative table and the per-file positions are saved to the state file.
+    """
+
+    def __init__(self, paths: Iterable[str] = DEFAULT_LOGS, state_file: str = STATE_FILE,
+                 pattern: str = DEFAULT_PATTERN, limit: int = MAX_SIGNATURES):
+        self.paths = list(paths)
+        self.state_file = state_file
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.positions: Dict[str, dict] = {}
+        self.table = SignatureTable(limit)
+        self.last_scan = 0.0
+        self.bytes_read = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == STATE_VERSION:
+                self.positions = data.get("files", {})
+                self.table.entries = data.get("signatures", {})
+                self.last_scan = data.get("last_scan", 0.0)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning("Log scanner state %s ignored: %s", self.state_file, e)
+
+    def save(self):
+        tmp_path = f"{self.state_file}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": STATE_VERSION, "last_scan": self.last_scan,
+                           "files": self.positions, "signatures": self.table.entries},
+                          f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logging.error("Cannot save log scanner state %s: %s", self.state_file, e)
+
+    def _read_from(self, path: str, offset: int, found: Dict[str, int]) -> int:
+        """Read complete lines from offset and return the offset after the last one."""
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size - offset > MAX_READ_BYTES:
+                logging.warning("Log scanner skipped %d bytes of %s", size - offset - MAX_READ_BYTES, path)
+                offset = size - MAX_READ_BYTES
+            f.seek(offset)
+            data = f.read(size - offset)
+        end = data.rfind(b"\n")
+        if end < 0:
+            return offset
+        self.bytes_read += end + 1
+        for line in data[:end].decode("utf-8", "replace").split("\n"):
+            if not self.pattern.search(line):
+                continue
+            signature = normalize(line)
+            # A flood of distinct lines must not grow one scan beyond the table's scale
+            if signature and (signature in found or len(found) < self.table.limit * 4):
+                found[signature] = found.get(signature, 0) + 1
+        return offset + end + 1
+
+    def _scan_file(self, path: str, found: Dict[str, int]):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        saved = self.positions.get(path)
+        if saved is None:
+            offset = max(0, st.st_size - INITIAL_BACKLOG)
+        elif saved["inode"] != st.st_ino:
+            # Rotated: finish the old file if it was renamed to path.1
+            try:
+                if os.stat(f"{path}.1").st_ino == saved["inode"]:
+                    self._read_from(f"{path}.1", saved["offset"], found)
+            except OSError:
+                pass
+            offset = 0
+        elif st.st_size < saved["offset"]:
+            # Truncated in place
+            offset = 0
+        else:
+            offset = saved["offset"]
+        try:
+            offset = self._read_from(path, offset, found)
+        except OSError as e:
+            logging.warning("Cannot read %s: %s", path, e)
+            return
+        self.positions[path] = {"inode": st.st_ino, "offset": offset}
+
+    def scan(self) -> List[Tuple[str, int, bool]]:
+        """
+        Read new data of all logs
+
+        Returns:
+            List[Tuple[str, int, bool]]: (signature, new occurrences, first time seen),
+            most frequent first
+        """
+        found: Dict[str, int] = {}
+        self.bytes_read = 0
+        for path in self.paths:
+            self._scan_file(path, found)
+        now = time.time()
+        known = set(self.table.entries)
+        for signature, count in found.items():
+            self.table.add(signature, count, now)
+        self.table.trim()
+        self.last_scan = now
+        self.save()
+        return sorted(((sig, count, sig not in known) for sig, count in found.items()),
+                      key=lambda item: item[1], reverse=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Incremental system log error scanner")
+    parser.add_argument("logs", nargs="*", help=f"logs to scan (default: {' '.join(DEFAULT_LOGS)})")
+    parser.add_argument("--state", default=STATE_FILE, help="state file")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="regular expression of interesting lines")
+    parser.add_argument("--top", type=int, default=20, help="number of signatures to print")
+    args = parser.parse_args(argv)
+
+    scanner = LogScanner(args.logs or DEFAULT_LOGS, state_file=args.state, pattern=args.pattern)
+    for signature, count, new in scanner.scan()[:args.top]:
+        print(f"{count:>6} {'NEW ' if new else ''}{signature}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
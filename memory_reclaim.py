@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+PSI-driven memory reclaim.
+
+Pressure stall information from /proc/pressure decides whether reclaim is
+needed at all. When it is, memory is reclaimed proactively from the
+cgroups holding the most inactive page cache through cgroup v2
+memory.reclaim, instead of dropping the page cache of the whole host.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from server_config import ServerConfig, load_server_config, parse_size
+from disk_index import format_size
+
+PROC_ROOT = "/proc"
+CGROUP_ROOT = "/sys/fs/cgroup"
+PSI_RESOURCES = ("memory", "io", "cpu")
+# Depth below the cgroup root searched for reclaim targets
+MAX_CGROUP_DEPTH = 3
+# Cgroups that are reclaimed from in one run
+MAX_TARGETS = 5
+# Share of a cgroup's inactive file cache that may be reclaimed at once
+MAX_INACTIVE_SHARE = 0.5
+# Seconds to wait before reading PSI again; avg10 is refreshed every 2 seconds
+SETTLE_SECONDS = 4
+
+Pressure = Dict[str, Dict[str, float]]
+
+
+def read_pressure(resource: str, proc_root: str = PROC_ROOT) -> Optional[Pressure]:
+    """
+    Read one /proc/pressure file
+
+    Args:
+        resource (str): memory, io or cpu
+        proc_root (str): procfs mount point
+
+    Returns:
+        Optional[Pressure]: {'some': {'avg10': ..., 'avg60': ..., 'avg300': ..., 'total': ...},
+        'full': {...}} or None without PSI support
+    """
+    try:
+        with open(os.path.join(proc_root, "pressure", resource), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    result = {}
+    for line in lines:
+        kind, *pairs = line.split()
+        result[kind] = {key: float(value) for key, value in (pair.split("=") for pair in pairs)}
+    return result
+
+
+def read_all_pressure(proc_root: str = PROC_ROOT) -> Dict[str, Pressure]:
+    """Read memory, io and cpu pressure; resources without PSI are omitted."""
+    result = {}
+    for resource in PSI_RESOURCES:
+        pressure = read_pressure(resource, proc_root)
+        if pressure is not None:
+            result[resource] = pressure
+    return result
+
+
+def format_pressure(psi: Dict[str, Pressure]) -> str:
+    """
+    Format some/full avg10 of every resource
+
+    Args:
+        psi (Dict[str, Pressure]): Result of read_all_pressure
+
+    Returns:
+        str: e.g. 'memory 12.30/4.10  io 0.50/0.00  cpu 3.20'
+    """
+    parts = []
+    for resource in PSI_RESOURCES:
+        if resource not in psi:
+            continue
+        some = psi[resource].get("some", {}).get("avg10", 0.0)
+        full = psi[resource].get("full", {}).get("avg10")
+        parts.append(f"{resource} {some:.2f}" + (f"/{full:.2f}" if full is not None else ""))
+    return "  ".join(parts) if parts else "PSI unavailable"
+
+
+def read_mem_available(proc_root: str = PROC_ROOT) -> Tuple[int, int]:
+    """Return (MemTotal, MemAvailable) in bytes."""
+    values = {}
+    with open(os.path.join(proc_root, "meminfo"), "r", encoding="utf-8") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("MemTotal", "MemAvailable"):
+                values[key] = int(rest.split()[0]) * 1024
+    return values.get("MemTotal", 0), values.get("MemAvailable", 0)
+
+
+def reclaim_decision(psi: Dict[str, Pressure], mem_total: int, mem_available: int,
+                     psi_threshold: float, mem_warning: int) -> Tuple[bool, str]:
+    """
+    Decide whether memory should be reclaimed
+
+    Reclaim is needed when tasks stall on memory or available memory is
+    below the warning level. It is skipped when I/O is the bottleneck and
+    memory is not, because dropping cache would only add reads.
+
+    Args:
+        psi (Dict[str, Pressure]): Current pressure
+        mem_total (int): MemTotal in bytes
+        mem_available (int): MemAvailable in bytes
+        psi_threshold (float): memory 'some' avg10 percentage that calls for reclaim
+        mem_warning (int): Used memory percentage that calls for reclaim
+
+    Returns:
+        Tuple[bool, str]: (reclaim needed, reason)
+    """
+    used_percent = 100.0 * (mem_total - mem_available) / mem_total if mem_total else 0.0
+    memory_some = psi.get("memory", {}).get("some", {}).get("avg10", 0.0)
+    io_some = psi.get("io", {}).get("some", {}).get("avg10", 0.0)
+    if memory_some >= psi_threshold:
+        return True, f"memory pressure {memory_some:.1f}% >= {psi_threshold:.1f}%"
+    if used_percent >= mem_warning:
+        return True, f"memory used {used_percent:.0f}% >= {mem_warning}%"
+    if io_some >= psi_threshold:
+        return False, f"I/O pressure {io_some:.1f}% without memory pressure, keeping page cache"
+    return False, f"no memory pressure ({memory_some:.1f}%, used {used_percent:.0f}%)"
+
+
+@dataclass
+class ReclaimTarget:
+    """A cgroup and the amount of memory requested from it."""
+    cgroup: str
+    inactive_file: int
+    requested: int
+    freed: int = 0
+    error: str = ""
+
+
+@dataclass
+class ReclaimResult:
+    """Outcome of a reclaim run."""
+    reason: str
+    reclaimed: bool
+    psi_before: Dict[str, Pressure]
+    psi_after: Dict[str, Pressure] = field(default_factory=dict)
+    targets: List[ReclaimTarget] = field(default_factory=list)
+    fallback: bool = False
+
+    @property
+    def freed(self) -> int:
+        return sum(t.freed for t in self.targets)
+
+
+def _memory_stat(cgroup: str) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(os.path.join(cgroup, "memory.stat"), "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(" ")
+                values[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return values
+
+
+def _read_current(cgroup: str) -> int:
+    try:
+        with open(os.path.join(cgroup, "memory.current"), "r", encoding="utf-8") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def find_targets(cgroup_root: str = CGROUP_ROOT, limit: int = MAX_TARGETS) -> List[Tuple[str, int]]:
+    """
+    Find leaf cgroups with the most inactive page cache
+
+    Args:
+        cgroup_root (str): cgroup v2 mount point
+        limit (int): Number of cgroups to return
+
+    Returns:
+        List[Tuple[str, int]]: (cgroup directory, inactive_file bytes), largest first
+    """
+    candidates = []
+    base_depth = cgroup_root.rstrip(os.sep).count(os.sep)
+    for path, dirs, files in os.walk(cgroup_root):
+        depth = path.count(os.sep) - base_depth
+        if depth >= MAX_CGROUP_DEPTH:
+            dirs[:] = []
+        # Only leaves: reclaiming a parent would also hit its children again
+        if depth == 0 or dirs or "memory.reclaim" not in files:
+            continue
+        inactive = _memory_stat(path).get("inactive_file", 0)
+        if inactive > 0:
+            candidates.append((path, inactive))
+    return sorted(candidates, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def reclaim(target_bytes: int, cgroup_root: str = CGROUP_ROOT) -> List[ReclaimTarget]:
+    """
+    Spread a reclaim request over the cgroups with the most inactive cache
+
+    Args:
+        target_bytes (int): Total memory to reclaim
+        cgroup_root (str): cgroup v2 mount point
+
+    Returns:
+        List[ReclaimTarget]: What was requested and freed per cgroup
+    """
+    results = []
+    remaining = target_bytes
+    for cgroup, inactive in find_targets(cgroup_root):
+        if remaining <= 0:
+            break
+        amount = min(remaining, int(inactive * MAX_INACTIVE_SHARE))
+        if amount <= 0:
+            continue
+        target = ReclaimTarget(cgroup, inactive, amount)
+        before = _read_current(cgroup)
+        try:
+            with open(os.path.join(cgroup, "memory.reclaim"), "w", encoding="utf-8") as f:
+                f.write(str(amount))
+            # A successful write means the whole amount was reclaimed
+            target.freed = amount
+        except OSError as e:
+            # EAGAIN means the kernel reclaimed less than requested
+            target.error = e.strerror or str(e)
+            target.freed = max(before - _read_current(cgroup), 0)
+        remaining -= target.freed
+        results.append(target)
+    return results
+
+
+def run_reclaim(force: bool = False, dry_run: bool = False, settle: float = SETTLE_SECONDS,
+                proc_root: str = PROC_ROOT, cfg: Optional[ServerConfig] = None) -> ReclaimResult:
+    """
+    Measure pressure, reclaim if needed and measure again
+
+    Without memory.reclaim support (kernels before 5.19 or cgroup v1) the
+    page cache alone is dropped (drop_caches=1), keeping dentries and inodes.
+
+    Args:
+        force (bool): Reclaim even if pressure is low
+        dry_run (bool): Only report the decision and targets
+        settle (float): Seconds to wait before the second PSI read
+        proc_root (str): procfs mount point
+        cfg (ServerConfig, optional): Thresholds and target, read from the config file by default
+
+    Returns:
+        ReclaimResult: Decision, targets and PSI before/after
+    """
+    cfg = cfg or load_server_config()
+    psi = read_all_pressure(proc_root)
+    mem_total, mem_available = read_mem_available(proc_root)
+    needed, reason = reclaim_decision(psi, mem_total, mem_available, cfg.psi_memory_threshold, cfg.mem_warning)
+    if force and not needed:
+        needed, reason = True, f"forced ({reason})"
+    result = ReclaimResult(reason=reason, reclaimed=False, psi_before=psi)
+    if not needed:
+        return result
+
+    target_bytes = parse_size(cfg.reclaim_target)
+    if dry_run:
+        result.targets = [ReclaimTarget(cgroup, inactive, min(target_bytes, int(inactive * MAX_INACTIVE_SHARE)))
+                          for cgroup, inactive in find_targets(cfg.cgroup_root)]
+        return result
+
+    if os.path.exists(os.path.join(cfg.cgroup_root, "memory.reclaim")):
+        result.targets = reclaim(target_bytes, cfg.cgroup_root)
+    else:
+        logging.warning("memory.reclaim is unavailable, dropping the page cache only")
+        os.sync()
+        with open(os.path.join(proc_root, "sys", "vm", "drop_caches"), "w", encoding="utf-8") as f:
+            f.write("1")
+        result.fallback = True
+    result.reclaimed = True
+    if settle:
+        time.sleep(settle)
+    result.psi_after = read_all_pressure(proc_root)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="PSI-driven memory reclaim")
+    parser.add_argument("--force", action="store_true", help="reclaim even without memory pressure")
+    parser.add_argument("--dry-run", action="store_true", help="only print the decision and targets")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    result = run_reclaim(force=args.force, dry_run=args.dry_run)
+    print(f"PSI before: {format_pressure(result.psi_before)}")
+    print(f"Decision: {result.reason}")
+    for target in result.targets:
+        error = f" ({target.error})" if target.error else ""
+        print(f"  {target.cgroup}: inactive {format_size(target.inactive_file)}, "
+              f"requested {format_size(target.requested)}, freed {format_size(target.freed)}{error}")
+    if result.fallback:
+        print("memory.reclaim unavailable, page cache dropped")
+    if result.psi_after:
+        print(f"PSI after: {format_pressure(result.psi_after)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
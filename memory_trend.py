@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Memory growth trends per process.
+
+For every large process the sampler scan updates exponentially weighted
+least-squares sums of (time, RSS), so the growth rate is known at any
+moment in O(1) per process and recent behaviour outweighs the old. A
+process whose RSS grows steadily (a good linear fit, not just noise) is
+projected to the memory limit of its cgroup, or to the memory available
+on the host, and reported long before it gets there.
+
+Only the largest MAX_TRACKED processes above MIN_RSS are tracked, and the
+state of a process is dropped as soon as it disappears from a scan.
+"""
+import os
+import sys
+import math
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from system_sampler import PROC_ROOT, ProcessSample, Sample, Sampler
+from command_accounting import command_key
+from disk_index import format_size
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Processes below this RSS are not tracked
+MIN_RSS = 64 * 1024 * 1024
+MAX_TRACKED = 100
+# Time constant of the exponential weights, seconds
+TREND_TAU = 6 * 3600
+# Observation span and fit quality needed before a trend is reported
+MIN_SPAN = 3600
+MIN_R2 = 0.8
+DEFAULT_MIN_GROWTH = 10 * 1024 * 1024  # bytes per hour
+DEFAULT_HORIZON = 24 * 3600
+# Seconds between two warnings about the same process
+WARN_COOLDOWN = 6 * 3600
+MAX_PENDING = 20
+
+
+class Trend:
+    """Exponentially weighted least squares of RSS over time."""
+
+    __slots__ = ("start_ticks", "name", "origin", "last", "rss", "sw", "st", "sy", "stt", "sty", "syy", "warned")
+
+    def __init__(self, start_ticks: int, name: str, origin: float):
+        self.start_ticks = start_ticks
+        self.name = name
+        self.origin = origin
+        self.last = origin
+        self.rss = 0
+        self.sw = self.st = self.sy = self.stt = self.sty = self.syy = 0.0
+        self.warned = 0.0
+
+    def add(self, timestamp: float, rss: float):
+        decay = math.exp(-(timestamp - self.last) / TREND_TAU)
+        self.last = timestamp
+        self.rss = rss
+        # Hours from the first observation and megabytes keep the sums well conditioned
+        t = (timestamp - self.origin) / 3600.0
+        y = rss / (1024.0 * 1024.0)
+        self.sw = self.sw * decay + 1.0
+        self.st = self.st * decay + t
+        self.sy = self.sy * decay + y
+        self.stt = self.stt * decay + t * t
+        self.sty = self.sty * decay + t * y
+        self.syy = self.syy * decay + y * y
+
+    def fit(self) -> Tuple[float, float]:
+        """
+        Get the weighted slope and the coefficient of determination
+
+        Returns:
+            Tuple[float, float]: (bytes per second, R^2); (0.0, 0.0) without variance
+        """
+        var_t = self.sw * self.stt - self.st * self.st
+        var_y = self.sw * self.syy - self.sy * self.sy
+        if var_t <= 1e-12 or var_y <= 1e-12:
+            return 0.0, 0.0
+        cov = self.sw * self.sty - self.st * self.sy
+        slope = cov / var_t  # MB per hour
+        return slope * 1024 * 1024 / 3600.0, cov * cov / (var_t * var_y)
+
+
+@dataclass
+class Growth:
+    """A process heading for its memory limit."""
+    pid: int
+    name: str
+    rss: int
+    rate: float
+    headroom: int
+    eta: float
+    limit: str
+    r2: float
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def cgroup_headroom(pid: int, proc_root: str = PROC_ROOT, cgroup_root: str = CGROUP_ROOT) -> Optional[int]:
+    """
+    Get the memory left before the cgroup limit of a process
+
+    Args:
+        pid (int): Process ID
+        proc_root (str): procfs mount point
+        cgroup_root (str): cgroup v2 mount point
+
+    Returns:
+        Optional[int]: memory.max - memory.current in bytes, None without a limit
+    """
+    try:
+        with open(os.path.join(proc_root, str(pid), "cgroup"), "r", encoding="utf-8") as f:
+            path = f.read().splitlines()[-1].rpartition(":")[2]
+    except (OSError, IndexError):
+        return None
+    cgroup = os.path.join(cgroup_root, path.lstrip("/"))
+    limit = _read_int(os.path.join(cgroup, "memory.max"))
+    current = _read_int(os.path.join(cgroup, "memory.current"))
+    if limit is None or current is None:
+        return None
+    return max(limit - current, 0)
+
+
+class MemoryTrendTracker:
+    """
+    Per-process RSS trends fed by the sampler.
+
+    observe() runs on the sampler thread and queues warnings; the bot
+    takes them with drain().
+    """
+
+    def __init__(self, min_growth: float = DEFAULT_MIN_GROWTH, horizon: float = DEFAULT_HORIZON,
+                 proc_root: str = PROC_ROOT, cgroup_root: str = CGROUP_ROOT):
+        self.min_growth = min_growth
+        self.horizon = horizon
+        self.proc_root = proc_root
+        self.cgroup_root = cgroup_root
+        self._trends: Dict[int, Trend] = {}
+        self._pending = deque(maxlen=MAX_PENDING)
+        self._lock = threading.Lock()
+
+    def _assess(self, pid: int, trend: Trend, mem_available: int) -> Optional[Growth]:
+        if trend.last - trend.origin < MIN_SPAN:
+            return None
+        rate, r2 = trend.fit()
+        if r2 < MIN_R2 or rate * 3600 < self.min_growth:
+            return None
+        headroom, limit = mem_available, "host"
+        cgroup_left = cgroup_headroom(pid, self.proc_root, self.cgroup_root)
+        if cgroup_left is not None and cgroup_left < headroom:
+            headroom, limit = cgroup_left, "cgroup"
+        return Growth(pid, trend.name, trend.rss, rate, headroom, headroom / rate, limit, r2)
+
+    def observe(self, sample: Sample, processes: List[ProcessSample]) -> List[Growth]:
+        """
+        Update the trends with one scan
+
+        Args:
+            sample (Sample): Host sample of the scan
+            processes (List[ProcessSample]): Every process of the scan
+
+        Returns:
+            List[Growth]: Processes that will reach their limit within the horizon
+        """
+        large = sorted((p for p in processes if p.rss_bytes >= MIN_RSS),
+                       key=lambda p: p.rss_bytes, reverse=True)[:MAX_TRACKED]
+        found = []
+        with self._lock:
+            trends = {}
+            for proc in large:
+                trend = self._trends.get(proc.pid)
+                # A reused PID starts a new trend
+                if trend is None or trend.start_ticks != proc.start_ticks:
+                    trend = Trend(proc.start_ticks, command_key(self.proc_root, proc.pid, proc.name),
+                                  sample.timestamp)
+                trend.add(sample.timestamp, proc.rss_bytes)
+                trends[proc.pid] = trend
+                if sample.timestamp - trend.warned < WARN_COOLDOWN:
+                    continue
+                growth = self._assess(proc.pid, trend, sample.mem_available)
+                if growth is not None and growth.eta <= self.horizon:
+                    trend.warned = sample.timestamp
+                    found.append(growth)
+            # Exited and shrunk processes are forgotten
+            self._trends = trends
+            self._pending.extend(found)
+        return found
+
+    def drain(self) -> List[Growth]:
+        """Take the warnings queued since the last call."""
+        with self._lock:
+            found = list(self._pending)
+            self._pending.clear()
+            return found
+
+    def growing(self, mem_available: int) -> List[Growth]:
+        """
+        Get every tracked process with a reliable growth trend
+
+        Args:
+            mem_available (int): MemAvailable of the host in bytes
+
+        Returns:
+            List[Growth]: Growing processes, soonest to reach the limit first
+        """
+        with self._lock:
+            items = list(self._trends.items())
+        result = []
+        for pid, trend in items:
+            growth = self._assess(pid, trend, mem_available)
+            if growth is not None:
+                result.append(growth)
+        return sorted(result, key=lambda g: g.eta)
+
+
+def attach_tracker(tracker: MemoryTrendTracker, sampler: Sampler):
+    """
+    Feed every sampler scan to the tracker
+
+    Args:
+        tracker (MemoryTrendTracker): Target tracker
+        sampler (Sampler): Source sampler
+    """
+    sampler.add_listener(tracker.observe)
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as minutes, hours or days."""
+    if seconds < 3600:
+        return f"{max(seconds, 60) / 60:.0f}m"
+    if seconds < 2 * 86400:
+        return f"{seconds / 3600:.0f}h"
+    return f"{seconds / 86400:.1f}d"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Watch per-process memory growth")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between scans")
+    parser.add_argument("--duration", type=float, default=3600, help="seconds to watch")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    sampler = Sampler(interval=args.interval)
+    tracker = MemoryTrendTracker(min_growth=0)
+    attach_tracker(tracker, sampler)
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        sampler.sample_once()
+        time.sleep(args.interval)
+    sample = sampler.buffer.latest()
+    for growth in tracker.growing(sample.mem_available if sample else 0):
+        print(f"{growth.name} (PID {growth.pid}): {format_size(growth.rss)}, "
+              f"+{format_size(int(growth.rate * 3600))}/h, {growth.limit} limit in {format_duration(growth.eta)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Prometheus exposition for the server control bot.
+Renders host metrics from the sampler's ring buffer and bot internals
+collected in memory; a scrape never runs subprocesses or reads /proc.
+"""
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from system_sampler import Sample, SampleBuffer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Default bind address; expose explicitly if Prometheus runs on another host
+DEFAULT_BIND = "127.0.0.1"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class _Family:
+    """Lines of one metric family in exposition format."""
+
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = name
+        self.lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+
+    def add(self, value: float, suffix: str = "", **labels):
+        self.lines.append(f"{self.name}{suffix}{_labels(**labels)} {_format_value(value)}")
+
+
+class BotMetrics:
+    """
+    Thread-safe registry of bot internals.
+
+    Handler and job timings are kept as summaries (count, sum, max);
+    gauges are either set directly or computed at scrape time by callbacks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings: Dict[Tuple[str, str], List[float]] = {}
+        self._failures: Dict[Tuple[str, str], int] = {}
+        self._gauges: Dict[str, Tuple[str, float]] = {}
+        self._gauge_callbacks: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self.started = time.time()
+
+    def observe(self, kind: str, name: str, seconds: float, failed: bool = False):
+        """
+        Record one handler or job execution
+
+        Args:
+            kind (str): 'handler', 'job' or 'action'
+            name (str): Handler or job name
+            seconds (float): Execution time
+            failed (bool): Whether the execution raised
+        """
+        key = (kind, name)
+        with self._lock:
+            entry = self._timings.get(key)
+            if entry is None:
+                entry = self._timings[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            if failed:
+                self._failures[key] = self._failures.get(key, 0) + 1
+
+    def set_gauge(self, name: str, value: float, help_text: str = ""):
+        with self._lock:
+            self._gauges[name] = (help_text or name, value)
+
+    def register_gauge(self, name: str, callback: Callable[[], float], help_text: str = ""):
+        """
+        Register a gauge evaluated on every scrape. The callback must be cheap.
+
+        Args:
+            name (str): Metric name
+            callback (Callable[[], float]): Returns the current value
+            help_text (str): HELP line
+        """
+        with self._lock:
+            self._gauge_callbacks[name] = (help_text or name, callback)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            timings = {k: list(v) for k, v in self._timings.items()}
+            failures = dict(self._failures)
+            gauges = dict(self._gauges)
+            callbacks = dict(self._gauge_callbacks)
+
+        lines = []
+        for kind in ("handler", "job", "action"):
+            items = sorted((name, v) for (k, name), v in timings.items() if k == kind)
+            if not items:
+                continue
+            seconds = _Family(f"scs_bot_{kind}_duration_seconds", "summary",
+                              f"Execution time of bot {kind}s")
+            peak = _Family(f"scs_bot_{kind}_duration_max_seconds", "gauge",
+                           f"Longest execution time of bot {kind}s")
+            failed = _Family(f"scs_bot_{kind}_failures_total", "counter",
+                             f"Failed executions of bot {kind}s")
+            for name, (count, total, maximum) in items:
+                seconds.add(count, "_count", name=name)
+                seconds.add(total, "_sum", name=name)
+                peak.add(maximum, name=name)
+                failed.add(failures.get((kind, name), 0), name=name)
+            lines += seconds.lines + peak.lines + failed.lines
+
+        for name, (help_text, callback) in sorted(callbacks.items()):
+            try:
+                value = float(callback())
+            except Exception as e:
+                logging.debug("Gauge %s failed: %s", name, e)
+                continue
+            family = _Family(name, "gauge", help_text)
+            family.add(value)
+            lines += family.lines
+        for name, (help_text, value) in sorted(gauges.items()):
+            family = _Family(name, "gauge", help_text)
+            family.add(value)
+            lines += family.lines
+
+        family = _Family("scs_bot_uptime_seconds", "gauge", "Seconds since the bot started")
+        family.add(round(time.time() - self.started, 3))
+        return lines + family.lines
+
+
+def render_sample(sample: Sample) -> List[str]:
+    """
+    Render one host sample in exposition format
+
+    Args:
+        sample (Sample): Sample to render
+
+    Returns:
+        List[str]: Exposition lines
+    """
+    families = []
+
+    load = _Family("scs_host_load", "gauge", "Load average")
+    for period, value in zip(("1m", "5m", "15m"), sample.load):
+        load.add(value, period=period)
+    families.append(load)
+
+    for name, help_text, value in (
+            ("scs_host_cpu_percent", "CPU utilisation between the last two samples", sample.cpu_percent),
+            ("scs_host_cpu_count", "Number of logical CPUs", sample.cpu_count),
+            ("scs_host_memory_total_bytes", "Total memory", sample.mem_total),
+            ("scs_host_memory_available_bytes", "Available memory", sample.mem_available),
+            ("scs_host_swap_total_bytes", "Total swap", sample.swap_total),
+            ("scs_host_swap_free_bytes", "Free swap", sample.swap_free),
+            ("scs_host_processes", "Number of processes", sample.processes_total),
+            ("scs_host_sample_timestamp_seconds", "Time the sample was taken", sample.timestamp),
+    ):
+        family = _Family(name, "gauge", help_text)
+        family.add(value)
+        families.append(family)
+
+    disk_total = _Family("scs_host_disk_total_bytes", "gauge", "Filesystem size")
+    disk_used = _Family("scs_host_disk_used_bytes", "gauge", "Used filesystem space")
+    for mount, (total, used) in sorted(sample.disks.items()):
+        disk_total.add(total, mount=mount)
+        disk_used.add(used, mount=mount)
+    families += [disk_total, disk_used]
+
+    io_families = [
+        (_Family("scs_host_disk_io_read_bytes_per_second", "gauge", "Bytes read from the block device per second"),
+         "read_bps"),
+        (_Family("scs_host_disk_io_write_bytes_per_second", "gauge", "Bytes written to the block device per second"),
+         "write_bps"),
+        (_Family("scs_host_disk_io_await_milliseconds", "gauge", "Average time of a request to the block device"),
+         "await_ms"),
+        (_Family("scs_host_disk_io_utilization_percent", "gauge", "Share of time the block device was busy"),
+         "util_percent"),
+    ]
+    for device, stats in sorted(sample.disk_io.items()):
+        for family, attr in io_families:
+            family.add(getattr(stats, attr), device=device)
+    families += [family for family, _attr in io_families]
+
+    net_families = [
+        (_Family("scs_host_network_receive_bytes_per_second", "gauge", "Bytes received per second"), "rx_bps"),
+        (_Family("scs_host_network_transmit_bytes_per_second", "gauge", "Bytes sent per second"), "tx_bps"),
+        (_Family("scs_host_network_receive_packets_per_second", "gauge", "Packets received per second"), "rx_pps"),
+        (_Family("scs_host_network_transmit_packets_per_second", "gauge", "Packets sent per second"), "tx_pps"),
+        (_Family("scs_host_network_errors_per_second", "gauge", "Receive and transmit errors per second"),
+         "errors_per_sec"),
+        (_Family("scs_host_network_drops_per_second", "gauge", "Dropped packets per second"), "drops_per_sec"),
+    ]
+    for interface, stats in sorted(sample.net_io.items()):
+        for family, attr in net_families:
+            family.add(getattr(stats, attr), interface=interface)
+    families += [family for family, _attr in net_families]
+    for name, help_text, value in (
+            ("scs_host_tcp_retransmits_per_second", "TCP segments retransmitted per second",
+             sample.tcp_retrans_per_sec),
+            ("scs_host_tcp_retransmit_percent", "Retransmitted share of sent TCP segments",
+             sample.tcp_retrans_percent),
+    ):
+        family = _Family(name, "gauge", help_text)
+        family.add(value)
+        families.append(family)
+
+    top_cpu = _Family("scs_process_cpu_percent", "gauge", "CPU usage of the top processes by CPU")
+    for rank, proc in enumerate(sample.top_cpu, 1):
+        top_cpu.add(proc.cpu_percent, rank=rank, pid=proc.pid, name=proc.name)
+    top_mem = _Family("scs_process_rss_bytes", "gauge", "Resident memory of the top processes by memory")
+    for rank, proc in enumerate(sample.top_mem, 1):
+        top_mem.add(proc.rss_bytes, rank=rank, pid=proc.pid, name=proc.name)
+    top_io = _Family("scs_process_io_bytes_per_second", "gauge", "Storage I/O of the top processes by I/O")
+    for rank, proc in enumerate(sample.top_io, 1):
+        top_io.add(proc.io_bps, rank=rank, pid=proc.pid, name=proc.name)
+    families += [top_cpu, top_mem, top_io]
+
+    lines = []
+    for family in families:
+        lines += family.lines
+    return lines
+
+
+class MetricsRenderer:
+    """Renders the full payload, reusing host lines while the sample is unchanged."""
+
+    def __init__(self, buffer: SampleBuffer, bot_metrics: Optional[BotMetrics] = None):
+        self.buffer = buffer
+        self.bot_metrics = bot_metrics
+        self._cached: Tuple[Optional[float], str] = (None, "")
+
+    def render(self) -> str:
+        sample = self.buffer.latest()
+        host = ""
+        if sample is not None:
+            cached_ts, cached_text = self._cached
+            if cached_ts == sample.timestamp:
+                host = cached_text
+            else:
+                host = "\n".join(render_sample(sample)) + "\n"
+                self._cached = (sample.timestamp, host)
+        bot = ""
+        if self.bot_metrics is not None:
+            bot = "\n".join(self.bot_metrics.render()) + "\n"
+        return host + bot
+
+
+class MetricsServer:
+    """Embedded HTTP server exposing /metrics."""
+
+    def __init__(self, renderer: MetricsRenderer, port: int, bind: str = DEFAULT_BIND):
+        self.renderer = renderer
+        self.address = (bind, port)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        renderer = self.renderer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = renderer.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                logging.debug("metrics: " + format, *args)
+
+        self._server = ThreadingHTTPServer(self.address, Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        logging.info("Metrics endpoint listening on http://%s:%s/metrics", *self.address)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
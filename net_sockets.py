@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Socket table read from /proc/net/{tcp,tcp6,udp,udp6}.
+
+One pass over the tables yields the listening sockets, per-state TCP
+connection counts and the busiest remote peers; addresses are decoded
+only for the rows that are reported. Socket inodes of listeners can be
+mapped to the owning process, with the mapping cached between scans.
+"""
+import os
+import sys
+import time
+import socket
+import struct
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+PROC_ROOT = "/proc"
+TABLES = ("tcp", "tcp6", "udp", "udp6")
+TCP_STATES = {
+    "01": "ESTABLISHED", "02": "SYN_SENT", "03": "SYN_RECV", "04": "FIN_WAIT1",
+    "05": "FIN_WAIT2", "06": "TIME_WAIT", "07": "CLOSE", "08": "CLOSE_WAIT",
+    "09": "LAST_ACK", "0A": "LISTEN", "0B": "CLOSING", "0C": "NEW_SYN_RECV",
+}
+# State of an unconnected (bound) UDP socket
+UDP_UNCONNECTED = "07"
+# Minimum seconds between two full /proc/*/fd walks for unknown inodes
+PID_MAP_REFRESH_INTERVAL = 30.0
+
+
+def decode_address(value: str) -> Tuple[str, int]:
+    """
+    Decode an 'ADDR:PORT' field of a /proc/net table
+
+    Args:
+        value (str): e.g. '0100007F:0016' or a 32-digit IPv6 address
+
+    Returns:
+        Tuple[str, int]: (IP address, port)
+    """
+    addr, port = value.split(":")
+    if len(addr) == 8:
+        ip = socket.inet_ntop(socket.AF_INET, struct.pack("<I", int(addr, 16)))
+    else:
+        words = [int(addr[i:i + 8], 16) for i in range(0, 32, 8)]
+        ip = socket.inet_ntop(socket.AF_INET6, struct.pack("<4I", *words))
+        if ip.startswith("::ffff:") and "." in ip:
+            ip = ip[7:]
+    return ip, int(port, 16)
+
+
+@dataclass
+class Listener:
+    """A listening TCP or bound UDP socket."""
+    proto: str
+    ip: str
+    port: int
+    inode: int
+    pid: Optional[int] = None
+    process: str = ""
+
+    @property
+    def address(self) -> str:
+        return f"[{self.ip}]:{self.port}" if ":" in self.ip else f"{self.ip}:{self.port}"
+
+
+@dataclass
+class SocketSummary:
+    """Result of one scan of the socket tables."""
+    listeners: List[Listener] = field(default_factory=list)
+    states: Counter = field(default_factory=Counter)
+    peers: List[Tuple[str, int]] = field(default_factory=list)
+    udp_sockets: int = 0
+
+    def listening_ports(self) -> List[str]:
+        """Distinct 'port/proto' strings, sorted by port."""
+        ports = {(l.port, l.proto.rstrip("6")) for l in self.listeners}
+        return [f"{port}/{proto}" for port, proto in sorted(ports)]
+
+
+class InodePidMap:
+    """
+    Socket inode to (pid, process name) mapping.
+
+    /proc/*/fd is walked only when an inode is unknown and the previous walk
+    is older than PID_MAP_REFRESH_INTERVAL; entries of sockets that are gone
+    are dropped by prune().
+    """
+
+    def __init__(self, proc_root: str = PROC_ROOT):
+        self.proc_root = proc_root
+        self._map: Dict[int, Tuple[int, str]] = {}
+        self._refreshed = 0.0
+
+    def _refresh(self):
+        mapping = {}
+        for entry in os.listdir(self.proc_root):
+            if not entry.isdigit():
+                continue
+            fd_dir = os.path.join(self.proc_root, entry, "fd")
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            name = None
+            for fd in fds:
+                try:
+                    target = os.readlink(os.path.join(fd_dir, fd))
+                except OSError:
+                    continue
+                if target.startswith("socket:["):
+                    if name is None:
+                        try:
+                            with open(os.path.join(self.proc_root, entry, "comm"), "r", encoding="utf-8") as f:
+                                name = f.read().strip()
+                        except OSError:
+                            name = "?"
+                    mapping[int(target[8:-1])] = (int(entry), name)
+        self._map = mapping
+        self._refreshed = time.monotonic()
+
+    def resolve(self, inodes: List[int]) -> Dict[int, Tuple[int, str]]:
+        """
+        Map inodes to their owners
+
+        Args:
+            inodes (List[int]): Socket inodes
+
+        Returns:
+            Dict[int, Tuple[int, str]]: Inode to (pid, name) for the inodes found
+        """
+        missing = [i for i in inodes if i and i not in self._map]
+        if missing and time.monotonic() - self._refreshed >= PID_MAP_REFRESH_INTERVAL:
+            self._refresh()
+        return {i: self._map[i] for i in inodes if i in self._map}
+
+    def prune(self, live_inodes: set):
+        self._map = {i: owner for i, owner in self._map.items() if i in live_inodes}
+
+
+def scan_sockets(proc_root: str = PROC_ROOT, top_peers: int = 5,
+                 pid_map: Optional[InodePidMap] = None) -> SocketSummary:
+    """
+    Read all socket tables in one pass
+
+    Args:
+        proc_root (str): procfs mount point
+        top_peers (int): Number of remote peers with most connections to report
+        pid_map (InodePidMap, optional): Resolves listener owners when given
+
+    Returns:
+        SocketSummary: Listeners, TCP state counts and top peers
+    """
+    summary = SocketSummary()
+    peers: Counter = Counter()
+    for table in TABLES:
+        is_tcp = table.startswith("tcp")
+        try:
+            with open(os.path.join(proc_root, "net", table), "r", encoding="utf-8") as f:
+                next(f, None)
+                for line in f:
+                    parts = line.split()
+                    if len(parts) < 10:
+                        continue
+                    state = parts[3]
+                    if is_tcp:
+                        summary.states[TCP_STATES.get(state, state)] += 1
+                        if state == "0A":
+                            ip, port = decode_address(parts[1])
+                            summary.listeners.append(Listener(table, ip, port, int(parts[9])))
+                        elif state == "01":
+                            # Count by the raw address; only the top rows are decoded
+                            peers[parts[2].rsplit(":", 1)[0]] += 1
+                    else:
+                        summary.udp_sockets += 1
+                        if state == UDP_UNCONNECTED:
+                            ip, port = decode_address(parts[1])
+                            summary.listeners.append(Listener(table, ip, port, int(parts[9])))
+        except OSError:
+            continue
+    summary.peers = [(decode_address(raw + ":0")[0], count) for raw, count in peers.most_common(top_peers)]
+    if pid_map is not None:
+        inodes = [l.inode for l in summary.listeners]
+        owners = pid_map.resolve(inodes)
+        for listener in summary.listeners:
+            if listener.inode in owners:
+                listener.pid, listener.process = owners[listener.inode]
+        pid_map.prune(set(inodes))
+    summary.listeners.sort(key=lambda l: (l.port, l.proto))
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Socket summary from /proc/net")
+    parser.add_argument("--listen", action="store_true", help="print only listening sockets")
+    parser.add_argument("--pids", action="store_true", help="resolve the processes owning listeners")
+    parser.add_argument("--proc-root", default=PROC_ROOT)
+    args = parser.parse_args(argv)
+
+    pid_map = InodePidMap(args.proc_root) if args.pids else None
+    summary = scan_sockets(args.proc_root, pid_map=pid_map)
+    for l in summary.listeners:
+        owner = f"  {l.pid}/{l.process}" if l.pid else ""
+        print(f"{l.proto:<5} {l.address:<40}{owner}")
+    if not args.listen:
+        print(" ".join(f"{state}={count}" for state, count in summary.states.most_common()))
+        for ip, count in summary.peers:
+            print(f"peer {ip} {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,21 @@
 #!/bin/bash
 
+# Базовая директория
+SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+
 # Глобальные переменные
 LOG_DIR="/var/log"
 MAX_LOG_SIZE_MB=100
 DATE=$(date '+%Y-%m-%d_%H-%M-%S')
 OPTIMIZE_LOG="/var/log/optimize_server.log"
 CONFIG_FILE="/root/critical_processes_config.sh"
-
 # Загружаем конфигурацию
-if [ -f "$CONFIG_FILE" ]; then
+# Значения и функции конфига читаются из снапшота, который бот обновляет при каждом изменении конфига:
+# одно чтение без повторной загрузки конфига. Полный конфиг загружается, только если снапшота нет или он устарел
+CONFIG_SNAPSHOT="$(dirname "$CONFIG_FILE")/.config_snapshot.env"
+if [ -f "$CONFIG_SNAPSHOT" ] && ! [ "$CONFIG_FILE" -nt "$CONFIG_SNAPSHOT" ]; then
+  source "$CONFIG_SNAPSHOT"
+elif [ -f "$CONFIG_FILE" ]; then
   source "$CONFIG_FILE"
 else
   echo "Конфигурационный файл $CONFIG_FILE не найден. Используем значения по умолчанию."
@@ -23,7 +30,19 @@ else
 fi
 
 log_message() {
-  echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a $OPTIMIZE_LOG
+  # printf с %(...)T и перенаправление - встроенные в bash, строка лога не порождает процессов date и tee
+  local line
+  printf -v line '[%(%Y-%m-%d %H:%M:%S)T] %s' -1 "$1"
+  echo "$line"
+  echo "$line" >> $OPTIMIZE_LOG
+}
+
+# Перечитываем пороги и лимиты из снапшота, если он не старше конфига:
+# изменения лимитов подхватываются между этапами оптимизации без перезапуска скрипта
+reload_limits() {
+  if [ -f "$CONFIG_SNAPSHOT" ] && ! [ "$CONFIG_FILE" -nt "$CONFIG_SNAPSHOT" ]; then
+    source "$CONFIG_SNAPSHOT"
+  fi
 }
 
 # Записываем начало выполнения
@@ -73,6 +92,37 @@ $(echo "$top_processes" | tail -n +2 | head -5)</pre>
   fi
 }
 
+# Выполнение плана process_policy.py: строки "действие PID лимит имя".
+# Те же правила прогоняются на записях /proc через proc_replay.py.
+# Возвращает ошибку, если план получить не удалось: тогда работают встроенные правила
+apply_process_plan() {
+  local plan status action pid limit comm
+  plan=$(python3 "$SCRIPT_DIR/process_policy.py" --plan --config "$CONFIG_FILE" "$@" 2>>$OPTIMIZE_LOG)
+  status=$?
+  if [ $status -ne 0 ]; then
+    log_message "process_policy.py завершился с ошибкой (код $status), применяем встроенные правила"
+    return 1
+  fi
+  while read -r action pid limit comm; do
+    case "$action" in
+      limit)
+        log_message "Ограничиваем процесс $comm (PID: $pid) до $limit% CPU"
+        cpulimit -p $pid -l $limit -b 2>/dev/null
+        ;;
+      stop)
+        log_message "Останавливаем процесс $comm (PID: $pid)"
+        kill -15 $pid 2>/dev/null
+        ;;
+      restart)
+        log_message "Процесс $comm является критичным, перезапускаем его"
+        if systemctl list-unit-files | grep -q "$comm"; then
+          systemctl restart $comm 2>/dev/null
+        fi
+        ;;
+    esac
+  done <<< "$plan"
+}
+
 # Функция для проверки и остановки крупных процессов
 check_and_handle_heavy_processes() {
   log_message "Проверяем ресурсоемкие процессы..."
@@ -87,6 +137,10 @@ check_and_handle_heavy_processes() {
   log_message "Топ процессы по памяти:"
   echo "$TOP_MEM_PROCESSES" | tee -a $OPTIMIZE_LOG
   
+  if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/process_policy.py" ] && apply_process_plan; then
+    return
+  fi
+  
   # Ограничиваем процессы с высоким потреблением CPU
   for i in {1..5}; do
     PID=$(ps aux --sort=-%cpu | awk -v line=$((i+1)) 'NR==line {print $2}')
@@ -177,7 +231,12 @@ check_dependencies() {
   
   # Проверяем наличие ошибок в логах
   log_message "Проверяем логи на наличие ошибок..."
-  ERROR_LOGS=$(grep -i "error\|failed\|warning" /var/log/syslog /var/log/messages /var/log/dmesg 2>/dev/null | tail -n 50)
+  # Сканер читает только строки, добавленные с прошлого запуска, и группирует их по сигнатурам
+  if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/log_scanner.py" ]; then
+    ERROR_LOGS=$(python3 "$SCRIPT_DIR/log_scanner.py" --top 50 2>/dev/null)
+  else
+    ERROR_LOGS=$(grep -i "error\|failed\|warning" /var/log/syslog /var/log/messages /var/log/dmesg 2>/dev/null | tail -n 50)
+  fi
   if [ -n "$ERROR_LOGS" ]; then
     log_message "Обнаружены ошибки в системных логах:"
     echo "$ERROR_LOGS" | tee -a $OPTIMIZE_LOG
@@ -206,32 +265,47 @@ done
 
 # Проверяем и очищаем большие лог-файлы
 log_message "Проверяем и очищаем большие лог-файлы..."
-find /home -name "*.log" -size +${MAX_LOG_SIZE_MB}M -type f | while read file; do
-  log_message "Архивирую большой лог-файл: $file"
-  cp "$file" "${file}.${DATE}.bak"
-  echo "Log rotated on ${DATE}" > "$file"
-done
+# Инкрементальный индекс перечитывает только изменившиеся каталоги вместо полного обхода find
+if [ ${#DISK_SCAN_ROOTS[@]} -eq 0 ]; then
+  DISK_SCAN_ROOTS=("/home")
+fi
+if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/log_rotation.py" ]; then
+  # Потоковое сжатие и усечение на месте: без полной копии на диске и без смены inode у открытых логов
+  ROTATE_ARGS=()
+  for root in "${DISK_SCAN_ROOTS[@]}"; do
+    ROTATE_ARGS+=(--root "$root")
+  done
+  python3 "$SCRIPT_DIR/log_rotation.py" "${ROTATE_ARGS[@]}" --max-size "${MAX_LOG_SIZE_MB}M" \
+    --compress "${LOG_ROTATE_COMPRESSION:-gzip}" --keep "${LOG_ROTATE_KEEP:-5}" \
+    --max-age-days "${MAX_HISTORY_DAYS:-7}" 2>&1 | tee -a $OPTIMIZE_LOG
+else
+  LARGE_LOGS=$(find "${DISK_SCAN_ROOTS[@]}" -name "*.log" -size +${MAX_LOG_SIZE_MB}M -type f)
+  echo "$LARGE_LOGS" | while read file; do
+    [ -n "$file" ] || continue
+    log_message "Архивирую большой лог-файл: $file"
+    gzip -c "$file" > "${file}.${DATE}.gz" && truncate -s 0 "$file"
+  done
+fi
 
-# Очищаем кэш памяти
-log_message "Очищаем кэш памяти..."
-sync && echo 3 > /proc/sys/vm/drop_caches
-
-# Управление clamd процессом, который потребляет много памяти
-log_message "Проверяем потребление памяти процессом clamd..."
-CLAMD_MEM_PERCENT=$(ps aux | grep clamd | grep -v grep | awk '{print $4}' | head -1)
-if [ -n "$CLAMD_MEM_PERCENT" ]; then
-  if (( $(echo "$CLAMD_MEM_PERCENT > 20" | bc -l) )); then
-    log_message "clamd потребляет ${CLAMD_MEM_PERCENT}% памяти, останавливаем контейнер..."
-    docker stop mailcowdockerized-clamd-mailcow-1 >/dev/null 2>&1
-    log_message "Ожидаем 30 секунд перед перезапуском clamd с ограничением памяти..."
-    sleep 30
-    log_message "Перезапускаем clamd с ограничением памяти..."
-    docker start mailcowdockerized-clamd-mailcow-1 >/dev/null 2>&1
-    docker update --memory=256m --memory-swap=384m mailcowdockerized-clamd-mailcow-1 >/dev/null 2>&1
-  fi
+# Освобождаем память только при давлении (PSI) и только из cgroup с большим неактивным кэшем
+log_message "Проверяем давление на память (PSI)..."
+if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/memory_reclaim.py" ]; then
+  python3 "$SCRIPT_DIR/memory_reclaim.py" 2>&1 | tee -a $OPTIMIZE_LOG
+else
+  log_message "python3 недоступен, сбрасываем только page cache..."
+  sync && echo 1 > /proc/sys/vm/drop_caches
+fi
+
+# Политики памяти контейнеров: статистика читается из cgroupfs, лимиты выставляются через docker update
+log_message "Проверяем потребление памяти контейнерами..."
+if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/container_stats.py" ]; then
+  python3 "$SCRIPT_DIR/container_stats.py" enforce 2>&1 | tee -a $OPTIMIZE_LOG
+else
+  log_message "python3 недоступен, политики памяти контейнеров пропущены"
 fi
 
 # Первая проверка тяжелых процессов
+reload_limits
 check_and_handle_heavy_processes
 
 # Проверка зависимостей
@@ -246,6 +320,7 @@ INITIAL_LOAD=$(cat /proc/loadavg | cut -d' ' -f1)
 log_message "Текущая нагрузка после первой оптимизации: $INITIAL_LOAD"
 
 # Если нагрузка все еще высокая, применяем более строгие меры
+reload_limits
 if check_load; then
   log_message "Нагрузка все еще высокая, применяем более строгие меры..."
   
@@ -253,39 +328,43 @@ if check_load; then
   send_alert
   
   # Вторая проверка тяжелых процессов с более строгими ограничениями
-  for i in {1..10}; do
-    PID=$(ps aux --sort=-%cpu | awk -v line=$((i+1)) 'NR==line {print $2}')
-    if [ -n "$PID" ]; then
-      COMM=$(ps -p $PID -o comm=)
-      CPU_PERCENT=$(ps aux --sort=-%cpu | awk -v line=$((i+1)) 'NR==line {print $3}')
+  if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/process_policy.py" ] && apply_process_plan --strict; then
+    log_message "Строгие меры применены по плану process_policy.py"
+  else
+    for i in {1..10}; do
+      PID=$(ps aux --sort=-%cpu | awk -v line=$((i+1)) 'NR==line {print $2}')
+      if [ -n "$PID" ]; then
+        COMM=$(ps -p $PID -o comm=)
+        CPU_PERCENT=$(ps aux --sort=-%cpu | awk -v line=$((i+1)) 'NR==line {print $3}')
       
-      log_message "Строгое ограничение для процесса $COMM (PID: $PID) с CPU: $CPU_PERCENT%"
+        log_message "Строгое ограничение для процесса $COMM (PID: $PID) с CPU: $CPU_PERCENT%"
       
-      # Используем функции из конфига если доступны
-      if type is_critical_process &>/dev/null && type is_stoppable_process &>/dev/null; then
-        if is_stoppable_process "$COMM"; then
-          log_message "Останавливаем некритичный процесс $COMM (PID: $PID)"
-          kill -15 $PID 2>/dev/null
-        elif is_critical_process "$COMM"; then
-          log_message "Строго ограничиваем критичный процесс $COMM (PID: $PID) до $CPU_LIMIT_CRITICAL% CPU"
-          cpulimit -p $PID -l $CPU_LIMIT_CRITICAL -b 2>/dev/null
-        else 
-          log_message "Ограничиваем процесс $COMM (PID: $PID) до $CPU_LIMIT_STRICT% CPU"
-          cpulimit -p $PID -l $CPU_LIMIT_STRICT -b 2>/dev/null
-        fi
-      else
-        # Используем старую логику если функций нет
-        if ! echo "$COMM" | grep -qE 'nginx|sshd|systemd|mysql|postgres|docker|bash|sh'; then
-          log_message "Останавливаем некритичный процесс $COMM (PID: $PID)"
-          kill -15 $PID 2>/dev/null
+        # Используем функции из конфига если доступны
+        if type is_critical_process &>/dev/null && type is_stoppable_process &>/dev/null; then
+          if is_stoppable_process "$COMM"; then
+            log_message "Останавливаем некритичный процесс $COMM (PID: $PID)"
+            kill -15 $PID 2>/dev/null
+          elif is_critical_process "$COMM"; then
+            log_message "Строго ограничиваем критичный процесс $COMM (PID: $PID) до $CPU_LIMIT_CRITICAL% CPU"
+            cpulimit -p $PID -l $CPU_LIMIT_CRITICAL -b 2>/dev/null
+          else 
+            log_message "Ограничиваем процесс $COMM (PID: $PID) до $CPU_LIMIT_STRICT% CPU"
+            cpulimit -p $PID -l $CPU_LIMIT_STRICT -b 2>/dev/null
+          fi
         else
-          # Иначе сильно ограничиваем
-          log_message "Строго ограничиваем критичный процесс $COMM (PID: $PID) до 5% CPU"
-          cpulimit -p $PID -l 5 -b 2>/dev/null
+          # Используем старую логику если функций нет
+          if ! echo "$COMM" | grep -qE 'nginx|sshd|systemd|mysql|postgres|docker|bash|sh'; then
+            log_message "Останавливаем некритичный процесс $COMM (PID: $PID)"
+            kill -15 $PID 2>/dev/null
+          else
+            # Иначе сильно ограничиваем
+            log_message "Строго ограничиваем критичный процесс $COMM (PID: $PID) до 5% CPU"
+            cpulimit -p $PID -l 5 -b 2>/dev/null
+          fi
         fi
       fi
-    fi
-  done
+    done
+  fi
   
   # Останавливаем некритичные сервисы
   log_message "Останавливаем некритичные сервисы..."
@@ -319,7 +398,11 @@ if check_load; then
     
     # Отправляем второе уведомление с полной диагностикой
     DISK_INFO=$(df -h)
-    NET_INFO=$(netstat -tuln | head -20)
+    if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/net_sockets.py" ]; then
+      NET_INFO=$(python3 "$SCRIPT_DIR/net_sockets.py" 2>/dev/null | head -20)
+    else
+      NET_INFO=$(netstat -tuln | head -20)
+    fi
     
     if type send_telegram_notification &>/dev/null; then
       log_message "Отправляем расширенное уведомление в Telegram"
@@ -342,7 +425,11 @@ if check_load; then
     
     # Проверяем сетевые соединения
     log_message "Проверяем сетевые соединения..."
-    netstat -tuln | tee -a $OPTIMIZE_LOG
+    if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/net_sockets.py" ]; then
+      python3 "$SCRIPT_DIR/net_sockets.py" --pids | tee -a $OPTIMIZE_LOG
+    else
+      netstat -tuln | tee -a $OPTIMIZE_LOG
+    fi
     
     # Проверяем открытые файлы
     log_message "Проверяем количество открытых файлов..."
@@ -351,7 +438,11 @@ if check_load; then
     # Проверяем запущенные контейнеры Docker
     if command -v docker &> /dev/null; then
       log_message "Проверяем контейнеры Docker..."
-      docker stats --no-stream | tee -a $OPTIMIZE_LOG
+      if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/container_stats.py" ]; then
+        python3 "$SCRIPT_DIR/container_stats.py" top | tee -a $OPTIMIZE_LOG
+      else
+        docker stats --no-stream | tee -a $OPTIMIZE_LOG
+      fi
     fi
     
     # Последняя мера - перезагрузка некритичных сервисов
@@ -362,17 +453,33 @@ if check_load; then
 fi
 
 # Более строгое ограничение для ночного времени
-HOUR=$(date +%H)
-if [ $HOUR -ge $NIGHT_START ] && [ $HOUR -lt $NIGHT_END ]; then
+reload_limits
+HOUR=$((10#$(date +%H)))
+# Ночное окно может переходить через полночь (22 -> 7)
+if [ "$NIGHT_START" -le "$NIGHT_END" ]; then
+  [ $HOUR -ge $NIGHT_START ] && [ $HOUR -lt $NIGHT_END ] && IS_NIGHT=1 || IS_NIGHT=0
+else
+  { [ $HOUR -ge $NIGHT_START ] || [ $HOUR -lt $NIGHT_END ]; } && IS_NIGHT=1 || IS_NIGHT=0
+fi
+if command -v python3 &> /dev/null && [ -f "$SCRIPT_DIR/profile_scheduler.py" ]; then
+  # Ночным режимом управляет планировщик профилей: состояние общее с ботом, поэтому
+  # ограничения не дублируются, а утром снимаются и контейнеры размораживаются
+  log_message "Применяем профиль ресурсов по расписанию"
+  python3 "$SCRIPT_DIR/profile_scheduler.py" reconcile 2>&1 | tee -a $OPTIMIZE_LOG
+elif [ $IS_NIGHT -eq 1 ]; then
   # Ночное время - более строгие ограничения
   log_message "Ночное время - применяем строгие ограничения ресурсов"
   for pid in $(ps aux | grep node | grep -v grep | awk '{print $2}'); do
     cpulimit -p $pid -l $NIGHT_CPU_LIMIT -b 2>/dev/null
   done
   
-  # Временно остановить clamd на ночь
-  log_message "Ночное время - останавливаем clamd до утра"
-  docker stop mailcowdockerized-clamd-mailcow-1 >/dev/null 2>&1
+  # Временно останавливаем контейнеры из CONTAINER_NIGHT_STOP до утра
+  log_message "Ночное время - останавливаем контейнеры из CONTAINER_NIGHT_STOP"
+  for pattern in "${CONTAINER_NIGHT_STOP[@]}"; do
+    for name in $(docker ps --format '{{.Names}}' 2>/dev/null | grep -- "$pattern"); do
+      docker stop "$name" >/dev/null 2>&1
+    done
+  done
 fi
 
 log_message "=== Завершение оптимизации сервера ==="
@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+Record and replay procfs snapshots.
+
+A recording is a JSON-lines file, gzip-compressed when its name ends in
+.gz. The first line is a header and every other line is one frame: the
+host-wide files (stat, meminfo, loadavg, ...) and, per process, stat, the
+main lines of status, the byte counters of io and cgroup. A frame only
+carries the files that changed since the previous frame and the PIDs that
+exited, so idle processes cost nothing after the first frame.
+
+Replaying writes the frames one by one into a directory laid out like
+/proc and runs the sampler and the optimizer decisions (process_policy.py)
+against it with the recorded clock. The same file format is produced by
+the synthetic scenarios, which simulate tens of thousands of processes, so
+scan and decision costs can be measured and policy changes compared
+without a loaded server.
+
+Usage:
+    proc_replay.py record capture.jsonl.gz --frames 6 --interval 10
+    proc_replay.py synth storm.jsonl.gz --processes 50000 --scenario fork_storm
+    proc_replay.py replay storm.jsonl.gz --config new_config.sh --baseline critical_processes_config.sh
+    proc_replay.py bench storm.jsonl.gz
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import shutil
+import argparse
+import statistics
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from process_policy import Decision, ProcessClassifier, decide
+from server_config import CONFIG_FILE, ServerConfig, load_server_config
+from system_sampler import CLOCK_TICKS, PAGE_SIZE, PROC_ROOT, ProcessSample, Sampler
+
+FORMAT_VERSION = 1
+# Host-wide files kept in a frame; mounts is left out, disk usage is not replayable
+HOST_FILES = ("stat", "meminfo", "loadavg", "uptime", "diskstats", "net/dev", "net/snmp")
+PID_FILES = ("stat", "status", "io", "cgroup")
+# Lines of /proc/[pid]/status and /proc/[pid]/io worth keeping
+STATUS_FIELDS = ("Name:", "State:", "PPid:", "Uid:", "Threads:", "VmRSS:", "VmSwap:")
+IO_FIELDS = ("read_bytes:", "write_bytes:")
+SCENARIOS = ("steady", "cpu_hog", "memory_leak", "fork_storm")
+# Directory replays are written to when none is given; tmpfs keeps disk speed out of the timings
+REPLAY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+Frame = Dict[str, object]
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _keep_lines(text: Optional[str], prefixes: Tuple[str, ...]) -> Optional[str]:
+    if text is None:
+        return None
+    return "".join(line + "\n" for line in text.splitlines() if line.startswith(prefixes))
+
+
+def read_frame(proc_root: str = PROC_ROOT) -> Tuple[Dict[str, str], Dict[str, Dict[str, str]]]:
+    """
+    Read the recorded files of procfs once
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, Dict[str, str]]]: Host files by name and
+            per-process files by PID; unreadable files are left out
+    """
+    host = {}
+    for name in HOST_FILES:
+        text = _read(os.path.join(proc_root, name))
+        if text is not None:
+            host[name] = text
+    pids = {}
+    for entry in os.listdir(proc_root):
+        if not entry.isdigit():
+            continue
+        base = os.path.join(proc_root, entry)
+        stat = _read(os.path.join(base, "stat"))
+        if stat is None:
+            continue
+        files = {"stat": stat}
+        for name, text in (("status", _keep_lines(_read(os.path.join(base, "status")), STATUS_FIELDS)),
+                           ("io", _keep_lines(_read(os.path.join(base, "io")), IO_FIELDS)),
+                           ("cgroup", _read(os.path.join(base, "cgroup")))):
+            if text:
+                files[name] = text
+        pids[entry] = files
+    return host, pids
+
+
+class FrameEncoder:
+    """Turns full snapshots into frames that carry only what changed."""
+
+    def __init__(self):
+        self._host: Dict[str, str] = {}
+        self._pids: Dict[str, Dict[str, str]] = {}
+
+    def encode(self, timestamp: float, host: Dict[str, str], pids: Dict[str, Dict[str, str]]) -> Frame:
+        """
+        Build the next frame
+
+        Args:
+            timestamp (float): Unix time of the snapshot
+            host (Dict[str, str]): Host files by name
+            pids (Dict[str, Dict[str, str]]): Per-process files by PID
+
+        Returns:
+            Frame: Changed files and exited PIDs
+        """
+        changed_host = {name: text for name, text in host.items() if self._host.get(name) != text}
+        changed_pids = {}
+        for pid, files in pids.items():
+            before = self._pids.get(pid)
+            if before is None:
+                changed_pids[pid] = files
+                continue
+            # A reused PID has a new stat start time, so its stat line differs anyway
+            delta = {name: text for name, text in files.items() if before.get(name) != text}
+            if delta:
+                changed_pids[pid] = delta
+        gone = [pid for pid in self._pids if pid not in pids]
+        self._host = dict(host)
+        self._pids = pids
+        return {"time": round(timestamp, 3), "host": changed_host, "pids": changed_pids, "gone": gone}
+
+
+def write_recording(path: str, frames: Iterable[Frame], source: str, interval: float) -> int:
+    """
+    Write frames to a recording file
+
+    Args:
+        path (str): Output file, gzip-compressed if it ends in .gz
+        frames (Iterable[Frame]): Frames in time order
+        source (str): Where the frames came from, kept in the header
+        interval (float): Nominal seconds between frames
+
+    Returns:
+        int: Number of frames written
+    """
+    count = 0
+    with _open(path, "w") as f:
+        header = {"format": "proc-replay", "version": FORMAT_VERSION, "source": source, "interval": interval,
+                  "clock_ticks": CLOCK_TICKS, "page_size": PAGE_SIZE}
+        f.write(json.dumps(header) + "\n")
+        for frame in frames:
+            f.write(json.dumps(frame, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+
+def read_recording(path: str) -> Tuple[Dict[str, object], Iterator[Frame]]:
+    """
+    Open a recording
+
+    Args:
+        path (str): Recording file
+
+    Returns:
+        Tuple[Dict[str, object], Iterator[Frame]]: Header and a lazy frame iterator
+
+    Raises:
+        ValueError: If the file is not a recording of a supported version
+    """
+    f = _open(path, "r")
+    try:
+        header = json.loads(f.readline() or "{}")
+    except json.JSONDecodeError:
+        header = {}
+    if header.get("format") != "proc-replay" or header.get("version") != FORMAT_VERSION:
+        f.close()
+        raise ValueError(f"{path} is not a proc-replay recording of version {FORMAT_VERSION}")
+
+    def frames() -> Iterator[Frame]:
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return header, frames()
+
+
+def record(proc_root: str = PROC_ROOT, frames: int = 6, interval: float = 10.0) -> Iterator[Frame]:
+    """
+    Snapshot procfs repeatedly
+
+    Args:
+        proc_root (str): procfs mount point
+        frames (int): Number of snapshots
+        interval (float): Seconds between snapshot starts
+
+    Yields:
+        Frame: One frame per snapshot
+    """
+    encoder = FrameEncoder()
+    for index in range(frames):
+        started = time.monotonic()
+        timestamp = time.time()
+        host, pids = read_frame(proc_root)
+        yield encoder.encode(timestamp, host, pids)
+        if index + 1 < frames:
+            time.sleep(max(interval - (time.monotonic() - started), 0.0))
+
+
+@dataclass
+class _SimProcess:
+    pid: int
+    ppid: int
+    name: str
+    start: int
+    rss_pages: int
+    ticks: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    state: str = "S"
+
+
+# Command names of simulated processes with their weights
+SYNTHETIC_NAMES = (("php-fpm", 20), ("python3", 10), ("node", 10), ("bash", 10), ("sshd", 5), ("nginx", 8),
+                   ("postgres", 8), ("java", 4), ("cron", 1), ("worker", 15), ("kworker/0:1", 5), ("rg", 2),
+                   ("chrome", 2))
+# Processes that go heavy in the cpu_hog scenario
+HOG_NAMES = ("node", "chrome", "nginx", "ffmpeg", "rg")
+
+
+class Simulator:
+    """
+    Synthetic host producing procfs text.
+
+    Every scenario runs a background of mostly sleeping processes, of which
+    a small share runs in each interval; the scenario adds its load on top.
+    """
+
+    def __init__(self, processes: int, scenario: str = "steady", cpus: int = 16, seed: int = 0,
+                 mem_total: int = 64 * 1024 ** 3):
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario}, expected one of {', '.join(SCENARIOS)}")
+        self.scenario = scenario
+        self.cpus = cpus
+        self.rng = random.Random(seed)
+        self.uptime = 86400.0
+        self.clock = 1700000000.0
+        self.cpu_busy = 0
+        self.cpu_total = 0
+        self.next_pid = 300
+        self.mem_total = mem_total
+        names, weights = zip(*SYNTHETIC_NAMES)
+        self._names, self._weights = names, weights
+        self.procs: Dict[int, _SimProcess] = {}
+        self.procs[1] = _SimProcess(1, 0, "systemd", 1, 3000)
+        for _ in range(processes - 1):
+            self._spawn(start=self.rng.randint(100, int(self.uptime * CLOCK_TICKS) - 1))
+        self.hogs = [self._spawn(name=name) for name in HOG_NAMES] if scenario == "cpu_hog" else []
+        self.leak = self._spawn(name="java") if scenario == "memory_leak" else None
+        # Keep the background at about a tenth of the memory
+        pages = sum(p.rss_pages for p in self.procs.values())
+        self.mem_total = max(self.mem_total, pages * PAGE_SIZE * 10)
+
+    def _spawn(self, name: Optional[str] = None, start: Optional[int] = None) -> _SimProcess:
+        pid = self.next_pid
+        self.next_pid += 1
+        name = name or self.rng.choices(self._names, self._weights)[0]
+        start = int(self.uptime * CLOCK_TICKS) if start is None else start
+        proc = _SimProcess(pid, 1, name, start, self.rng.randint(64, 4096))
+        self.procs[pid] = proc
+        return proc
+
+    def step(self, interval: float):
+        """Advance the simulation by one interval."""
+        self.uptime += interval
+        self.clock += interval
+        slot = int(CLOCK_TICKS * interval)
+        busy = 0
+        for proc in self.procs.values():
+            proc.state = "S"
+        # 2% of the background runs for up to a fifth of the interval
+        for pid in self.rng.sample(list(self.procs), max(len(self.procs) // 50, 1)):
+            proc = self.procs[pid]
+            ticks = self.rng.randint(1, max(slot // 5, 1))
+            proc.ticks += ticks
+            proc.write_bytes += self.rng.choice((0, 0, 4096, 65536))
+            proc.state = "R"
+            busy += ticks
+        for proc in self.hogs:
+            ticks = int(slot * self.rng.uniform(0.9, 1.0))
+            proc.ticks += ticks
+            proc.state = "R"
+            busy += ticks
+        if self.leak is not None:
+            # Grows by 8% of memory per interval, from 5% up to 60%
+            pages = self.mem_total // PAGE_SIZE
+            self.leak.rss_pages = min(max(self.leak.rss_pages, pages // 20) + pages * 8 // 100, pages * 60 // 100)
+            self.leak.ticks += slot // 4
+            busy += slot // 4
+        if self.scenario == "fork_storm":
+            # A tenth of the processes is replaced by short-lived shells every interval
+            for pid in self.rng.sample([p for p in self.procs if p > 1], len(self.procs) // 10):
+                del self.procs[pid]
+                proc = self._spawn(name=self.rng.choice(("bash", "sh", "curl", "grep")))
+                proc.ticks = self.rng.randint(1, max(slot // 10, 1))
+                busy += proc.ticks
+        total = slot * self.cpus
+        self.cpu_busy += min(busy, total)
+        self.cpu_total += total
+
+    def snapshot(self) -> Tuple[float, Dict[str, str], Dict[str, Dict[str, str]]]:
+        """Current time, host files and per-process files."""
+        running = sum(1 for p in self.procs.values() if p.state == "R")
+        used = sum(p.rss_pages for p in self.procs.values()) * PAGE_SIZE
+        available = max(self.mem_total - used, 0)
+        idle = self.cpu_total - self.cpu_busy
+        load = min(running, self.cpus * 4) * 1.0
+        host = {
+            "stat": f"cpu  {self.cpu_busy} 0 0 {idle} 0 0 0 0 0 0\n"
+                    + "".join(f"cpu{i} 0 0 0 0 0 0 0 0 0 0\n" for i in range(self.cpus))
+                    + f"procs_running {running}\n",
+            "meminfo": f"MemTotal:       {self.mem_total // 1024} kB\nMemFree:        {available // 1024} kB\n"
+                       f"MemAvailable:   {available // 1024} kB\nSwapTotal:      0 kB\nSwapFree:       0 kB\n",
+            "loadavg": f"{load:.2f} {load:.2f} {load:.2f} {running}/{len(self.procs)} {self.next_pid - 1}\n",
+            "uptime": f"{self.uptime:.2f} {idle / CLOCK_TICKS:.2f}\n",
+        }
+        pids = {}
+        for proc in self.procs.values():
+            utime = proc.ticks * 3 // 4
+            stat = (f"{proc.pid} ({proc.name}) {proc.state} {proc.ppid} {proc.pid} {proc.pid} 0 -1 4194560 "
+                    f"0 0 0 0 {utime} {proc.ticks - utime} 0 0 20 0 1 0 {proc.start} "
+                    f"{proc.rss_pages * PAGE_SIZE * 4} {proc.rss_pages}" + " 0" * 29 + "\n")
+            status = (f"Name:\t{proc.name}\nState:\t{proc.state}\nPPid:\t{proc.ppid}\nUid:\t0\t0\t0\t0\n"
+                      f"Threads:\t1\nVmRSS:\t{proc.rss_pages * PAGE_SIZE // 1024} kB\n")
+            io = f"read_bytes: {proc.read_bytes}\nwrite_bytes: {proc.write_bytes}\n"
+            pids[str(proc.pid)] = {"stat": stat, "status": status, "io": io,
+                                   "cgroup": f"0::/system.slice/{proc.name.split('/')[0]}.service\n"}
+        return self.clock, host, pids
+
+
+def synthesize(processes: int, frames: int = 6, interval: float = 10.0, scenario: str = "steady",
+               seed: int = 0) -> Iterator[Frame]:
+    """
+    Generate a synthetic recording
+
+    Args:
+        processes (int): Number of background processes
+        frames (int): Number of frames
+        interval (float): Simulated seconds between frames
+        scenario (str): One of SCENARIOS
+        seed (int): Random seed, the same seed gives the same recording
+
+    Yields:
+        Frame: One frame per simulated interval
+    """
+    sim = Simulator(processes, scenario, seed=seed)
+    encoder = FrameEncoder()
+    for index in range(frames):
+        if index:
+            sim.step(interval)
+        yield encoder.encode(*sim.snapshot())
+
+
+class ProcTree:
+    """Directory laid out like /proc, updated frame by frame."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def apply(self, frame: Frame):
+        """Write the changed files of a frame and remove exited processes."""
+        for name, text in frame["host"].items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        for pid in frame["gone"]:
+            shutil.rmtree(os.path.join(self.root, pid), ignore_errors=True)
+        for pid, files in frame["pids"].items():
+            base = os.path.join(self.root, pid)
+            if not os.path.isdir(base):
+                os.mkdir(base)
+            for name, text in files.items():
+                if name in PID_FILES:
+                    with open(os.path.join(base, name), "w", encoding="utf-8") as f:
+                        f.write(text)
+
+
+@dataclass
+class FrameResult:
+    """Outcome and cost of replaying one frame."""
+    index: int
+    timestamp: float
+    processes: int
+    decisions: List[Decision]
+    baseline: Optional[List[Decision]] = None
+    write_seconds: float = 0.0
+    collect_seconds: float = 0.0
+    decide_seconds: float = 0.0
+    changed: int = 0
+
+
+@dataclass
+class Policy:
+    """Limits and classifier of one configuration file."""
+    cfg: ServerConfig
+    classifier: ProcessClassifier = field(default_factory=ProcessClassifier)
+
+    @classmethod
+    def load(cls, path: str = CONFIG_FILE) -> "Policy":
+        return cls(load_server_config(path), ProcessClassifier.from_config(path))
+
+
+def replay(frames: Iterable[Frame], proc_root: str, policy: Policy, baseline: Optional[Policy] = None,
+           strict: bool = False) -> Iterator[FrameResult]:
+    """
+    Replay frames through the sampler and the optimizer decisions
+
+    The first frame has no CPU rates yet, so only memory decisions can
+    come out of it.
+
+    Args:
+        frames (Iterable[Frame]): Frames in time order
+        proc_root (str): Empty directory to build the fake procfs in
+        policy (Policy): Policy under test
+        baseline (Policy, optional): Policy to compare against on the same processes
+        strict (bool): Decide as in the strict second pass
+
+    Yields:
+        FrameResult: One result per frame
+    """
+    tree = ProcTree(proc_root)
+    sampler = Sampler(buffer_size=1, proc_root=proc_root)
+    scanned: List[List[ProcessSample]] = []
+    sampler.add_listener(lambda sample, processes: scanned.append(processes))
+    for index, frame in enumerate(frames):
+        started = time.perf_counter()
+        tree.apply(frame)
+        written = time.perf_counter()
+        sample = sampler.sample_once(frame["time"])
+        collected = time.perf_counter()
+        processes = scanned.pop()
+        decisions = decide(processes, sample.mem_total, policy.cfg, policy.classifier, strict)
+        decided = time.perf_counter()
+        result = FrameResult(index, frame["time"], len(processes), decisions,
+                             write_seconds=written - started, collect_seconds=collected - written,
+                             decide_seconds=decided - collected, changed=len(frame["pids"]))
+        if baseline is not None:
+            result.baseline = decide(processes, sample.mem_total, baseline.cfg, baseline.classifier, strict)
+        yield result
+
+
+def _format_decision(d: Decision) -> str:
+    limit = f" to {d.limit}%" if d.action == "limit" else ""
+    return f"{d.action}{limit}: {d.name} (PID: {d.pid}), {d.reason}"
+
+
+def _decision_key(d: Decision) -> Tuple[int, str, int]:
+    return d.pid, d.action, d.limit
+
+
+def _replay_dir(path: Optional[str]) -> Tuple[str, bool]:
+    if path:
+        os.makedirs(path, exist_ok=True)
+        if os.listdir(path):
+            raise ValueError(f"Replay directory {path} is not empty")
+        return path, False
+    return tempfile.mkdtemp(prefix="proc-replay-", dir=REPLAY_DIR), True
+
+
+def _summary(name: str, values: List[float]) -> str:
+    return (f"{name:<8} median {statistics.median(values) * 1000:9.1f} ms  "
+            f"max {max(values) * 1000:9.1f} ms  total {sum(values):7.2f} s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Record and replay procfs snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="snapshot this host's procfs")
+    rec.add_argument("output")
+    rec.add_argument("--frames", type=int, default=6)
+    rec.add_argument("--interval", type=float, default=10.0)
+    rec.add_argument("--proc-root", default=PROC_ROOT, help="procfs mount point")
+
+    synth = commands.add_parser("synth", help="generate a synthetic recording")
+    synth.add_argument("output")
+    synth.add_argument("--processes", type=int, default=10000)
+    synth.add_argument("--frames", type=int, default=6)
+    synth.add_argument("--interval", type=float, default=10.0)
+    synth.add_argument("--scenario", choices=SCENARIOS, default="steady")
+    synth.add_argument("--seed", type=int, default=0)
+
+    for name, help_text in (("replay", "print the optimizer decisions of a recording"),
+                            ("bench", "time scanning and deciding over a recording")):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("input")
+        sub.add_argument("--proc-root", help="empty directory for the fake procfs, a temporary one by default")
+        sub.add_argument("--config", default=CONFIG_FILE, help="configuration of the policy under test")
+        sub.add_argument("--strict", action="store_true", help="decisions of the second, strict pass")
+        if name == "replay":
+            sub.add_argument("--baseline", help="configuration to compare against, prints only differences")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        count = write_recording(args.output, record(args.proc_root, args.frames, args.interval),
+                                args.proc_root, args.interval)
+        print(f"Recorded {count} frames to {args.output}")
+        return 0
+    if args.command == "synth":
+        frames = synthesize(args.processes, args.frames, args.interval, args.scenario, args.seed)
+        count = write_recording(args.output, frames, f"synthetic:{args.scenario}:{args.processes}", args.interval)
+        print(f"Generated {count} frames to {args.output}")
+        return 0
+
+    try:
+        header, frames = read_recording(args.input)
+        proc_root, temporary = _replay_dir(args.proc_root)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if header.get("clock_ticks") != CLOCK_TICKS or header.get("page_size") != PAGE_SIZE:
+        print(f"Warning: recorded with {header.get('clock_ticks')} ticks and {header.get('page_size')} byte pages, "
+              f"replayed with {CLOCK_TICKS} and {PAGE_SIZE}", file=sys.stderr)
+    policy = Policy.load(args.config)
+    baseline = Policy.load(args.baseline) if getattr(args, "baseline", None) else None
+    results = []
+    try:
+        for result in replay(frames, proc_root, policy, baseline, args.strict):
+            results.append(result)
+            if args.command == "bench":
+                print(f"frame {result.index}: {result.processes} processes, {result.changed} changed, "
+                      f"write {result.write_seconds * 1000:.1f} ms, collect {result.collect_seconds * 1000:.1f} ms, "
+                      f"decide {result.decide_seconds * 1000:.2f} ms")
+            elif baseline is None:
+                print(f"frame {result.index} ({result.processes} processes):")
+                for d in result.decisions:
+                    print(f"  {_format_decision(d)}")
+            else:
+                ours = {_decision_key(d): d for d in result.decisions}
+                theirs = {_decision_key(d): d for d in result.baseline}
+                for key in sorted(ours.keys() - theirs.keys()):
+                    print(f"frame {result.index} + {_format_decision(ours[key])}")
+                for key in sorted(theirs.keys() - ours.keys()):
+                    print(f"frame {result.index} - {_format_decision(theirs[key])}")
+    finally:
+        if temporary:
+            shutil.rmtree(proc_root, ignore_errors=True)
+    if not results:
+        print("No frames in the recording")
+        return 1
+    if args.command == "bench":
+        # The first frame writes and scans every process from scratch
+        rest = results[1:] or results
+        print(f"{len(results)} frames from {header.get('source')}, first frame left out of the medians")
+        print(_summary("write", [r.write_seconds for r in rest]))
+        print(_summary("collect", [r.collect_seconds for r in rest]))
+        print(_summary("decide", [r.decide_seconds for r in rest]))
+    elif baseline is not None:
+        changed = sum(1 for r in results if {_decision_key(d) for d in r.decisions}
+                      != {_decision_key(d) for d in r.baseline})
+        print(f"{changed} of {len(results)} frames decide differently")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Decision rules of optimize_server.sh as a pure function.
+
+Given a process list, decide() returns what the optimizer would do to each
+heavy process: limit its CPU with cpulimit, stop it or restart its service.
+Nothing is executed here; optimize_server.sh runs the plan printed by
+--plan, and proc_replay.py feeds recorded or synthetic process lists
+through the same rules.
+
+Processes are classified with the grep patterns of is_critical_process,
+is_limitable_process and is_stoppable_process, read from
+critical_processes_config.sh, so editing those functions changes the
+policy in both places.
+"""
+import re
+import sys
+import time
+import heapq
+import argparse
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from server_config import CONFIG_FILE, ServerConfig, load_server_config
+from system_sampler import PROC_ROOT, ProcessSample, ProcessScanner, read_meminfo
+
+# Processes examined per pass, as 'ps aux | head' in the script
+TOP_PROCESSES = 5
+STRICT_TOP_PROCESSES = 10
+# Levels above which a top process is handled
+CPU_HEAVY_PERCENT = 50.0
+MEM_HEAVY_PERCENT = 30.0
+# Limit of processes that match no config pattern
+FALLBACK_CPU_LIMIT = 15
+# Seconds between the two scans a CPU rate is measured over
+DEFAULT_SCAN_INTERVAL = 1.0
+
+# Patterns used when critical_processes_config.sh has no such function
+DEFAULT_PATTERNS = {
+    "is_critical_process": ["systemd|sshd|nginx|mysql|postgres|mariadb|docker|containerd|cron|udevd|rsyslog"
+                            "|fail2ban|supervisord", "python3|game_card_bot.py"],
+    "is_limitable_process": ["node|python|php|java|ruby|perl|bash"],
+    "is_stoppable_process": ["chrome|firefox|rg|find|grep|unused_service|test|ripgrep", "cursor|vscode|rg"],
+}
+_GREP_RE = re.compile(r"grep -qE '([^']*)'")
+
+
+@dataclass
+class Decision:
+    """One action the optimizer takes on a process."""
+    pid: int
+    name: str
+    action: str  # limit, stop, restart
+    limit: int = 0
+    reason: str = ""
+
+
+class ProcessClassifier:
+    """Classifies process names as critical, limitable or stoppable."""
+
+    def __init__(self, patterns: Optional[Dict[str, List[str]]] = None):
+        patterns = dict(DEFAULT_PATTERNS, **(patterns or {}))
+        self._critical = [re.compile(p) for p in patterns["is_critical_process"]]
+        self._limitable = [re.compile(p) for p in patterns["is_limitable_process"]]
+        stoppable = [re.compile(p) for p in patterns["is_stoppable_process"]]
+        # is_stoppable_process checks critical processes after its first pattern
+        self._stoppable, self._stoppable_unless_critical = stoppable[:1], stoppable[1:]
+        self._cache: Dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls, path: str = CONFIG_FILE) -> "ProcessClassifier":
+        """
+        Read the grep patterns of the classification functions
+
+        Args:
+            path (str): Path to critical_processes_config.sh
+
+        Returns:
+            ProcessClassifier: Classifier, with defaults for missing functions
+        """
+        patterns: Dict[str, List[str]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return cls()
+        for function in DEFAULT_PATTERNS:
+            match = re.search(r"^" + function + r"\(\)\s*\{\n(.*?)^\}", text, re.M | re.S)
+            found = _GREP_RE.findall(match.group(1)) if match else []
+            if found:
+                patterns[function] = found
+        return cls(patterns)
+
+    def classify(self, name: str) -> str:
+        """
+        Get the class of a process name
+
+        Args:
+            name (str): Command name
+
+        Returns:
+            str: critical, limitable, stoppable or other
+        """
+        kind = self._cache.get(name)
+        if kind is not None:
+            return kind
+        if any(p.search(name) for p in self._critical):
+            kind = "critical"
+        elif any(p.search(name) for p in self._limitable):
+            kind = "limitable"
+        elif any(p.search(name) for p in self._stoppable + self._stoppable_unless_critical):
+            kind = "stoppable"
+        else:
+            kind = "other"
+        self._cache[name] = kind
+        return kind
+
+    def is_stoppable(self, name: str) -> bool:
+        """is_stoppable_process, which also holds for some limitable names."""
+        if any(p.search(name) for p in self._stoppable):
+            return True
+        return self.classify(name) != "critical" and any(p.search(name) for p in self._stoppable_unless_critical)
+
+
+def decide(processes: List[ProcessSample], mem_total: int, cfg: ServerConfig,
+           classifier: Optional[ProcessClassifier] = None, strict: bool = False) -> List[Decision]:
+    """
+    Decide what the optimizer does to the heaviest processes
+
+    Args:
+        processes (List[ProcessSample]): Scanned processes with CPU rates
+        mem_total (int): Total memory in bytes
+        cfg (ServerConfig): Limits to apply
+        classifier (ProcessClassifier, optional): Name classifier, read from the config by default
+        strict (bool): Second pass of a load that stayed high
+
+    Returns:
+        List[Decision]: Actions in the order the script runs them
+    """
+    classifier = classifier or ProcessClassifier.from_config()
+    decisions = []
+    if strict:
+        # The strict pass takes the top processes regardless of their usage
+        for proc in heapq.nlargest(STRICT_TOP_PROCESSES, processes, key=lambda p: p.cpu_percent):
+            reason = f"CPU {proc.cpu_percent:.1f}%, load still high"
+            if classifier.is_stoppable(proc.name):
+                decisions.append(Decision(proc.pid, proc.name, "stop", reason=reason))
+            elif classifier.classify(proc.name) == "critical":
+                decisions.append(Decision(proc.pid, proc.name, "limit", cfg.cpu_limit_critical, reason))
+            else:
+                decisions.append(Decision(proc.pid, proc.name, "limit", cfg.cpu_limit_strict, reason))
+        return decisions
+
+    for proc in heapq.nlargest(TOP_PROCESSES, processes, key=lambda p: p.cpu_percent):
+        if proc.cpu_percent <= CPU_HEAVY_PERCENT:
+            break
+        reason = f"CPU {proc.cpu_percent:.1f}%"
+        kind = classifier.classify(proc.name)
+        if kind == "critical":
+            decisions.append(Decision(proc.pid, proc.name, "limit", cfg.cpu_limit_normal, reason))
+        elif kind == "limitable":
+            decisions.append(Decision(proc.pid, proc.name, "limit", cfg.cpu_limit_strict, reason))
+        elif classifier.is_stoppable(proc.name):
+            decisions.append(Decision(proc.pid, proc.name, "stop", reason=reason))
+        else:
+            decisions.append(Decision(proc.pid, proc.name, "limit", FALLBACK_CPU_LIMIT, reason))
+
+    if mem_total <= 0:
+        return decisions
+    for proc in heapq.nlargest(TOP_PROCESSES, processes, key=lambda p: p.rss_bytes):
+        mem_percent = proc.rss_bytes * 100.0 / mem_total
+        if mem_percent <= MEM_HEAVY_PERCENT:
+            break
+        reason = f"memory {mem_percent:.1f}%"
+        if classifier.classify(proc.name) == "critical":
+            decisions.append(Decision(proc.pid, proc.name, "restart", reason=reason))
+        else:
+            decisions.append(Decision(proc.pid, proc.name, "stop", reason=reason))
+    return decisions
+
+
+def scan_processes(proc_root: str = PROC_ROOT, interval: float = DEFAULT_SCAN_INTERVAL) -> List[ProcessSample]:
+    """
+    Scan processes twice to measure their current CPU usage
+
+    Args:
+        proc_root (str): procfs mount point
+        interval (float): Seconds between the scans
+
+    Returns:
+        List[ProcessSample]: Processes of the second scan
+    """
+    scanner = ProcessScanner(proc_root, read_io=False)
+    scanner.scan()
+    time.sleep(interval)
+    return scanner.scan()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Optimizer decisions for heavy processes")
+    parser.add_argument("--strict", action="store_true", help="decisions of the second, strict pass")
+    parser.add_argument("--plan", action="store_true",
+                        help="print 'action pid limit name' lines for optimize_server.sh")
+    parser.add_argument("--config", default=CONFIG_FILE, help="path to critical_processes_config.sh")
+    parser.add_argument("--proc-root", default=PROC_ROOT, help="procfs mount point")
+    parser.add_argument("--interval", type=float, default=DEFAULT_SCAN_INTERVAL,
+                        help="seconds the CPU usage is measured over")
+    args = parser.parse_args(argv)
+
+    processes = scan_processes(args.proc_root, args.interval)
+    mem_total = read_meminfo(args.proc_root).get("MemTotal", 0)
+    decisions = decide(processes, mem_total, load_server_config(args.config),
+                       ProcessClassifier.from_config(args.config), args.strict)
+    for d in decisions:
+        if args.plan:
+            print(f"{d.action} {d.pid} {d.limit} {d.name}")
+        else:
+            limit = f" to {d.limit}%" if d.action == "limit" else ""
+            print(f"{d.action}{limit}: {d.name} (PID: {d.pid}), {d.reason}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,13 +7,22 @@ CGROUP_DIR="/sys/fs/cgroup"
 PROCESS_LIST_FILE="/root/managed_processes.conf"
 
 # Загружаем конфигурацию, если она существует
-if [ -f "$CONFIG_FILE" ]; then
+# Значения и функции конфига читаются из снапшота, который бот обновляет при каждом изменении конфига:
+# одно чтение без повторной загрузки конфига. Полный конфиг загружается, только если снапшота нет или он устарел
+CONFIG_SNAPSHOT="$(dirname "$CONFIG_FILE")/.config_snapshot.env"
+if [ -f "$CONFIG_SNAPSHOT" ] && ! [ "$CONFIG_FILE" -nt "$CONFIG_SNAPSHOT" ]; then
+  source "$CONFIG_SNAPSHOT"
+elif [ -f "$CONFIG_FILE" ]; then
   source "$CONFIG_FILE"
 fi
 
 # Функция логирования
 log_message() {
-  echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a $LOG_FILE
+  # printf с %(...)T и перенаправление - встроенные в bash, строка лога не порождает процессов date и tee
+  local line
+  printf -v line '[%(%Y-%m-%d %H:%M:%S)T] %s' -1 "$1"
+  echo "$line"
+  echo "$line" >> $LOG_FILE
 }
 
 log_message "=== Запуск менеджера ресурсов процессов ==="
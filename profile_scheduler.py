@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Time-based resource profiles.
+
+A profile is a set of 'kind:target=value' settings:
+
+    nice:node=10        priority of processes whose name contains 'node'
+    cpu:node=10         cpulimit cap in percent for those processes
+    memory:clamd=256M   memory.max of containers whose name contains 'clamd'
+    freeze:clamd=1      containers paused through cgroup.freeze
+
+The scheduler knows the transition times of the day, switches profiles
+at them and applies only the settings that differ from what is already
+applied; settings missing from the new profile are reverted. The applied
+settings are persisted, so a restart in the middle of the night neither
+applies them twice nor forgets to revert them in the morning. Between
+transitions refresh() extends the active cpu and nice settings to
+processes started after them and restarts cpulimit where it died.
+"""
+import os
+import sys
+import json
+import signal
+import logging
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from server_config import ServerConfig, load_server_config, parse_size
+from container_stats import ContainerCollector
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(BASE_DIR, "profile_state.json")
+PROC_ROOT = "/proc"
+KINDS = ("nice", "cpu", "memory", "freeze")
+# Seconds to wait for a terminated cpulimit to exit
+CPULIMIT_EXIT_TIMEOUT = 5
+
+Profile = Dict[str, str]
+
+
+def parse_profile(entries: List[str]) -> Profile:
+    """
+    Parse profile entries, skipping invalid ones
+
+    Args:
+        entries (List[str]): 'kind:target=value' strings
+
+    Returns:
+        Profile: Setting key 'kind:target' to value
+    """
+    profile = {}
+    for entry in entries:
+        key, sep, value = entry.partition("=")
+        kind, _, target = key.partition(":")
+        if not sep or kind not in KINDS or not target or not value:
+            logging.warning("Invalid profile entry: %s", entry)
+            continue
+        profile[key] = value
+    return profile
+
+
+def parse_schedule(entries: List[str]) -> List[Tuple[int, str]]:
+    """
+    Parse 'HH:MM=profile' transitions
+
+    Args:
+        entries (List[str]): Transition strings
+
+    Returns:
+        List[Tuple[int, str]]: (minute of day, profile name), sorted by time
+    """
+    transitions = []
+    for entry in entries:
+        at, sep, name = entry.partition("=")
+        try:
+            hours, minutes = (int(x) for x in at.split(":"))
+            if not sep or not name or not (0 <= hours < 24 and 0 <= minutes < 60):
+                raise ValueError
+        except ValueError:
+            logging.warning("Invalid profile schedule entry: %s", entry)
+            continue
+        transitions.append((hours * 60 + minutes, name))
+    return sorted(transitions)
+
+
+def profiles_from_config(cfg: ServerConfig) -> Tuple[Dict[str, Profile], List[Tuple[int, str]]]:
+    """
+    Build profiles and the schedule from the configuration
+
+    Without PROFILE_SCHEDULE the night window NIGHT_START..NIGHT_END is
+    used; without PROFILE_NIGHT the night profile caps LIMIT_PROCESSES at
+    NIGHT_CPU_LIMIT and freezes CONTAINER_NIGHT_STOP.
+
+    Args:
+        cfg (ServerConfig): Configuration
+
+    Returns:
+        Tuple[Dict[str, Profile], List[Tuple[int, str]]]: Profiles and transitions
+    """
+    night = cfg.profile_night or (
+        [f"cpu:{p}={cfg.night_cpu_limit}" for p in cfg.limit_processes]
+        + [f"freeze:{p}=1" for p in cfg.container_night_stop]
+    )
+    profiles = {"day": parse_profile(cfg.profile_day), "night": parse_profile(night)}
+    schedule = parse_schedule(cfg.profile_schedule or
+                              [f"{cfg.night_start:02d}:00=night", f"{cfg.night_end:02d}:00=day"])
+    return profiles, schedule
+
+
+class ProfileScheduler:
+    """
+    Applies the profile that is due according to the schedule.
+
+    reconcile() is idempotent: it computes the due profile, diffs it with
+    the persisted applied settings and changes only what differs.
+    """
+
+    def __init__(self, profiles: Dict[str, Profile], schedule: List[Tuple[int, str]],
+                 state_file: str = STATE_FILE, proc_root: str = PROC_ROOT,
+                 cgroup_root: str = "/sys/fs/cgroup"):
+        self.profiles = profiles
+        self.schedule = schedule
+        self.state_file = state_file
+        self.proc_root = proc_root
+        self.containers = ContainerCollector(cgroup_root)
+        self._lock = threading.Lock()
+        # cpulimit: target -> {limited pid: cpulimit pid}, nice: target -> {pid: original priority}
+        self.state = {"active": None, "applied": {}, "originals": {}, "cpulimit": {}, "nice": {}}
+        # cpulimit processes started by this process, waited for by _reap()
+        self._children: Dict[int, subprocess.Popen] = {}
+        self._handlers: Dict[str, Tuple[Callable[[str, str], None], Callable[[str], None]]] = {
+            "nice": (self._apply_nice, self._revert_nice),
+            "cpu": (self._apply_cpu, self._revert_cpu),
+            "memory": (self._apply_memory, self._revert_memory),
+            "freeze": (self._apply_freeze, self._revert_freeze),
+        }
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state.update(json.load(f))
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning("Profile state %s ignored: %s", self.state_file, e)
+
+    def _save(self):
+        tmp_path = f"{self.state_file}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logging.error("Cannot save profile state %s: %s", self.state_file, e)
+
+    def update(self, profiles: Dict[str, Profile], schedule: List[Tuple[int, str]]):
+        with self._lock:
+            self.profiles = profiles
+            self.schedule = schedule
+
+    def due_profile(self, now: datetime) -> Optional[str]:
+        """
+        Get the profile of the last transition at or before now
+
+        Args:
+            now (datetime): Current time
+
+        Returns:
+            Optional[str]: Profile name, None without a schedule
+        """
+        if not self.schedule:
+            return None
+        minute = now.hour * 60 + now.minute
+        due = self.schedule[-1][1]  # Before the first transition the last one of yesterday holds
+        for at, name in self.schedule:
+            if at <= minute:
+                due = name
+        return due
+
+    def next_transition(self, now: datetime) -> Optional[datetime]:
+        """
+        Get the time of the next transition after now
+
+        Args:
+            now (datetime): Current time
+
+        Returns:
+            Optional[datetime]: Next transition, None without a schedule
+        """
+        if not self.schedule:
+            return None
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in (0, 1):
+            for at, _name in self.schedule:
+                when = midnight + timedelta(days=day, minutes=at)
+                if when > now:
+                    return when
+        return None
+
+    def reconcile(self, now: Optional[datetime] = None) -> Tuple[Optional[str], List[str]]:
+        """
+        Bring the applied settings in line with the due profile
+
+        Args:
+            now (datetime, optional): Current time
+
+        Returns:
+            Tuple[Optional[str], List[str]]: (due profile, changed setting keys)
+        """
+        now = now or datetime.now()
+        with self._lock:
+            name = self.due_profile(now)
+            if name is None:
+                return None, []
+            wanted = self.profiles.get(name, {})
+            applied = self.state["applied"]
+            changed = []
+            self._reap()
+            for key in [k for k in applied if k not in wanted]:
+                kind, _, target = key.partition(":")
+                self._run(self._handlers[kind][1], key, target)
+                del applied[key]
+                changed.append(key)
+            for key, value in wanted.items():
+                if applied.get(key) == value:
+                    # After a restart cpulimit is gone while the state says applied
+                    self._refresh(key, value)
+                    continue
+                kind, _, target = key.partition(":")
+                if self._run(self._handlers[kind][0], key, target, value):
+                    applied[key] = value
+                    changed.append(key)
+            self.state["active"] = name
+            self._save()
+        if changed:
+            logging.info("Profile %s: %d settings changed (%s)", name, len(changed), ", ".join(changed))
+        return name, changed
+
+    def refresh(self) -> int:
+        """
+        Extend the applied cpu and nice settings to new processes
+
+        The due profile is not switched here, that is left to reconcile().
+
+        Returns:
+            int: Processes the settings were applied to
+        """
+        with self._lock:
+            self._reap()
+            count = sum(self._refresh(key, value) for key, value in list(self.state["applied"].items()))
+            self._save()
+        if count:
+            logging.info("Profile %s extended to %d new processes", self.state["active"], count)
+        return count
+
+    def _refresh(self, key: str, value: str) -> int:
+        kind, _, target = key.partition(":")
+        handler = {"cpu": self._limit_new, "nice": self._nice_new}.get(kind)
+        if handler is None:
+            return 0
+        try:
+            return handler(target, value)
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            logging.error("Profile setting %s failed: %s", key, e)
+            return 0
+
+    def _reap(self):
+        for pid, proc in list(self._children.items()):
+            if proc.poll() is not None:
+                del self._children[pid]
+
+    @staticmethod
+    def _run(handler, key: str, *args) -> bool:
+        try:
+            handler(*args)
+            return True
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            logging.error("Profile setting %s failed: %s", key, e)
+            return False
+
+    def _pids(self, pattern: str) -> List[int]:
+        pids = []
+        for entry in os.listdir(self.proc_root):
+            if entry.isdigit() and int(entry) != os.getpid():
+                try:
+                    with open(os.path.join(self.proc_root, entry, "comm"), "r", encoding="utf-8") as f:
+                        comm = f.read().strip()
+                    # cpulimit of 'limit' would otherwise limit itself
+                    if pattern in comm and comm != "cpulimit":
+                        pids.append(int(entry))
+                except OSError:
+                    continue
+        return pids
+
+    def _container_cgroups(self, pattern: str) -> List[str]:
+        return [cgroup for cid, cgroup in self.containers.discover().items()
+                if pattern in self.containers.container_name(cid)]
+
+    def _set_nice(self, target: str, value: str, pids: List[int]) -> int:
+        originals = self.state["nice"].setdefault(target, {})
+        count = 0
+        for pid in pids:
+            try:
+                if str(pid) not in originals:
+                    originals[str(pid)] = os.getpriority(os.PRIO_PROCESS, pid)
+                os.setpriority(os.PRIO_PROCESS, pid, int(value))
+                count += 1
+            except ProcessLookupError:
+                originals.pop(str(pid), None)
+        return count
+
+    def _apply_nice(self, target: str, value: str):
+        self._set_nice(target, value, self._pids(target))
+
+    def _nice_new(self, target: str, value: str) -> int:
+        known = self.state["nice"].get(target, {})
+        return self._set_nice(target, value, [pid for pid in self._pids(target) if str(pid) not in known])
+
+    def _revert_nice(self, target: str):
+        for pid, priority in self.state["nice"].pop(target, {}).items():
+            try:
+                os.setpriority(os.PRIO_PROCESS, int(pid), priority)
+            except ProcessLookupError:
+                continue
+
+    def _cpulimit_alive(self, pid: int) -> bool:
+        proc = self._children.get(pid)
+        if proc is not None:
+            return proc.poll() is None
+        try:
+            # Started before a restart; the pid may have been reused since
+            with open(os.path.join(self.proc_root, str(pid), "comm"), "r", encoding="utf-8") as f:
+                return f.read().strip() == "cpulimit"
+        except OSError:
+            return False
+
+    def _apply_cpu(self, target: str, value: str):
+        self._revert_cpu(target)
+        self._limit_new(target, value)
+
+    def _limit_new(self, target: str, value: str) -> int:
+        limits = self.state["cpulimit"].setdefault(target, {})
+        for pid in [p for p, limiter in limits.items() if not self._cpulimit_alive(limiter)]:
+            del limits[pid]
+        count = 0
+        for pid in self._pids(target):
+            if str(pid) in limits:
+                continue
+            # -z: cpulimit exits together with its target
+            proc = subprocess.Popen(["cpulimit", "-p", str(pid), "-l", str(int(value)), "-z"],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self._children[proc.pid] = proc
+            limits[str(pid)] = proc.pid
+            count += 1
+        return count
+
+    def _revert_cpu(self, target: str):
+        for pid in self.state["cpulimit"].pop(target, {}).values():
+            if not self._cpulimit_alive(pid):
+                continue
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                continue
+            proc = self._children.pop(pid, None)
+            if proc is not None:
+                try:
+                    proc.wait(timeout=CPULIMIT_EXIT_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    # Waited for by the next _reap()
+                    self._children[pid] = proc
+
+    def _apply_memory(self, target: str, value: str):
+        limit = str(parse_size(value))
+        for cgroup in self._container_cgroups(target):
+            path = os.path.join(cgroup, "memory.max")
+            originals = self.state["originals"]
+            if path not in originals:
+                with open(path, "r", encoding="utf-8") as f:
+                    originals[path] = f.read().strip()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(limit)
+
+    def _revert_memory(self, target: str):
+        originals = self.state["originals"]
+        for path in [p for p in originals if os.path.basename(p) == "memory.max"]:
+            if any(path.startswith(c + os.sep) for c in self._container_cgroups(target)):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(originals.pop(path))
+
+    def _apply_freeze(self, target: str, value: str):
+        for cgroup in self._container_cgroups(target):
+            with open(os.path.join(cgroup, "cgroup.freeze"), "w", encoding="utf-8") as f:
+                f.write("1" if value not in ("0", "false", "no") else "0")
+
+    def _revert_freeze(self, target: str):
+        self._apply_freeze(target, "0")
+
+
+def create_scheduler(cfg: Optional[ServerConfig] = None, state_file: str = STATE_FILE) -> ProfileScheduler:
+    cfg = cfg or load_server_config()
+    profiles, schedule = profiles_from_config(cfg)
+    return ProfileScheduler(profiles, schedule, state_file=state_file, cgroup_root=cfg.cgroup_root)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time-based resource profiles")
+    parser.add_argument("command", choices=("status", "reconcile"))
+    parser.add_argument("--state", default=STATE_FILE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    scheduler = create_scheduler(state_file=args.state)
+    now = datetime.now()
+    if args.command == "reconcile":
+        scheduler.reconcile(now)
+    print(f"active: {scheduler.state['active']}, due: {scheduler.due_profile(now)}, "
+          f"next transition: {scheduler.next_transition(now)}")
+    for key, value in sorted(scheduler.state["applied"].items()):
+        print(f"  {key}={value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
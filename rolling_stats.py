@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Rolling percentiles over fixed time windows.
+
+For every metric and window a sorted array of the values inside the window
+is maintained incrementally: a new sample is inserted with bisect and the
+samples that fall out of the window are removed the same way, so p50, p95,
+p99 and max are index lookups when the stats are requested. Seeding the
+windows from the history uses NumPy's vectorized sort when it is installed
+and falls back to sorted() otherwise.
+"""
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Optional, Sequence
+
+try:
+    import numpy
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+DEFAULT_WINDOWS = (3600, 86400, 7 * 86400)
+PERCENTILES = (50, 95, 99)
+# Expired points kept at the head of the time-ordered columns before they are cut
+COMPACT_THRESHOLD = 4096
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """
+    Linear-interpolated percentile of sorted values (NumPy's default method)
+
+    Args:
+        sorted_values (Sequence[float]): Values in ascending order
+        q (float): Percentile, 0-100
+
+    Returns:
+        float: Percentile value, 0.0 for no values
+    """
+    n = len(sorted_values)
+    if n == 0:
+        return 0.0
+    rank = (n - 1) * q / 100.0
+    lo = int(rank)
+    hi = min(lo + 1, n - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (rank - lo)
+
+
+def _sorted_array(values: Sequence[float]) -> array:
+    if NUMPY_AVAILABLE and len(values):
+        return array("d", numpy.sort(numpy.asarray(values, dtype=float)).tobytes())
+    return array("d", sorted(values))
+
+
+class _MetricWindows:
+    """Time-ordered columns of one metric and a sorted array per window."""
+
+    def __init__(self, windows: Sequence[int]):
+        self.windows = tuple(windows)
+        self.ts = array("d")
+        self.values = array("d")
+        self.heads = [0] * len(self.windows)
+        self.sorted = [array("d") for _ in self.windows]
+
+    def seed(self, ts: Sequence[float], values: Sequence[float]):
+        self.ts = array("d", ts)
+        self.values = array("d", values)
+        end = self.ts[-1] if self.ts else 0.0
+        for i, window in enumerate(self.windows):
+            self.heads[i] = bisect_left(self.ts, end - window)
+            self.sorted[i] = _sorted_array(self.values[self.heads[i]:])
+
+    def add(self, timestamp: float, value: float):
+        if self.ts and timestamp <= self.ts[-1]:
+            return
+        self.ts.append(timestamp)
+        self.values.append(value)
+        for i, window in enumerate(self.windows):
+            window_sorted = self.sorted[i]
+            insort(window_sorted, value)
+            head = self.heads[i]
+            cutoff = timestamp - window
+            while self.ts[head] < cutoff:
+                del window_sorted[bisect_left(window_sorted, self.values[head])]
+                head += 1
+            self.heads[i] = head
+        oldest = min(self.heads)
+        if oldest >= COMPACT_THRESHOLD:
+            del self.ts[:oldest]
+            del self.values[:oldest]
+            self.heads = [h - oldest for h in self.heads]
+
+
+class RollingStats:
+    """
+    Percentiles of several metrics over several windows.
+
+    add() is called from the sampler thread, summary() from bot handlers.
+    """
+
+    def __init__(self, windows: Sequence[int] = DEFAULT_WINDOWS):
+        self.windows = tuple(windows)
+        self._metrics: Dict[str, _MetricWindows] = {}
+        self._lock = threading.Lock()
+
+    def seed(self, store, metrics: Iterable[str]):
+        """
+        Fill the windows from a HistoryStore, e.g. after a restart
+
+        Args:
+            store (HistoryStore): History to read
+            metrics (Iterable[str]): Metric names
+        """
+        longest = max(self.windows)
+        for name in metrics:
+            ts, values = store.window(name, longest)
+            metric = _MetricWindows(self.windows)
+            metric.seed(ts, values)
+            with self._lock:
+                self._metrics[name] = metric
+
+    def add(self, timestamp: float, values: Dict[str, float]):
+        with self._lock:
+            for name, value in values.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = _MetricWindows(self.windows)
+                metric.add(timestamp, float(value))
+
+    def summary(self, name: str, window: int) -> Optional[Dict[str, float]]:
+        """
+        Get p50/p95/p99/max of a metric over a window
+
+        Args:
+            name (str): Metric name
+            window (int): One of the configured windows in seconds
+
+        Returns:
+            Optional[Dict[str, float]]: {'p50', 'p95', 'p99', 'max', 'count'} or None without data
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None or window not in self.windows:
+                return None
+            window_sorted = metric.sorted[self.windows.index(window)]
+            if not window_sorted:
+                return None
+            result = {f"p{q}": percentile(window_sorted, q) for q in PERCENTILES}
+            result["max"] = window_sorted[-1]
+            result["count"] = len(window_sorted)
+            return result
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Sampling profiler for the running bot.
+
+Nothing is installed until a profile is requested, so the bot pays
+nothing while the profiler is off. A profile run starts one thread that
+reads the stacks of every other thread with sys._current_frames() every
+few milliseconds and counts, per function, how often it was on top of a
+stack (self time) and anywhere in it (cumulative time). Sampling does not
+slow the profiled code the way cProfile's per-call hooks would, so a
+sluggish bot can be examined in production.
+
+The CPU time of each thread is read from /proc/self/task around the
+window, which tells a thread burning CPU from one that is merely waiting.
+tracemalloc is started for the same window and the report ends with the
+source lines whose allocations grew the most.
+"""
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_DURATION = 10.0
+MAX_DURATION = 60.0
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP = 25
+# Frames kept per allocation traceback; 1 is enough for a per-line diff and cheapest
+TRACEMALLOC_FRAMES = 1
+# Functions where an idle thread sits; not reported as the hottest
+IDLE_FUNCTIONS = frozenset({"wait", "select", "poll", "sleep", "accept", "readinto", "recv_into",
+                            "_wait_for_tstate_lock"})
+
+_running = threading.Lock()
+
+
+@dataclass
+class ProfileReport:
+    """Result of one profiling window."""
+    duration: float
+    samples: int
+    cumulative: Counter = field(default_factory=Counter)
+    own: Counter = field(default_factory=Counter)
+    threads: Counter = field(default_factory=Counter)
+    thread_cpu: Dict[str, float] = field(default_factory=dict)
+    allocations: List[tracemalloc.StatisticDiff] = field(default_factory=list)
+    memory: Tuple[int, int] = (0, 0)
+
+    def top(self, limit: int = DEFAULT_TOP) -> List[Tuple[str, int, int]]:
+        """Functions by cumulative samples: (function, cumulative, self)."""
+        return [(name, count, self.own[name]) for name, count in self.cumulative.most_common(limit)]
+
+    def hottest(self) -> Optional[str]:
+        """Function most often on top of a stack, idle waits excluded."""
+        for name, _count in self.own.most_common():
+            if name.split(" ", 1)[0] not in IDLE_FUNCTIONS:
+                return name
+        return None
+
+
+def _thread_cpu() -> Dict[str, float]:
+    """CPU seconds used so far by each thread of this process, by thread name."""
+    ticks = os.sysconf("SC_CLK_TCK")
+    result = {}
+    for thread in threading.enumerate():
+        try:
+            with open(f"/proc/self/task/{thread.native_id}/stat", "r", encoding="utf-8") as f:
+                fields = f.read().rpartition(")")[2].split()
+        except (OSError, TypeError):
+            continue
+        # utime and stime are fields 14 and 15 of stat, 12 and 13 after the command name
+        result[thread.name] = (int(fields[11]) + int(fields[12])) / ticks
+    return result
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(report: ProfileReport, duration: float, interval: float, skip: set):
+    names = {}
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names.update((t.ident, t.name) for t in threading.enumerate() if t.ident not in names)
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident in skip:
+                continue
+            report.samples += 1
+            report.threads[names.get(ident, str(ident))] += 1
+            report.own[_frame_name(frame)] += 1
+            # A recursive function counts once per sample
+            seen = set()
+            while frame is not None:
+                name = _frame_name(frame)
+                if name not in seen:
+                    seen.add(name)
+                    report.cumulative[name] += 1
+                frame = frame.f_back
+        time.sleep(interval)
+
+
+def run_profile(duration: float = DEFAULT_DURATION, interval: float = DEFAULT_INTERVAL,
+                top: int = DEFAULT_TOP) -> Optional[ProfileReport]:
+    """
+    Profile the current process for a while; blocks the calling thread
+
+    Args:
+        duration (float): Seconds to sample, capped at MAX_DURATION
+        interval (float): Seconds between stack samples
+        top (int): Allocation lines kept in the report
+
+    Returns:
+        Optional[ProfileReport]: The report, None if another profile is running
+    """
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        duration = min(max(duration, 1.0), MAX_DURATION)
+        report = ProfileReport(duration, 0)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        before = tracemalloc.take_snapshot()
+        cpu_before = _thread_cpu()
+        # The calling thread only waits, so it is left out with the sampler itself
+        _sample(report, duration, interval, {threading.get_ident()})
+        cpu_after = _thread_cpu()
+        report.thread_cpu = {name: seconds - cpu_before.get(name, 0.0) for name, seconds in cpu_after.items()}
+        after = tracemalloc.take_snapshot()
+        report.memory = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        report.allocations = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")[:top]
+        return report
+    finally:
+        _running.release()
+
+
+def format_report(report: ProfileReport, top: int = DEFAULT_TOP) -> str:
+    """
+    Render a report as plain text
+
+    Args:
+        report (ProfileReport): Profile to render
+        top (int): Functions to list
+
+    Returns:
+        str: Text suitable for a document attachment
+    """
+    total = max(report.samples, 1)
+    lines = [f"Sampled {report.samples} stacks over {report.duration:.0f}s", "",
+             f"{'cum%':>6} {'self%':>6}  function"]
+    for name, cumulative, own in report.top(top):
+        lines.append(f"{cumulative * 100.0 / total:>6.1f} {own * 100.0 / total:>6.1f}  {name}")
+    lines += ["", f"{'samples':>8} {'cpu':>7}  thread"]
+    for name, count in report.threads.most_common():
+        cpu = report.thread_cpu.get(name)
+        cpu_text = f"{cpu:>6.2f}s" if cpu is not None else f"{'-':>7}"
+        lines.append(f"{count * 100.0 / total:>7.1f}% {cpu_text}  {name}")
+    current, peak = report.memory
+    lines += ["", f"Allocations during the window (traced now {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB):",
+              f"{'size diff':>12} {'count diff':>11}  line"]
+    for stat in report.allocations:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:>10.1f}Ki {stat.count_diff:>+11}  {frame.filename}:{frame.lineno}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Typed view of critical_processes_config.sh.
+Parses thresholds, process lists, night settings and limits into a
+ServerConfig, hot-swaps it when the file changes and writes a snapshot
+of the values and functions the shell scripts source in one cheap read.
+"""
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from dataclasses import dataclass, field, fields, replace
+from typing import Callable, Dict, List, Optional, Union
+
+# Base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Main shell configuration
+CONFIG_FILE = os.path.join(BASE_DIR, "critical_processes_config.sh")
+# Name of the snapshot written next to the configuration
+SNAPSHOT_NAME = ".config_snapshot.env"
+# Credentials file sourced by the snapshot, the way the configuration does
+CREDENTIALS_NAME = ".telegram_credentials"
+# Values left out of the snapshot
+SNAPSHOT_SECRETS = ("FLEET_TOKEN", "AUTHORIZED_ADMINS")
+# Seconds between two mtime checks
+DEFAULT_POLL_INTERVAL = 2.0
+
+_ASSIGNMENT_RE = re.compile(r"^([A-Z_][A-Z0-9_]*)=(.*)$")
+_FUNCTION_RE = re.compile(r"^[a-z_][a-z0-9_]*\(\)\s*\{\n.*?^\}\n", re.M | re.S)
+_DEFAULT_RE = re.compile(r"^\$\{([A-Z_][A-Z0-9_]*):?-([^}]*)\}$")
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+ConfigValue = Union[str, List[str]]
+
+
+def _strip_comment(value: str) -> str:
+    """Drop a trailing comment outside of quotes."""
+    quote = None
+    for i, ch in enumerate(value):
+        if ch in "\"'":
+            quote = None if quote == ch else (quote or ch)
+        elif ch == "#" and quote is None and (i == 0 or value[i - 1].isspace()):
+            return value[:i].rstrip()
+    return value.strip()
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def parse_shell_config(text: str) -> Dict[str, ConfigValue]:
+    """
+    Parse top-level assignments of a shell configuration file
+
+    Only unindented NAME=value and NAME=( ... ) assignments are read;
+    function bodies and conditional blocks are ignored. ${NAME:-default}
+    is resolved against earlier assignments, and the last assignment wins
+    like it does in the shell.
+
+    Args:
+        text (str): File contents
+
+    Returns:
+        Dict[str, ConfigValue]: Variable name to string or list of strings
+    """
+    values: Dict[str, ConfigValue] = {}
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        match = _ASSIGNMENT_RE.match(lines[i])
+        i += 1
+        if not match:
+            continue
+        name, raw = match.group(1), match.group(2)
+        if raw.startswith("("):
+            # Arrays may span several lines with one element and a comment per line
+            part = raw[1:]
+            items = []
+            while True:
+                part = _strip_comment(part)
+                closed = ")" in part
+                part = part.split(")", 1)[0]
+                items += [_unquote(item) for item in re.findall(r'"[^"]*"|\'[^\']*\'|\S+', part)]
+                if closed or i >= len(lines):
+                    break
+                part = lines[i]
+                i += 1
+            values[name] = items
+            continue
+        value = _unquote(_strip_comment(raw))
+        default = _DEFAULT_RE.match(value)
+        if default:
+            earlier = values.get(default.group(1))
+            value = earlier if isinstance(earlier, str) and earlier else default.group(2)
+        values[name] = value
+    return values
+
+
+def extract_functions(text: str) -> str:
+    """
+    Get the top-level shell functions of a configuration file
+
+    Args:
+        text (str): File contents
+
+    Returns:
+        str: Function definitions in file order, verbatim
+    """
+    return "\n".join(match.group(0) for match in _FUNCTION_RE.finditer(text))
+
+
+def parse_size(value: str) -> int:
+    """
+    Convert a size such as '100M' to bytes
+
+    Args:
+        value (str): Size with an optional K/M/G/T suffix
+
+    Returns:
+        int: Size in bytes
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$", str(value).upper())
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    """Typed configuration shared by the bot and the shell scripts."""
+    load_threshold: float = 15.0
+    cpu_critical: float = 90.0
+    mem_warning: int = 85
+    mem_critical: int = 95
+    disk_warning: int = 85
+    disk_critical: int = 95
+    cpu_limit_normal: int = 50
+    cpu_limit_strict: int = 30
+    cpu_limit_critical: int = 10
+    mem_limit_normal: int = 1024
+    mem_limit_strict: int = 512
+    mem_limit_critical: int = 256
+    night_start: int = 22
+    night_end: int = 7
+    night_cpu_limit: int = 10
+    night_mem_limit: int = 256
+    max_log_size: str = "100M"
+    max_history_days: int = 7
+    log_rotate_compression: str = "gzip"
+    log_rotate_keep: int = 5
+    sampler_interval: int = 10
+    metrics_port: int = 0
+    metrics_bind: str = "127.0.0.1"
+    fleet_port: int = 0
+    fleet_bind: str = "127.0.0.1"
+    fleet_token: str = ""
+    fleet_query_timeout: float = 2.0
+    authorized_admins: List[int] = field(default_factory=list)
+    critical_processes: List[str] = field(default_factory=list)
+    limit_processes: List[str] = field(default_factory=list)
+    stoppable_processes: List[str] = field(default_factory=list)
+    disk_scan_roots: List[str] = field(default_factory=lambda: ["/home"])
+    cgroup_root: str = "/sys/fs/cgroup"
+    container_memory_policies: List[str] = field(default_factory=list)
+    container_night_stop: List[str] = field(default_factory=list)
+    psi_memory_threshold: float = 10.0
+    profile_schedule: List[str] = field(default_factory=list)
+    profile_day: List[str] = field(default_factory=list)
+    profile_night: List[str] = field(default_factory=list)
+    reclaim_target: str = "512M"
+    anomaly_z_threshold: float = 4.0
+    anomaly_cooldown: int = 1800
+    memory_trend_horizon: float = 24.0
+    memory_trend_min_growth: str = "10M"
+    stale_action_age: int = 300
+    watchdog_threshold: float = 30.0
+    watchdog_kill_after: float = 300.0
+    loaded_at: float = 0.0
+    source_mtime: float = 0.0
+
+    @property
+    def max_log_size_bytes(self) -> int:
+        return parse_size(self.max_log_size)
+
+    def is_night(self, hour: int) -> bool:
+        """
+        Check whether an hour falls into the night window
+
+        Args:
+            hour (int): Hour of day, 0-23
+
+        Returns:
+            bool: True during night hours
+        """
+        if self.night_start <= self.night_end:
+            return self.night_start <= hour < self.night_end
+        return hour >= self.night_start or hour < self.night_end
+
+    @classmethod
+    def from_values(cls, values: Dict[str, ConfigValue], source_mtime: float = 0.0) -> "ServerConfig":
+        """
+        Build a config from parsed shell variables
+
+        Values that are missing or cannot be converted keep their defaults.
+
+        Args:
+            values (Dict[str, ConfigValue]): Result of parse_shell_config
+            source_mtime (float): mtime of the parsed file
+
+        Returns:
+            ServerConfig: Typed configuration
+        """
+        kwargs = {}
+        for f in fields(cls):
+            if f.name in ("loaded_at", "source_mtime"):
+                continue
+            raw = values.get(f.name.upper())
+            if raw is None:
+                continue
+            if isinstance(raw, str) and str(f.type).startswith("typing.List"):
+                # A scalar assignment (VAR="a b") is a list of its words, as in the shell
+                raw = raw.split()
+            try:
+                if f.name == "authorized_admins":
+                    kwargs[f.name] = [int(x) for x in raw if str(x).isdigit()]
+                elif isinstance(raw, list):
+                    kwargs[f.name] = list(raw)
+                elif f.type in (int, "int"):
+                    kwargs[f.name] = int(float(raw))
+                elif f.type in (float, "float"):
+                    kwargs[f.name] = float(raw)
+                else:
+                    kwargs[f.name] = str(raw)
+            except (TypeError, ValueError):
+                logging.warning("Invalid value for %s: %r, using default", f.name.upper(), raw)
+        cfg = cls(loaded_at=time.time(), source_mtime=source_mtime, **kwargs)
+        try:
+            cfg.max_log_size_bytes  # pylint: disable=pointless-statement
+        except ValueError:
+            logging.warning("Invalid MAX_LOG_SIZE %r, using default", cfg.max_log_size)
+            cfg = replace(cfg, max_log_size=cls.max_log_size)
+        return cfg
+
+    def to_shell(self) -> Dict[str, ConfigValue]:
+        """
+        Get the flat shell view of the config
+
+        Returns:
+            Dict[str, ConfigValue]: Shell variable name to value
+        """
+        values: Dict[str, ConfigValue] = {}
+        for f in fields(self):
+            if f.name in ("loaded_at", "source_mtime"):
+                continue
+            value = getattr(self, f.name)
+            values[f.name.upper()] = [str(v) for v in value] if isinstance(value, list) else str(value)
+        # Derived values used by the scripts directly
+        values["MAX_LOG_SIZE_MB"] = str(self.max_log_size_bytes // (1024 * 1024))
+        return values
+
+
+def load_server_config(path: str = CONFIG_FILE) -> ServerConfig:
+    """
+    Load and parse the shell configuration
+
+    Args:
+        path (str): Path to critical_processes_config.sh
+
+    Returns:
+        ServerConfig: Parsed configuration, defaults if the file is missing
+    """
+    if not os.path.exists(path):
+        logging.warning("Config file not found at %s, using defaults", path)
+        return ServerConfig(loaded_at=time.time())
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return ServerConfig.from_values(parse_shell_config(text), os.path.getmtime(path))
+
+
+def _shell_quote(value: str) -> str:
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def write_snapshot(cfg: ServerConfig, path: str, functions: str = ""):
+    """
+    Atomically write the snapshot sourced by the shell scripts
+
+    The snapshot holds the values and the functions of the configuration,
+    so a script sources it instead of the configuration. Secrets are left
+    out and the file is readable by its owner only; the Telegram
+    credentials are sourced from their own file as the configuration does.
+
+    Args:
+        cfg (ServerConfig): Configuration to write
+        path (str): Snapshot path
+        functions (str): Shell functions of the configuration, see extract_functions
+    """
+    credentials = _shell_quote(os.path.join(os.path.dirname(os.path.abspath(path)), CREDENTIALS_NAME))
+    lines = [
+        "# Generated by server_config.py - do not edit, change critical_processes_config.sh instead",
+        f"# source_mtime={cfg.source_mtime:.0f}",
+        f'if [ -z "${{TELEGRAM_BOT_TOKEN}}" ] && [ -f {credentials} ]; then source {credentials}; fi',
+    ]
+    for name, value in cfg.to_shell().items():
+        if name in SNAPSHOT_SECRETS:
+            continue
+        if isinstance(value, list):
+            lines.append(f"{name}=(" + " ".join(_shell_quote(v) for v in value) + ")")
+        else:
+            lines.append(f"{name}={_shell_quote(value)}")
+    text = "\n".join(lines) + "\n"
+    if functions:
+        text += "\n" + functions
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # An existing file keeps its mode on open, so set it explicitly
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def read_functions(path: str) -> str:
+    """
+    Read the shell functions of a configuration file
+
+    Args:
+        path (str): Path to critical_processes_config.sh
+
+    Returns:
+        str: Function definitions, empty if the file is unreadable
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return extract_functions(f.read())
+    except OSError:
+        return ""
+
+
+class ConfigWatcher:
+    """
+    Keeps a current ServerConfig in sync with the configuration file.
+
+    The file's mtime is polled from a daemon thread; on change the config is
+    re-parsed, swapped in as a whole and the snapshot is rewritten. A file
+    that fails to parse keeps the previous config active.
+    """
+
+    def __init__(self, path: str = CONFIG_FILE, snapshot_path: Optional[str] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.snapshot_path = snapshot_path or os.path.join(os.path.dirname(path), SNAPSHOT_NAME)
+        self.poll_interval = poll_interval
+        self._listeners: List[Callable[[ServerConfig, ServerConfig], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._mtime = self._get_mtime()
+        self.current = load_server_config(path)
+        self._write_snapshot()
+
+    def add_listener(self, callback: Callable[[ServerConfig, ServerConfig], None]):
+        """
+        Register a callback called with (old, new) after every reload
+
+        Args:
+            callback (Callable[[ServerConfig, ServerConfig], None]): Listener
+        """
+        self._listeners.append(callback)
+
+    def _get_mtime(self) -> float:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return 0.0
+
+    def _write_snapshot(self):
+        try:
+            write_snapshot(self.current, self.snapshot_path, read_functions(self.path))
+        except OSError as e:
+            logging.error("Cannot write config snapshot %s: %s", self.snapshot_path, e)
+
+    def check(self) -> bool:
+        """
+        Reload the config if the file changed
+
+        Returns:
+            bool: True if a new config was swapped in
+        """
+        mtime = self._get_mtime()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            new = load_server_config(self.path)
+        except Exception as e:
+            logging.error("Config reload failed, keeping previous values: %s", e)
+            return False
+        old, self.current = self.current, new
+        self._write_snapshot()
+        logging.info("Config reloaded from %s", self.path)
+        for listener in self._listeners:
+            try:
+                listener(old, new)
+            except Exception as e:
+                logging.error("Config listener failed: %s", e)
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+
+if __name__ == "__main__":
+    # Regenerate the snapshot without a running bot, e.g. from cron
+    config_path = sys.argv[1] if len(sys.argv) > 1 else CONFIG_FILE
+    snapshot = os.path.join(os.path.dirname(os.path.abspath(config_path)), SNAPSHOT_NAME)
+    write_snapshot(load_server_config(config_path), snapshot, read_functions(config_path))
+    print(snapshot)
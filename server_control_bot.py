@@ -5,12 +5,43 @@ Telegram бот для управления сервером.
 """
 import os
 import sys
+import io
+import re
+import html
 import json
 import logging
 import subprocess
 import time
+import threading
+import functools
+import atexit
 from datetime import datetime
 
+from system_sampler import Sampler
+from metrics_exporter import BotMetrics, MetricsRenderer, MetricsServer, DEFAULT_BIND
+from server_config import ConfigWatcher, parse_size
+from fleet import FleetServer, format_snapshot_line
+from disk_index import DiskIndex, format_size
+from log_rotation import rotate_large_logs
+from log_scanner import LogScanner
+from container_stats import ContainerCollector, format_top
+from net_sockets import scan_sockets
+from memory_reclaim import run_reclaim, format_pressure
+from profile_scheduler import ProfileScheduler, profiles_from_config
+from history_store import HistoryStore, attach_to_sampler, sample_metrics
+from rolling_stats import RollingStats
+from chart import ChartCache, render_chart
+from anomaly_detector import AnomalyDetector, attach_detector
+from command_accounting import CommandAccounting, attach_accounting, format_value
+from memory_trend import MemoryTrendTracker, attach_tracker, format_duration
+from action_router import ActionRouter, SLOW, EXCLUSIVE, ACCEPTED, BUSY, UNKNOWN
+from update_intake import drain_backlog, triage
+from live_view import LiveViews
+from status_delta import take_snapshot, diff
+from log_pipeline import LogPipeline, audit
+from self_profiler import run_profile, format_report, DEFAULT_DURATION, MAX_DURATION
+from stall_watchdog import StallWatchdog, Heartbeat
+
 # Импортируем модуль локализации
 try:
     from utilities import get_text, get_user_language, set_user_language, load_localization_config
@@ -101,8 +132,9 @@ patched = patch_telegram_dependencies()
 MAX_IMPORT_ATTEMPTS = 3
 for attempt in range(MAX_IMPORT_ATTEMPTS):
     try:
-        from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-        from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, CallbackContext
+        from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+        from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, CallbackContext, TypeHandler
+        from telegram.error import BadRequest, RetryAfter, TelegramError
         print("Библиотека python-telegram-bot успешно импортирована")
         break
     except ImportError as e:
@@ -147,16 +179,23 @@ if not os.path.exists(log_dir):
 # Периодический отчет - интервал в секундах
 STATUS_REPORT_INTERVAL = 3600  # 1 час
 
-# Логирование в консоль и файл
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] %(levelname)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# Максимальная длина сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Предел выполнения внешних команд: зависшая команда не должна держать поток бота бесконечно
+COMMAND_TIMEOUT = 120
+
+# Логирование в консоль и файл через очередь: обработчики не ждут записи на диск,
+# при переполнении очереди записи отбрасываются и считаются.
+# Действия пользователей дополнительно пишутся в JSON-lines журнал аудита
+AUDIT_LOG_FILE = os.path.join(os.path.dirname(LOG_FILE), "server_control_bot.audit.jsonl")
+LOG_PIPELINE = LogPipeline(LOG_FILE, AUDIT_LOG_FILE)
+LOG_PIPELINE.start()
+atexit.register(LOG_PIPELINE.stop)
+
+# Типизированная конфигурация с горячей перезагрузкой.
+# Также пишет плоский снапшот .config_snapshot.env для shell-скриптов
+CONFIG_WATCHER = ConfigWatcher(CONFIG_FILE)
 
 def load_config():
     """
@@ -173,7 +212,10 @@ def load_config():
             'critical': 10
         },
         'MEMORY_LIMITS': {},
-        'NOTIFICATION_LEVELS': {}
+        'NOTIFICATION_LEVELS': {},
+        'SAMPLER_INTERVAL': 10,
+        'METRICS_PORT': 0,
+        'METRICS_BIND': DEFAULT_BIND
     }
     
     # Приоритетно загружаем токен из переменной окружения
@@ -230,31 +272,28 @@ def load_config():
                     except Exception as e:
                         logging.warning("Не удалось загрузить ID администраторов: %s", e)
             
-            # Загружаем лимиты CPU
-            try:
-                # Ищем значения переменных, исключая shell-переменные с ${} и комментарии
-                normal_pattern = r'CPU_LIMIT_NORMAL=(\d+)'
-                strict_pattern = r'CPU_LIMIT_STRICT=(\d+)'
-                critical_pattern = r'CPU_LIMIT_CRITICAL=(\d+)'
-                
-                import re
-                normal_match = re.search(normal_pattern, content)
-                strict_match = re.search(strict_pattern, content)
-                critical_match = re.search(critical_pattern, content)
-                
-                if normal_match:
-                    cfg['CPU_LIMITS']['normal'] = int(normal_match.group(1))
-                if strict_match:
-                    cfg['CPU_LIMITS']['strict'] = int(strict_match.group(1))
-                if critical_match:
-                    cfg['CPU_LIMITS']['critical'] = int(critical_match.group(1))
-            except Exception as e:
-                logging.warning("Ошибка при загрузке лимитов CPU, используются значения по умолчанию: %s", e)
     except (IOError, OSError) as e:
         logging.error("Ошибка доступа к файлу конфигурации: %s", e)
     except Exception as e:  # pylint: disable=broad-exception-caught
         logging.error("Неожиданная ошибка при загрузке конфигурации: %s", e)
     
+    # Лимиты и настройки сбора метрик берем из типизированной конфигурации
+    server_cfg = CONFIG_WATCHER.current
+    cfg['CPU_LIMITS'] = {
+        'normal': server_cfg.cpu_limit_normal,
+        'strict': server_cfg.cpu_limit_strict,
+        'critical': server_cfg.cpu_limit_critical
+    }
+    if server_cfg.sampler_interval > 0:
+        cfg['SAMPLER_INTERVAL'] = server_cfg.sampler_interval
+    cfg['METRICS_PORT'] = server_cfg.metrics_port
+    cfg['METRICS_BIND'] = server_cfg.metrics_bind
+    
+    # Переменная окружения имеет приоритет над файлом конфигурации
+    env_metrics_port = os.environ.get('METRICS_PORT')
+    if env_metrics_port and env_metrics_port.isdigit():
+        cfg['METRICS_PORT'] = int(env_metrics_port)
+    
     # Проверяем наличие необходимых данных
     if not cfg['BOT_TOKEN']:
         logging.critical("Не указан токен бота в переменных окружения или файле учетных данных")
@@ -271,6 +310,150 @@ def load_config():
 
 config = load_config()
 
+# Фоновый сбор метрик из /proc и внутренние метрики бота
+SAMPLER = Sampler(interval=config['SAMPLER_INTERVAL'])
+# История метрик за 7 дней для графиков и статистики
+HISTORY_STORE = HistoryStore()
+attach_to_sampler(HISTORY_STORE, SAMPLER)
+# Перцентили по окнам 1ч/24ч/7д поддерживаются инкрементально на каждом измерении
+ROLLING_STATS = RollingStats()
+STATS_METRICS = ("load", "cpu", "mem", "disk")
+ROLLING_STATS.seed(HISTORY_STORE, STATS_METRICS)
+SAMPLER.add_listener(lambda sample, _processes: ROLLING_STATS.add(
+    sample.timestamp, {name: value for name, value in sample_metrics(sample).items() if name in STATS_METRICS}))
+CHART_CACHE = ChartCache()
+# Сообщения "top", обновляемые на месте из последнего измерения сборщика
+LIVE_VIEWS = LiveViews()
+# Оповещения о значениях, необычных для этого хоста в этот час суток
+ANOMALY_METRICS = ("load", "cpu", "mem", "net_rx", "net_tx", "net_faults", "tcp_retrans")
+ANOMALY_DETECTOR = AnomalyDetector(
+    metrics=ANOMALY_METRICS,
+    threshold=CONFIG_WATCHER.current.anomaly_z_threshold,
+    cooldown=CONFIG_WATCHER.current.anomaly_cooldown
+)
+attach_detector(ANOMALY_DETECTOR, SAMPLER)
+# Накопленное потребление CPU, I/O и памяти по командам за 24 часа и 7 дней
+COMMAND_ACCOUNTING = CommandAccounting()
+attach_accounting(COMMAND_ACCOUNTING, SAMPLER)
+
+def memory_trend_settings(cfg):
+    """
+    Возвращает минимальный рост памяти (байт в час) и горизонт предупреждения (секунды).
+    Args:
+        cfg (ServerConfig): Конфигурация
+    Returns:
+        tuple: (min_growth, horizon)
+    """
+    try:
+        min_growth = parse_size(cfg.memory_trend_min_growth)
+    except ValueError:
+        logging.warning("Некорректный MEMORY_TREND_MIN_GROWTH %r, используется 10M", cfg.memory_trend_min_growth)
+        min_growth = parse_size("10M")
+    return min_growth, cfg.memory_trend_horizon * 3600
+
+# Рост памяти процессов с прогнозом времени до исчерпания лимита
+MEMORY_TRENDS = MemoryTrendTracker(
+    *memory_trend_settings(CONFIG_WATCHER.current),
+    cgroup_root=CONFIG_WATCHER.current.cgroup_root
+)
+attach_tracker(MEMORY_TRENDS, SAMPLER)
+BOT_METRICS = BotMetrics()
+# Профили ресурсов (ночной режим), переключаемые по расписанию
+PROFILE_SCHEDULER = ProfileScheduler(
+    *profiles_from_config(CONFIG_WATCHER.current),
+    cgroup_root=CONFIG_WATCHER.current.cgroup_root
+)
+
+# Центральный сервер для агентов других хостов (включается через FLEET_PORT)
+FLEET_SERVER = None
+
+# Отдельный экземпляр Bot со своим пулом соединений: оповещения о зависании
+# не должны зависеть от зависших потоков и занятых соединений основного Updater
+_alert_bot = None
+
+def get_alert_bot():
+    """
+    Возвращает экземпляр Bot для оповещений сторожевого таймера.
+    Returns:
+        Bot: Бот с собственным пулом соединений
+    """
+    global _alert_bot
+    if _alert_bot is None:
+        _alert_bot = Bot(config['BOT_TOKEN'])
+    return _alert_bot
+
+def notify_stall(stall):
+    """
+    Сообщает администраторам о зависании и присылает стеки всех потоков.
+    Вызывается в потоке сторожевого таймера.
+    Args:
+        stall (Stall): Зависший исполнитель
+    """
+    audit("stall", probe=stall.probe, lag=round(stall.lag, 1), killed=[pid for pid, _name, _age in stall.killed])
+    for admin_id in config['AUTHORIZED_ADMINS']:
+        caption = _("messages.stall_detected", admin_id).format(probe=stall.probe, lag=stall.lag)
+        if stall.killed:
+            caption += "\n" + _("messages.stall_killed", admin_id).format(
+                processes=", ".join(f"{name} ({pid}, {format_duration(age)})" for pid, name, age in stall.killed))
+        try:
+            get_alert_bot().send_document(
+                chat_id=admin_id,
+                document=io.BytesIO(stall.stacks.encode("utf-8")),
+                filename=f"stacks-{datetime.now():%Y%m%d-%H%M%S}.txt",
+                caption=caption[:1024]
+            )
+        except Exception as e:
+            logging.error("Не удалось отправить оповещение о зависании админу %s: %s", admin_id, e)
+
+def notify_recovered(probe, lag):
+    """
+    Сообщает администраторам, что зависший исполнитель снова отвечает.
+    Args:
+        probe (str): Имя исполнителя
+        lag (float): Сколько секунд он не отвечал
+    """
+    for admin_id in config['AUTHORIZED_ADMINS']:
+        try:
+            get_alert_bot().send_message(
+                chat_id=admin_id, text=_("messages.stall_recovered", admin_id).format(probe=probe, lag=lag))
+        except Exception as e:
+            logging.error("Не удалось отправить оповещение о восстановлении админу %s: %s", admin_id, e)
+
+WATCHDOG = StallWatchdog(
+    threshold=CONFIG_WATCHER.current.watchdog_threshold,
+    kill_after=CONFIG_WATCHER.current.watchdog_kill_after,
+    on_stall=notify_stall,
+    on_recover=notify_recovered
+)
+
+def on_config_reload(old_cfg, new_cfg):
+    """
+    Применяет изменившиеся значения конфигурации без перезапуска бота.
+    Args:
+        old_cfg (ServerConfig): Предыдущая конфигурация
+        new_cfg (ServerConfig): Новая конфигурация
+    """
+    config['CPU_LIMITS'] = {
+        'normal': new_cfg.cpu_limit_normal,
+        'strict': new_cfg.cpu_limit_strict,
+        'critical': new_cfg.cpu_limit_critical
+    }
+    if new_cfg.sampler_interval > 0:
+        SAMPLER.interval = new_cfg.sampler_interval
+    if (new_cfg.metrics_port, new_cfg.metrics_bind) != (old_cfg.metrics_port, old_cfg.metrics_bind):
+        logging.warning("Изменение METRICS_PORT/METRICS_BIND вступит в силу после перезапуска бота")
+    logging.info("CPU лимиты обновлены: %s", config['CPU_LIMITS'])
+    # Новые профили применяются сразу, меняется только разница с уже примененными настройками
+    PROFILE_SCHEDULER.update(*profiles_from_config(new_cfg))
+    PROFILE_SCHEDULER.reconcile()
+    ANOMALY_DETECTOR.threshold = new_cfg.anomaly_z_threshold
+    ANOMALY_DETECTOR.cooldown = new_cfg.anomaly_cooldown
+    MEMORY_TRENDS.min_growth, MEMORY_TRENDS.horizon = memory_trend_settings(new_cfg)
+    WATCHDOG.threshold = new_cfg.watchdog_threshold
+    WATCHDOG.kill_after = new_cfg.watchdog_kill_after
+
+CONFIG_WATCHER.add_listener(on_config_reload)
+
 def get_main_keyboard(user_id=None):
     """
     Создает основную клавиатуру бота.
@@ -324,6 +507,18 @@ def get_processes_keyboard(user_id=None):
             InlineKeyboardButton(_("buttons.memory_stats", user_id), callback_data="memory_stats"),
             InlineKeyboardButton(_("buttons.load_history", user_id), callback_data="load_history")
         ],
+        [
+            InlineKeyboardButton(_("buttons.disk_usage", user_id), callback_data="disk_usage"),
+            InlineKeyboardButton(_("buttons.log_errors", user_id), callback_data="log_errors")
+        ],
+        [
+            InlineKeyboardButton(_("buttons.containers", user_id), callback_data="containers"),
+            InlineKeyboardButton(_("buttons.top_consumers", user_id), callback_data="top_consumers")
+        ],
+        [
+            InlineKeyboardButton(_("buttons.io", user_id), callback_data="io"),
+            InlineKeyboardButton(_("buttons.live_top", user_id), callback_data="live_top")
+        ],
         [
             InlineKeyboardButton(_("buttons.back", user_id), callback_data="main_menu")
         ]
@@ -425,23 +620,29 @@ def is_authorized(user_id):
     """
     return user_id in config['AUTHORIZED_ADMINS']
 
-def measure_time(func):
+def measure_time(kind="handler"):
     """
-    Декоратор для измерения времени выполнения функции.
+    Декоратор для измерения времени выполнения обработчика или задачи.
+    Результат записывается в BOT_METRICS и доступен через /metrics.
     Args:
-        func (callable): Функция для измерения
+        kind (str): Тип вызова - 'handler' или 'job'
     Returns:
-        callable: Обернутая функция
-    """
-    async def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = await func(*args, **kwargs)
-        end_time = time.time()
-        # Конвертируем в миллисекунды
-        _ = (end_time - start_time) * 1000
-        
-        return result
-    return wrapper
+        callable: Декоратор
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.monotonic()
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                BOT_METRICS.observe(kind, func.__name__, time.monotonic() - start_time, failed)
+        return wrapper
+    return decorator
 
 # Функция для получения локализованного текста
 def _(key, user_id=None):
@@ -469,13 +670,20 @@ def _(key, user_id=None):
         }
         return text_map.get(key, key)
     
-    # Определяем язык пользователя
-    lang_code = LOCALIZATION_CONFIG["DEFAULT_LANGUAGE"]
-    if user_id is not None and LOCALIZATION_CONFIG.get("MULTI_LANGUAGE_SUPPORT", False):
-        lang_code = get_user_language(user_id)
-    
-    # Получаем локализованный текст
-    return get_text(key, lang_code)
+    # Получаем локализованный текст на языке пользователя
+    return get_text(key, user_language(user_id))
+
+def user_language(user_id=None):
+    """
+    Определяет язык интерфейса пользователя.
+    Args:
+        user_id (int, optional): ID пользователя
+    Returns:
+        str: Код языка
+    """
+    if user_id is not None and LOCALIZATION_AVAILABLE and LOCALIZATION_CONFIG.get("MULTI_LANGUAGE_SUPPORT", False):
+        return get_user_language(user_id)
+    return LOCALIZATION_CONFIG["DEFAULT_LANGUAGE"]
 
 # Функция для получения клавиатуры выбора языка
 def get_language_keyboard():
@@ -502,6 +710,7 @@ def get_language_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 # Обработчики команд
+@measure_time()
 def start_command(update: Update, _context: CallbackContext):
     """Обработчик команд /start и /help."""
     user_id = update.effective_user.id
@@ -522,6 +731,7 @@ def start_command(update: Update, _context: CallbackContext):
         parse_mode="HTML"
     )
 
+@measure_time()
 def language_command(update: Update, _context: CallbackContext):
     """Обработчик команды /language."""
     if not is_authorized(update.effective_user.id):
@@ -537,393 +747,1086 @@ def language_command(update: Update, _context: CallbackContext):
         reply_markup=get_language_keyboard()
     )
 
-# Обработчик callback-запросов
-def button_callback(update: Update, _context: CallbackContext):  # pylint: disable=too-many-branches,too-many-statements
-    """Обработчик нажатий на кнопки."""
-    query = update.callback_query
-    
-    # Добавляем подробное логирование
-    logging.info("Получен callback: %s от пользователя %s", 
-                 query.data, query.from_user.id)
-    
-    # Отвечаем на callback, чтобы убрать часы загрузки
+@measure_time()
+def profile_command(update: Update, context: CallbackContext):
+    """
+    Обработчик команды /profile [секунды]: профилирует работающего бота
+    и присылает самые затратные функции и рост выделений памяти файлом.
+    """
+    user_id = update.effective_user.id
+    if not is_authorized(user_id):
+        update.message.reply_text(_("messages.unauthorized"))
+        return
     try:
-        query.answer()
-        logging.info("Успешно отправлен ответ на callback")
-    except Exception as e:
-        logging.error("Ошибка при ответе на callback: %s", e)
-    
-    if not is_authorized(query.from_user.id):
-        try:
-            query.edit_message_text(_("messages.unauthorized", query.from_user.id))
-            logging.warning("Попытка неавторизованного доступа от ID: %s", 
-                           query.from_user.id)
-        except Exception as e:
-            logging.error("Ошибка при отправке сообщения о неавторизованном доступе: %s", e)
+        duration = float(context.args[0]) if context.args else DEFAULT_DURATION
+    except ValueError:
+        duration = DEFAULT_DURATION
+    duration = min(max(duration, 1.0), MAX_DURATION)
+    audit("profile", user=user_id, seconds=duration)
+    update.message.reply_text(_("messages.profile_started", user_id).format(seconds=f"{duration:.0f}"))
+    report = run_profile(duration)
+    if report is None:
+        update.message.reply_text(_("messages.profile_busy", user_id))
         return
+    update.message.reply_document(
+        document=io.BytesIO(format_report(report).encode("utf-8")),
+        filename=f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt",
+        caption=_("messages.profile_done", user_id).format(
+            samples=report.samples, top=report.hottest() or "-")
+    )
 
-    # Обработка выбора языка
-    if query.data.startswith("set_lang_"):
-        lang_code = query.data.replace("set_lang_", "")
-        if LOCALIZATION_AVAILABLE:
-            if set_user_language(query.from_user.id, lang_code):
-                success_key = f"LANG_SELECTED_{lang_code.upper()}"
-                success_msg = LOCALIZATION_CONFIG.get(success_key, f"Language set to {lang_code}")
-                query.edit_message_text(
-                    success_msg,
-                    reply_markup=get_main_keyboard(query.from_user.id)
-                )
-                logging.info("Пользователь %s установил язык: %s", query.from_user.id, lang_code)
-            else:
-                query.edit_message_text(
-                    "❌ Error setting language",
-                    reply_markup=get_language_keyboard()
-                )
-        else:
-            query.edit_message_text(
-                "🌐 Language selection is not available",
-                reply_markup=get_main_keyboard(query.from_user.id)
-            )
-        return
+# Кнопки обрабатываются через реестр действий: быстрые выполняются сразу,
+# медленные и монопольные - в ограниченном пуле, чтобы навигация не ждала скриптов
+ACTION_WORKERS = 2
 
-    action = query.data
-    
-    try:
-        logging.info("Начинаем обработку действия: %s", action)
-        
-        # Оборачиваем каждое редактирование сообщения в try-except для обнаружения конкретных ошибок
-        if action == "stats":
-            try:
-                # Использование синхронного подхода вместо асинхронного
-                stats_text = "📈 Статистика недоступна в этой версии"
-                
-                query.edit_message_text(
-                    stats_text,
-                    reply_markup=get_main_keyboard(query.from_user.id),
-                    parse_mode="HTML"
-                )
-                logging.info("Успешно обработано действие: %s", action)
-            except Exception as e:
-                logging.error("Ошибка при обработке действия '%s': %s", action, e)
-        
-        elif action == "night_mode":
-            try:
-                # Запрос подтверждения перед включением ночного режима
-                keyboard = [
-                    [
-                        InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_night_mode"),
-                        InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                query.edit_message_text(
-                    _("messages.night_mode_confirm", query.from_user.id),
-                    reply_markup=reply_markup
-                )
-                logging.info("Успешно обработано действие: %s", action)
-            except Exception as e:
-                logging.error("Ошибка при обработке действия '%s': %s", action, e)
-        
-        elif action == "confirm_night_mode":
-            try:
-                # Включаем ночной режим после подтверждения
-                night_script = os.path.join(BASE_DIR, "night_optimize.sh")
-                logging.info("Пытаемся запустить скрипт: %s", night_script)
-                # Проверяем существование скрипта
-                if not os.path.exists(night_script):
-                    logging.error("Скрипт %s не найден", night_script)
-                    query.edit_message_text(
-                        f"❌ Ошибка: скрипт {night_script} не найден",
-                        reply_markup=get_main_keyboard(query.from_user.id)
-                    )
-                    return
-                    
-                # Запускаем скрипт с обработкой возможных ошибок
-                try:
-                    with subprocess.Popen([night_script]) as _:
-                        pass
-                    logging.info("Скрипт %s успешно запущен", night_script)
-                except Exception as script_err:
-                    logging.error("Ошибка при запуске скрипта %s: %s", night_script, script_err)
-                    query.edit_message_text(
-                        f"❌ Ошибка при запуске ночного режима: {str(script_err)}",
-                        reply_markup=get_main_keyboard(query.from_user.id)
-                    )
-                    return
-                
-                query.edit_message_text(
-                    _("messages.night_mode_activated", query.from_user.id),
-                    reply_markup=get_main_keyboard(query.from_user.id)
-                )
-                logging.info("Успешно обработано действие: %s", action)
-            except Exception as e:
-                logging.error("Ошибка при обработке действия '%s': %s", action, e)
-        
-        elif action == "settings":
-            try:
-                query.edit_message_text(
-                    _("messages.settings_title", query.from_user.id),
-                    reply_markup=get_settings_keyboard(query.from_user.id)
-                )
-                logging.info("Успешно обработано действие: %s", action)
-            except Exception as e:
-                logging.error("Ошибка при обработке действия '%s': %s", action, e)
-        
-        elif action == "status":
-            try:
-                status_script = os.path.join(BASE_DIR, "check_server_status.sh")
-                success, result, error = run_script_safely(status_script, query, args=["--silent"], timeout=15)
-                
-                if success:
-                    query.edit_message_text(
-                        f"📊 Статус сервера:\n\n{result}",
-                        reply_markup=get_main_keyboard(query.from_user.id)
-                    )
-                    logging.info("Успешно обработано действие: %s", action)
-                # В случае неудачи сообщение об ошибке уже будет показано в run_script_safely
-            except Exception as e:
-                logging.error("Неожиданная ошибка при обработке действия '%s': %s", action, e, exc_info=True)
-                try:
-                    query.edit_message_text(
-                        f"❌ Неожиданная ошибка при получении статуса: {str(e)}",
-                        reply_markup=get_main_keyboard(query.from_user.id)
-                    )
-                except Exception as edit_err:
-                    logging.error("Не удалось обновить сообщение: %s", edit_err)
-        
-        elif action == "processes":
-            # Запрос подтверждения перед управлением процессами
-            keyboard = [
-                [
-                    InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_processes"),
-                    InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            query.edit_message_text(
-                _("messages.processes_confirm", query.from_user.id),
-                reply_markup=reply_markup
-            )
-        
-        elif action == "confirm_processes":
-            # Показываем меню управления процессами после подтверждения
-            query.edit_message_text(
-                _("messages.processes_title", query.from_user.id),
-                reply_markup=get_processes_keyboard(query.from_user.id)
-            )
-        
-        elif action == "optimize":
-            # Запрос подтверждения перед оптимизацией
-            keyboard = [
-                [
-                    InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_optimize"),
-                    InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            query.edit_message_text(
-                _("messages.optimize_confirm", query.from_user.id),
-                reply_markup=reply_markup
-            )
-        
-        elif action == "confirm_optimize":
-            try:
-                # Запускаем оптимизацию после подтверждения
-                optimize_script = os.path.join(BASE_DIR, "optimize_server.sh")
-                
-                # Просто запускаем скрипт в фоне, не ждем результат
-                success, _, error = run_script_safely(optimize_script, query, timeout=5)
-                
-                if success:
-                    query.edit_message_text(
-                        _("messages.optimize_started", query.from_user.id),
-                        reply_markup=get_main_keyboard(query.from_user.id)
-                    )
-                    logging.info("Успешно обработано действие: %s", action)
-                # В случае неудачи сообщение об ошибке уже будет показано в run_script_safely
-            except Exception as e:
-                logging.error("Неожиданная ошибка при обработке действия '%s': %s", action, e, exc_info=True)
-                try:
-                    query.edit_message_text(
-                        f"❌ Неожиданная ошибка при запуске оптимизации: {str(e)}",
-                        reply_markup=get_main_keyboard(query.from_user.id)
-                    )
-                except Exception as edit_err:
-                    logging.error("Не удалось обновить сообщение: %s", edit_err)
-        
-        elif action == "logs":
-            query.edit_message_text(
-                _("messages.logs_title", query.from_user.id),
-                reply_markup=get_processes_keyboard(query.from_user.id)
-            )
-        
-        elif action == "cleanup":
-            # Запрос подтверждения перед очисткой кэша
-            keyboard = [
-                [
-                    InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_cleanup"),
-                    InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            query.edit_message_text(
-                _("messages.cleanup_confirm", query.from_user.id),
-                reply_markup=reply_markup
-            )
-        
-        elif action == "confirm_cleanup":
-            # Выполняем очистку кэша после подтверждения
-            try:
-                subprocess.run(
-                    "sync && echo 3 > /proc/sys/vm/drop_caches",
-                    shell=True, check=True, stderr=subprocess.PIPE
-                )
-                query.edit_message_text(
-                    _("messages.cleanup_done", query.from_user.id),
-                    reply_markup=get_main_keyboard(query.from_user.id)
-                )
-            except subprocess.CalledProcessError as e:
-                logging.error("Ошибка очистки кэша: %s", e)
-                error_msg = e.stderr.decode() if e.stderr else str(e)
-                query.edit_message_text(
-                    _("messages.cleanup_error", query.from_user.id).format(error=error_msg),
-                    reply_markup=get_main_keyboard(query.from_user.id)
-                )
-        
-        elif action == "show_all_processes":
-            try:
-                result = subprocess.check_output(
-                    ["ps", "aux", "--sort=-%cpu"],
-                    universal_newlines=True
-                )
-                # Берем только первые 11 строк (заголовок + 10 процессов)
-                result_lines = result.split('\n')[:11]
-                result = '\n'.join(result_lines)
-                
-                query.edit_message_text(
-                    f"{_('messages.top_processes_title', query.from_user.id)}\n\n<pre>{result}</pre>",
-                    parse_mode="HTML",
-                    reply_markup=get_processes_keyboard(query.from_user.id)
-                )
-            except subprocess.CalledProcessError as e:
-                logging.error("Ошибка получения списка процессов: %s", e)
-                query.edit_message_text(
-                    _("messages.command_error", query.from_user.id).format(error=e.output),
-                    reply_markup=get_processes_keyboard(query.from_user.id)
-                )
-        
-        elif action == "heavy_processes":
-            try:
-                heavy_script = os.path.join(BASE_DIR, "monitor_heavy_processes.sh")
-                cmd = [heavy_script, "--analyze"]
-                result = subprocess.check_output(
-                    cmd, stderr=subprocess.STDOUT, universal_newlines=True
-                )
-                query.edit_message_text(
-                    f"{_('messages.heavy_processes_title', query.from_user.id)}\n\n{result}",
-                    reply_markup=get_processes_keyboard(query.from_user.id)
-                )
-            except subprocess.CalledProcessError as e:
-                logging.error("Ошибка анализа тяжелых процессов: %s", e)
-                query.edit_message_text(
-                    _("messages.heavy_processes_error", query.from_user.id).format(error=e.output),
-                    reply_markup=get_processes_keyboard(query.from_user.id)
-                )
-        
-        elif action == "main_menu":
+def report_action_error(spec, error, args):
+    """
+    Сообщает пользователю об ошибке действия, вызванного кнопкой.
+    Args:
+        spec (ActionSpec): Действие
+        error (Exception): Ошибка
+        args (tuple): Аргументы обработчика (query, context)
+    """
+    query = args[0]
+    if isinstance(error, subprocess.SubprocessError):
+        text = f"❌ Ошибка выполнения команды: {str(error)}"
+    else:
+        text = f"❌ Неожиданная ошибка: {str(error)}"
+    query.edit_message_text(text, reply_markup=get_main_keyboard(query.from_user.id))
+
+def observe_action(name, seconds, failed):
+    """
+    Записывает время выполнения действия в метрики и журнал аудита.
+    Args:
+        name (str): Имя действия
+        seconds (float): Время выполнения
+        failed (bool): Завершилось ли действие ошибкой
+    """
+    BOT_METRICS.observe("action", name, seconds, failed)
+    audit("action_done", action=name, seconds=round(seconds, 3), failed=failed)
+
+ACTION_ROUTER = ActionRouter(
+    workers=ACTION_WORKERS,
+    on_error=report_action_error,
+    observe=observe_action
+)
+action = ACTION_ROUTER.action
+
+@action("set_lang", parametrized=True)
+def action_set_lang(query, _context, lang_code):
+    """Выбор языка интерфейса."""
+    if LOCALIZATION_AVAILABLE:
+        if set_user_language(query.from_user.id, lang_code):
+            success_key = f"LANG_SELECTED_{lang_code.upper()}"
+            success_msg = LOCALIZATION_CONFIG.get(success_key, f"Language set to {lang_code}")
             query.edit_message_text(
-                f"{_('messages.main_menu', query.from_user.id)}",
+                success_msg,
                 reply_markup=get_main_keyboard(query.from_user.id)
             )
-        
-        elif action.startswith("logs_"):
-            log_files = {
-                "logs_system": "/var/log/syslog",
-                "logs_cursor": "/var/log/cursor_monitor.log",
-                "logs_optimize": "/var/log/optimize_server.log",
-                "logs_bot": "/var/log/server_control_bot.log"
-            }
-            
-            log_file = log_files.get(action)
-            
-            if log_file:
-                try:
-                    # Безопасное получение последних строк лога
-                    result = subprocess.check_output(
-                        ["tail", "-n", "20", log_file],
-                        universal_newlines=True
-                    )
-                    query.edit_message_text(
-                        _("messages.logs_template", query.from_user.id).format(log_file=log_file) + f"\n\n<pre>{result}</pre>",
-                        parse_mode="HTML",
-                        reply_markup=get_processes_keyboard(query.from_user.id)
-                    )
-                except subprocess.CalledProcessError as e:
-                    logging.error("Ошибка чтения лог-файла %s: %s", log_file, e)
-                    query.edit_message_text(
-                        _("messages.command_error", query.from_user.id).format(error=e.output),
-                        reply_markup=get_processes_keyboard(query.from_user.id)
-                    )
+            logging.info("Пользователь %s установил язык: %s", query.from_user.id, lang_code)
         else:
             query.edit_message_text(
-                _("messages.unknown_action", query.from_user.id).format(action=action),
-                reply_markup=get_main_keyboard(query.from_user.id)
-            )
-    
-    except subprocess.SubprocessError as e:
-        logging.error("Ошибка выполнения subprocess при обработке callback %s: %s", action, e)
-        try:
-            query.edit_message_text(
-                f"❌ Ошибка выполнения команды: {str(e)}",
-                reply_markup=get_main_keyboard(query.from_user.id)
-            )
-        except Exception as edit_err:
-            logging.error("Не удалось отредактировать сообщение: %s", edit_err)
-    except Exception as e:  # pylint: disable=broad-exception-caught
-        logging.error("Ошибка при обработке callback %s: %s", action, e, exc_info=True)
-        try:
-            query.edit_message_text(
-                f"❌ Неожиданная ошибка: {str(e)}",
-                reply_markup=get_main_keyboard(query.from_user.id)
+                "❌ Error setting language",
+                reply_markup=get_language_keyboard()
             )
-        except Exception as edit_err:
-            logging.error("Не удалось отредактировать сообщение: %s", edit_err)
+    else:
+        query.edit_message_text(
+            "🌐 Language selection is not available",
+            reply_markup=get_main_keyboard(query.from_user.id)
+        )
 
-# Функция для получения статуса сервера
-def get_server_status():
-    """
-    Получает текущий статус сервера, используя скрипт check_server_status.sh
-    Returns:
-        str: Текстовое представление статуса сервера
-    """
+@action("stats")
+def action_stats(query, _context, _arg):
+    """Перцентили нагрузки за 1ч/24ч/7д."""
+    query.edit_message_text(
+        get_stats_text(query.from_user.id),
+        reply_markup=get_main_keyboard(query.from_user.id),
+        parse_mode="HTML"
+    )
+
+@action("night_mode")
+def action_night_mode(query, _context, _arg):
+    """Запрос подтверждения перед включением ночного режима."""
+    keyboard = [
+        [
+            InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_night_mode"),
+            InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
+        ]
+    ]
+    query.edit_message_text(
+        _("messages.night_mode_confirm", query.from_user.id),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+@action("confirm_night_mode", cost=EXCLUSIVE, debounce=10)
+def action_confirm_night_mode(query, _context, _arg):
+    """Включает ночной режим после подтверждения."""
+    night_script = os.path.join(BASE_DIR, "night_optimize.sh")
+    logging.info("Пытаемся запустить скрипт: %s", night_script)
+    # Проверяем существование скрипта
+    if not os.path.exists(night_script):
+        logging.error("Скрипт %s не найден", night_script)
+        query.edit_message_text(
+            f"❌ Ошибка: скрипт {night_script} не найден",
+            reply_markup=get_main_keyboard(query.from_user.id)
+        )
+        return
+
+    # Запускаем скрипт с обработкой возможных ошибок
     try:
-        status_script = os.path.join(BASE_DIR, "check_server_status.sh")
-        cmd = [status_script, "--silent"]
-        result = subprocess.check_output(
-            cmd, stderr=subprocess.STDOUT, universal_newlines=True
+        with subprocess.Popen([night_script]):
+            pass
+        logging.info("Скрипт %s успешно запущен", night_script)
+    except Exception as script_err:
+        logging.error("Ошибка при запуске скрипта %s: %s", night_script, script_err)
+        query.edit_message_text(
+            f"❌ Ошибка при запуске ночного режима: {str(script_err)}",
+            reply_markup=get_main_keyboard(query.from_user.id)
         )
-        return result
-    except subprocess.CalledProcessError as e:
-        logging.error("Ошибка выполнения скрипта статуса: %s", e)
-        return _("errors.status_script_error", None).format(error=e.output)
-    except Exception as e:  # pylint: disable=broad-exception-caught
+        return
+
+    query.edit_message_text(
+        _("messages.night_mode_activated", query.from_user.id),
+        reply_markup=get_main_keyboard(query.from_user.id)
+    )
+
+@action("settings")
+def action_settings(query, _context, _arg):
+    """Меню настроек."""
+    query.edit_message_text(
+        _("messages.settings_title", query.from_user.id),
+        reply_markup=get_settings_keyboard(query.from_user.id)
+    )
+
+@action("status", cost=SLOW, max_concurrency=2, debounce=3)
+def action_status(query, _context, _arg):
+    """Статус сервера из check_server_status.sh, сеть и агенты."""
+    status_script = os.path.join(BASE_DIR, "check_server_status.sh")
+    success, result, _error = run_script_safely(status_script, query, args=["--silent"], timeout=15)
+
+    if success:
+        status_text = f"📊 Статус сервера:\n\n{result}\n\n{get_network_text(query.from_user.id)}"
+        fleet_text = get_fleet_status_text(query.from_user.id)
+        if fleet_text:
+            status_text = f"{status_text}\n\n{fleet_text}"
+        query.edit_message_text(
+            fit_message([status_text], html_markup=False),
+            reply_markup=get_main_keyboard(query.from_user.id)
+        )
+    # В случае неудачи сообщение об ошибке уже будет показано в run_script_safely
+
+@action("processes")
+def action_processes(query, _context, _arg):
+    """Запрос подтверждения перед управлением процессами."""
+    keyboard = [
+        [
+            InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_processes"),
+            InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
+        ]
+    ]
+    query.edit_message_text(
+        _("messages.processes_confirm", query.from_user.id),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+@action("confirm_processes")
+def action_confirm_processes(query, _context, _arg):
+    """Меню управления процессами после подтверждения."""
+    query.edit_message_text(
+        _("messages.processes_title", query.from_user.id),
+        reply_markup=get_processes_keyboard(query.from_user.id)
+    )
+
+@action("optimize")
+def action_optimize(query, _context, _arg):
+    """Запрос подтверждения перед оптимизацией."""
+    keyboard = [
+        [
+            InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_optimize"),
+            InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
+        ]
+    ]
+    query.edit_message_text(
+        _("messages.optimize_confirm", query.from_user.id),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+@action("confirm_optimize", cost=EXCLUSIVE, debounce=10)
+def action_confirm_optimize(query, _context, _arg):
+    """Запускает оптимизацию после подтверждения."""
+    optimize_script = os.path.join(BASE_DIR, "optimize_server.sh")
+
+    # Просто запускаем скрипт в фоне, не ждем результат
+    success, _output, _error = run_script_safely(optimize_script, query, timeout=5)
+
+    if success:
+        query.edit_message_text(
+            _("messages.optimize_started", query.from_user.id),
+            reply_markup=get_main_keyboard(query.from_user.id)
+        )
+    # В случае неудачи сообщение об ошибке уже будет показано в run_script_safely
+
+@action("logs")
+def action_logs(query, _context, _arg):
+    """Меню логов."""
+    query.edit_message_text(
+        _("messages.logs_title", query.from_user.id),
+        reply_markup=get_processes_keyboard(query.from_user.id)
+    )
+
+@action("cleanup")
+def action_cleanup(query, _context, _arg):
+    """Запрос подтверждения перед очисткой кэша."""
+    keyboard = [
+        [
+            InlineKeyboardButton(_("buttons.confirm_yes", query.from_user.id), callback_data="confirm_cleanup"),
+            InlineKeyboardButton(_("buttons.confirm_no", query.from_user.id), callback_data="main_menu")
+        ]
+    ]
+    query.edit_message_text(
+        _("messages.cleanup_confirm", query.from_user.id),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+@action("confirm_cleanup", cost=EXCLUSIVE, debounce=10)
+def action_confirm_cleanup(query, _context, _arg):
+    """
+    Освобождает память по PSI из cgroup с наибольшим неактивным кэшем
+    вместо сброса всего page cache.
+    """
+    user_id = query.from_user.id
+    try:
+        result = run_reclaim(cfg=CONFIG_WATCHER.current)
+        lines = [_("messages.cleanup_psi_before", user_id).format(psi=format_pressure(result.psi_before))]
+        if not result.reclaimed:
+            lines.append(_("messages.cleanup_reclaim_skipped", user_id).format(reason=result.reason))
+        elif result.fallback:
+            lines.append(_("messages.cleanup_done", user_id))
+        else:
+            lines.append(_("messages.cleanup_reclaimed", user_id).format(
+                freed=format_size(result.freed), count=len(result.targets), reason=result.reason))
+        if result.psi_after:
+            lines.append(_("messages.cleanup_psi_after", user_id).format(psi=format_pressure(result.psi_after)))
+        rotated, freed = cleanup_large_logs()
+        if rotated:
+            lines.append(_("messages.cleanup_logs_rotated", user_id).format(
+                count=rotated, freed=format_size(freed)))
+        query.edit_message_text(
+            "\n".join(lines),
+            reply_markup=get_main_keyboard(user_id)
+        )
+    except (OSError, ValueError) as e:
+        logging.error("Ошибка очистки памяти: %s", e)
+        query.edit_message_text(
+            _("messages.cleanup_error", user_id).format(error=e),
+            reply_markup=get_main_keyboard(user_id)
+        )
+
+@action("show_all_processes", cost=SLOW, debounce=2)
+def action_show_all_processes(query, _context, _arg):
+    """Топ процессов по CPU из ps."""
+    try:
+        result = WATCHDOG.children.check_output(
+            ["ps", "aux", "--sort=-%cpu"],
+            universal_newlines=True,
+            timeout=COMMAND_TIMEOUT
+        )
+        # Берем только первые 11 строк (заголовок + 10 процессов)
+        result_lines = result.split('\n')[:11]
+        result = '\n'.join(result_lines)
+
+        query.edit_message_text(
+            f"{_('messages.top_processes_title', query.from_user.id)}\n\n<pre>{result}</pre>",
+            parse_mode="HTML",
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+    except subprocess.CalledProcessError as e:
+        logging.error("Ошибка получения списка процессов: %s", e)
+        query.edit_message_text(
+            _("messages.command_error", query.from_user.id).format(error=e.output),
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+
+@action("heavy_processes", cost=SLOW, max_concurrency=1, debounce=3)
+def action_heavy_processes(query, _context, _arg):
+    """Анализ тяжелых процессов через monitor_heavy_processes.sh."""
+    try:
+        heavy_script = os.path.join(BASE_DIR, "monitor_heavy_processes.sh")
+        cmd = [heavy_script, "--analyze"]
+        result = WATCHDOG.children.check_output(
+            cmd, stderr=subprocess.STDOUT, universal_newlines=True, timeout=COMMAND_TIMEOUT
+        )
+        query.edit_message_text(
+            f"{_('messages.heavy_processes_title', query.from_user.id)}\n\n{result}",
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+    except subprocess.CalledProcessError as e:
+        logging.error("Ошибка анализа тяжелых процессов: %s", e)
+        query.edit_message_text(
+            _("messages.heavy_processes_error", query.from_user.id).format(error=e.output),
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+
+@action("disk_usage", cost=SLOW, max_concurrency=1, debounce=3)
+def action_disk_usage(query, _context, _arg):
+    """Крупнейшие каталоги из индекса диска."""
+    try:
+        query.edit_message_text(
+            get_disk_usage_text(query.from_user.id),
+            parse_mode="HTML",
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+    except OSError as e:
+        logging.error("Ошибка анализа диска: %s", e)
+        query.edit_message_text(
+            _("messages.disk_usage_error", query.from_user.id).format(error=e),
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+
+@action("log_errors", cost=SLOW, max_concurrency=1, debounce=3)
+def action_log_errors(query, _context, _arg):
+    """Частые ошибки в логах."""
+    query.edit_message_text(
+        get_log_errors_text(query.from_user.id),
+        parse_mode="HTML",
+        reply_markup=get_processes_keyboard(query.from_user.id)
+    )
+
+@action("containers", cost=SLOW, max_concurrency=1, debounce=3)
+def action_containers(query, _context, _arg):
+    """Потребление ресурсов контейнерами."""
+    query.edit_message_text(
+        get_containers_text(query.from_user.id),
+        parse_mode="HTML",
+        reply_markup=get_processes_keyboard(query.from_user.id)
+    )
+
+@action("load_history")
+def action_load_history(query, _context, _arg):
+    """Выбор окна графика нагрузки."""
+    keyboard = [
+        [
+            InlineKeyboardButton(_(f"buttons.{label}", query.from_user.id), callback_data=f"load_history_{window}")
+            for window, label in HISTORY_WINDOWS.items()
+        ],
+        [
+            InlineKeyboardButton(_("buttons.back", query.from_user.id), callback_data="processes")
+        ]
+    ]
+    query.edit_message_text(
+        _("messages.load_history_choose", query.from_user.id),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+@action("load_history", cost=SLOW, debounce=3, parametrized=True)
+def action_load_chart(query, context, window):
+    """График нагрузки за выбранное окно."""
+    if window.isdigit() and int(window) in HISTORY_WINDOWS:
+        send_load_chart(context.bot, query.message.chat_id, int(window), query.from_user.id)
+
+@action("io")
+def action_io(query, _context, _arg):
+    """Дисковый ввод-вывод по устройствам и процессам."""
+    query.edit_message_text(
+        get_io_text(query.from_user.id),
+        parse_mode="HTML",
+        reply_markup=get_processes_keyboard(query.from_user.id)
+    )
+
+@action("live_top")
+def action_live_top(query, _context, _arg):
+    """Включает обновление сообщения с процессами на время LIVE_VIEWS.duration."""
+    user_id = query.from_user.id
+    text = get_live_top_text(user_id)
+    session = LIVE_VIEWS.start(query.message.chat_id, query.message.message_id, user_id,
+                               user_language(user_id), text)
+    if session is None:
+        query.edit_message_text(
+            _("messages.live_top_busy", user_id),
+            reply_markup=get_processes_keyboard(user_id)
+        )
+        return
+    query.edit_message_text(text, parse_mode="HTML", reply_markup=get_live_top_keyboard(user_id))
+
+@action("live_stop")
+def action_live_stop(query, _context, _arg):
+    """Останавливает обновление сообщения с процессами."""
+    LIVE_VIEWS.stop(query.message.chat_id)
+    query.edit_message_text(
+        _("messages.processes_title", query.from_user.id),
+        reply_markup=get_processes_keyboard(query.from_user.id)
+    )
+
+@action("top_consumers")
+def action_top_consumers(query, _context, _arg):
+    """Выбор окна для главных потребителей."""
+    keyboard = [
+        [
+            InlineKeyboardButton(_(f"buttons.{HISTORY_WINDOWS[window]}", query.from_user.id),
+                                 callback_data=f"top_consumers_{window}")
+            for window in CONSUMER_WINDOWS
+        ],
+        [
+            InlineKeyboardButton(_("buttons.back", query.from_user.id), callback_data="processes")
+        ]
+    ]
+    query.edit_message_text(
+        _("messages.top_consumers_choose", query.from_user.id),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+@action("top_consumers", parametrized=True)
+def action_top_consumers_window(query, _context, window):
+    """Главные потребители CPU, диска и памяти за выбранное окно."""
+    if window.isdigit() and int(window) in CONSUMER_WINDOWS:
+        query.edit_message_text(
+            get_top_consumers_text(int(window), query.from_user.id),
+            parse_mode="HTML",
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+
+@action("main_menu")
+def action_main_menu(query, _context, _arg):
+    """Главное меню."""
+    query.edit_message_text(
+        f"{_('messages.main_menu', query.from_user.id)}",
+        reply_markup=get_main_keyboard(query.from_user.id)
+    )
+
+LOG_FILES = {
+    "system": "/var/log/syslog",
+    "cursor": "/var/log/cursor_monitor.log",
+    "optimize": "/var/log/optimize_server.log",
+    "bot": "/var/log/server_control_bot.log"
+}
+
+@action("logs", cost=SLOW, debounce=2, parametrized=True)
+def action_show_log(query, _context, name):
+    """Последние строки выбранного лога."""
+    log_file = LOG_FILES.get(name)
+    if not log_file:
+        return
+    try:
+        # Безопасное получение последних строк лога
+        result = WATCHDOG.children.check_output(
+            ["tail", "-n", "20", log_file],
+            universal_newlines=True,
+            timeout=COMMAND_TIMEOUT
+        )
+        query.edit_message_text(
+            _("messages.logs_template", query.from_user.id).format(log_file=log_file) + f"\n\n<pre>{result}</pre>",
+            parse_mode="HTML",
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+    except subprocess.CalledProcessError as e:
+        logging.error("Ошибка чтения лог-файла %s: %s", log_file, e)
+        query.edit_message_text(
+            _("messages.command_error", query.from_user.id).format(error=e.output),
+            reply_markup=get_processes_keyboard(query.from_user.id)
+        )
+
+def is_destructive_action(data):
+    """
+    Проверяет, меняет ли кнопка состояние сервера (оптимизация, ночной режим, очистка).
+    Args:
+        data (str): Данные callback
+    Returns:
+        bool: True для монопольных действий
+    """
+    spec, _arg = ACTION_ROUTER.resolve(data)
+    return spec is not None and spec.cost == EXCLUSIVE
+
+def recover_backlog(updater):
+    """
+    Разбирает обновления, накопившиеся пока бот не работал, до запуска polling.
+    Повторы одного действия в чате схлопываются, устаревшие опасные действия
+    не выполняются - пользователя просят нажать кнопку еще раз.
+    Args:
+        updater (Updater): Updater бота
+    """
+    try:
+        backlog = drain_backlog(updater.bot)
+    except TelegramError as e:
+        logging.error("Не удалось получить накопившиеся обновления: %s", e)
+        return
+    if not backlog:
+        return
+    result = triage(backlog, is_destructive_action, CONFIG_WATCHER.current.stale_action_age)
+    logging.info("Накопившиеся обновления: %d выполняется, %d устарело, %d повторов",
+                 len(result.keep), len(result.expired), len(result.duplicates))
+    for update in result.expired:
+        query = update.callback_query
+        user_id = query.from_user.id
+        if not is_authorized(user_id):
+            continue
+        audit("callback", user=user_id, data=query.data, status="expired")
+        try:
+            query.edit_message_text(
+                _("messages.action_expired", user_id),
+                reply_markup=get_main_keyboard(user_id)
+            )
+        except TelegramError as e:
+            logging.error("Не удалось сообщить об устаревшем действии %s: %s", query.data, e)
+    # Оставшиеся обновления обрабатываются диспетчером в исходном порядке
+    for update in result.keep:
+        updater.dispatcher.update_queue.put(update)
+
+# Обработчик callback-запросов
+@measure_time()
+def button_callback(update: Update, context: CallbackContext):
+    """Обработчик нажатий на кнопки: проверка доступа и передача действия в реестр."""
+    query = update.callback_query
+    user_id = query.from_user.id
+    logging.info("Получен callback: %s от пользователя %s", query.data, user_id)
+
+    if not is_authorized(user_id):
+        try:
+            query.answer()
+            query.edit_message_text(_("messages.unauthorized", user_id))
+            logging.warning("Попытка неавторизованного доступа от ID: %s", user_id)
+        except Exception as e:
+            logging.error("Ошибка при отправке сообщения о неавторизованном доступе: %s", e)
+        return
+
+    status, spec = ACTION_ROUTER.dispatch(query.data, user_id, query, context)
+    audit("callback", user=user_id, data=query.data, status=status)
+    # Ответ на callback убирает часы загрузки; занятое действие объясняется всплывающим окном
+    try:
+        if status == BUSY:
+            query.answer(_("messages.action_busy", user_id), show_alert=True)
+        else:
+            query.answer()
+    except Exception as e:
+        logging.error("Ошибка при ответе на callback: %s", e)
+
+    if status == UNKNOWN:
+        query.edit_message_text(
+            _("messages.unknown_action", user_id).format(action=query.data),
+            reply_markup=get_main_keyboard(user_id)
+        )
+    elif status != ACCEPTED:
+        logging.info("Действие %s отклонено: %s", spec.name, status)
+
+# Функция для получения статуса сервера
+# Теги HTML-разметки Telegram в тексте сообщения
+_HTML_TAG_RE = re.compile(r"<(/?)([a-z]+)[^>]*>")
+
+def fit_message(lines, limit=MAX_MESSAGE_LENGTH, html_markup=True):
+    """
+    Собирает сообщение из строк, укладываясь в лимит длины Telegram.
+    Лишние строки отбрасываются целиком с конца, поэтому теги и HTML-сущности не разрезаются,
+    а теги, оставшиеся открытыми, закрываются.
+    Args:
+        lines (list): Строки сообщения, строка может содержать переводы строк
+        limit (int): Максимальная длина сообщения
+        html_markup (bool): Текст в HTML; для простого текста теги не отслеживаются
+    Returns:
+        str: Текст сообщения не длиннее limit
+    """
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return text
+    kept, size, open_tags = [], 0, []
+    for line in text.split("\n"):
+        tags = list(open_tags)
+        for closing, name in (_HTML_TAG_RE.findall(line) if html_markup else ()):
+            if not closing:
+                tags.append(name)
+            elif name in tags:
+                del tags[len(tags) - 1 - tags[::-1].index(name)]
+        closers = "".join(f"</{name}>" for name in reversed(tags))
+        if size + len(line) + len("\n…") + len(closers) + 1 > limit:
+            break
+        kept.append(line)
+        size += len(line) + 1
+        open_tags = tags
+    return "\n".join(kept + ["…"]) + "".join(f"</{name}>" for name in reversed(open_tags))
+
+def get_server_status():
+    """
+    Получает текущий статус сервера, используя скрипт check_server_status.sh
+    Returns:
+        str: Текстовое представление статуса сервера
+    """
+    try:
+        status_script = os.path.join(BASE_DIR, "check_server_status.sh")
+        cmd = [status_script, "--silent"]
+        result = WATCHDOG.children.check_output(
+            cmd, stderr=subprocess.STDOUT, universal_newlines=True, timeout=COMMAND_TIMEOUT
+        )
+        return result
+    except subprocess.CalledProcessError as e:
+        logging.error("Ошибка выполнения скрипта статуса: %s", e)
+        return _("errors.status_script_error", None).format(error=e.output)
+    except Exception as e:  # pylint: disable=broad-exception-caught
         logging.error("Неожиданная ошибка при получении статуса: %s", e)
         return _("errors.unexpected", None).format(error=str(e))
 
-# Функция для отправки периодического отчета о статусе
+def get_network_text(user_id=None):
+    """
+    Формирует сводку по слушающим портам и TCP-соединениям из /proc/net.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст сводки
+    """
+    summary = scan_sockets()
+    ports = summary.listening_ports()
+    lines = [
+        _("network.listening", user_id).format(ports=", ".join(ports) if ports else "—"),
+        _("network.connections", user_id).format(
+            established=summary.states.get("ESTABLISHED", 0),
+            time_wait=summary.states.get("TIME_WAIT", 0)
+        )
+    ]
+    if summary.peers:
+        lines.append(_("network.top_peers", user_id).format(
+            peers=", ".join(f"{ip} ({count})" for ip, count in summary.peers[:3])))
+    sample = SAMPLER.buffer.latest()
+    for interface, stats in sorted(sample.net_io.items()) if sample else ():
+        lines.append(_("network.traffic", user_id).format(
+            interface=interface,
+            rx=format_size(int(stats.rx_bps)),
+            tx=format_size(int(stats.tx_bps)),
+            faults=f"{stats.errors_per_sec + stats.drops_per_sec:.1f}"
+        ))
+    if sample and sample.tcp_retrans_per_sec:
+        lines.append(_("network.retransmits", user_id).format(
+            rate=f"{sample.tcp_retrans_per_sec:.1f}", percent=f"{sample.tcp_retrans_percent:.2f}"))
+    return "\n".join(lines)
+
+def get_fleet_status_text(user_id=None):
+    """
+    Опрашивает все подключенные агенты одновременно и формирует сводку.
+    Время ответа ограничено FLEET_QUERY_TIMEOUT независимо от количества хостов.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Сводка по хостам или пустая строка, если агентов нет
+    """
+    if FLEET_SERVER is None or not FLEET_SERVER.hosts:
+        return ""
+    results = FLEET_SERVER.query_all(timeout=CONFIG_WATCHER.current.fleet_query_timeout)
+    lines = [_("fleet.title", user_id).format(count=len(results))]
+    for host in sorted(results):
+        entry = results[host]
+        snapshot = entry['snapshot']
+        summary = format_snapshot_line(snapshot) if snapshot else _("fleet.no_data", user_id)
+        age = int(entry['age']) if entry['age'] is not None else "?"
+        if entry['status'] == "stale":
+            summary += f" ({_('fleet.stale', user_id).format(age=age)})"
+        elif entry['status'] == "offline":
+            summary += f" ({_('fleet.offline', user_id).format(age=age)})"
+        lines.append(f"• {host}: {summary}")
+    return "\n".join(lines)
+
+_disk_index = None
+
+def get_disk_index():
+    """
+    Возвращает инкрементальный индекс диска для текущих DISK_SCAN_ROOTS.
+    Кэш каталогов общий с optimize_server.sh.
+    Returns:
+        DiskIndex: Индекс диска
+    """
+    global _disk_index
+    roots = CONFIG_WATCHER.current.disk_scan_roots
+    if _disk_index is None or _disk_index.roots != [os.path.abspath(r) for r in roots]:
+        _disk_index = DiskIndex(roots)
+    return _disk_index
+
+def cleanup_large_logs():
+    """
+    Сжимает и усекает логи больше MAX_LOG_SIZE, удаляя архивы сверх LOG_ROTATE_KEEP
+    и старше MAX_HISTORY_DAYS.
+    Returns:
+        tuple: (количество ротированных логов, освобождено байт)
+    """
+    cfg = CONFIG_WATCHER.current
+    try:
+        large_logs = get_disk_index().scan().large_files(cfg.max_log_size_bytes)
+        results = rotate_large_logs(
+            [path for path, _size in large_logs],
+            compression=cfg.log_rotate_compression,
+            keep=cfg.log_rotate_keep,
+            max_age_days=cfg.max_history_days
+        )
+    except (OSError, ValueError) as e:
+        logging.error("Ошибка ротации логов: %s", e)
+        return 0, 0
+    rotated = [r for r in results if r.archive]
+    return len(rotated), sum(r.freed for r in rotated)
+
+def get_disk_usage_text(user_id=None):
+    """
+    Формирует отчет о крупнейших каталогах и больших логах.
+    Перечитываются только каталоги, изменившиеся с прошлого сканирования.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст отчета в HTML
+    """
+    index = get_disk_index().scan()
+    max_log_size = CONFIG_WATCHER.current.max_log_size_bytes
+    lines = [_("messages.disk_usage_title", user_id).format(roots=", ".join(index.roots)), "<pre>"]
+    lines += [f"{format_size(size):>8}  {html.escape(path)}" for path, size in index.top_consumers(10)]
+    lines.append("</pre>")
+    large_logs = index.large_files(max_log_size)
+    if large_logs:
+        lines.append(_("messages.disk_large_logs", user_id).format(size=format_size(max_log_size)))
+        lines.append("<pre>")
+        lines += [f"{format_size(size):>8}  {html.escape(path)}" for path, size in large_logs[:10]]
+        lines.append("</pre>")
+    lines.append(_("messages.disk_scan_stats", user_id).format(**index.stats))
+    return fit_message(lines)
+
+# Сканер системных логов бота; позиции хранятся отдельно от optimize_server.sh,
+# чтобы "с прошлой проверки" означало прошлую проверку из бота
+LOG_SCANNER_STATE_FILE = os.path.join(BASE_DIR, "log_scanner_bot_state.json")
+_log_scanner = None
+_log_scanner_lock = threading.Lock()
+
+def get_log_errors_text(user_id=None):
+    """
+    Формирует список новых сигнатур ошибок в системных логах с прошлой проверки.
+    Читаются только строки, добавленные после прошлой проверки.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст отчета в HTML
+    """
+    global _log_scanner
+    with _log_scanner_lock:
+        if _log_scanner is None:
+            _log_scanner = LogScanner(state_file=LOG_SCANNER_STATE_FILE)
+        previous = _log_scanner.last_scan
+        found = _log_scanner.scan()
+    since = datetime.fromtimestamp(previous).strftime('%Y-%m-%d %H:%M:%S') if previous else "—"
+    if not found:
+        return _("messages.log_errors_none", user_id).format(since=since)
+    lines = [_("messages.log_errors_title", user_id).format(since=since), "<pre>"]
+    for signature, count, new in found[:15]:
+        marker = "*" if new else " "
+        lines.append(f"{count:>6}{marker} {html.escape(signature[:120])}")
+    lines.append("</pre>")
+    lines.append(_("messages.log_errors_legend", user_id))
+    return fit_message(lines)
+
+# Сборщик статистики контейнеров из cgroupfs; CPU% считается по разнице двух чтений
+_container_collector = None
+_container_collected_at = 0.0
+_container_lock = threading.Lock()
+# Если прошлое чтение старше, делаем два чтения подряд с паузой в секунду
+CONTAINER_RATE_MAX_AGE = 30
+
+def get_containers_text(user_id=None):
+    """
+    Формирует таблицу потребления ресурсов контейнерами.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст отчета в HTML
+    """
+    global _container_collector, _container_collected_at
+    with _container_lock:
+        cgroup_root = CONFIG_WATCHER.current.cgroup_root
+        if _container_collector is None or _container_collector.cgroup_root != cgroup_root:
+            _container_collector = ContainerCollector(cgroup_root)
+            _container_collected_at = 0.0
+        if time.time() - _container_collected_at > CONTAINER_RATE_MAX_AGE:
+            _container_collector.collect()
+            # Пауза для замера скорости идет в пуле SLOW и не держит диспетчер
+            time.sleep(1)
+        samples = _container_collector.collect()
+        _container_collected_at = time.time()
+    if not samples:
+        return _("messages.containers_none", user_id)
+    lines = [_("messages.containers_title", user_id), "<pre>"]
+    lines += [html.escape(line) for line in format_top(samples, limit=15)]
+    lines.append("</pre>")
+    return fit_message(lines)
+
+def get_stats_text(user_id=None):
+    """
+    Формирует p50/p95/p99/max нагрузки, CPU, памяти и диска за 1ч, 24ч и 7д.
+    Значения берутся из окон, поддерживаемых на каждом измерении, без пересчета истории.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст в HTML
+    """
+    lines = [_("messages.stats_title", user_id)]
+    for name in STATS_METRICS:
+        rows = []
+        for window, label in HISTORY_WINDOWS.items():
+            summary = ROLLING_STATS.summary(name, window)
+            if summary is None:
+                continue
+            rows.append(f"{_(f'buttons.{label}', user_id):<9}" + "".join(
+                f"{summary[key]:>7.2f}" for key in ("p50", "p95", "p99", "max")))
+        if rows:
+            lines.append(f"\n<b>{_(f'messages.stats_{name}', user_id)}</b>")
+            lines.append("<pre>" + " " * 9 + "".join(f"{key:>7}" for key in ("p50", "p95", "p99", "max")))
+            lines += rows
+            lines[-1] += "</pre>"
+    if len(lines) == 1:
+        return _("messages.load_history_empty", user_id)
+    return fit_message(lines)
+
+CONSUMER_WINDOWS = (86400, 604800)
+CONSUMERS_TOP = 5
+
+def get_io_text(user_id=None):
+    """
+    Формирует сводку дискового ввода-вывода: устройства и процессы с наибольшим I/O.
+    Данные берутся из последнего измерения сборщика.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст в HTML
+    """
+    sample = SAMPLER.buffer.latest()
+    if sample is None or not sample.disk_io:
+        return _("messages.io_no_data", user_id)
+    lines = [_("messages.io_title", user_id), "<pre>" + f"{'':<8}{'r/s':>7}{'w/s':>7}{'read':>8}{'write':>8}{'await':>8}{'util':>6}"]
+    for device, stats in sorted(sample.disk_io.items()):
+        lines.append(f"{device[:8]:<8}{stats.read_iops:>7.0f}{stats.write_iops:>7.0f}"
+                     f"{format_size(int(stats.read_bps)):>8}{format_size(int(stats.write_bps)):>8}"
+                     f"{stats.await_ms:>6.1f}ms{stats.util_percent:>5.0f}%")
+    lines[-1] += "</pre>"
+    if sample.top_io:
+        lines.append(f"\n<b>{_('messages.io_top_processes', user_id)}</b>")
+        lines.append("<pre>" + "\n".join(
+            f"{format_size(int(p.read_bps)):>8}{format_size(int(p.write_bps)):>8}  {p.pid:>7} {html.escape(p.name)}"
+            for p in sample.top_io[:CONSUMERS_TOP]) + "</pre>")
+    return fit_message(lines)
+
+LIVE_TOP_NAME_WIDTH = 20
+
+def get_live_top_text(user_id=None):
+    """
+    Формирует компактную таблицу процессов для обновляемого сообщения.
+    Используются топы по CPU и памяти из последнего измерения, без запуска ps.
+    Строки добавляются, пока сообщение укладывается в лимит длины.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст в HTML
+    """
+    sample = SAMPLER.buffer.latest()
+    if sample is None:
+        return _("messages.load_history_empty", user_id)
+    header = _("messages.live_top_title", user_id).format(
+        load=" ".join(f"{value:.2f}" for value in sample.load),
+        cpu=sample.cpu_percent,
+        mem=sample.mem_percent,
+        total=sample.processes_total,
+        interval=LIVE_VIEWS.interval
+    )
+    # Потоки ядра (без RSS) не показываются
+    processes = {p.pid: p for p in sample.top_mem + sample.top_cpu if p.rss_bytes}
+    rows = [f"{'PID':>7} {'CPU%':>5} {'RSS':>6} NAME"]
+    room = MAX_MESSAGE_LENGTH - len(header) - len("\n<pre></pre>") - len(rows[0])
+    for proc in sorted(processes.values(), key=lambda p: (p.cpu_percent, p.rss_bytes), reverse=True):
+        # CPU округляется до целого, чтобы шум не вызывал лишних правок сообщения
+        row = (f"{proc.pid:>7} {proc.cpu_percent:>5.0f} {format_size(proc.rss_bytes):>6} "
+               f"{html.escape(proc.name[:LIVE_TOP_NAME_WIDTH])}")
+        room -= len(row) + 1
+        if room < 0:
+            break
+        rows.append(row)
+    return header + "\n<pre>" + "\n".join(rows) + "</pre>"
+
+def get_live_top_keyboard(user_id=None):
+    """
+    Создает клавиатуру обновляемого сообщения с процессами.
+    Args:
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        InlineKeyboardMarkup: Объект клавиатуры
+    """
+    return InlineKeyboardMarkup([[InlineKeyboardButton(_("buttons.live_stop", user_id), callback_data="live_stop")]])
+
+@measure_time("job")
+def update_live_views(context: CallbackContext):
+    """
+    Обновляет сообщения "top": один рендер на язык, правка только при изменении текста.
+    Args:
+        context (CallbackContext): Контекст вызова
+    """
+    if not len(LIVE_VIEWS):
+        return
+    edits, expired = LIVE_VIEWS.tick(lambda _language, user_id: get_live_top_text(user_id))
+    for session, text in edits:
+        try:
+            context.bot.edit_message_text(text, chat_id=session.chat_id, message_id=session.message_id,
+                                          parse_mode="HTML", reply_markup=get_live_top_keyboard(session.user_id))
+            LIVE_VIEWS.confirm(session, text)
+        except RetryAfter as e:
+            LIVE_VIEWS.pause(e.retry_after)
+            break
+        except BadRequest as e:
+            # Сообщение удалено или изменено другой кнопкой - обновлять больше нечего
+            if "not modified" in str(e):
+                LIVE_VIEWS.confirm(session, text)
+            else:
+                LIVE_VIEWS.stop(session.chat_id, session.message_id)
+        except TelegramError as e:
+            logging.error("Ошибка обновления сообщения top в чате %s: %s", session.chat_id, e)
+    for session in expired:
+        try:
+            context.bot.edit_message_text(
+                f"{session.last_text}\n\n{_('messages.live_top_stopped', session.user_id)}",
+                chat_id=session.chat_id, message_id=session.message_id, parse_mode="HTML",
+                reply_markup=get_processes_keyboard(session.user_id)
+            )
+        except TelegramError as e:
+            logging.error("Ошибка завершения сообщения top в чате %s: %s", session.chat_id, e)
+
+def get_top_consumers_text(window, user_id=None):
+    """
+    Формирует списки команд, больше всего потребивших CPU, диска и памяти за окно.
+    Args:
+        window (int): Окно в секундах (24 часа или 7 дней)
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Текст в HTML
+    """
+    lines = [_("messages.top_consumers_title", user_id).format(window=_(f"buttons.{HISTORY_WINDOWS[window]}", user_id))]
+    for resource in ("cpu", "io", "rss"):
+        rows = COMMAND_ACCOUNTING.top(window, resource, CONSUMERS_TOP)
+        if not rows:
+            continue
+        lines.append(f"\n<b>{_(f'messages.top_consumers_{resource}', user_id)}</b>")
+        lines.append("<pre>" + "\n".join(
+            f"{format_value(resource, value):>8}  {html.escape(key)}" for key, value, _error in rows) + "</pre>")
+    if len(lines) == 1:
+        return _("messages.load_history_empty", user_id)
+    return fit_message(lines)
+
+# Окна истории в секундах и ключи их подписей
+HISTORY_WINDOWS = {3600: "window_1h", 86400: "window_24h", 604800: "window_7d"}
+# Метрики графика нагрузки: (имя в истории, подпись, фиксированный максимум)
+LOAD_CHART_METRICS = (("load", "LOAD", None), ("cpu", "CPU %", 100.0), ("mem", "MEM %", 100.0),
+                      ("io_util", "IO %", 100.0))
+
+def send_load_chart(bot, chat_id, window, user_id=None):
+    """
+    Отправляет PNG-график нагрузки, CPU и памяти за окно window секунд.
+    Повторные запросы в течение CACHE_TTL отправляют уже загруженный файл по file_id.
+    Args:
+        bot (Bot): Экземпляр бота
+        chat_id (int): ID чата
+        window (int): Длина окна в секундах
+        user_id (int, optional): ID пользователя для локализации
+    """
+    key = (tuple(name for name, _title, _max in LOAD_CHART_METRICS), window)
+    if window not in HISTORY_WINDOWS:
+        return
+    window_label = _(f"buttons.{HISTORY_WINDOWS[window]}", user_id)
+    cached = CHART_CACHE.get(key)
+    if cached is not None:
+        bot.send_photo(chat_id=chat_id, photo=cached[0], caption=cached[1])
+        return
+    end = time.time()
+    panels = []
+    for name, title, fixed_max in LOAD_CHART_METRICS:
+        xs, ys = HISTORY_STORE.window(name, window, end)
+        panels.append((title, xs, ys, fixed_max))
+    if not panels[0][1]:
+        bot.send_message(chat_id=chat_id, text=_("messages.load_history_empty", user_id))
+        return
+    load_values = panels[0][2]
+    caption = _("messages.load_history_caption", user_id).format(
+        window=window_label,
+        load_max=max(load_values),
+        cpu_avg=sum(panels[1][2]) / max(len(panels[1][2]), 1),
+        mem_max=max(panels[2][2], default=0.0),
+        points=len(load_values)
+    )
+    png = render_chart(panels, end - window, end)
+    message = bot.send_photo(chat_id=chat_id, photo=io.BytesIO(png), caption=caption)
+    # Telegram хранит загруженное фото, поэтому в кэше достаточно file_id
+    CHART_CACHE.put(key, (message.photo[-1].file_id, caption))
+
+# Снапшот последнего отправленного отчета, следующий отчет содержит только изменения
+_last_report = None
+
+DELTA_METRIC_FORMATS = {"swap": "{:.0f}%".format}
+
+def format_status_change(change, user_id=None):
+    """
+    Формирует строку отчета об одном значимом изменении.
+    Args:
+        change (Change): Изменение между снапшотами
+        user_id (int, optional): ID пользователя для локализации
+    Returns:
+        str: Строка в HTML
+    """
+    if change.kind == "metric":
+        value_format = DELTA_METRIC_FORMATS.get(change.name) or ANOMALY_METRIC_FORMATS[change.name]
+        return _("report.delta_metric", user_id).format(
+            metric=_(f"report.metric_{change.name}", user_id),
+            old=value_format(change.old),
+            new=value_format(change.new),
+            arrow="📈" if change.new > change.old else "📉"
+        )
+    if change.kind == "top_cpu":
+        return _("report.delta_top_cpu", user_id).format(name=html.escape(change.name), cpu=change.new)
+    if change.kind == "top_mem":
+        return _("report.delta_top_mem", user_id).format(name=html.escape(change.name), rss=format_size(change.new))
+    if change.kind == "disk":
+        return _("report.delta_disk", user_id).format(
+            mount=html.escape(change.name), growth=format_size(change.new - change.old), percent=change.extra)
+    return _(f"report.delta_{change.kind}", user_id).format(port=change.name)
+
+@measure_time("job")
 def send_status_report(context: CallbackContext):
     """
-    Отправляет периодический отчет о статусе сервера всем администраторам.
+    Отправляет администраторам изменения с прошлого отчета.
+    Первый отчет после запуска полный; если ничего существенного не изменилось, отчет не отправляется.
+    Args:
+        context (CallbackContext): Контекст вызова
+    """
+    global _last_report
+    sample = SAMPLER.buffer.latest()
+    if sample is None:
+        send_full_status_report(context)
+        return
+    snapshot = take_snapshot(sample, scan_sockets().listening_ports())
+    if _last_report is None:
+        send_full_status_report(context)
+        _last_report = snapshot
+        return
+    changes = diff(_last_report, snapshot)
+    if not changes:
+        logging.info("Периодический отчет пропущен: существенных изменений нет")
+        return
+    hostname = os.uname().nodename
+    since = format_duration(snapshot.timestamp - _last_report.timestamp)
+    for admin_id in config['AUTHORIZED_ADMINS']:
+        message = fit_message(
+            [_("report.delta_title", admin_id).format(hostname=html.escape(hostname), since=since), ""]
+            + [format_status_change(change, admin_id) for change in changes]
+        )
+        keyboard = [[InlineKeyboardButton(_("buttons.full_report", admin_id), callback_data="status")]]
+        try:
+            context.bot.send_message(chat_id=admin_id, text=message, parse_mode="HTML",
+                                     reply_markup=InlineKeyboardMarkup(keyboard))
+            logging.info("Отправлен отчет об изменениях администратору %s", admin_id)
+        except Exception as e:
+            logging.error(_("errors.report_sending", None).format(admin_id=admin_id, error=e))
+    _last_report = snapshot
+
+def send_full_status_report(context: CallbackContext):
+    """
+    Отправляет полный отчет о статусе сервера всем администраторам.
     Args:
         context (CallbackContext): Контекст вызова
     """
     status = get_server_status()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    hostname = subprocess.check_output("hostname", universal_newlines=True).strip()
+    hostname = os.uname().nodename
     
     # Отправляем сообщение всем администраторам на их языке
     for admin_id in config['AUTHORIZED_ADMINS']:
@@ -942,7 +1845,56 @@ def send_status_report(context: CallbackContext):
         except Exception as e:
             logging.error(_("errors.report_sending", None).format(admin_id=admin_id, error=e))
 
+@measure_time("job")
+def profile_transition(context: CallbackContext):
+    """
+    Переключает профиль ресурсов в момент перехода по расписанию
+    и планирует следующий переход.
+    Args:
+        context (CallbackContext): Контекст вызова
+    """
+    try:
+        name, changed = PROFILE_SCHEDULER.reconcile()
+        if changed:
+            for admin_id in config['AUTHORIZED_ADMINS']:
+                try:
+                    context.bot.send_message(
+                        chat_id=admin_id,
+                        text=_("messages.profile_switched", admin_id).format(profile=name, count=len(changed))
+                    )
+                except Exception as e:
+                    logging.error("Не удалось уведомить администратора %s о смене профиля: %s", admin_id, e)
+    finally:
+        schedule_profile_transition(context.job_queue)
+
+# Интервал, с которым профиль распространяется на новые процессы
+PROFILE_REFRESH_INTERVAL = 60
+
+@measure_time("job")
+def refresh_profile(_context: CallbackContext):
+    """
+    Применяет ограничения активного профиля к процессам, запущенным после перехода,
+    и перезапускает завершившиеся cpulimit.
+    Args:
+        _context (CallbackContext): Контекст вызова
+    """
+    PROFILE_SCHEDULER.refresh()
+
+def schedule_profile_transition(job_queue):
+    """
+    Планирует однократную задачу на время следующего перехода профиля.
+    Args:
+        job_queue (JobQueue): Очередь задач бота
+    """
+    now = datetime.now()
+    when = PROFILE_SCHEDULER.next_transition(now)
+    if when is not None:
+        # Задержка в секундах: наивное datetime job_queue трактует как UTC
+        job_queue.run_once(profile_transition, when=(when - now).total_seconds())
+        logging.info("Следующее переключение профиля ресурсов: %s", when)
+
 # Функция для проверки нагрузки системы и отправки предупреждений
+@measure_time("job")
 def check_system_load(context: CallbackContext):
     """
     Проверяет текущую нагрузку системы и отправляет предупреждения если она превышает лимиты.
@@ -955,10 +1907,9 @@ def check_system_load(context: CallbackContext):
         load_avg = os.getloadavg()
         one_min_load = load_avg[0]
         
-        # Проверяем превышение лимитов
-        critical_limit = config['CPU_LIMITS'].get('critical', 10)
-        strict_limit = config['CPU_LIMITS'].get('strict', 30)
-        normal_limit = config['CPU_LIMITS'].get('normal', 50)
+        # Проверяем превышение лимитов (актуальные значения после горячей перезагрузки)
+        server_cfg = CONFIG_WATCHER.current
+        normal_limit = server_cfg.cpu_limit_normal
         
         # Высокая нагрузка - отправляем предупреждение
         if one_min_load > normal_limit:
@@ -993,6 +1944,76 @@ def check_system_load(context: CallbackContext):
     except Exception as e:
         logging.error("Ошибка при проверке нагрузки системы: %s", e)
 
+ANOMALY_METRIC_FORMATS = {
+    "load": "{:.2f}".format,
+    "cpu": "{:.0f}%".format,
+    "mem": "{:.0f}%".format,
+    "net_rx": lambda value: f"{format_size(int(value))}/s",
+    "net_tx": lambda value: f"{format_size(int(value))}/s",
+    "net_faults": "{:.1f}/s".format,
+    "tcp_retrans": "{:.2f}%".format,
+}
+
+@measure_time("job")
+def send_anomaly_alerts(context: CallbackContext):
+    """
+    Отправляет администраторам аномалии, найденные детектором с прошлого запуска.
+    Args:
+        context (CallbackContext): Контекст вызова
+    """
+    for anomaly in ANOMALY_DETECTOR.drain():
+        value_format = ANOMALY_METRIC_FORMATS.get(anomaly.metric, "{:.2f}".format)
+        for admin_id in config['AUTHORIZED_ADMINS']:
+            baseline_key = "report.anomaly_baseline_hour" if anomaly.seasonal else "report.anomaly_baseline_day"
+            message = _("report.anomaly", admin_id).format(
+                metric=_(f"report.metric_{anomaly.metric}", admin_id),
+                value=value_format(anomaly.value)
+            ) + "\n" + _(baseline_key, admin_id).format(
+                hour=anomaly.hour,
+                mean=value_format(anomaly.mean),
+                std=value_format(anomaly.std),
+                z=f"{anomaly.z:.1f}"
+            )
+            keyboard = [[
+                InlineKeyboardButton(_("buttons.heavy_processes", admin_id), callback_data="heavy_processes"),
+                InlineKeyboardButton(_("buttons.status", admin_id), callback_data="status")
+            ]]
+            try:
+                context.bot.send_message(chat_id=admin_id, text=message,
+                                         reply_markup=InlineKeyboardMarkup(keyboard))
+            except Exception as e:
+                logging.error("Ошибка отправки оповещения об аномалии админу %s: %s", admin_id, e)
+        logging.info("Аномалия %s: %.2f при обычном %.2f ± %.2f", anomaly.metric, anomaly.value, anomaly.mean, anomaly.std)
+
+@measure_time("job")
+def send_memory_trend_alerts(context: CallbackContext):
+    """
+    Предупреждает администраторов о процессах, которые скоро исчерпают лимит памяти.
+    Args:
+        context (CallbackContext): Контекст вызова
+    """
+    for growth in MEMORY_TRENDS.drain():
+        logging.info("Рост памяти %s (PID %s): %s/ч, лимит через %s", growth.name, growth.pid,
+                     format_size(int(growth.rate * 3600)), format_duration(growth.eta))
+        for admin_id in config['AUTHORIZED_ADMINS']:
+            message = _("report.memory_growth", admin_id).format(
+                name=growth.name,
+                pid=growth.pid,
+                rate=format_size(int(growth.rate * 3600)),
+                rss=format_size(growth.rss),
+                limit=_(f"report.memory_limit_{growth.limit}", admin_id),
+                eta=format_duration(growth.eta)
+            )
+            keyboard = [[
+                InlineKeyboardButton(_("buttons.heavy_processes", admin_id), callback_data="heavy_processes"),
+                InlineKeyboardButton(_("buttons.top_consumers", admin_id), callback_data="top_consumers")
+            ]]
+            try:
+                context.bot.send_message(chat_id=admin_id, text=message,
+                                         reply_markup=InlineKeyboardMarkup(keyboard))
+            except Exception as e:
+                logging.error("Ошибка отправки предупреждения о росте памяти админу %s: %s", admin_id, e)
+
 # Функция-помощник для проверки и запуска внешних скриптов
 def run_script_safely(script_path, query, args=None, timeout=30):
     """
@@ -1049,7 +2070,7 @@ def run_script_safely(script_path, query, args=None, timeout=30):
     
     # Запускаем скрипт и получаем результат
     try:
-        output = subprocess.check_output(
+        output = WATCHDOG.children.check_output(
             cmd,
             stderr=subprocess.STDOUT,
             universal_newlines=True,
@@ -1130,6 +2151,8 @@ if __name__ == '__main__':
         # Регистрируем обработчики
         dispatcher.add_handler(CommandHandler("start", start_command))
         dispatcher.add_handler(CommandHandler("help", start_command))
+        # Профилирование занимает до минуты, поэтому выполняется вне потока диспетчера
+        dispatcher.add_handler(CommandHandler("profile", profile_command, run_async=True))
         
         # Регистрируем обработчик выбора языка
         if LOCALIZATION_AVAILABLE and LOCALIZATION_CONFIG.get("USER_LANGUAGE_SELECTION", False):
@@ -1157,6 +2180,69 @@ if __name__ == '__main__':
         )
         logging.info("Планировщик проверки нагрузки системы запущен. Интервал: 600 секунд")
         
+        # Аномалии и рост памяти находит сборщик метрик, задачи только доставляют их администраторам
+        job_queue.run_repeating(send_anomaly_alerts, interval=60, first=60)
+        job_queue.run_repeating(send_memory_trend_alerts, interval=60, first=60)
+        job_queue.run_repeating(update_live_views, interval=LIVE_VIEWS.interval, first=LIVE_VIEWS.interval)
+        
+        # Восстанавливаем профиль, положенный по расписанию (после перезапуска применяется только разница)
+        PROFILE_SCHEDULER.reconcile()
+        schedule_profile_transition(job_queue)
+        job_queue.run_repeating(refresh_profile, interval=PROFILE_REFRESH_INTERVAL, first=PROFILE_REFRESH_INTERVAL)
+        
+        # Запускаем фоновый сбор метрик и отслеживание изменений конфигурации
+        SAMPLER.start()
+        CONFIG_WATCHER.start()
+        
+        # Сторожевой таймер: пробы в диспетчер, очередь задач и пул действий, задержка пишется в метрики
+        dispatcher.add_handler(TypeHandler(Heartbeat, lambda heartbeat, _context: heartbeat.ack()), group=-1)
+        WATCHDOG.add_probe("dispatcher", lambda ack: dispatcher.update_queue.put(Heartbeat(ack)))
+        WATCHDOG.add_probe("job_queue", lambda ack: job_queue.run_once(lambda _context: ack(), 0))
+        WATCHDOG.add_probe("action_pool", ACTION_ROUTER.probe)
+        for probe_name in ("dispatcher", "job_queue", "action_pool"):
+            BOT_METRICS.register_gauge(
+                f"scs_bot_{probe_name}_lag_seconds", functools.partial(WATCHDOG.lag, probe_name),
+                f"Seconds until the {probe_name.replace('_', ' ')} answers a heartbeat"
+            )
+        WATCHDOG.start()
+        
+        # Прием снапшотов от агентов других серверов (включается через FLEET_PORT)
+        server_cfg = CONFIG_WATCHER.current
+        if server_cfg.fleet_port:
+            try:
+                FLEET_SERVER = FleetServer(
+                    port=server_cfg.fleet_port,
+                    bind=server_cfg.fleet_bind,
+                    token=os.environ.get('FLEET_TOKEN', server_cfg.fleet_token)
+                )
+                FLEET_SERVER.start()
+            except (OSError, ValueError) as e:
+                FLEET_SERVER = None
+                logging.error("Не удалось запустить сервер агентов на порту %s: %s", server_cfg.fleet_port, e)
+        
+        # Эндпоинт /metrics для Prometheus (включается через METRICS_PORT)
+        if config['METRICS_PORT']:
+            BOT_METRICS.register_gauge(
+                "scs_bot_update_queue_depth", dispatcher.update_queue.qsize,
+                "Updates waiting in the dispatcher queue"
+            )
+            BOT_METRICS.register_gauge(
+                "scs_bot_log_records_dropped", lambda: LOG_PIPELINE.dropped,
+                "Log records dropped because the logging queue was full"
+            )
+            BOT_METRICS.register_gauge(
+                "scs_bot_scheduled_jobs", lambda: len(job_queue.jobs()),
+                "Jobs scheduled in the job queue"
+            )
+            try:
+                MetricsServer(
+                    MetricsRenderer(SAMPLER.buffer, BOT_METRICS),
+                    config['METRICS_PORT'],
+                    config['METRICS_BIND']
+                ).start()
+            except OSError as e:
+                logging.error("Не удалось запустить эндпоинт метрик на порту %s: %s", config['METRICS_PORT'], e)
+        
         # Удаляем проблемную строку, которая вызывает ошибку
         # Просто информируем о регистрации обработчиков
         logging.info("Обработчики команд и callback зарегистрированы")
@@ -1166,9 +2252,16 @@ if __name__ == '__main__':
         print("Бот запущен. Нажмите Ctrl+C для остановки.")
         
         # Запускаем бота с более частой проверкой обновлений и подробным логированием
+        # Очередь, накопившаяся за время простоя, разбирается до запуска polling
+        recover_backlog(updater)
         updater.start_polling(poll_interval=1.0, timeout=30, drop_pending_updates=False, read_latency=2.0)
         logging.info("Polling запущен успешно")
         updater.idle()
+        # Базовые линии и накопленное потребление сохраняются, чтобы пережить перезапуск
+        ANOMALY_DETECTOR.save()
+        COMMAND_ACCOUNTING.save()
+        ACTION_ROUTER.shutdown(wait=False)
+        WATCHDOG.stop()
         
     except KeyboardInterrupt:
         logging.info("Бот остановлен пользователем")
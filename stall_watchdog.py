@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Watchdog for stalled bot executors.
+
+Every executor the bot depends on (the dispatcher, the job queue, the
+action pool) gets a heartbeat probe: a no-op task that acknowledges when
+it runs. The watchdog thread sends a probe, and the time until the
+acknowledgement is the lag of that executor. An unanswered probe keeps
+growing the lag, so a worker stuck in a subprocess shows up as a lag that
+climbs past the threshold instead of silence.
+
+On a stall the watchdog dumps the stack of every thread and, if allowed,
+kills child processes that have been running longer than kill_after
+seconds, together with their descendants. Only children started through
+the watchdog's ChildRegistry are candidates: long-lived helpers such as
+cpulimit or a detached night script are never touched. The bot is notified through a
+callback that runs on the watchdog thread, so it must not need the
+stalled executors to deliver the alert.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import traceback
+import subprocess
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from system_sampler import PROC_ROOT
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_THRESHOLD = 30.0
+DEFAULT_KILL_AFTER = 300.0
+
+
+@dataclass
+class Stall:
+    """An executor that did not answer its probe in time."""
+    probe: str
+    lag: float
+    stacks: str
+    killed: List[Tuple[int, str, float]] = field(default_factory=list)
+
+
+class Heartbeat:
+    """Marker put on an update queue; the handler that receives it calls ack()."""
+
+    def __init__(self, ack: Callable[[], None]):
+        self.ack = ack
+
+
+class _Probe:
+    __slots__ = ("name", "send", "seq", "sent", "lag", "stalled")
+
+    def __init__(self, name: str, send: Callable[[Callable[[], None]], None]):
+        self.name = name
+        self.send = send
+        self.seq = 0
+        self.sent: Optional[float] = None
+        self.lag = 0.0
+        self.stalled = False
+
+
+class ChildRegistry:
+    """Pids of the child processes a worker waits for, the ones a stall may be blamed on."""
+
+    def __init__(self):
+        self._pids: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def pids(self) -> List[int]:
+        with self._lock:
+            return list(self._pids)
+
+    def check_output(self, args: List[str], timeout: Optional[float] = None, **kwargs) -> str:
+        """
+        subprocess.check_output with the child registered while it runs
+
+        Args:
+            args (List[str]): Command
+            timeout (float, optional): Seconds before the child is killed
+            **kwargs: Other subprocess.Popen arguments
+
+        Returns:
+            str: Output of the command
+
+        Raises:
+            subprocess.CalledProcessError: The command exited with a non-zero code
+            subprocess.TimeoutExpired: The command ran longer than timeout
+        """
+        with subprocess.Popen(args, stdout=subprocess.PIPE, **kwargs) as proc:
+            with self._lock:
+                self._pids.add(proc.pid)
+            try:
+                output, _ = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                output, _ = proc.communicate()
+                raise subprocess.TimeoutExpired(proc.args, timeout, output=output) from None
+            finally:
+                with self._lock:
+                    self._pids.discard(proc.pid)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args, output=output)
+        return output
+
+
+def dump_stacks() -> str:
+    """Get the current stack of every thread of this process as text."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    parts = []
+    for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+        parts.append(f"Thread {names.get(ident, ident)} ({ident}):\n" + "".join(traceback.format_stack(frame)))
+    return "\n".join(parts)
+
+
+def _read_children(proc_root: str, root_pid: int) -> Dict[int, Tuple[int, str, int]]:
+    """pid -> (ppid, command, start ticks) for every process under root_pid."""
+    table = {}
+    for entry in os.listdir(proc_root):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc_root, entry, "stat"), "r", encoding="utf-8") as f:
+                data = f.read()
+        except OSError:
+            continue
+        name_end = data.rfind(")")
+        fields = data[name_end + 2:].split()
+        # ppid is field 4 and starttime field 22 of stat, 2 and 20 after the command name
+        table[int(entry)] = (int(fields[1]), data[data.find("(") + 1:name_end], int(fields[19]))
+    descendants = {}
+    parents = {root_pid}
+    while parents:
+        found = {pid: info for pid, info in table.items() if info[0] in parents and pid not in descendants}
+        descendants.update(found)
+        parents = set(found)
+    return descendants
+
+
+def kill_hung_children(kill_after: float, pids: Iterable[int], proc_root: str = PROC_ROOT,
+                       root_pid: Optional[int] = None) -> List[Tuple[int, str, float]]:
+    """
+    Kill the given direct children older than kill_after together with their descendants
+
+    Args:
+        kill_after (float): Minimum age of a child in seconds
+        pids (Iterable[int]): Children that may be killed, other children are left alone
+        proc_root (str): procfs mount point
+        root_pid (int, optional): Parent process, this process by default
+
+    Returns:
+        List[Tuple[int, str, float]]: Killed direct children as (pid, command, age)
+    """
+    root_pid = os.getpid() if root_pid is None else root_pid
+    candidates = set(pids)
+    if not candidates:
+        return []
+    try:
+        with open(os.path.join(proc_root, "uptime"), "r", encoding="utf-8") as f:
+            uptime = float(f.read().split()[0])
+        descendants = _read_children(proc_root, root_pid)
+    except (OSError, ValueError, IndexError) as e:
+        logging.error("Cannot list child processes: %s", e)
+        return []
+    ticks = os.sysconf("SC_CLK_TCK")
+    killed = []
+    for pid, (ppid, name, start) in descendants.items():
+        age = uptime - start / ticks
+        if pid not in candidates or ppid != root_pid or age < kill_after:
+            continue
+        # The child first, so a shell script cannot go on after its killed command;
+        # the descendants listed above are then killed by pid, reparented or not
+        subtree = [pid] + [p for p in descendants if _is_under(descendants, p, pid)]
+        for target in subtree:
+            try:
+                os.kill(target, signal.SIGKILL)
+            except OSError:
+                pass
+        killed.append((pid, name, age))
+        logging.warning("Killed hung child process %s (%s) after %.0f s", pid, name, age)
+    return killed
+
+
+def _is_under(table: Dict[int, Tuple[int, str, int]], pid: int, ancestor: int) -> bool:
+    parent = table[pid][0]
+    while parent in table:
+        if parent == ancestor:
+            return True
+        parent = table[parent][0]
+    return parent == ancestor
+
+
+class StallWatchdog:
+    """
+    Heartbeat prober of the bot executors.
+
+    A probe is registered with a send function that schedules the given
+    acknowledgement on the monitored executor.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, interval: float = DEFAULT_INTERVAL,
+                 kill_after: float = DEFAULT_KILL_AFTER,
+                 on_stall: Optional[Callable[[Stall], None]] = None,
+                 on_recover: Optional[Callable[[str, float], None]] = None,
+                 proc_root: str = PROC_ROOT):
+        self.threshold = threshold
+        self.interval = interval
+        self.kill_after = kill_after
+        self.on_stall = on_stall
+        self.on_recover = on_recover
+        self.proc_root = proc_root
+        self._probes: Dict[str, _Probe] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Children a stalled worker may be waiting for
+        self.children = ChildRegistry()
+
+    def add_probe(self, name: str, send: Callable[[Callable[[], None]], None]):
+        """
+        Monitor an executor
+
+        Args:
+            name (str): Executor name used in metrics and alerts
+            send (Callable): Schedules its argument, a no-op acknowledgement, on the executor
+        """
+        with self._lock:
+            self._probes[name] = _Probe(name, send)
+
+    def lag(self, name: str) -> float:
+        """Last measured lag of an executor, or the age of its unanswered probe if larger."""
+        with self._lock:
+            probe = self._probes[name]
+            if probe.sent is not None:
+                return max(probe.lag, time.monotonic() - probe.sent)
+            return probe.lag
+
+    def _ack(self, probe: _Probe, seq: int):
+        now = time.monotonic()
+        with self._lock:
+            if seq != probe.seq or probe.sent is None:
+                return
+            probe.lag = now - probe.sent
+            probe.sent = None
+            recovered = probe.stalled
+            probe.stalled = False
+        if recovered and self.on_recover is not None:
+            self.on_recover(probe.name, probe.lag)
+
+    def check(self, now: Optional[float] = None) -> List[Stall]:
+        """
+        Send due probes and detect stalls; one watchdog step
+
+        Args:
+            now (float, optional): Monotonic time
+
+        Returns:
+            List[Stall]: Executors that crossed the threshold in this step
+        """
+        now = time.monotonic() if now is None else now
+        to_send, stalled = [], []
+        with self._lock:
+            for probe in self._probes.values():
+                if probe.sent is None:
+                    probe.seq += 1
+                    probe.sent = now
+                    to_send.append((probe, probe.seq))
+                elif now - probe.sent >= self.threshold and not probe.stalled:
+                    probe.stalled = True
+                    stalled.append((probe.name, now - probe.sent))
+        for probe, seq in to_send:
+            try:
+                probe.send(lambda probe=probe, seq=seq: self._ack(probe, seq))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.error("Cannot send %s heartbeat: %s", probe.name, e)
+        if not stalled:
+            return []
+        stacks = dump_stacks()
+        killed = (kill_hung_children(self.kill_after, self.children.pids(), self.proc_root)
+                  if self.kill_after > 0 else [])
+        return [Stall(name, lag, stacks, killed) for name, lag in stalled]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for stall in self.check():
+                logging.error("%s has not answered for %.0f s", stall.probe, stall.lag)
+                if self.on_stall is not None:
+                    try:
+                        self.on_stall(stall)
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        logging.error("Stall notification failed: %s", e)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="stall-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
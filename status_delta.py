@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Changes between two periodic status reports.
+
+A report snapshot is a handful of numbers and names taken from the last
+sampler measurement and the socket tables, so building one forks nothing.
+The next report is the difference against the snapshot of the last report
+that was actually sent: metrics that moved beyond their tolerance, processes
+that newly entered the top lists, listening ports that appeared or
+disappeared and disks that grew. Small drifts accumulate against that
+snapshot until they become significant, and nothing is sent when nothing
+changed.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from system_sampler import Sample
+
+# Absolute tolerances; load is scaled by the CPU count
+METRIC_TOLERANCE = {"load": 0.5, "cpu": 15.0, "mem": 5.0, "swap": 5.0}
+# Processes entering a top list below these levels are not worth a line
+TOP_MIN_CPU = 10.0
+TOP_MIN_RSS = 256 * 1024 * 1024
+TOP_SIZE = 5
+# Disk growth reported from this many bytes or percentage points up
+DISK_MIN_GROWTH = 1024 ** 3
+DISK_MIN_POINTS = 2.0
+
+
+@dataclass
+class StatusSnapshot:
+    """What a report showed."""
+    timestamp: float
+    cpu_count: int
+    metrics: Dict[str, float]
+    disks: Dict[str, Tuple[int, int]]
+    top_cpu: Dict[str, float]
+    top_mem: Dict[str, int]
+    ports: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class Change:
+    """One significant difference between two snapshots."""
+    kind: str  # metric, top_cpu, top_mem, port_opened, port_closed, disk
+    name: str
+    old: Optional[float] = None
+    new: Optional[float] = None
+    extra: float = 0.0
+
+
+def take_snapshot(sample: Sample, ports: List[str]) -> StatusSnapshot:
+    """
+    Build a report snapshot
+
+    Args:
+        sample (Sample): Latest sampler measurement
+        ports (List[str]): Listening ports as 'port/proto'
+
+    Returns:
+        StatusSnapshot: Snapshot of the values a report compares
+    """
+    swap_used = max(sample.swap_total - sample.swap_free, 0)
+    metrics = {
+        "load": sample.load[0],
+        "cpu": sample.cpu_percent,
+        "mem": sample.mem_percent,
+        "swap": swap_used * 100.0 / sample.swap_total if sample.swap_total else 0.0,
+    }
+    top_cpu: Dict[str, float] = {}
+    for proc in sample.top_cpu[:TOP_SIZE]:
+        if proc.cpu_percent >= TOP_MIN_CPU:
+            top_cpu[proc.name] = top_cpu.get(proc.name, 0.0) + proc.cpu_percent
+    top_mem: Dict[str, int] = {}
+    for proc in sample.top_mem[:TOP_SIZE]:
+        if proc.rss_bytes >= TOP_MIN_RSS:
+            top_mem[proc.name] = top_mem.get(proc.name, 0) + proc.rss_bytes
+    return StatusSnapshot(sample.timestamp, sample.cpu_count, metrics, dict(sample.disks),
+                          top_cpu, top_mem, set(ports))
+
+
+def diff(old: StatusSnapshot, new: StatusSnapshot) -> List[Change]:
+    """
+    Get the significant changes from one snapshot to the next
+
+    Args:
+        old (StatusSnapshot): Snapshot of the last sent report
+        new (StatusSnapshot): Current snapshot
+
+    Returns:
+        List[Change]: Changes in report order, empty if nothing significant moved
+    """
+    changes = []
+    for name, tolerance in METRIC_TOLERANCE.items():
+        if name == "load":
+            tolerance *= max(new.cpu_count, 1)
+        before, after = old.metrics.get(name, 0.0), new.metrics.get(name, 0.0)
+        if abs(after - before) >= tolerance:
+            changes.append(Change("metric", name, before, after))
+    for name, cpu in sorted(new.top_cpu.items(), key=lambda item: -item[1]):
+        if name not in old.top_cpu:
+            changes.append(Change("top_cpu", name, new=cpu))
+    for name, rss in sorted(new.top_mem.items(), key=lambda item: -item[1]):
+        if name not in old.top_mem:
+            changes.append(Change("top_mem", name, new=rss))
+    changes.extend(Change("port_opened", port) for port in sorted(new.ports - old.ports))
+    changes.extend(Change("port_closed", port) for port in sorted(old.ports - new.ports))
+    for mount, (total, used) in sorted(new.disks.items()):
+        _total, before = old.disks.get(mount, (total, used))
+        growth = used - before
+        points = growth * 100.0 / total if total else 0.0
+        if growth >= DISK_MIN_GROWTH or (growth > 0 and points >= DISK_MIN_POINTS):
+            changes.append(Change("disk", mount, before, used, used * 100.0 / total if total else 0.0))
+    return changes
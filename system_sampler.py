@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+Background sampler for host metrics.
+Reads procfs directly and keeps recent samples in an in-memory ring buffer,
+so views and exporters can render from already collected data without
+spawning subprocesses.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default procfs mount point
+PROC_ROOT = "/proc"
+# Seconds between two samples
+DEFAULT_INTERVAL = 10
+# Number of samples kept in memory (1 hour at the default interval)
+DEFAULT_BUFFER_SIZE = 360
+# Number of processes kept per top list
+DEFAULT_TOP_N = 10
+# Filesystem types reported as disks
+DISK_FS_TYPES = ("ext2", "ext3", "ext4", "xfs", "btrfs", "zfs", "f2fs", "vfat", "overlay")
+# Virtual block devices left out of the I/O stats
+VIRTUAL_DEVICES = ("loop", "ram", "zram", "fd", "sr")
+# Partitions, whose I/O is already counted on their disk
+_PARTITION_RE = re.compile(r"^(?:(?:[shv]|xv)d[a-z]+\d+|(?:nvme\d+n\d+|mmcblk\d+)p\d+)$")
+SECTOR_SIZE = 512
+# Loopback and bridge/veth interfaces, whose traffic is already counted on the uplink
+VIRTUAL_INTERFACES = ("lo", "veth", "docker", "br-", "virbr", "ifb", "cali", "flannel", "cni")
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+@dataclass
+class ProcessSample:
+    """Single process as seen by one scan."""
+    pid: int
+    name: str
+    state: str
+    cpu_percent: float
+    rss_bytes: int
+    cpu_ticks: int = 0
+    start_ticks: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    read_bps: float = 0.0
+    write_bps: float = 0.0
+
+    @property
+    def io_bps(self) -> float:
+        return self.read_bps + self.write_bps
+
+
+@dataclass
+class DiskIO:
+    """Throughput and latency of one block device between two samples."""
+    device: str
+    read_iops: float
+    write_iops: float
+    read_bps: float
+    write_bps: float
+    await_ms: float
+    util_percent: float
+
+
+@dataclass
+class NetIO:
+    """Traffic and errors of one network interface between two samples."""
+    interface: str
+    rx_bps: float
+    tx_bps: float
+    rx_pps: float
+    tx_pps: float
+    errors_per_sec: float
+    drops_per_sec: float
+
+
+@dataclass
+class Sample:
+    """Host metrics captured at one point in time."""
+    timestamp: float
+    load: Tuple[float, float, float]
+    cpu_percent: float
+    cpu_count: int
+    mem_total: int
+    mem_available: int
+    swap_total: int
+    swap_free: int
+    disks: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    processes_total: int = 0
+    top_cpu: List[ProcessSample] = field(default_factory=list)
+    top_mem: List[ProcessSample] = field(default_factory=list)
+    top_io: List[ProcessSample] = field(default_factory=list)
+    disk_io: Dict[str, DiskIO] = field(default_factory=dict)
+    net_io: Dict[str, NetIO] = field(default_factory=dict)
+    tcp_retrans_per_sec: float = 0.0
+    tcp_retrans_percent: float = 0.0
+
+    @property
+    def mem_used(self) -> int:
+        return max(self.mem_total - self.mem_available, 0)
+
+    @property
+    def mem_percent(self) -> float:
+        if not self.mem_total:
+            return 0.0
+        return self.mem_used * 100.0 / self.mem_total
+
+    def disk_percent(self, mount: str = "/") -> float:
+        """
+        Get usage of a mount point in percent
+
+        Args:
+            mount (str): Mount point
+
+        Returns:
+            float: Used space in percent, 0.0 if the mount is unknown
+        """
+        total, used = self.disks.get(mount, (0, 0))
+        if not total:
+            return 0.0
+        return used * 100.0 / total
+
+    @property
+    def io_util(self) -> float:
+        """Utilisation of the busiest block device in percent."""
+        return max((d.util_percent for d in self.disk_io.values()), default=0.0)
+
+    @property
+    def io_await(self) -> float:
+        """Longest average request latency among block devices in milliseconds."""
+        return max((d.await_ms for d in self.disk_io.values()), default=0.0)
+
+    @property
+    def net_rx_bps(self) -> float:
+        return sum(n.rx_bps for n in self.net_io.values())
+
+    @property
+    def net_tx_bps(self) -> float:
+        return sum(n.tx_bps for n in self.net_io.values())
+
+    @property
+    def net_faults_per_sec(self) -> float:
+        """Errors and drops per second over all interfaces."""
+        return sum(n.errors_per_sec + n.drops_per_sec for n in self.net_io.values())
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def read_loadavg(proc_root: str = PROC_ROOT) -> Tuple[float, float, float]:
+    """
+    Read load averages from procfs
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Tuple[float, float, float]: 1, 5 and 15 minute load averages
+    """
+    parts = _read_text(os.path.join(proc_root, "loadavg")).split()
+    try:
+        return float(parts[0]), float(parts[1]), float(parts[2])
+    except (IndexError, ValueError):
+        return 0.0, 0.0, 0.0
+
+
+def read_cpu_times(proc_root: str = PROC_ROOT) -> Tuple[int, int, int]:
+    """
+    Read aggregated CPU times from /proc/stat
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Tuple[int, int, int]: (busy ticks, total ticks, cpu count)
+    """
+    busy = total = cpu_count = 0
+    for line in _read_text(os.path.join(proc_root, "stat")).splitlines():
+        if line.startswith("cpu "):
+            values = [int(v) for v in line.split()[1:]]
+            total = sum(values[:8])
+            # idle + iowait are not busy time
+            busy = total - values[3] - (values[4] if len(values) > 4 else 0)
+        elif line.startswith("cpu"):
+            cpu_count += 1
+        elif cpu_count:
+            break
+    return busy, total, max(cpu_count, 1)
+
+
+def read_meminfo(proc_root: str = PROC_ROOT) -> Dict[str, int]:
+    """
+    Read /proc/meminfo
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Dict[str, int]: Field name to value in bytes
+    """
+    info = {}
+    for line in _read_text(os.path.join(proc_root, "meminfo")).splitlines():
+        key, _, rest = line.partition(":")
+        parts = rest.split()
+        if parts and parts[0].isdigit():
+            info[key] = int(parts[0]) * (1024 if len(parts) > 1 else 1)
+    return info
+
+
+def read_disk_usage(proc_root: str = PROC_ROOT) -> Dict[str, Tuple[int, int]]:
+    """
+    Get usage of locally mounted filesystems via statvfs
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Dict[str, Tuple[int, int]]: Mount point to (total bytes, used bytes)
+    """
+    disks = {}
+    for line in _read_text(os.path.join(proc_root, "mounts")).splitlines():
+        parts = line.split()
+        if len(parts) < 3 or parts[2] not in DISK_FS_TYPES or parts[1] in disks:
+            continue
+        mount = parts[1].replace("\\040", " ")
+        try:
+            st = os.statvfs(mount)
+        except OSError:
+            continue
+        total = st.f_blocks * st.f_frsize
+        used = total - st.f_bfree * st.f_frsize
+        if total:
+            disks[mount] = (total, used)
+    return disks
+
+
+def read_diskstats(proc_root: str = PROC_ROOT) -> Dict[str, Tuple[int, ...]]:
+    """
+    Read cumulative counters of whole block devices from /proc/diskstats
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Dict[str, Tuple[int, ...]]: Device to (reads, sectors read, ms reading,
+            writes, sectors written, ms writing, ms doing I/O)
+    """
+    stats = {}
+    for line in _read_text(os.path.join(proc_root, "diskstats")).splitlines():
+        parts = line.split()
+        if len(parts) < 14:
+            continue
+        name = parts[2]
+        if name.startswith(VIRTUAL_DEVICES) or _PARTITION_RE.match(name):
+            continue
+        try:
+            stats[name] = tuple(int(parts[i]) for i in (3, 5, 6, 7, 9, 10, 12))
+        except ValueError:
+            continue
+    return stats
+
+
+def disk_io_rates(before: Dict[str, Tuple[int, ...]], after: Dict[str, Tuple[int, ...]],
+                  elapsed: float) -> Dict[str, DiskIO]:
+    """
+    Compute per-device rates from two read_diskstats results
+
+    Args:
+        before (Dict[str, Tuple[int, ...]]): Earlier counters
+        after (Dict[str, Tuple[int, ...]]): Later counters
+        elapsed (float): Seconds between the two reads
+
+    Returns:
+        Dict[str, DiskIO]: Device to rates; devices missing from either read are omitted
+    """
+    rates = {}
+    if elapsed <= 0:
+        return rates
+    for name, now in after.items():
+        prev = before.get(name)
+        if prev is None:
+            continue
+        reads, read_sectors, read_ms, writes, write_sectors, write_ms, io_ms = (
+            max(a - b, 0) for a, b in zip(now, prev))
+        ios = reads + writes
+        rates[name] = DiskIO(
+            device=name,
+            read_iops=round(reads / elapsed, 1),
+            write_iops=round(writes / elapsed, 1),
+            read_bps=read_sectors * SECTOR_SIZE / elapsed,
+            write_bps=write_sectors * SECTOR_SIZE / elapsed,
+            await_ms=round((read_ms + write_ms) / ios, 2) if ios else 0.0,
+            util_percent=round(min(io_ms / (elapsed * 10.0), 100.0), 1),
+        )
+    return rates
+
+
+def read_net_dev(proc_root: str = PROC_ROOT) -> Dict[str, Tuple[int, ...]]:
+    """
+    Read cumulative interface counters from /proc/net/dev
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Dict[str, Tuple[int, ...]]: Interface to (rx bytes, rx packets, rx errors,
+            rx drops, tx bytes, tx packets, tx errors, tx drops)
+    """
+    stats = {}
+    for line in _read_text(os.path.join(proc_root, "net", "dev")).splitlines()[2:]:
+        name, sep, rest = line.partition(":")
+        name = name.strip()
+        parts = rest.split()
+        if not sep or len(parts) < 12 or name.startswith(VIRTUAL_INTERFACES):
+            continue
+        try:
+            stats[name] = tuple(int(parts[i]) for i in (0, 1, 2, 3, 8, 9, 10, 11))
+        except ValueError:
+            continue
+    return stats
+
+
+def net_io_rates(before: Dict[str, Tuple[int, ...]], after: Dict[str, Tuple[int, ...]],
+                 elapsed: float) -> Dict[str, NetIO]:
+    """
+    Compute per-interface rates from two read_net_dev results
+
+    Args:
+        before (Dict[str, Tuple[int, ...]]): Earlier counters
+        after (Dict[str, Tuple[int, ...]]): Later counters
+        elapsed (float): Seconds between the two reads
+
+    Returns:
+        Dict[str, NetIO]: Interface to rates; interfaces missing from either read are omitted
+    """
+    rates = {}
+    if elapsed <= 0:
+        return rates
+    for name, now in after.items():
+        prev = before.get(name)
+        if prev is None:
+            continue
+        rx_bytes, rx_packets, rx_errors, rx_drops, tx_bytes, tx_packets, tx_errors, tx_drops = (
+            max(a - b, 0) / elapsed for a, b in zip(now, prev))
+        rates[name] = NetIO(
+            interface=name,
+            rx_bps=rx_bytes,
+            tx_bps=tx_bytes,
+            rx_pps=round(rx_packets, 1),
+            tx_pps=round(tx_packets, 1),
+            errors_per_sec=round(rx_errors + tx_errors, 2),
+            drops_per_sec=round(rx_drops + tx_drops, 2),
+        )
+    return rates
+
+
+def read_tcp_segments(proc_root: str = PROC_ROOT) -> Optional[Tuple[int, int]]:
+    """
+    Read TCP segment counters from /proc/net/snmp
+
+    Args:
+        proc_root (str): procfs mount point
+
+    Returns:
+        Optional[Tuple[int, int]]: (OutSegs, RetransSegs), None if unavailable
+    """
+    tcp_lines = [line.split()[1:] for line in _read_text(os.path.join(proc_root, "net", "snmp")).splitlines()
+                 if line.startswith("Tcp:")]
+    if len(tcp_lines) < 2:
+        return None
+    values = dict(zip(tcp_lines[0], tcp_lines[1]))
+    try:
+        return int(values["OutSegs"]), int(values["RetransSegs"])
+    except (KeyError, ValueError):
+        return None
+
+
+def read_pid_io(proc_root: str, pid: str) -> Optional[Tuple[int, int]]:
+    """
+    Read storage I/O counters of a process
+
+    Args:
+        proc_root (str): procfs mount point
+        pid (str): Process ID
+
+    Returns:
+        Optional[Tuple[int, int]]: (read_bytes, write_bytes), None if unreadable
+    """
+    read_bytes = write_bytes = None
+    for line in _read_text(os.path.join(proc_root, pid, "io")).splitlines():
+        if line.startswith("read_bytes:"):
+            read_bytes = int(line.split()[1])
+        elif line.startswith("write_bytes:"):
+            write_bytes = int(line.split()[1])
+    if read_bytes is None or write_bytes is None:
+        return None
+    return read_bytes, write_bytes
+
+
+def parse_pid_stat(data: str) -> Optional[Tuple[str, str, int, int, int]]:
+    """
+    Parse the contents of /proc/[pid]/stat
+
+    Args:
+        data (str): File contents
+
+    Returns:
+        Optional[Tuple[str, str, int, int, int]]: (name, state, cpu ticks,
+            start ticks, rss pages) or None if the line is malformed
+    """
+    # The command name may contain spaces and parentheses
+    lpar = data.find("(")
+    rpar = data.rfind(")")
+    if lpar < 0 or rpar < 0:
+        return None
+    fields = data[rpar + 2:].split()
+    if len(fields) < 22:
+        return None
+    try:
+        return (
+            data[lpar + 1:rpar],
+            fields[0],
+            int(fields[11]) + int(fields[12]),
+            int(fields[19]),
+            int(fields[21]),
+        )
+    except ValueError:
+        return None
+
+
+class ProcessScanner:
+    """
+    Walks /proc/[pid] and computes per-process CPU and I/O rates from deltas.
+
+    /proc/[pid]/io is read in the same walk, but only for processes whose
+    CPU time moved since the previous scan: a process that did not run
+    issued no I/O, and anything it did between two reads is counted at the
+    next read.
+    """
+
+    def __init__(self, proc_root: str = PROC_ROOT, read_io: bool = True):
+        self.proc_root = proc_root
+        self.read_io = read_io
+        # pid -> (start ticks, cpu ticks, read bytes, write bytes)
+        self._prev: Dict[int, Tuple[int, int, int, int]] = {}
+        self._prev_time: Optional[float] = None
+
+    def scan(self, now: Optional[float] = None) -> List[ProcessSample]:
+        """
+        Scan all processes once
+
+        Args:
+            now (float, optional): Monotonic timestamp of the scan
+
+        Returns:
+            List[ProcessSample]: Every process alive during the scan
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = (now - self._prev_time) if self._prev_time is not None else 0.0
+        prev = self._prev
+        current: Dict[int, Tuple[int, int, int, int]] = {}
+        processes = []
+        try:
+            entries = os.listdir(self.proc_root)
+        except OSError as e:
+            logging.error("Cannot list %s: %s", self.proc_root, e)
+            return processes
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            parsed = parse_pid_stat(_read_text(os.path.join(self.proc_root, entry, "stat")))
+            if parsed is None:
+                continue
+            pid = int(entry)
+            name, state, ticks, start, rss_pages = parsed
+            cpu_percent = read_bps = write_bps = 0.0
+            before = prev.get(pid)
+            # A reused PID has a different start time and gets no delta
+            if before is not None and before[0] != start:
+                before = None
+            read_bytes, write_bytes = (before[2], before[3]) if before is not None else (0, 0)
+            if self.read_io and (before is None or ticks != before[1]):
+                io = read_pid_io(self.proc_root, entry)
+                if io is not None:
+                    read_bytes, write_bytes = io
+            if elapsed > 0 and before is not None:
+                cpu_percent = (ticks - before[1]) * 100.0 / (CLOCK_TICKS * elapsed)
+                read_bps = max(read_bytes - before[2], 0) / elapsed
+                write_bps = max(write_bytes - before[3], 0) / elapsed
+            current[pid] = (start, ticks, read_bytes, write_bytes)
+            processes.append(ProcessSample(
+                pid=pid,
+                name=name,
+                state=state,
+                cpu_percent=round(max(cpu_percent, 0.0), 1),
+                rss_bytes=rss_pages * PAGE_SIZE,
+                cpu_ticks=ticks,
+                start_ticks=start,
+                read_bytes=read_bytes,
+                write_bytes=write_bytes,
+                read_bps=read_bps,
+                write_bps=write_bps,
+            ))
+        self._prev = current
+        self._prev_time = now
+        return processes
+
+
+class SampleBuffer:
+    """Thread-safe ring buffer of the most recent samples."""
+
+    def __init__(self, size: int = DEFAULT_BUFFER_SIZE):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, sample: Sample):
+        with self._lock:
+            self._samples.append(sample)
+
+    def latest(self) -> Optional[Sample]:
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def snapshot(self) -> List[Sample]:
+        with self._lock:
+            return list(self._samples)
+
+    def since(self, timestamp: float) -> List[Sample]:
+        """
+        Get samples taken at or after a timestamp
+
+        Args:
+            timestamp (float): Unix timestamp
+
+        Returns:
+            List[Sample]: Matching samples, oldest first
+        """
+        with self._lock:
+            return [s for s in self._samples if s.timestamp >= timestamp]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class Sampler:
+    """
+    Periodically samples the host into a SampleBuffer.
+
+    Listeners registered with add_listener are called from the sampler thread
+    with the new sample and the full process list of the scan.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 top_n: int = DEFAULT_TOP_N, proc_root: str = PROC_ROOT):
+        self.interval = interval
+        self.top_n = top_n
+        self.proc_root = proc_root
+        self.buffer = SampleBuffer(buffer_size)
+        self.scanner = ProcessScanner(proc_root)
+        self._listeners: List[Callable[[Sample, List[ProcessSample]], None]] = []
+        self._prev_cpu: Optional[Tuple[int, int]] = None
+        self._prev_disk: Optional[Tuple[float, Dict[str, Tuple[int, ...]]]] = None
+        self._prev_net: Optional[Tuple[float, Dict[str, Tuple[int, ...]], Optional[Tuple[int, int]]]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, callback: Callable[[Sample, List[ProcessSample]], None]):
+        self._listeners.append(callback)
+
+    def sample_once(self, now: Optional[float] = None) -> Sample:
+        """
+        Take one sample, store it and notify listeners
+
+        Args:
+            now (float, optional): Unix time of a replayed sample, used for both
+                the rates and the timestamp
+
+        Returns:
+            Sample: The new sample
+        """
+        busy, total, cpu_count = read_cpu_times(self.proc_root)
+        cpu_percent = 0.0
+        if self._prev_cpu is not None and total > self._prev_cpu[1]:
+            cpu_percent = (busy - self._prev_cpu[0]) * 100.0 / (total - self._prev_cpu[1])
+        self._prev_cpu = (busy, total)
+
+        timestamp = time.time() if now is None else now
+        now = time.monotonic() if now is None else now
+        diskstats = read_diskstats(self.proc_root)
+        disk_io = disk_io_rates(self._prev_disk[1], diskstats, now - self._prev_disk[0]) if self._prev_disk else {}
+        self._prev_disk = (now, diskstats)
+        net_dev = read_net_dev(self.proc_root)
+        tcp = read_tcp_segments(self.proc_root)
+        net_io, retrans_per_sec, retrans_percent = {}, 0.0, 0.0
+        if self._prev_net is not None:
+            elapsed = now - self._prev_net[0]
+            net_io = net_io_rates(self._prev_net[1], net_dev, elapsed)
+            prev_tcp = self._prev_net[2]
+            if tcp is not None and prev_tcp is not None and elapsed > 0:
+                out_segs, retrans = tcp[0] - prev_tcp[0], max(tcp[1] - prev_tcp[1], 0)
+                retrans_per_sec = round(retrans / elapsed, 2)
+                retrans_percent = round(retrans * 100.0 / out_segs, 2) if out_segs > 0 else 0.0
+        self._prev_net = (now, net_dev, tcp)
+
+        meminfo = read_meminfo(self.proc_root)
+        processes = self.scanner.scan(now)
+        sample = Sample(
+            timestamp=timestamp,
+            load=read_loadavg(self.proc_root),
+            cpu_percent=round(cpu_percent, 1),
+            cpu_count=cpu_count,
+            mem_total=meminfo.get("MemTotal", 0),
+            mem_available=meminfo.get("MemAvailable", meminfo.get("MemFree", 0)),
+            swap_total=meminfo.get("SwapTotal", 0),
+            swap_free=meminfo.get("SwapFree", 0),
+            disks=read_disk_usage(self.proc_root),
+            processes_total=len(processes),
+            top_cpu=sorted(processes, key=lambda p: p.cpu_percent, reverse=True)[:self.top_n],
+            top_mem=sorted(processes, key=lambda p: p.rss_bytes, reverse=True)[:self.top_n],
+            top_io=sorted((p for p in processes if p.io_bps > 0), key=lambda p: p.io_bps, reverse=True)[:self.top_n],
+            disk_io=disk_io,
+            net_io=net_io,
+            tcp_retrans_per_sec=retrans_per_sec,
+            tcp_retrans_percent=retrans_percent,
+        )
+        self.buffer.append(sample)
+
+        for listener in self._listeners:
+            try:
+                listener(sample, processes)
+            except Exception as e:
+                logging.error("Sample listener %s failed: %s", getattr(listener, "__name__", listener), e)
+        return sample
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+        logging.info("Sampler started, interval %s s", self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.sample_once()
+            except Exception as e:
+                logging.error("Sampling failed: %s", e)
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0.1))
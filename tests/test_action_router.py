@@ -0,0 +1,91 @@
+"""Resolution, debouncing and admission of bot actions."""
+import threading
+import unittest
+from unittest import mock
+
+import action_router
+from action_router import ACCEPTED, BUSY, DEBOUNCED, EXCLUSIVE, SLOW, UNKNOWN, ActionRouter
+
+
+class ActionRouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = ActionRouter(workers=2)
+        self.calls = []
+
+    def tearDown(self):
+        self.router.shutdown()
+
+    def record(self, *args):
+        self.calls.append(args)
+
+    def test_resolve(self):
+        self.router.action("menu")(self.record)
+        self.router.action("load_history", parametrized=True)(self.record)
+        spec, arg = self.router.resolve("menu")
+        self.assertEqual((spec.name, arg), ("menu", ""))
+        spec, arg = self.router.resolve("load_history_3600")
+        self.assertEqual((spec.name, arg), ("load_history", "3600"))
+        self.assertEqual(self.router.resolve("load_history"), (None, ""))
+        self.assertEqual(self.router.resolve("nothing_here"), (None, ""))
+        with self.assertRaises(ValueError):
+            self.router.action("bad", cost="instant")
+
+    def test_fast_action_runs_inline(self):
+        self.router.action("service", parametrized=True)(self.record)
+        status, spec = self.router.dispatch("service_nginx", 1, "update")
+        self.assertEqual((status, spec.name), (ACCEPTED, "service"))
+        self.assertEqual(self.calls, [("update", "nginx")])
+        self.assertEqual(self.router.dispatch("other", 1), (UNKNOWN, None))
+
+    def test_debounce_per_user_and_data(self):
+        self.router.action("status", debounce=2.0)(self.record)
+        now = [100.0]
+        with mock.patch.object(action_router.time, "monotonic", lambda: now[0]):
+            self.assertEqual(self.router.dispatch("status", 1)[0], ACCEPTED)
+            now[0] = 101.0
+            self.assertEqual(self.router.dispatch("status", 1)[0], DEBOUNCED)
+            self.assertEqual(self.router.dispatch("status", 2)[0], ACCEPTED)
+            now[0] = 102.5
+            self.assertEqual(self.router.dispatch("status", 1)[0], ACCEPTED)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_exclusive_and_concurrency_limits(self):
+        release = threading.Event()
+        finished = threading.Event()
+
+        def block(*_args):
+            release.wait(5)
+            finished.set()
+
+        self.router.action("optimize", cost=EXCLUSIVE)(block)
+        self.router.action("cleanup", cost=EXCLUSIVE)(self.record)
+        self.router.action("scan", cost=SLOW, max_concurrency=1)(block)
+        self.assertEqual(self.router.dispatch("optimize", 1)[0], ACCEPTED)
+        self.assertEqual(self.router.dispatch("cleanup", 1)[0], BUSY)
+        self.assertEqual(self.router.dispatch("scan", 1)[0], ACCEPTED)
+        self.assertEqual(self.router.dispatch("scan", 2)[0], BUSY)
+        self.assertEqual(self.router.running(), {"optimize": 1, "scan": 1})
+        release.set()
+        self.router.shutdown()
+        self.assertTrue(finished.is_set())
+        self.assertEqual(self.router.running(), {})
+
+    def test_failure_is_reported_and_released(self):
+        errors, observed = [], []
+        router = ActionRouter(workers=1, on_error=lambda spec, e, args: errors.append((spec.name, str(e))),
+                              observe=lambda name, _elapsed, failed: observed.append((name, failed)))
+
+        @router.action("boom", max_concurrency=1)
+        def boom(_arg):
+            raise RuntimeError("broken")
+
+        self.assertEqual(router.dispatch("boom", 1)[0], ACCEPTED)
+        self.assertEqual(router.dispatch("boom", 1)[0], ACCEPTED)
+        router.shutdown()
+        self.assertEqual(errors, [("boom", "broken")] * 2)
+        self.assertEqual(observed, [("boom", True)] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""EWMA baselines and streak logic of the anomaly detector."""
+import os
+import tempfile
+import unittest
+
+from anomaly_detector import MIN_HOUR_SAMPLES, MIN_SAMPLES, AnomalyDetector, Baseline
+
+
+class BaselineTest(unittest.TestCase):
+
+    def test_plain_average_then_ewma(self):
+        baseline = Baseline()
+        for value in (2.0, 4.0, 6.0):
+            baseline.update(value, 0.1)
+        self.assertAlmostEqual(baseline.mean, 4.0)
+        self.assertAlmostEqual(baseline.var, 8.0 / 3)
+        # count is now above 1/alpha: every value moves the mean by a tenth
+        for _ in range(20):
+            baseline.update(4.0, 0.1)
+        baseline.update(14.0, 0.1)
+        self.assertAlmostEqual(baseline.mean, 5.0)
+
+    def test_round_trip(self):
+        baseline = Baseline(1.5, 0.25, 7)
+        self.assertEqual(Baseline(*baseline.to_list()).to_list(), [1.5, 0.25, 7])
+        self.assertEqual(baseline.std, 0.5)
+
+
+class AnomalyDetectorTest(unittest.TestCase):
+
+    def warm(self, detector, start=0.0):
+        t = start
+        for i in range(MIN_SAMPLES):
+            detector.observe(t, {"load": 1.0 + (i % 2) * 0.2})
+            t += 10
+        return t
+
+    def test_learning_period_is_silent(self):
+        detector = AnomalyDetector(metrics=("load",), state_file=None)
+        for i in range(MIN_HOUR_SAMPLES - 1):
+            self.assertEqual(detector.observe(i * 10.0, {"load": 100.0 if i % 50 == 0 else 1.0}), [])
+        self.assertEqual({b["load"] for b in map(detector.baselines, range(24))}, {None})
+
+    def test_alert_after_consecutive_samples(self):
+        detector = AnomalyDetector(metrics=("load",), state_file=None, cooldown=600)
+        t = self.warm(detector)
+        self.assertEqual(detector.observe(t, {"load": 20.0}), [])
+        self.assertEqual(detector.observe(t + 10, {"load": 20.0}), [])
+        # A normal sample breaks the run
+        self.assertEqual(detector.observe(t + 20, {"load": 1.1}), [])
+        found = []
+        for step in range(3, 6):
+            found += detector.observe(t + step * 10, {"load": 20.0})
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].metric, "load")
+        self.assertGreaterEqual(found[0].z, detector.threshold)
+        self.assertEqual(detector.drain(), found)
+        self.assertEqual(detector.drain(), [])
+        # Cooldown holds further alerts of the same metric
+        self.assertEqual(detector.observe(t + 60, {"load": 20.0}), [])
+        self.assertEqual(len(detector.observe(t + 60 + 600, {"load": 20.0})), 1)
+
+    def test_incident_is_clipped_in_baseline(self):
+        detector = AnomalyDetector(metrics=("load",), state_file=None)
+        t = self.warm(detector)
+        for step in range(100):
+            detector.observe(t + step * 10, {"load": 1000.0})
+        baseline = detector._states["load"].day  # pylint: disable=protected-access
+        self.assertLess(baseline.mean, 10.0)
+
+    def test_state_is_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.json")
+            detector = AnomalyDetector(metrics=("load",), state_file=path)
+            self.warm(detector)
+            detector.save()
+            restored = AnomalyDetector(metrics=("load",), state_file=path)
+            for hour in range(24):
+                before, after = detector.baselines(hour)["load"], restored.baselines(hour)["load"]
+                self.assertEqual(before is None, after is None)
+                if before is not None:
+                    self.assertAlmostEqual(before.mean, after.mean, places=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+"""Largest-Triangle-Three-Buckets downsampling."""
+import unittest
+
+from chart import lttb
+
+
+class LttbTest(unittest.TestCase):
+
+    def test_short_series_passes_through(self):
+        xs, ys = [0, 1, 2], [5, 6, 7]
+        self.assertEqual(lttb(xs, ys, 10), ([0, 1, 2], [5, 6, 7]))
+        self.assertEqual(lttb(xs, ys, 2), ([0, 1, 2], [5, 6, 7]))
+
+    def test_length_and_endpoints(self):
+        xs = list(range(1000))
+        ys = [x % 7 for x in xs]
+        out_x, out_y = lttb(xs, ys, 50)
+        self.assertEqual(len(out_x), 50)
+        self.assertEqual(len(out_y), 50)
+        self.assertEqual((out_x[0], out_y[0]), (0, 0))
+        self.assertEqual((out_x[-1], out_y[-1]), (999, 999 % 7))
+        self.assertEqual(out_x, sorted(out_x))
+
+    def test_spike_is_kept(self):
+        xs = list(range(500))
+        ys = [1.0] * 500
+        ys[123] = 100.0
+        ys[321] = -50.0
+        out_x, out_y = lttb(xs, ys, 20)
+        self.assertIn((123, 100.0), list(zip(out_x, out_y)))
+        self.assertIn((321, -50.0), list(zip(out_x, out_y)))
+
+
+if __name__ == "__main__":
+    unittest.main()
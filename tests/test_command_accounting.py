@@ -0,0 +1,63 @@
+"""Space-Saving top-k counters."""
+import random
+import unittest
+from collections import Counter
+
+from command_accounting import SpaceSaving
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def test_exact_below_capacity(self):
+        sketch = SpaceSaving(4)
+        for key, value in (("a", 1), ("b", 2), ("a", 3), ("c", 0), ("c", -1)):
+            sketch.add(key, value)
+        self.assertEqual(sketch.top(10), [("a", 4, 0.0), ("b", 2, 0.0)])
+
+    def test_eviction_records_error(self):
+        sketch = SpaceSaving(2)
+        sketch.add("a", 5)
+        sketch.add("b", 1)
+        sketch.add("c", 2)
+        self.assertEqual(sketch.top(2), [("a", 5, 0.0), ("c", 3, 1.0)])
+
+    def test_heavy_hitters_survive(self):
+        rng = random.Random(7)
+        exact = Counter()
+        sketch = SpaceSaving(16)
+        stream = [("heavy%d" % (i % 3), 50.0) for i in range(300)]
+        stream += [("noise%d" % rng.randrange(500), 1.0) for _ in range(3000)]
+        rng.shuffle(stream)
+        for key, value in stream:
+            exact[key] += value
+            sketch.add(key, value)
+        top = sketch.top(3)
+        self.assertEqual({key for key, _count, _error in top}, {"heavy0", "heavy1", "heavy2"})
+        for key, count, error in top:
+            # Counts are upper bounds, off by at most the recorded error
+            self.assertGreaterEqual(count, exact[key])
+            self.assertLessEqual(count - error, exact[key])
+
+    def test_max_mode(self):
+        sketch = SpaceSaving(2, mode="max")
+        sketch.add("a", 10)
+        sketch.add("a", 4)
+        sketch.add("b", 3)
+        sketch.add("c", 2)
+        self.assertEqual([row[:2] for row in sketch.top(2)], [("a", 10), ("b", 3)])
+        sketch.add("c", 7)
+        self.assertEqual([row[:2] for row in sketch.top(2)], [("a", 10), ("c", 7)])
+
+    def test_merge_and_round_trip(self):
+        first, second = SpaceSaving(4), SpaceSaving(4)
+        first.add("a", 1.5)
+        second.add("a", 2.0)
+        second.add("b", 1.0)
+        first.merge(second)
+        self.assertEqual(first.top(2), [("a", 3.5, 0.0), ("b", 1.0, 0.0)])
+        restored = SpaceSaving.from_dict(first.to_dict(), 1, "sum")
+        self.assertEqual(restored.top(5), [("a", 3.5, 0.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Container statistics against a fake cgroup v2 tree."""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from container_stats import ContainerCollector, MemoryPolicy, evaluate_policies, format_top
+
+WEB_ID = "a" * 64
+DB_ID = "b" * 64
+MiB = 1024 * 1024
+
+
+class FakeHost:
+    """cgroup and docker roots in a temporary directory."""
+
+    def __init__(self):
+        self.base = tempfile.mkdtemp(prefix="fake-cgroup-")
+        self.cgroup_root = os.path.join(self.base, "cgroup")
+        self.docker_root = os.path.join(self.base, "docker")
+
+    def add_container(self, container_id: str, name: str, scope: str = "system.slice", prefix: str = "docker-"):
+        path = os.path.join(self.cgroup_root, scope, f"{prefix}{container_id}.scope")
+        os.makedirs(path)
+        meta = os.path.join(self.docker_root, "containers", container_id)
+        os.makedirs(meta)
+        with open(os.path.join(meta, "config.v2.json"), "w") as f:
+            json.dump({"Name": f"/{name}"}, f)
+        return path
+
+    @staticmethod
+    def write(cgroup: str, cpu_usec: int, mem: int, limit: str = "max", rbytes: int = 0, wbytes: int = 0):
+        files = {
+            "cpu.stat": f"usage_usec {cpu_usec}\nuser_usec {cpu_usec}\nsystem_usec 0\n",
+            "memory.current": f"{mem}\n",
+            "memory.max": f"{limit}\n",
+            "memory.stat": f"anon {mem // 2}\nfile {mem // 2}\n",
+            "io.stat": f"8:0 rbytes={rbytes} wbytes={wbytes} rios=1 wios=1\n",
+        }
+        for name, text in files.items():
+            with open(os.path.join(cgroup, name), "w") as f:
+                f.write(text)
+
+    def remove(self):
+        shutil.rmtree(self.base, ignore_errors=True)
+
+
+class ContainerCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.host = FakeHost()
+        self.web = self.host.add_container(WEB_ID, "web")
+        self.db = self.host.add_container(DB_ID, "db", scope="machine.slice", prefix="libpod-")
+        self.collector = ContainerCollector(self.host.cgroup_root, self.host.docker_root)
+
+    def tearDown(self):
+        self.host.remove()
+
+    def test_discovery_and_names(self):
+        found = self.collector.discover()
+        self.assertEqual(found, {WEB_ID: self.web, DB_ID: self.db})
+        self.assertEqual(self.collector.container_name(WEB_ID), "web")
+        # Without metadata the short id is shown
+        self.assertEqual(ContainerCollector(self.host.cgroup_root, self.host.base).container_name(DB_ID),
+                         DB_ID[:12])
+
+    def test_rates_between_collections(self):
+        self.host.write(self.web, cpu_usec=1_000_000, mem=100 * MiB, rbytes=0, wbytes=0)
+        self.host.write(self.db, cpu_usec=0, mem=50 * MiB, limit=str(64 * MiB))
+        first = {s.name: s for s in self.collector.collect(now=100.0)}
+        self.assertEqual(first["web"].cpu_percent, 0.0)
+        self.assertIsNone(first["web"].mem_limit)
+        self.assertEqual(first["db"].mem_limit, 64 * MiB)
+
+        # 5 CPU seconds and 10 MiB read over 10 seconds
+        self.host.write(self.web, cpu_usec=6_000_000, mem=100 * MiB, rbytes=10 * MiB, wbytes=MiB)
+        second = {s.name: s for s in self.collector.collect(now=110.0)}
+        self.assertAlmostEqual(second["web"].cpu_percent, 50.0)
+        self.assertAlmostEqual(second["web"].io_read_rate, MiB)
+        self.assertAlmostEqual(second["web"].io_write_rate, MiB / 10)
+        self.assertEqual(format_top(list(second.values()))[1].split()[-1], "web")
+
+    def test_removed_container_is_dropped(self):
+        self.host.write(self.web, cpu_usec=0, mem=MiB)
+        self.host.write(self.db, cpu_usec=0, mem=MiB)
+        self.collector.collect(now=100.0)
+        shutil.rmtree(self.db)
+        names = [s.name for s in self.collector.collect(now=110.0)]
+        self.assertEqual(names, ["web"])
+
+    def test_memory_policy(self):
+        self.host.write(self.web, cpu_usec=0, mem=300 * MiB)
+        self.host.write(self.db, cpu_usec=0, mem=300 * MiB, limit=str(256 * MiB))
+        samples = self.collector.collect(now=100.0)
+        policies = [MemoryPolicy.parse("web:20%:256m:384m"), MemoryPolicy.parse("db:100M:256m:384m")]
+        actions = evaluate_policies(samples, policies, mem_total=1024 * MiB)
+        # db is already limited to the policy's memory
+        self.assertEqual([(s.name, p.memory) for s, p in actions], [("web", "256m")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Incremental disk index: reuse of unchanged directories and the relisting age."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from disk_index import DiskIndex
+
+
+class DiskIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.dir, "root")
+        self.cache = os.path.join(self.dir, "cache.json")
+        for sub in ("app/logs", "db", "empty"):
+            os.makedirs(os.path.join(self.root, sub))
+        self.write("app/logs/app.log", 1000)
+        self.write("app/logs/app.log.1", 500)
+        self.write("db/data.db", 4000)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, name: str, size: int):
+        with open(os.path.join(self.root, name), "ab") as f:
+            f.write(b"x" * size)
+
+    def index(self, **kwargs) -> DiskIndex:
+        return DiskIndex([self.root], cache_file=self.cache, workers=2, **kwargs).scan()
+
+    def test_first_scan(self):
+        index = self.index()
+        self.assertEqual(index.stats, {"listed": 5, "reused": 0})
+        self.assertEqual(index.large_files(0), [(os.path.join(self.root, "app/logs/app.log"), 1000)])
+        self.assertEqual(index.top_consumers(2), [(os.path.join(self.root, "db"), 4000),
+                                                  (os.path.join(self.root, "app"), 1500)])
+
+    def test_unchanged_directories_are_reused(self):
+        self.index()
+        self.write("app/logs/app.log", 2000)
+        index = self.index()
+        self.assertEqual(index.stats, {"listed": 0, "reused": 5})
+        # A tracked file is re-stat'ed even though its directory did not change
+        self.assertEqual(index.large_files(0), [(os.path.join(self.root, "app/logs/app.log"), 3000)])
+        self.assertEqual(dict(index.top_consumers(2))[os.path.join(self.root, "app")], 3500)
+
+    def test_new_file_relists_its_directory(self):
+        self.index()
+        self.write("empty/new.log", 10)
+        index = self.index()
+        self.assertEqual(index.stats, {"listed": 1, "reused": 4})
+        self.assertIn((os.path.join(self.root, "empty/new.log"), 10), index.large_files(0))
+
+    def test_untracked_growth_caught_up_after_max_age(self):
+        self.index()
+        self.write("db/data.db", 6000)
+        stale = self.index()
+        self.assertEqual(dict(stale.top_consumers(2))[os.path.join(self.root, "db")], 4000)
+        fresh = self.index(max_age=0)
+        self.assertEqual(fresh.stats["reused"], 0)
+        self.assertEqual(dict(fresh.top_consumers(2))[os.path.join(self.root, "db")], 10000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Fleet server with several agents on localhost."""
+import time
+import socket
+import threading
+import unittest
+
+from fleet import FleetAgent, FleetServer, encode_frame
+
+INTERVAL = 0.2
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class FleetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FleetServer(port=0, token="secret")
+        self.server.start()
+        self.agents = []
+
+    def tearDown(self):
+        for agent in self.agents:
+            agent.stop()
+        self.server.stop()
+
+    def start_agent(self, host: str, token: str = "secret") -> FleetAgent:
+        agent = FleetAgent(self.server.address, host=host, token=token, interval=INTERVAL)
+        self.agents.append(agent)
+        threading.Thread(target=agent.run, daemon=True).start()
+        return agent
+
+    def connected(self, *hosts: str) -> bool:
+        states = self.server.hosts
+        return all(h in states and states[h].connected and states[h].latest() for h in hosts)
+
+    def test_query_all_agents(self):
+        hosts = ["web-1", "web-2", "db-1"]
+        for host in hosts:
+            self.start_agent(host)
+        self.assertTrue(wait_for(lambda: self.connected(*hosts)))
+
+        result = self.server.query_all(timeout=2.0)
+        self.assertEqual(set(result), set(hosts))
+        for host in hosts:
+            self.assertEqual(result[host]["status"], "ok")
+            self.assertEqual(result[host]["snapshot"]["host"], host)
+
+    def test_stopped_agent_goes_offline(self):
+        self.start_agent("web-1")
+        gone = self.start_agent("web-2")
+        self.assertTrue(wait_for(lambda: self.connected("web-1", "web-2")))
+        gone.stop()
+        self.assertTrue(wait_for(lambda: not self.server.hosts["web-2"].connected))
+
+        result = self.server.query_all(timeout=1.0)
+        self.assertEqual(result["web-1"]["status"], "ok")
+        self.assertEqual(result["web-2"]["status"], "offline")
+        self.assertIsNotNone(result["web-2"]["snapshot"])
+
+    def test_wrong_token_rejected(self):
+        self.start_agent("web-1")
+        self.start_agent("intruder", token="guess")
+        self.assertTrue(wait_for(lambda: self.connected("web-1")))
+        time.sleep(INTERVAL * 3)
+        self.assertNotIn("intruder", self.server.hosts)
+
+    def test_agent_reconnects_after_connection_loss(self):
+        self.start_agent("web-1")
+        self.assertTrue(wait_for(lambda: self.connected("web-1")))
+        state = self.server.hosts["web-1"]
+        old_sock = state._sock  # pylint: disable=protected-access
+        old_sock.shutdown(socket.SHUT_RDWR)
+        # pylint: disable-next=protected-access
+        self.assertTrue(wait_for(lambda: state.connected and state._sock is not old_sock))
+
+    def test_agent_that_stopped_reading_does_not_delay_queries(self):
+        self.start_agent("web-1")
+        stuck = socket.socket()
+        stuck.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stuck.connect(self.server.address)
+        stuck.sendall(encode_frame({"type": "hello", "host": "stuck", "token": "secret", "interval": INTERVAL}))
+        try:
+            self.assertTrue(wait_for(lambda: self.connected("web-1") and "stuck" in self.server.hosts
+                                     and self.server.hosts["stuck"].connected))
+            state = self.server.hosts["stuck"]
+            state._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)  # pylint: disable=protected-access
+            # Queries nobody reads fill the buffers until a send runs into its deadline
+            for query_id in range(100000):
+                started = time.monotonic()
+                if state.send_query(query_id, started + 0.2) is None:
+                    break
+            self.assertLess(time.monotonic() - started, 1.0)
+
+            started = time.monotonic()
+            result = self.server.query_all(timeout=1.0)
+            self.assertLess(time.monotonic() - started, 2.0)
+            self.assertEqual(result["web-1"]["status"], "ok")
+            self.assertNotEqual(result["stuck"]["status"], "ok")
+        finally:
+            stuck.close()
+
+    def test_bad_hello_interval_rejected(self):
+        sock = socket.create_connection(self.server.address)
+        try:
+            sock.sendall(encode_frame({"type": "hello", "host": "odd", "token": "secret", "interval": "often"}))
+            sock.settimeout(5)
+            # The handshake is rejected and the connection closed
+            self.assertEqual(sock.recv(1), b"")
+            self.assertNotIn("odd", self.server.hosts)
+        finally:
+            sock.close()
+
+    def test_failed_push_drops_connection(self):
+        agent = FleetAgent(("127.0.0.1", 1), host="web-1", interval=INTERVAL)
+        local, remote = socket.socketpair()
+        remote.close()
+        agent._sock = local  # pylint: disable=protected-access
+        agent._send({"type": "snapshot", "snapshot": {}})  # pylint: disable=protected-access
+        # The reader of a dropped connection sees end of stream and reconnects
+        self.assertEqual(local.recv(1), b"")
+        local.close()
+
+
+class FleetBindTest(unittest.TestCase):
+
+    def test_remote_bind_requires_token(self):
+        with self.assertRaises(ValueError):
+            FleetServer(port=0, bind="0.0.0.0").start()
+
+    def test_loopback_without_token(self):
+        server = FleetServer(port=0)
+        server.start()
+        try:
+            self.assertEqual(server.address[0], "127.0.0.1")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""Edit scheduling of live views."""
+import unittest
+
+from live_view import LiveViews
+
+
+class LiveViewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.views = LiveViews(interval=5, duration=60, max_views=2, min_edit_interval=5, edits_per_second=1)
+        self.text = "a"
+
+    def render(self, _language, _user_id):
+        return self.text
+
+    def test_unchanged_text_is_not_edited(self):
+        session = self.views.start(1, 10, 100, "ru", text="a", now=0)
+        self.assertEqual(self.views.tick(self.render, now=10), ([], []))
+        self.text = "b"
+        edits, _expired = self.views.tick(self.render, now=20)
+        self.assertEqual(edits, [(session, "b")])
+
+    def test_failed_edit_is_retried(self):
+        session = self.views.start(1, 10, 100, "ru", text="a", now=0)
+        self.text = "b"
+        self.assertEqual(self.views.tick(self.render, now=10)[0], [(session, "b")])
+        # Not confirmed: the next tick tries again once the interval has passed
+        self.assertEqual(self.views.tick(self.render, now=12)[0], [])
+        self.assertEqual(self.views.tick(self.render, now=15)[0], [(session, "b")])
+        self.views.confirm(session, "b")
+        self.assertEqual(self.views.tick(self.render, now=20)[0], [])
+
+    def test_budget_and_pause(self):
+        first = self.views.start(1, 10, 100, "ru", now=0)
+        second = self.views.start(2, 20, 200, "ru", now=1)
+        self.assertIsNone(self.views.start(3, 30, 300, "ru", now=1))
+        # Budget of one edit per tick; the longest waiting view goes first
+        self.views.edits_per_second = 0.1
+        self.assertEqual(self.views.tick(self.render, now=10)[0], [(first, "a")])
+        self.views.confirm(first, "a")
+        self.views.pause(30, now=11)
+        self.assertEqual(self.views.tick(self.render, now=20)[0], [])
+        self.assertEqual(self.views.tick(self.render, now=45)[0], [(second, "a")])
+
+    def test_expired_views_are_removed(self):
+        session = self.views.start(1, 10, 100, "ru", text="a", now=0)
+        self.assertEqual(self.views.tick(self.render, now=60), ([], [session]))
+        self.assertEqual(len(self.views), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Log rotation: archive contents, failures, name clashes and retention."""
+import os
+import gzip
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import log_rotation
+from log_rotation import enforce_retention, rotate_file
+
+
+class RotateFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "app.log")
+        self.data = b"".join(b"line %d\n" % i for i in range(20000))
+        with open(self.log, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_gzip_archive_and_truncate(self):
+        result = rotate_file(self.log, "gzip", suffix="s1")
+        self.assertIsNone(result.error)
+        self.assertEqual(result.archive, self.log + ".s1.gz")
+        self.assertEqual(result.original_size, len(self.data))
+        self.assertGreater(result.freed, 0)
+        with gzip.open(result.archive, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.path.getsize(self.log), 0)
+
+    def test_uncompressed_copy(self):
+        result = rotate_file(self.log, "none", suffix="s1")
+        with open(result.archive, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(result.freed, 0)
+
+    def test_empty_log_is_skipped(self):
+        open(self.log, "wb").close()
+        result = rotate_file(self.log, suffix="s1")
+        self.assertIsNone(result.archive)
+        self.assertIsNone(result.error)
+        self.assertEqual(os.listdir(self.dir), ["app.log"])
+
+    def test_same_name_keeps_both_archives(self):
+        first = rotate_file(self.log, suffix="s1")
+        with open(self.log, "wb") as f:
+            f.write(b"second\n")
+        second = rotate_file(self.log, suffix="s1")
+        self.assertEqual(second.archive, self.log + ".s1-1.gz")
+        with gzip.open(first.archive, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        with gzip.open(second.archive, "rb") as f:
+            self.assertEqual(f.read(), b"second\n")
+
+    def test_failure_leaves_log_untouched(self):
+        with mock.patch.object(log_rotation._ArchiveWriter, "close",  # pylint: disable=protected-access
+                               side_effect=OSError(28, "No space left on device")):
+            result = rotate_file(self.log, suffix="s1")
+        self.assertIn("No space left", result.error)
+        self.assertIsNone(result.archive)
+        self.assertEqual(os.path.getsize(self.log), len(self.data))
+        self.assertEqual(os.listdir(self.dir), ["app.log"])
+
+
+class RetentionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "app.log")
+        now = time.time()
+        self.archives = []
+        for age_days in range(6):
+            archive = f"{self.log}.d{age_days}.gz"
+            open(archive, "wb").close()
+            os.utime(archive, (now - age_days * 86400 - 60, now - age_days * 86400 - 60))
+            self.archives.append(archive)
+        # Archives of another log sharing the prefix are not touched
+        open(os.path.join(self.dir, "app.log2.d0.gz"), "wb").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_keep_newest(self):
+        deleted = enforce_retention(self.log, keep=2)
+        self.assertEqual(sorted(deleted), sorted(self.archives[2:]))
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "app.log2.d0.gz")))
+
+    def test_max_age(self):
+        deleted = enforce_retention(self.log, keep=0, max_age_days=3)
+        self.assertEqual(sorted(deleted), sorted(self.archives[3:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Log scanner: offsets, rotation, truncation and signatures."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from log_scanner import LogScanner, SignatureTable, normalize
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_prefixes_numbers_and_hex(self):
+        self.assertEqual(normalize("Oct 19 03:20:12 web1 kernel: error at 0xdeadbeef pid 1234"),
+                         "kernel: error at <hex> pid #")
+        self.assertEqual(normalize("2026-10-19T03:20:12.123+00:00 web1 app[77]: failed id=ab12cd34ef"),
+                         "app[#]: failed id=<hex>")
+        self.assertEqual(normalize("[  123.456789] usb 1-1: error   -71"), "usb #-#: error -#")
+
+    def test_trim_keeps_frequent(self):
+        table = SignatureTable(limit=2)
+        table.add("a", 5, 1.0)
+        table.add("b", 1, 2.0)
+        table.add("c", 1, 3.0)
+        table.trim()
+        self.assertEqual(set(table.entries), {"a", "c"})
+
+
+class LogScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "syslog")
+        self.state = os.path.join(self.dir, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def append(self, text: str, path: str = None):
+        with open(path or self.log, "a", encoding="utf-8") as f:
+            f.write(text)
+
+    def scan(self):
+        # A new scanner every time: positions must survive through the state file
+        return {sig: count for sig, count, _new in LogScanner([self.log], self.state).scan()}
+
+    def test_only_new_complete_lines(self):
+        self.append("disk error 1\nall good\n")
+        self.assertEqual(self.scan(), {"disk error #": 1})
+        self.assertEqual(self.scan(), {})
+        self.append("disk error 2\ndisk err")
+        self.assertEqual(self.scan(), {"disk error #": 1})
+        # The partial line is read once it is complete
+        self.append("or 3\n")
+        self.assertEqual(self.scan(), {"disk error #": 1})
+
+    def test_first_time_seen(self):
+        self.append("mount failed\n")
+        self.assertEqual(LogScanner([self.log], self.state).scan(), [("mount failed", 1, True)])
+        self.append("mount failed\n")
+        self.assertEqual(LogScanner([self.log], self.state).scan(), [("mount failed", 1, False)])
+
+    def test_rotation_finishes_the_old_file(self):
+        self.append("old error 1\n")
+        self.scan()
+        self.append("old error 2\n")
+        os.rename(self.log, self.log + ".1")
+        self.append("new warning\n")
+        self.assertEqual(self.scan(), {"old error #": 1, "new warning": 1})
+
+    def test_truncation_restarts_from_the_beginning(self):
+        self.append("first error\n" * 3)
+        self.scan()
+        with open(self.log, "w", encoding="utf-8") as f:
+            f.write("second error\n")
+        self.assertEqual(self.scan(), {"second error": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Socket table parsing from a fake /proc/net."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from net_sockets import InodePidMap, decode_address, scan_sockets
+
+HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+
+
+def row(local: str, remote: str, state: str, inode: int) -> str:
+    return f"   0: {local} {remote} {state} 00000000:00000000 00:00000000 00000000     0        0 {inode} 1 0\n"
+
+
+class DecodeAddressTest(unittest.TestCase):
+
+    def test_ipv4_and_ipv6(self):
+        self.assertEqual(decode_address("0100007F:0016"), ("127.0.0.1", 22))
+        self.assertEqual(decode_address("00000000000000000000000001000000:01BB"), ("::1", 443))
+        # IPv4-mapped addresses are shown as IPv4
+        self.assertEqual(decode_address("0000000000000000FFFF00000500000A:0050"), ("10.0.0.5", 80))
+
+
+class ScanSocketsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="fake-proc-")
+        os.makedirs(os.path.join(self.root, "net"))
+        tables = {
+            "tcp": [row("00000000:0016", "00000000:0000", "0A", 100),
+                    row("0100007F:1F90", "0200000A:D431", "01", 0),
+                    row("0100007F:1F90", "0200000A:D432", "01", 0),
+                    row("0100007F:1F90", "0300000A:D433", "01", 0),
+                    row("0100007F:1F90", "0300000A:D434", "06", 0)],
+            "tcp6": [row("00000000000000000000000000000000:0050", "00000000000000000000000000000000:0000", "0A", 101)],
+            "udp": [row("00000000:0035", "00000000:0000", "07", 102),
+                    row("0100007F:0035", "0200000A:0035", "01", 103)],
+        }
+        for name, rows in tables.items():
+            with open(os.path.join(self.root, "net", name), "w", encoding="utf-8") as f:
+                f.write(HEADER + "".join(rows))
+        # Process 42 owns the ssh listener
+        os.makedirs(os.path.join(self.root, "42", "fd"))
+        os.symlink("socket:[100]", os.path.join(self.root, "42", "fd", "3"))
+        os.symlink("/dev/null", os.path.join(self.root, "42", "fd", "0"))
+        with open(os.path.join(self.root, "42", "comm"), "w", encoding="utf-8") as f:
+            f.write("sshd\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_summary(self):
+        summary = scan_sockets(self.root, top_peers=1)
+        self.assertEqual(summary.listening_ports(), ["22/tcp", "53/udp", "80/tcp"])
+        self.assertEqual(summary.states["LISTEN"], 2)
+        self.assertEqual(summary.states["ESTABLISHED"], 3)
+        self.assertEqual(summary.states["TIME_WAIT"], 1)
+        self.assertEqual(summary.udp_sockets, 2)
+        self.assertEqual(summary.peers, [("10.0.0.2", 2)])
+        self.assertEqual([l.address for l in summary.listeners], ["0.0.0.0:22", "0.0.0.0:53", "[::]:80"])
+
+    def test_listener_owners(self):
+        summary = scan_sockets(self.root, pid_map=InodePidMap(self.root))
+        owners = {l.port: (l.pid, l.process) for l in summary.listeners}
+        self.assertEqual(owners[22], (42, "sshd"))
+        self.assertEqual(owners[80], (None, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
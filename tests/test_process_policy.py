@@ -0,0 +1,108 @@
+"""Optimizer decisions and their replay over recorded process lists."""
+import os
+import tempfile
+import unittest
+
+from process_policy import FALLBACK_CPU_LIMIT, Decision, ProcessClassifier, decide
+from proc_replay import Policy, read_recording, replay, synthesize, write_recording
+from server_config import ServerConfig
+from system_sampler import ProcessSample
+
+PATTERNS = {
+    "is_critical_process": ["nginx|sshd"],
+    "is_limitable_process": ["node|python"],
+    "is_stoppable_process": ["chrome|rg", "cursor|node|sshd"],
+}
+
+
+def proc(pid, name, cpu=0.0, rss=0):
+    return ProcessSample(pid, name, "R", cpu, rss)
+
+
+def actions(decisions):
+    return [(d.pid, d.action, d.limit) for d in decisions]
+
+
+class ClassifierTest(unittest.TestCase):
+
+    def test_classes(self):
+        classifier = ProcessClassifier(PATTERNS)
+        self.assertEqual([classifier.classify(n) for n in ("nginx", "python3", "chrome", "ffmpeg")],
+                         ["critical", "limitable", "stoppable", "other"])
+        # The second stoppable pattern does not apply to critical processes
+        self.assertTrue(classifier.is_stoppable("node"))
+        self.assertFalse(classifier.is_stoppable("sshd"))
+
+    def test_from_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "critical_processes_config.sh")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("is_critical_process() {\n    echo \"$1\" | grep -qE 'redis'\n}\n")
+            classifier = ProcessClassifier.from_config(path)
+            self.assertEqual(classifier.classify("redis-server"), "critical")
+            # Functions missing from the file keep their defaults
+            self.assertEqual(classifier.classify("node"), "limitable")
+            self.assertEqual(ProcessClassifier.from_config(os.path.join(tmp, "missing")).classify("redis"), "other")
+
+
+class DecideTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = ServerConfig(cpu_limit_normal=60, cpu_limit_strict=25, cpu_limit_critical=5)
+        self.classifier = ProcessClassifier(PATTERNS)
+
+    def test_normal_pass(self):
+        processes = [proc(1, "nginx", 80), proc(2, "node", 70), proc(3, "chrome", 60), proc(4, "ffmpeg", 55),
+                     proc(5, "python3", 40), proc(6, "nginx", 1, 450), proc(7, "java", 1, 350), proc(8, "bash", 1, 100)]
+        decisions = decide(processes, 1000, self.cfg, self.classifier)
+        self.assertEqual(actions(decisions), [(1, "limit", 60), (2, "limit", 25), (3, "stop", 0),
+                                              (4, "limit", FALLBACK_CPU_LIMIT), (6, "restart", 0), (7, "stop", 0)])
+        self.assertEqual(decisions[0].reason, "CPU 80.0%")
+        self.assertEqual(decisions[4].reason, "memory 45.0%")
+
+    def test_quiet_host_and_unknown_memory(self):
+        processes = [proc(1, "node", 50, 900)]
+        self.assertEqual(decide(processes, 0, self.cfg, self.classifier), [])
+
+    def test_strict_pass(self):
+        processes = [proc(1, "nginx", 5), proc(2, "node", 4), proc(3, "python3", 3), proc(4, "sshd", 2)]
+        decisions = decide(processes, 1000, self.cfg, self.classifier, strict=True)
+        self.assertEqual(actions(decisions), [(1, "limit", 5), (2, "stop", 0), (3, "limit", 25), (4, "limit", 5)])
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_synthetic_recording_round_trip(self):
+        policy = Policy(ServerConfig(), ProcessClassifier(PATTERNS))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "hog.jsonl.gz")
+            frames = list(synthesize(60, frames=4, scenario="cpu_hog", seed=3))
+            self.assertEqual(write_recording(path, frames, "synthetic", 10.0), 4)
+            header, loaded = read_recording(path)
+            self.assertEqual(header["source"], "synthetic")
+            loaded = list(loaded)
+            self.assertEqual(loaded, frames)
+
+            os.mkdir(os.path.join(tmp, "proc"))
+            results = list(replay(loaded, os.path.join(tmp, "proc"), policy, baseline=Policy(ServerConfig())))
+        self.assertEqual(len(results), 4)
+        self.assertGreaterEqual(results[0].processes, 60)
+        # No CPU rates in the first frame; afterwards every hog is handled
+        self.assertEqual(results[0].decisions, [])
+        for result in results[1:]:
+            handled = {(d.name, d.action, d.limit) for d in result.decisions}
+            self.assertEqual(handled, {("node", "limit", 30), ("chrome", "stop", 0), ("nginx", "limit", 50),
+                                       ("ffmpeg", "limit", FALLBACK_CPU_LIMIT), ("rg", "stop", 0)})
+            self.assertTrue(all(isinstance(d, Decision) for d in result.baseline))
+
+    def test_bad_recording_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bad.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("not json\n")
+            with self.assertRaises(ValueError):
+                read_recording(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
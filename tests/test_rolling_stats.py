@@ -0,0 +1,83 @@
+"""Rolling percentiles over time windows."""
+import random
+import unittest
+from unittest import mock
+
+import rolling_stats
+from rolling_stats import RollingStats, percentile
+
+
+class FakeStore:
+    """HistoryStore stand-in returning fixed columns."""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def window(self, name, _seconds):
+        return self.columns[name]
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_interpolation(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual(percentile(values, 0), 1.0)
+        self.assertEqual(percentile(values, 100), 4.0)
+        self.assertAlmostEqual(percentile(values, 50), 2.5)
+        self.assertAlmostEqual(percentile(values, 95), 3.85)
+
+    def test_edge_cases(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([7.0], 99), 7.0)
+
+
+class RollingStatsTest(unittest.TestCase):
+
+    def test_window_expiry(self):
+        stats = RollingStats(windows=(10, 100))
+        for t in range(50):
+            stats.add(t, {"cpu": t})
+        short = stats.summary("cpu", 10)
+        self.assertEqual(short["count"], 11)
+        self.assertEqual(short["max"], 49)
+        self.assertAlmostEqual(short["p50"], 44)
+        self.assertEqual(stats.summary("cpu", 100)["count"], 50)
+
+    def test_out_of_order_sample_is_ignored(self):
+        stats = RollingStats(windows=(10,))
+        stats.add(5, {"cpu": 1})
+        stats.add(5, {"cpu": 100})
+        stats.add(4, {"cpu": 100})
+        self.assertEqual(stats.summary("cpu", 10)["count"], 1)
+
+    def test_unknown_metric_or_window(self):
+        stats = RollingStats(windows=(10,))
+        stats.add(0, {"cpu": 1})
+        self.assertIsNone(stats.summary("ram", 10))
+        self.assertIsNone(stats.summary("cpu", 60))
+
+    def test_matches_sorted_reference(self):
+        rng = random.Random(1)
+        stats = RollingStats(windows=(30,))
+        points = [(t, rng.uniform(0, 100)) for t in range(200)]
+        with mock.patch.object(rolling_stats, "COMPACT_THRESHOLD", 16):
+            for t, value in points:
+                stats.add(t, {"cpu": value})
+        expected = sorted(v for t, v in points if t >= 199 - 30)
+        summary = stats.summary("cpu", 30)
+        self.assertEqual(summary["count"], len(expected))
+        self.assertAlmostEqual(summary["p95"], percentile(expected, 95))
+        self.assertEqual(summary["max"], expected[-1])
+
+    def test_seed_then_add(self):
+        stats = RollingStats(windows=(10, 100))
+        stats.seed(FakeStore({"cpu": ([0.0, 50.0, 95.0], [9.0, 1.0, 5.0])}), ["cpu"])
+        self.assertEqual(stats.summary("cpu", 10)["count"], 1)
+        self.assertEqual(stats.summary("cpu", 100)["count"], 3)
+        stats.add(104, {"cpu": 2})
+        self.assertEqual(stats.summary("cpu", 10)["count"], 2)
+        self.assertEqual(stats.summary("cpu", 100)["max"], 5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
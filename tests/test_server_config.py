@@ -0,0 +1,105 @@
+"""Parsing of critical_processes_config.sh and the shell snapshot."""
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from server_config import ServerConfig, extract_functions, parse_shell_config, parse_size, write_snapshot
+
+CONFIG = """#!/bin/bash
+AUTHORIZED_ADMINS=(123 456)   # admins
+CPU_LIMIT_NORMAL=40
+NIGHT_START="23"  # quoted
+MAX_LOG_SIZE="${MAX_LOG_SIZE:-200M}"
+DISK_SCAN_ROOTS=(
+    "/home"       # users
+    '/var/log'
+)
+FLEET_TOKEN="secret"
+
+is_critical_process() {
+    local process_name=$1
+    echo "$process_name" | grep -qE 'sshd|nginx'
+}
+
+if [ -f x ]; then
+    INDENTED=ignored
+fi
+"""
+
+
+class ParseShellConfigTest(unittest.TestCase):
+
+    def test_values_and_arrays(self):
+        values = parse_shell_config(CONFIG)
+        self.assertEqual(values["AUTHORIZED_ADMINS"], ["123", "456"])
+        self.assertEqual(values["CPU_LIMIT_NORMAL"], "40")
+        self.assertEqual(values["NIGHT_START"], "23")
+        self.assertEqual(values["MAX_LOG_SIZE"], "200M")
+        self.assertEqual(values["DISK_SCAN_ROOTS"], ["/home", "/var/log"])
+        self.assertNotIn("INDENTED", values)
+
+    def test_functions(self):
+        functions = extract_functions(CONFIG)
+        self.assertTrue(functions.startswith("is_critical_process() {"))
+        self.assertTrue(functions.endswith("}\n"))
+        self.assertNotIn("INDENTED", functions)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("100M"), 100 * 1024 * 1024)
+        self.assertEqual(parse_size("1.5k"), 1536)
+        self.assertEqual(parse_size("512"), 512)
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+
+class FromValuesTest(unittest.TestCase):
+
+    def test_typed_values(self):
+        cfg = ServerConfig.from_values(parse_shell_config(CONFIG))
+        self.assertEqual(cfg.authorized_admins, [123, 456])
+        self.assertEqual(cfg.cpu_limit_normal, 40)
+        self.assertEqual(cfg.night_start, 23)
+        self.assertEqual(cfg.max_log_size_bytes, 200 * 1024 * 1024)
+
+    def test_scalar_for_list_field(self):
+        cfg = ServerConfig.from_values({"DISK_SCAN_ROOTS": "/home", "AUTHORIZED_ADMINS": "123",
+                                        "PROFILE_NIGHT": "cpu:node=10", "LIMIT_PROCESSES": "node php"})
+        self.assertEqual(cfg.disk_scan_roots, ["/home"])
+        self.assertEqual(cfg.authorized_admins, [123])
+        self.assertEqual(cfg.profile_night, ["cpu:node=10"])
+        self.assertEqual(cfg.limit_processes, ["node", "php"])
+
+    def test_invalid_values_keep_defaults(self):
+        default = ServerConfig()
+        cfg = ServerConfig.from_values({"CPU_LIMIT_NORMAL": "many", "MAX_LOG_SIZE": "huge",
+                                        "AUTHORIZED_ADMINS": ["12", "abc"]})
+        self.assertEqual(cfg.cpu_limit_normal, default.cpu_limit_normal)
+        self.assertEqual(cfg.max_log_size, default.max_log_size)
+        self.assertEqual(cfg.authorized_admins, [12])
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, ".config_snapshot.env")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_private_and_without_secrets(self):
+        cfg = ServerConfig.from_values(parse_shell_config(CONFIG))
+        write_snapshot(cfg, self.path, extract_functions(CONFIG))
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        with open(self.path, "r", encoding="utf-8") as f:
+            text = f.read()
+        self.assertNotIn("secret", text)
+        self.assertNotIn("AUTHORIZED_ADMINS=", text)
+        self.assertIn("CPU_LIMIT_NORMAL='40'", text)
+        self.assertIn("is_critical_process() {", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""The stall watchdog kills only the children a worker is waiting for."""
+import time
+import threading
+import subprocess
+import unittest
+
+from stall_watchdog import ChildRegistry, kill_hung_children
+
+
+class ChildRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ChildRegistry()
+
+    def test_check_output(self):
+        self.assertEqual(self.registry.check_output(["echo", "ok"], universal_newlines=True), "ok\n")
+        self.assertEqual(self.registry.pids(), [])
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.registry.check_output(["false"])
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.registry.check_output(["sleep", "5"], timeout=0.2)
+        self.assertEqual(self.registry.pids(), [])
+
+    def test_only_tracked_children_are_killed(self):
+        helper = subprocess.Popen(["sleep", "30"])  # like cpulimit, started outside the registry
+        errors = []
+
+        def worker():
+            try:
+                self.registry.check_output(["sh", "-c", "sleep 30; echo done"], timeout=60)
+            except subprocess.CalledProcessError as e:
+                errors.append(e.returncode)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not self.registry.pids() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            time.sleep(0.2)
+            killed = kill_hung_children(0, self.registry.pids())
+            thread.join(5)
+            self.assertEqual([name for _pid, name, _age in killed], ["sh"])
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(errors, [-9])
+            self.assertIsNone(helper.poll())
+        finally:
+            helper.kill()
+            helper.wait()
+
+    def test_nothing_tracked(self):
+        helper = subprocess.Popen(["sleep", "30"])
+        try:
+            self.assertEqual(kill_hung_children(0, []), [])
+            self.assertIsNone(helper.poll())
+        finally:
+            helper.kill()
+            helper.wait()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Differences between status report snapshots."""
+import unittest
+from types import SimpleNamespace
+
+from status_delta import Change, StatusSnapshot, diff, take_snapshot
+
+GB = 1024 ** 3
+
+
+def snapshot(load=1.0, cpu=20.0, mem=40.0, swap=0.0, cpu_count=4, disks=None, top_cpu=None, top_mem=None,
+             ports=("22/tcp",)):
+    return StatusSnapshot(0.0, cpu_count, {"load": load, "cpu": cpu, "mem": mem, "swap": swap},
+                          disks if disks is not None else {"/": (100 * GB, 50 * GB)},
+                          top_cpu or {}, top_mem or {}, set(ports))
+
+
+class DiffTest(unittest.TestCase):
+
+    def test_nothing_significant(self):
+        # Load tolerance is 0.5 per CPU, so 1.0 -> 2.9 on four CPUs is noise
+        self.assertEqual(diff(snapshot(), snapshot(load=2.9, cpu=34.0, mem=44.0)), [])
+
+    def test_metrics_beyond_tolerance(self):
+        changes = diff(snapshot(), snapshot(load=3.0, cpu=5.0, swap=5.0))
+        self.assertEqual(changes, [Change("metric", "load", 1.0, 3.0), Change("metric", "cpu", 20.0, 5.0),
+                                   Change("metric", "swap", 0.0, 5.0)])
+
+    def test_new_top_processes_and_ports(self):
+        old = snapshot(top_cpu={"nginx": 30.0}, ports=("22/tcp", "80/tcp"))
+        new = snapshot(top_cpu={"nginx": 60.0, "java": 20.0, "node": 50.0}, top_mem={"java": 2 * GB},
+                       ports=("22/tcp", "443/tcp"))
+        changes = diff(old, new)
+        self.assertEqual(changes, [Change("top_cpu", "node", new=50.0), Change("top_cpu", "java", new=20.0),
+                                   Change("top_mem", "java", new=2 * GB), Change("port_opened", "443/tcp"),
+                                   Change("port_closed", "80/tcp")])
+
+    def test_disk_growth(self):
+        old = snapshot(disks={"/": (100 * GB, 50 * GB), "/small": (10 * GB, 1 * GB), "/var": (1000 * GB, 0)})
+        new = snapshot(disks={"/": (100 * GB, 51 * GB), "/small": (10 * GB, GB + GB // 4),
+                              "/var": (1000 * GB, GB // 2), "/new": (10 * GB, 5 * GB)})
+        changes = diff(old, new)
+        self.assertEqual([(c.name, c.old, c.new) for c in changes],
+                         [("/", 50 * GB, 51 * GB), ("/small", GB, GB + GB // 4)])
+        self.assertAlmostEqual(changes[0].extra, 51.0)
+        # A disk that shrank is not reported
+        self.assertEqual(diff(new, old), [])
+
+
+class TakeSnapshotTest(unittest.TestCase):
+
+    def test_top_lists_are_filtered_and_merged(self):
+        proc = SimpleNamespace
+        sample = SimpleNamespace(
+            timestamp=5.0, cpu_count=2, load=(0.5, 0.4, 0.3), cpu_percent=12.0, mem_percent=30.0,
+            swap_total=1000, swap_free=750, disks={"/": (10, 5)},
+            top_cpu=[proc(name="php", cpu_percent=15.0), proc(name="php", cpu_percent=12.0),
+                     proc(name="sshd", cpu_percent=1.0)],
+            top_mem=[proc(name="mysqld", rss_bytes=GB), proc(name="bash", rss_bytes=1024)])
+        snap = take_snapshot(sample, ["22/tcp"])
+        self.assertEqual(snap.metrics, {"load": 0.5, "cpu": 12.0, "mem": 30.0, "swap": 25.0})
+        self.assertEqual(snap.top_cpu, {"php": 27.0})
+        self.assertEqual(snap.top_mem, {"mysqld": GB})
+        self.assertEqual(snap.ports, {"22/tcp"})
+
+
+if __name__ == "__main__":
+    unittest.main()
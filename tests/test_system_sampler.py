@@ -0,0 +1,113 @@
+"""Sampler rate math on a fake procfs."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from system_sampler import (CLOCK_TICKS, PAGE_SIZE, SECTOR_SIZE, ProcessScanner, Sampler, disk_io_rates,
+                            net_io_rates, parse_pid_stat, read_cpu_times, read_diskstats)
+
+
+def pid_stat(pid: int, name: str, ticks: int, start: int, rss_pages: int = 100) -> str:
+    fields = ["S"] + ["0"] * 22
+    fields[11], fields[12] = str(ticks), "0"
+    fields[19], fields[21] = str(start), str(rss_pages)
+    return f"{pid} ({name}) " + " ".join(fields) + "\n"
+
+
+class FakeProc:
+    """A directory laid out like /proc."""
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="fake-proc-")
+        os.makedirs(os.path.join(self.root, "net"))
+        self.write("loadavg", "1.50 1.00 0.50 1/100 999\n")
+        self.write("meminfo", "MemTotal: 1000 kB\nMemAvailable: 250 kB\nSwapTotal: 0 kB\nSwapFree: 0 kB\n")
+        self.write("mounts", "")
+
+    def write(self, name: str, text: str):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def counters(self, busy: int, idle: int, sectors_read: int, rx_bytes: int, out_segs: int, retrans: int):
+        self.write("stat", f"cpu  {busy} 0 0 {idle} 0 0 0 0 0 0\ncpu0 0 0 0 0 0 0 0 0\ncpu1 0 0 0 0 0 0 0 0\n"
+                           "intr 0\n")
+        self.write("diskstats", f"   8       0 sda 10 0 {sectors_read} 20 5 0 0 10 0 500 30\n"
+                                f"   8       1 sda1 10 0 {sectors_read} 20 5 0 0 10 0 500 30\n")
+        self.write("net/dev", "Inter-|   Receive\n face |bytes\n"
+                              f"  eth0: {rx_bytes} 10 0 0 0 0 0 0 2000 20 0 0 0 0 0 0\n"
+                              "    lo: 999999 10 0 0 0 0 0 0 999999 10 0 0 0 0 0 0\n")
+        self.write("net/snmp", "Tcp: RtoAlgorithm OutSegs RetransSegs\n"
+                               f"Tcp: 1 {out_segs} {retrans}\n")
+
+    def remove(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_pid_stat_with_parentheses_in_name(self):
+        self.assertEqual(parse_pid_stat(pid_stat(7, "tmux: server (1)", 42, 5, 3)), ("tmux: server (1)", "S", 42, 5, 3))
+        self.assertIsNone(parse_pid_stat("7 (short) S 1 2"))
+
+    def test_disk_rates(self):
+        before = {"sda": (10, 1000, 20, 5, 0, 10, 500)}
+        after = {"sda": (30, 3000, 60, 15, 200, 30, 1500), "sdb": (1, 1, 1, 1, 1, 1, 1)}
+        rates = disk_io_rates(before, after, 10.0)
+        self.assertEqual(set(rates), {"sda"})
+        self.assertEqual(rates["sda"].read_iops, 2.0)
+        self.assertEqual(rates["sda"].read_bps, 2000 * SECTOR_SIZE / 10.0)
+        self.assertEqual(rates["sda"].await_ms, 2.0)  # (40 + 20) ms over 30 I/Os
+        self.assertEqual(rates["sda"].util_percent, 10.0)  # 1000 ms busy in 10 s
+        self.assertEqual(disk_io_rates(before, after, 0), {})
+
+    def test_counter_reset_is_not_negative(self):
+        rates = net_io_rates({"eth0": (100,) * 8}, {"eth0": (50,) * 8}, 5.0)
+        self.assertEqual(rates["eth0"].rx_bps, 0.0)
+
+
+class SamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = FakeProc()
+
+    def tearDown(self):
+        self.proc.remove()
+
+    def test_host_rates(self):
+        self.proc.counters(busy=100, idle=900, sectors_read=0, rx_bytes=0, out_segs=1000, retrans=0)
+        self.assertEqual(read_cpu_times(self.proc.root), (100, 1000, 2))
+        self.assertEqual(set(read_diskstats(self.proc.root)), {"sda"})
+        sampler = Sampler(proc_root=self.proc.root)
+        first = sampler.sample_once(now=100.0)
+        self.assertEqual((first.cpu_percent, first.disk_io, first.net_io), (0.0, {}, {}))
+
+        self.proc.counters(busy=400, idle=1600, sectors_read=20, rx_bytes=10000, out_segs=2000, retrans=50)
+        second = sampler.sample_once(now=110.0)
+        self.assertEqual(second.cpu_percent, 30.0)
+        self.assertEqual(second.load, (1.5, 1.0, 0.5))
+        self.assertEqual(second.mem_percent, 75.0)
+        self.assertEqual(second.disk_io["sda"].read_bps, 20 * SECTOR_SIZE / 10.0)
+        self.assertEqual(set(second.net_io), {"eth0"})
+        self.assertEqual(second.net_io["eth0"].rx_bps, 1000.0)
+        self.assertEqual(second.tcp_retrans_per_sec, 5.0)
+        self.assertEqual(second.tcp_retrans_percent, 5.0)
+
+    def test_process_cpu_and_reused_pid(self):
+        self.proc.write("10/stat", pid_stat(10, "worker", ticks=0, start=50))
+        self.proc.write("11/stat", pid_stat(11, "idle", ticks=0, start=60))
+        scanner = ProcessScanner(self.proc.root, read_io=False)
+        scanner.scan(now=0.0)
+        self.proc.write("10/stat", pid_stat(10, "worker", ticks=CLOCK_TICKS * 5, start=50))
+        # PID 11 exited and was reused by a new process with busy history
+        self.proc.write("11/stat", pid_stat(11, "new", ticks=CLOCK_TICKS * 100, start=70))
+        processes = {p.pid: p for p in scanner.scan(now=10.0)}
+        self.assertEqual(processes[10].cpu_percent, 50.0)
+        self.assertEqual(processes[10].rss_bytes, 100 * PAGE_SIZE)
+        self.assertEqual(processes[11].cpu_percent, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Triage of the update backlog."""
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from update_intake import drain_backlog, triage, update_time
+
+NOW = 1_700_000_000.0
+
+
+def stamp(age):
+    return datetime.fromtimestamp(NOW - age, tz=timezone.utc)
+
+
+def callback(update_id, chat, data, age, edited_age=None):
+    message = SimpleNamespace(date=stamp(age), edit_date=stamp(edited_age) if edited_age is not None else None)
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat),
+                           callback_query=SimpleNamespace(data=data, message=message), effective_message=message)
+
+
+def command(update_id, chat, text, age):
+    message = SimpleNamespace(date=stamp(age), edit_date=None, text=text)
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat),
+                           callback_query=None, effective_message=message)
+
+
+def destructive(data):
+    return data in ("optimize", "cleanup")
+
+
+class FakeBot:
+    """Bot returning a fixed queue from get_updates."""
+
+    def __init__(self, count):
+        self.queue = [SimpleNamespace(update_id=i) for i in range(count)]
+        self.calls = []
+
+    def get_updates(self, offset=None, limit=100, timeout=0):
+        self.calls.append(offset)
+        start = offset or 0
+        return [u for u in self.queue if u.update_id >= start][:limit]
+
+
+class TriageTest(unittest.TestCase):
+
+    def test_last_duplicate_is_kept(self):
+        updates = [callback(1, 10, "status", 50), command(2, 10, "/start", 40),
+                   callback(3, 10, "status", 30), callback(4, 20, "status", 20), command(5, 10, "/start now", 10)]
+        result = triage(updates, destructive, now=NOW)
+        self.assertEqual([u.update_id for u in result.keep], [3, 4, 5])
+        self.assertEqual([u.update_id for u in result.duplicates], [1, 2])
+        self.assertEqual(result.expired, [])
+
+    def test_old_destructive_actions_expire(self):
+        updates = [callback(1, 10, "optimize", 600), callback(2, 20, "cleanup", 60),
+                   callback(3, 30, "status", 600), callback(4, 40, "optimize", 600, edited_age=30)]
+        result = triage(updates, destructive, max_age=300, now=NOW)
+        self.assertEqual([u.update_id for u in result.keep], [2, 3, 4])
+        self.assertEqual([u.update_id for u in result.expired], [1])
+
+    def test_callback_without_message_expires(self):
+        update = callback(1, 10, "optimize", 0)
+        update.callback_query.message = None
+        self.assertIsNone(update_time(update))
+        self.assertEqual(triage([update], destructive, now=NOW).expired, [update])
+
+    def test_drain_backlog_confirms_last_batch(self):
+        bot = FakeBot(5)
+        self.assertEqual([u.update_id for u in drain_backlog(bot, limit=2)], [0, 1, 2, 3, 4])
+        self.assertEqual(bot.calls, [None, 2, 4, 5])
+        self.assertEqual(drain_backlog(FakeBot(0)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
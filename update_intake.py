@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Triage of the update backlog collected while the bot was down.
+
+Telegram keeps unconfirmed updates for a day, so after a crash every
+button pressed in the meantime would be replayed in a burst, including
+several optimize or cleanup runs at the moment the server is struggling.
+At startup the backlog is fetched before polling begins and triaged:
+
+    duplicates  the same action in the same chat; only the last one is kept
+    expired     destructive actions whose button is older than the maximum
+                age; the user is asked to tap again
+    keep        everything else, handed to the dispatcher in order
+
+Telegram does not say when a button was pressed. The time the message
+carrying it was sent or last edited is used instead: the press came later,
+so the age is an upper bound and a fresh confirmation is never expired.
+"""
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+DEFAULT_MAX_AGE = 300
+# Updates fetched per getUpdates call (Telegram maximum)
+FETCH_LIMIT = 100
+
+
+@dataclass
+class Triage:
+    """Backlog split by what should happen to each update."""
+    keep: list = field(default_factory=list)
+    expired: list = field(default_factory=list)
+    duplicates: list = field(default_factory=list)
+
+
+def update_time(update) -> Optional[float]:
+    """
+    Get the latest moment an update could have been created
+
+    Args:
+        update (telegram.Update): Incoming update
+
+    Returns:
+        Optional[float]: Unix time; for a callback, when its message was sent or edited
+    """
+    if update.callback_query is not None:
+        message = update.callback_query.message
+        if message is None:
+            return None
+        stamp = message.edit_date or message.date
+    elif update.effective_message is not None:
+        stamp = update.effective_message.date
+    else:
+        return None
+    return stamp.timestamp() if stamp else None
+
+
+def update_key(update) -> Optional[Tuple[int, str]]:
+    """
+    Get the (chat, action) an update is a duplicate within
+
+    Args:
+        update (telegram.Update): Incoming update
+
+    Returns:
+        Optional[Tuple[int, str]]: Chat ID and callback data or command text, None if not collapsible
+    """
+    chat = update.effective_chat
+    if chat is None:
+        return None
+    if update.callback_query is not None:
+        return chat.id, update.callback_query.data or ""
+    message = update.effective_message
+    if message is not None and message.text and message.text.startswith("/"):
+        return chat.id, message.text.split()[0]
+    return None
+
+
+def triage(updates: list, is_destructive: Callable[[str], bool], max_age: float = DEFAULT_MAX_AGE,
+           now: Optional[float] = None) -> Triage:
+    """
+    Split a backlog into updates to process, expire and drop
+
+    Args:
+        updates (list): Updates in the order Telegram returned them
+        is_destructive (Callable[[str], bool]): Whether callback data starts a destructive action
+        max_age (float): Oldest destructive action still executed, seconds
+        now (float, optional): Current Unix time
+
+    Returns:
+        Triage: Updates grouped by outcome, each group in the original order
+    """
+    now = time.time() if now is None else now
+    last: dict = {}
+    for update in updates:
+        key = update_key(update)
+        if key is not None:
+            last[key] = update.update_id
+    result = Triage()
+    for update in updates:
+        key = update_key(update)
+        if key is not None and last[key] != update.update_id:
+            result.duplicates.append(update)
+            continue
+        query = update.callback_query
+        if query is not None and is_destructive(query.data or ""):
+            created = update_time(update)
+            if created is None or now - created > max_age:
+                result.expired.append(update)
+                continue
+        result.keep.append(update)
+    return result
+
+
+def drain_backlog(bot, limit: int = FETCH_LIMIT) -> List:
+    """
+    Fetch and confirm every update queued on the server
+
+    Args:
+        bot (telegram.Bot): Bot whose queue is drained
+        limit (int): Updates per request
+
+    Returns:
+        List: Pending updates in order; polling started afterwards only sees new ones
+    """
+    backlog = []
+    offset = None
+    while True:
+        updates = bot.get_updates(offset=offset, limit=limit, timeout=0)
+        backlog.extend(updates)
+        if len(updates) < limit:
+            break
+        offset = updates[-1].update_id + 1
+    if updates:
+        # Confirm the last batch so polling does not receive it again
+        bot.get_updates(offset=updates[-1].update_id + 1, limit=1, timeout=0)
+    if backlog:
+        logging.info("Fetched %d pending updates", len(backlog))
+    return backlog